@@ -1,20 +1,20 @@
 """Flask backend exposing webhook endpoints for the qualification bot."""
 from __future__ import annotations
 
+import atexit
 import os
+import time
 from datetime import datetime
 from typing import Any, Dict
 
-from cachetools import TTLCache
 from dotenv import load_dotenv
-from flask import Flask, jsonify, request
+from flask import Flask, Response, jsonify, request
 from flask_cors import CORS
 import structlog
 from pydantic import BaseModel, ValidationError
 
 from backend.models.database_models import (
     DatabaseConnection,
-    Lead,
     LeadRepository,
     SessionRepository,
     MessageRepository,
@@ -22,11 +22,18 @@ from backend.models.database_models import (
     SystemLogRepository,
     ReuniaoRepository,
 )
+from backend.models.cached_repositories import CachedLeadRepository, CachedSessionRepository
+from backend.models.log_sink import get_log_sink
+from backend.models.unit_of_work import InboundStore
+from backend.services.coordination import InMemoryCoordination, create_coordination_backend
+from backend.services.delivery_scheduler import delivery_scheduler
 from backend.services.google_sheets_service import GoogleSheetsService
-from backend.services.leads_watcher import LeadsWatcher
+from backend.services.inbound_worker import InboundJob, InboundWorkerPool
+from backend.services.leads_watcher import FileChangeNotifier, LeadsWatcher
 from backend.services.messaging_service import MessagingService
 from backend.services.metrics_service import metrics_service
 from backend.services.qualification_service import QualificationService
+from backend.services.tracing import correlation_scope, trace_summary, tracer
 from backend.services.whatsapp_service import WhatsAppService
 
 load_dotenv()
@@ -37,7 +44,10 @@ CORS(app)
 app.config['SECRET_KEY'] = os.getenv('SECRET_KEY', 'dev-secret-key')
 app.config['DEBUG'] = os.getenv('FLASK_DEBUG', 'false').lower() == 'true'
 
-INCOMING_DEDUP = TTLCache(maxsize=10000, ttl=120)
+# Shared by every gunicorn worker when COORDINATION_BACKEND=sqlite
+coordination = create_coordination_backend()
+INCOMING_DEDUP_NAMESPACE = 'incoming'
+INCOMING_DEDUP_TTL_SECONDS = 120
 
 
 class ParsedWahaPayload(BaseModel):
@@ -91,25 +101,83 @@ def _parse_waha_payload(data: Dict[str, Any]) -> ParsedWahaPayload:
 
 
 def _is_duplicate_incoming(telefone: str, message_id: str) -> bool:
-    cache_key = f"{telefone}:{message_id}"
-    if cache_key in INCOMING_DEDUP:
-        return True
-    INCOMING_DEDUP[cache_key] = True
-    return False
+    return not coordination.claim(
+        INCOMING_DEDUP_NAMESPACE, f"{telefone}:{message_id}", INCOMING_DEDUP_TTL_SECONDS
+    )
+
+
+def _forget_incoming(telefone: str, message_id: str) -> None:
+    coordination.release(INCOMING_DEDUP_NAMESPACE, f"{telefone}:{message_id}")
+
+
+def _process_inbound(job: InboundJob) -> Dict[str, Any]:
+    """Runs the qualification chain for a queued inbound message.
+
+    Runs inside the context captured by the webhook, so the spans and logs
+    carry that message's correlation id; the per-stage timings are logged
+    once the message is handled.
+    """
+    parsed: ParsedWahaPayload = job.payload
+    telefone_normalizado = job.telefone
+    tracer.record('inbound.queue_wait', time.monotonic() - job.enqueued_at)
+
+    try:
+        with tracer.span('inbound.process'):
+            # The worker pool orders messages per phone inside this process; the
+            # recipient lock extends that guarantee across gunicorn workers.
+            lock_requested = time.perf_counter()
+            with coordination.recipient_lock(telefone_normalizado):
+                tracer.record('inbound.recipient_lock', time.perf_counter() - lock_requested)
+                return _handle_inbound(parsed, telefone_normalizado)
+    finally:
+        logger.info("Inbound message timings", message_id=parsed.message_id, stages_ms=trace_summary())
+
+
+def _handle_inbound(parsed: ParsedWahaPayload, telefone_normalizado: str) -> Dict[str, Any]:
+    return qualification_service.processar_mensagem_por_telefone(
+        telefone=telefone_normalizado,
+        mensagem=parsed.mensagem,
+        nome=parsed.nome,
+    )
+
+
+def _repository_cache_enabled() -> bool:
+    """REPO_CACHE=auto caches only with a single worker (in-memory coordination).
+
+    The caches are per process; with several gunicorn workers another worker
+    may advance a session this process still holds.
+    """
+    mode = os.getenv('REPO_CACHE', 'auto').strip().lower()
+    if mode == 'auto':
+        return isinstance(coordination, InMemoryCoordination)
+    return mode in ('1', 'true', 'on')
 
 
 # Initialise dependencies ----------------------------------------------------
 try:
     database = DatabaseConnection()
-    lead_repo = LeadRepository(database)
-    session_repo = SessionRepository(database)
+    if _repository_cache_enabled():
+        cache_options = {
+            'maxsize': int(os.getenv('REPO_CACHE_MAXSIZE', '10000')),
+            'ttl_seconds': float(os.getenv('REPO_CACHE_TTL_SECONDS', '300')),
+        }
+        lead_repo = CachedLeadRepository(database, **cache_options)
+        session_repo = CachedSessionRepository(database, **cache_options)
+    else:
+        lead_repo = LeadRepository(database)
+        session_repo = SessionRepository(database)
     message_repo = MessageRepository(database)
     qualificacao_repo = QualificacaoRepository(database)
     reuniao_repo = ReuniaoRepository(database)
     system_log_repo = SystemLogRepository(database)  # pylint: disable=unused-variable
 
-    whatsapp_service = WhatsAppService()
-    messaging_service = MessagingService(whatsapp_service, message_repo)
+    inbound_store = InboundStore(
+        lead_repo, session_repo, message_repo, qualificacao_repo, reuniao_repo,
+        client=database.get_client(),
+    )
+
+    whatsapp_service = WhatsAppService(coordination=coordination)
+    messaging_service = MessagingService(whatsapp_service, message_repo, coordination=coordination)
     qualification_service = QualificationService(
         lead_repo=lead_repo,
         session_repo=session_repo,
@@ -118,15 +186,50 @@ try:
         reuniao_repo=reuniao_repo,
         messaging_service=messaging_service,
         whatsapp_service=whatsapp_service,
+        inbound_store=inbound_store,
+    )
+    # The watcher writes the sheet and lead status from the send result, so its
+    # first messages wait for the delivery instead of returning once scheduled
+    sheet_messaging_service = MessagingService(
+        whatsapp_service, message_repo, coordination=coordination,
+        delivery_timeout=float(os.getenv('SHEET_DELIVERY_TIMEOUT_SECONDS', '120')),
+    )
+    sheet_qualification_service = QualificationService(
+        lead_repo=lead_repo,
+        session_repo=session_repo,
+        message_repo=message_repo,
+        qualificacao_repo=qualificacao_repo,
+        reuniao_repo=reuniao_repo,
+        messaging_service=sheet_messaging_service,
+        whatsapp_service=whatsapp_service,
+        inbound_store=inbound_store,
     )
     sheets_service = GoogleSheetsService()
     leads_watcher = LeadsWatcher(
         sheets_service=sheets_service,
         lead_repo=lead_repo,
-        qualification_service=qualification_service,
+        qualification_service=sheet_qualification_service,
         poll_interval_seconds=int(os.getenv('LEADS_WATCHER_INTERVAL', '60')),
+        max_poll_interval_seconds=int(os.getenv('LEADS_WATCHER_MAX_INTERVAL', '600')),
+        full_rescan_seconds=int(os.getenv('LEADS_WATCHER_FULL_RESCAN_SECONDS', '900')),
+        start_concurrency=int(os.getenv('LEADS_WATCHER_CONCURRENCY', '8')),
+        # Every worker starts a watcher; with a shared backend only the lease holder polls
+        coordination=None if isinstance(coordination, InMemoryCoordination) else coordination,
     )
     leads_watcher.start()
+    if os.getenv('LEADS_WATCHER_CHANGE_FILE'):
+        sheet_change_file = FileChangeNotifier(
+            os.getenv('LEADS_WATCHER_CHANGE_FILE'),
+            lambda: leads_watcher.notify_change('file'),
+        )
+        sheet_change_file.start()
+        atexit.register(sheet_change_file.stop)
+    inbound_pool = InboundWorkerPool(
+        handler=_process_inbound,
+        workers=int(os.getenv('INBOUND_WORKERS', '4')),
+        max_queue_size=int(os.getenv('INBOUND_QUEUE_MAXSIZE', '1000')),
+    )
+    atexit.register(inbound_pool.stop)
     logger.info("Application services initialised")
 except Exception as exc:  # pylint: disable=broad-except
     logger.exception("Failed to initialise services", error=str(exc))
@@ -141,6 +244,13 @@ def webhook_whatsapp():
     if request.method == 'GET':
         return jsonify({'status': 'webhook_online'}), 200
 
+    # One correlation id per inbound message, inherited by the worker and
+    # delivery threads that handle it.
+    with correlation_scope(), tracer.span('webhook'):
+        return _receive_webhook()
+
+
+def _receive_webhook():
     try:
         payload = request.get_json(silent=True) or {}
         parsed = _parse_waha_payload(payload)
@@ -159,26 +269,19 @@ def webhook_whatsapp():
     except Exception:  # pylint: disable=broad-except
         telefone_normalizado = parsed.telefone
 
-    lead = lead_repo.get_lead_by_phone(telefone_normalizado)
-    if not lead:
-        novo_lead = Lead(nome=parsed.nome, telefone=telefone_normalizado, canal='whatsapp')
-        lead = lead_repo.create_lead(novo_lead)
-        if not lead:
-            logger.error("Could not create lead for incoming message", telefone=telefone_normalizado)
-            return jsonify({'status': 'lead_creation_failed'}), 200
+    if not inbound_pool.submit(telefone_normalizado, parsed):
+        # Let WAHA retry later instead of silently dropping the message.
+        _forget_incoming(parsed.telefone, parsed.message_id)
+        return jsonify({'status': 'queue_full'}), 503
 
-    result = qualification_service.processar_mensagem_recebida(
-        lead_id=lead['id'],
-        telefone=telefone_normalizado,
-        mensagem=parsed.mensagem,
-        nome=parsed.nome,
-    )
-
-    return jsonify({'status': 'processed', 'resultado': result}), 200
+    return jsonify({'status': 'queued'}), 200
 
 
 @app.route('/leads/run-watcher', methods=['POST'])
 def run_watcher_once():
+    # With the polling loop running, wake it instead of racing it
+    if leads_watcher.notify_change('endpoint'):
+        return jsonify({'status': 'scheduled'}), 202
     try:
         leads_watcher.process_once()
         return jsonify({'status': 'ok'}), 200
@@ -192,12 +295,37 @@ def get_metrics():
     """Endpoint para obter métricas do sistema"""
     try:
         summary = metrics_service.get_metrics_summary()
+        summary['inbound_queue'] = inbound_pool.stats()
+        summary['messaging'] = messaging_service.get_metrics()
+        summary['sheet_messaging'] = sheet_messaging_service.get_metrics()
+        summary['delivery_scheduler'] = delivery_scheduler.stats()
+        summary['waha_http'] = whatsapp_service.http.stats()
+        summary['waha_envio'] = whatsapp_service.estatisticas_envio()
+        summary['repository_cache'] = {
+            repo.cache.name: repo.cache.stats()
+            for repo in (lead_repo, session_repo)
+            if hasattr(repo, 'cache')
+        }
+        summary['system_log_sink'] = get_log_sink(database.get_client()).stats()
+        summary['latency'] = tracer.stats()
+        summary['leads_watcher'] = leads_watcher.stats()
         return jsonify(summary), 200
     except Exception as exc:
         logger.exception("Erro ao obter métricas", error=str(exc))
         return jsonify({'status': 'error', 'error': str(exc)}), 500
 
 
+@app.route('/metrics/prometheus', methods=['GET'])
+def get_prometheus_metrics():
+    """Métricas no formato texto do Prometheus, para scrapers"""
+    try:
+        body = metrics_service.render_prometheus(latency=tracer.histograms())
+        return Response(body, mimetype='text/plain; version=0.0.4; charset=utf-8'), 200
+    except Exception as exc:
+        logger.exception("Erro ao exportar métricas", error=str(exc))
+        return jsonify({'status': 'error', 'error': str(exc)}), 500
+
+
 @app.route('/metrics/detailed', methods=['GET'])
 def get_detailed_metrics():
     """Endpoint para obter métricas detalhadas com histórico"""
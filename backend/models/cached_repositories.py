@@ -0,0 +1,206 @@
+"""Write-through caches in front of the lead and active-session lookups.
+
+Every webhook hit reads the lead by phone and its active session; the same
+lead usually sends several messages within minutes, so both are kept in an
+in-process LRU+TTL cache that the repositories' own writes keep current.
+"""
+from __future__ import annotations
+
+import copy
+import threading
+from typing import Any, Callable, Dict, List, Optional
+
+from cachetools import TTLCache
+
+from backend.models.database_models import (
+    DEFAULT_PAGE_SIZE,
+    LEAD_COLUMNS,
+    SESSION_STATE_COLUMNS,
+    DatabaseConnection,
+    Lead,
+    LeadRepository,
+    Session,
+    SessionRepository,
+)
+
+
+class RecordCache:
+    """Thread-safe LRU+TTL cache of rows keyed by ``key_field``.
+
+    Rows are also indexed by ``id`` so updates issued by id (``update_lead``,
+    ``update_session``) can be applied in place. ``keep`` decides whether a
+    row still belongs in the cache after a write (e.g. only active sessions).
+    Only found rows are cached: a miss always goes to the database.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        key_field: str,
+        maxsize: int = 10_000,
+        ttl_seconds: float = 300.0,
+        keep: Optional[Callable[[Dict[str, Any]], bool]] = None,
+    ) -> None:
+        self.name = name
+        self.key_field = key_field
+        self.keep = keep
+        self._rows: TTLCache = TTLCache(maxsize=maxsize, ttl=ttl_seconds)
+        self._key_by_id: TTLCache = TTLCache(maxsize=maxsize, ttl=ttl_seconds)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            row = self._rows.get(key)
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            # Callers mutate nested dicts (session contexto): hand out copies
+            return copy.deepcopy(row)
+
+    def put(self, row: Optional[Dict[str, Any]]) -> None:
+        if not row or row.get(self.key_field) is None:
+            return
+        with self._lock:
+            self._store(copy.deepcopy(row))
+
+    def apply(self, row_id: str, updates: Dict[str, Any]) -> None:
+        """Apply a successful ``UPDATE ... WHERE id = row_id`` to the cached row."""
+        with self._lock:
+            key = self._key_by_id.get(row_id)
+            row = self._rows.get(key) if key is not None else None
+            if row is None:
+                return
+            row = {**row, **copy.deepcopy(updates)}
+            self._rows.pop(key, None)
+            self._store(row)
+
+    def invalidate(self, key: str) -> None:
+        with self._lock:
+            row = self._rows.pop(key, None)
+            if row is not None:
+                self._key_by_id.pop(row.get('id'), None)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._rows),
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_ratio': round(self.hits / lookups, 4) if lookups else 0.0,
+            }
+
+    def _store(self, row: Dict[str, Any]) -> None:
+        key = row.get(self.key_field)
+        if self.keep is not None and not self.keep(row):
+            self._rows.pop(key, None)
+            self._key_by_id.pop(row.get('id'), None)
+            return
+        self._rows[key] = row
+        if row.get('id') is not None:
+            self._key_by_id[row['id']] = key
+
+
+class CachedLeadRepository(LeadRepository):
+    """``LeadRepository`` serving ``get_lead_by_phone`` from a write-through cache."""
+
+    def __init__(self, db: DatabaseConnection, maxsize: int = 10_000, ttl_seconds: float = 300.0):
+        super().__init__(db)
+        self.cache = RecordCache('leads', 'telefone', maxsize=maxsize, ttl_seconds=ttl_seconds)
+
+    def create_lead(self, lead: Lead) -> Optional[Dict[str, Any]]:
+        created = super().create_lead(lead)
+        self.cache.put(created)
+        return created
+
+    def get_or_create_with_session(
+        self,
+        lead: Lead,
+        session: Optional[Session],
+        session_repo: SessionRepository,
+    ) -> Optional[Dict[str, Any]]:
+        result = super().get_or_create_with_session(lead, session, session_repo)
+        if result:
+            # Rows that came back from the RPC bypassed the cached read/create paths
+            self.cache.put(result.get('lead'))
+            session_cache = getattr(session_repo, 'cache', None)
+            if session_cache is not None:
+                session_cache.put(result.get('session'))
+        return result
+
+    def get_lead_by_phone(self, telefone: str, columns: str = LEAD_COLUMNS.slim) -> Optional[Dict[str, Any]]:
+        if columns != LEAD_COLUMNS.slim:
+            return super().get_lead_by_phone(telefone, columns)
+        cached = self.cache.get(telefone)
+        if cached is not None:
+            return cached
+        lead = super().get_lead_by_phone(telefone)
+        self.cache.put(lead)
+        return lead
+
+    def get_leads_by_phones(
+        self,
+        telefones: List[str],
+        columns: str = LEAD_COLUMNS.slim,
+        chunk_size: int = DEFAULT_PAGE_SIZE,
+    ) -> Dict[str, Dict[str, Any]]:
+        if columns != LEAD_COLUMNS.slim:
+            return super().get_leads_by_phones(telefones, columns, chunk_size)
+        found: Dict[str, Dict[str, Any]] = {}
+        missing = []
+        for telefone in dict.fromkeys(telefones):
+            cached = self.cache.get(telefone)
+            if cached is not None:
+                found[telefone] = cached
+            else:
+                missing.append(telefone)
+        if missing:
+            fetched = super().get_leads_by_phones(missing, columns, chunk_size)
+            for lead in fetched.values():
+                self.cache.put(lead)
+            found.update(fetched)
+        return found
+
+    def update_lead(self, lead_id: str, updates: Dict[str, Any]) -> bool:
+        updated = super().update_lead(lead_id, updates)
+        if updated:
+            self.cache.apply(lead_id, updates)
+        return updated
+
+
+class CachedSessionRepository(SessionRepository):
+    """``SessionRepository`` caching the active session of each lead."""
+
+    def __init__(self, db: DatabaseConnection, maxsize: int = 10_000, ttl_seconds: float = 300.0):
+        super().__init__(db)
+        self.cache = RecordCache(
+            'active_sessions',
+            'lead_id',
+            maxsize=maxsize,
+            ttl_seconds=ttl_seconds,
+            keep=lambda row: bool(row.get('ativa', True)),
+        )
+
+    def create_session(self, session: Session) -> Optional[Dict[str, Any]]:
+        created = super().create_session(session)
+        self.cache.put(created)
+        return created
+
+    def get_active_session(self, lead_id: str, columns: str = SESSION_STATE_COLUMNS) -> Optional[Dict[str, Any]]:
+        if columns != SESSION_STATE_COLUMNS:
+            return super().get_active_session(lead_id, columns)
+        cached = self.cache.get(lead_id)
+        if cached is not None:
+            return cached
+        session = super().get_active_session(lead_id)
+        self.cache.put(session)
+        return session
+
+    def update_session(self, session_id: str, updates: Dict[str, Any]) -> bool:
+        updated = super().update_session(session_id, updates)
+        if updated:
+            self.cache.apply(session_id, updates)
+        return updated
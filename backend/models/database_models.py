@@ -2,18 +2,37 @@
 Modelos de dados para o Agente Qualificador de Leads
 Integração com Supabase via Python
 """
+import inspect
 import os
+import threading
+import time
 from datetime import datetime, timezone
-from typing import Dict, List, Optional, Any
+from typing import Any, Callable, Dict, Iterator, List, Optional
 import json
 from supabase import create_client, Client
-from dataclasses import dataclass, asdict
+from postgrest import CountMethod, ReturnMethod
+from dataclasses import dataclass, asdict, field, replace
+
+from backend.models.log_sink import get_log_sink
+from backend.services.retry_policy import RetryPolicy
+from backend.services.tracing import tracer
 
 
 class DatabaseConnection:
-    """Gerenciador de conexão com Supabase"""
+    """Gerenciador de conexão com Supabase (ou SQLite local, via DATABASE_BACKEND)"""
     
     def __init__(self):
+        backend = os.getenv('DATABASE_BACKEND', 'supabase').strip().lower()
+        if backend == 'sqlite':
+            # Mesma interface do cliente Supabase sobre um arquivo local em WAL
+            from backend.models.sqlite_backend import SQLiteClient
+            self.url = os.getenv('SQLITE_DATABASE_PATH', 'data/agente.db')
+            self.key = None
+            self.client = SQLiteClient(self.url)
+            return
+        if backend != 'supabase':
+            raise ValueError(f"DATABASE_BACKEND inválido: {backend}")
+
         self.url = os.getenv('SUPABASE_URL')
         self.key = os.getenv('SUPABASE_SERVICE_ROLE_KEY')
         if not self.url or not self.key:
@@ -159,11 +178,332 @@ class Reuniao:
         return data
 
 
-class LeadRepository:
+@dataclass(frozen=True)
+class Columns:
+    """Projeção de colunas de uma tabela.
+
+    ``slim`` traz só o que o caminho quente usa; ``full`` traz a linha inteira.
+    Evita trafegar JSONB grandes (``contexto``, ``metadata``, ``detalhes``)
+    em consultas que não precisam deles.
+    """
+    slim: str
+    full: str
+
+
+LEAD_COLUMNS = Columns(
+    slim='id,nome,telefone,canal,status,processado',
+    full='id,nome,telefone,email,canal,status,score,processado,created_at,updated_at',
+)
+SESSION_COLUMNS = Columns(
+    slim='id,lead_id,estado,ativa,created_at',
+    full='id,lead_id,estado,contexto,ativa,created_at,updated_at',
+)
+# Estado da conversa: o que o fluxo precisa para continuar (inclui contexto)
+SESSION_STATE_COLUMNS = 'id,lead_id,estado,contexto,ativa'
+MESSAGE_COLUMNS = Columns(
+    slim='id,tipo,conteudo,created_at',
+    full='id,session_id,lead_id,conteudo,tipo,metadata,created_at',
+)
+QUALIFICACAO_COLUMNS = Columns(
+    slim='id,lead_id,session_id,score_total,resultado',
+    full=(
+        'id,lead_id,session_id,patrimonio_resposta,patrimonio_pontos,objetivo_resposta,'
+        'objetivo_pontos,urgencia_resposta,urgencia_pontos,interesse_resposta,'
+        'interesse_pontos,score_total,resultado,observacoes,created_at'
+    ),
+)
+SYSTEM_LOG_COLUMNS = Columns(
+    slim='id,nivel,evento,lead_id,created_at',
+    full='id,lead_id,session_id,nivel,evento,detalhes,created_at',
+)
+REUNIAO_COLUMNS = Columns(
+    slim='id,lead_id,data_agendada,status,link_reuniao',
+    full='id,lead_id,data_agendada,status,link_reuniao,observacoes,created_at,updated_at',
+)
+
+# UPDATEs não precisam da linha de volta (a sessão traria o contexto inteiro)
+UPDATE_OPTIONS = {'count': CountMethod.exact, 'returning': ReturnMethod.minimal}
+
+
+def _rows_affected(result: Any) -> int:
+    """Linhas afetadas por um UPDATE feito com ``UPDATE_OPTIONS``."""
+    if getattr(result, 'count', None) is not None:
+        return result.count
+    return len(result.data or [])
+
+
+# PostgREST "function not found in the schema cache" / Postgres undefined_function
+MISSING_FUNCTION_CODES = ('PGRST202', '42883')
+
+
+def is_missing_function_error(exc: Exception) -> bool:
+    """Se ``exc`` indica que a função do banco não está criada (e não uma falha transitória)."""
+    code = getattr(exc, 'code', None)
+    if code in MISSING_FUNCTION_CODES:
+        return True
+    text = str(exc)
+    if any(missing in text for missing in MISSING_FUNCTION_CODES):
+        return True
+    return 'function' in text and 'does not exist' in text
+
+
+DEFAULT_PAGE_SIZE = 200
+
+
+def _with_cursor_columns(columns: str) -> str:
+    """Garante ``id`` e ``created_at`` na projeção (usados como cursor)."""
+    if columns.strip() == '*':
+        return columns
+    names = [c.strip() for c in columns.split(',') if c.strip()]
+    names += [c for c in ('id', 'created_at') if c not in names]
+    return ','.join(names)
+
+
+def _keyset_pages(
+    build_query: Callable[[str], Any],
+    columns: str,
+    page_size: int = DEFAULT_PAGE_SIZE,
+    desc: bool = False,
+    on_error: Optional[Callable[[Exception], None]] = None,
+) -> Iterator[Dict[str, Any]]:
+    """Percorre uma consulta em páginas pela chave ``(created_at, id)``.
+
+    Cada página continua estritamente depois da última linha lida, então o
+    custo não cresce com a profundidade (como faria um OFFSET) e nada além de
+    ``page_size`` linhas fica em memória. ``build_query(columns)`` deve devolver
+    uma consulta nova já filtrada, sem ordenação nem limite.
+    """
+    columns = _with_cursor_columns(columns)
+    op = 'lt' if desc else 'gt'
+    cursor = None
+    while True:
+        try:
+            query = build_query(columns)
+            if cursor is not None:
+                created_at, row_id = cursor
+                query = query.or_(
+                    f'created_at.{op}."{created_at}",'
+                    f'and(created_at.eq."{created_at}",id.{op}.{row_id})'
+                )
+            rows = (
+                query.order('created_at', desc=desc)
+                .order('id', desc=desc)
+                .limit(page_size)
+                .execute()
+                .data
+                or []
+            )
+        except Exception as e:
+            if on_error:
+                on_error(e)
+            return
+        yield from rows
+        if len(rows) < page_size:
+            return
+        cursor = (rows[-1]['created_at'], rows[-1]['id'])
+
+
+# Lotes limitados por linhas e por tamanho do JSON enviado
+BULK_CHUNK_ROWS = 500
+BULK_CHUNK_BYTES = 512 * 1024
+
+
+@dataclass
+class BulkResult:
+    """Resultado de uma escrita em lote, alinhado com a lista de entrada.
+
+    ``ids[i]`` é o id gravado para a linha ``i`` (``None`` se não gravou);
+    ``conflicts`` e ``errors`` mapeiam índice da entrada -> motivo.
+    """
+    ids: List[Optional[str]] = field(default_factory=list)
+    conflicts: Dict[int, str] = field(default_factory=dict)
+    errors: Dict[int, str] = field(default_factory=dict)
+    round_trips: int = 0
+
+    @property
+    def created(self) -> int:
+        return sum(1 for row_id in self.ids if row_id)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            'created': self.created,
+            'conflicts': len(self.conflicts),
+            'errors': len(self.errors),
+            'round_trips': self.round_trips,
+        }
+
+
+def _chunks(
+    rows: List[Dict[str, Any]],
+    max_rows: int,
+    max_bytes: int,
+) -> Iterator[List[Any]]:
+    """Divide ``rows`` em lotes de ``(índice, linha)`` por quantidade e bytes."""
+    chunk: List[Any] = []
+    size = 0
+    for index, row in enumerate(rows):
+        row_size = len(json.dumps(row, default=str))
+        if chunk and (len(chunk) >= max_rows or size + row_size > max_bytes):
+            yield chunk
+            chunk, size = [], 0
+        chunk.append((index, row))
+        size += row_size
+    if chunk:
+        yield chunk
+
+
+def _bulk_write(
+    client: Client,
+    table: str,
+    rows: List[Dict[str, Any]],
+    key: Optional[str] = None,
+    upsert: bool = False,
+    chunk_rows: int = BULK_CHUNK_ROWS,
+    chunk_bytes: int = BULK_CHUNK_BYTES,
+    log_error: Optional[Callable[[str, Dict[str, Any]], None]] = None,
+) -> BulkResult:
+    """Insere (ou faz upsert por ``key``) ``rows`` em lotes.
+
+    Com ``key`` e sem ``upsert``, linhas cuja chave já existe são ignoradas
+    pelo banco (ON CONFLICT DO NOTHING) e voltam como conflito, sem derrubar o
+    lote. Se um lote falhar por outro motivo, suas linhas são reenviadas uma a
+    uma para isolar quais falharam.
+    """
+    result = BulkResult(ids=[None] * len(rows))
+    for chunk in _chunks(rows, max(1, chunk_rows), chunk_bytes):
+        batch = chunk
+        if key:
+            # A mesma chave duas vezes no lote: o Postgres rejeitaria o lote inteiro
+            batch_by_key: Dict[Any, Any] = {}
+            for index, row in chunk:
+                previous = batch_by_key.get(row.get(key))
+                if previous is None:
+                    batch_by_key[row.get(key)] = (index, row)
+                elif upsert:
+                    result.conflicts[previous[0]] = f"{key} repetido no lote"
+                    batch_by_key[row.get(key)] = (index, row)
+                else:
+                    result.conflicts[index] = f"{key} repetido no lote"
+            batch = list(batch_by_key.values())
+
+        payload = [row for _, row in batch]
+        try:
+            if key:
+                query = client.table(table).upsert(payload, on_conflict=key, ignore_duplicates=not upsert)
+            else:
+                query = client.table(table).insert(payload)
+            data = query.execute().data or []
+            result.round_trips += 1
+        except Exception as e:
+            result.round_trips += 1
+            if log_error:
+                log_error(f"Erro em lote de {table}, reenviando linha a linha: {str(e)}", {'linhas': len(batch)})
+            _write_rows_one_by_one(client, table, batch, result, key, upsert)
+            continue
+
+        if key:
+            ids_by_key = {created.get(key): created.get('id') for created in data}
+            for index, row in batch:
+                row_id = ids_by_key.get(row.get(key))
+                if row_id:
+                    result.ids[index] = row_id
+                else:
+                    result.conflicts[index] = f"{key} já existe"
+        else:
+            # PostgREST devolve as linhas na ordem em que foram enviadas
+            for (index, _), created in zip(batch, data):
+                result.ids[index] = created.get('id')
+    return result
+
+
+def _write_rows_one_by_one(
+    client: Client,
+    table: str,
+    batch: List[Any],
+    result: BulkResult,
+    key: Optional[str],
+    upsert: bool = False,
+) -> None:
+    for index, row in batch:
+        try:
+            if key:
+                # Mesma semântica do lote: upsert atualiza, senão ON CONFLICT DO NOTHING
+                query = client.table(table).upsert(row, on_conflict=key, ignore_duplicates=not upsert)
+            else:
+                query = client.table(table).insert(row)
+            data = query.execute().data or []
+            result.ids[index] = data[0].get('id') if data else None
+            if key and not data:
+                result.conflicts[index] = f"{key} já existe"
+        except Exception as e:
+            message = str(e)
+            if key and 'duplicate key' in message:
+                result.conflicts[index] = f"{key} já existe"
+            else:
+                result.errors[index] = message
+        finally:
+            result.round_trips += 1
+
+
+class ErrorLoggingRepository:
+    """Base dos repositories: ``log_error`` compartilhado e não bloqueante.
+
+    O erro vai para o sink em background de ``system_logs`` (gravado em
+    lotes), então um Supabase degradado não deixa o caminho de erro mais lento.
+
+    Cada método público das subclasses é medido como o estágio
+    ``repo.<Classe>.<método>`` do tracer (os ``iter_*`` ficam de fora:
+    só mediriam a criação do iterador preguiçoso). Sobrescritas de um método
+    já medido na classe base (os repositories com cache, que chamam
+    ``super()``) não são medidas de novo: cada chamada ao banco gera um
+    único estágio, com o nome da classe base.
+    """
+
+    db: Client
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        for name, attr in list(vars(cls).items()):
+            if name.startswith(('_', 'iter_')) or name == 'log_error' or not inspect.isfunction(attr):
+                continue
+            if any(getattr(getattr(base, name, None), '_repo_traced', False) for base in cls.__mro__[1:]):
+                continue
+            wrapped = tracer.traced(f"repo.{cls.__name__}.{name}")(attr)
+            wrapped._repo_traced = True
+            setattr(cls, name, wrapped)
+
+    def log_error(self, evento: str, detalhes: Dict[str, Any] = None):
+        """Log de erro interno"""
+        detalhes = dict(detalhes or {})
+        if len(evento) > 100:  # evento é VARCHAR(100)
+            detalhes.setdefault('mensagem', evento)
+            evento = evento[:100]
+        try:
+            log = SystemLog(nivel='ERROR', evento=evento, detalhes=detalhes)
+            get_log_sink(self.db).submit(log.to_dict())
+        except Exception:
+            pass  # Evita loop infinito de erros
+
+
+# Sem a função obter_ou_criar_lead_sessao, o get-or-create é serializado por
+# telefone dentro do processo (entre workers, o recipient_lock da coordenação)
+_PHONE_LOCKS = [threading.Lock() for _ in range(64)]
+
+
+def _phone_lock(telefone: str) -> threading.Lock:
+    return _PHONE_LOCKS[hash(telefone) % len(_PHONE_LOCKS)]
+
+
+class LeadRepository(ErrorLoggingRepository):
     """Repository para operações com Leads"""
+
+    GET_OR_CREATE_RPC = 'obter_ou_criar_lead_sessao'
     
     def __init__(self, db: DatabaseConnection):
         self.db = db.get_client()
+        self.rpc_enabled = hasattr(self.db, 'rpc')
+        # O get-or-create é idempotente: falhas transitórias podem ser repetidas
+        self.rpc_retry = RetryPolicy(max_attempts=3, base_delay=0.2, max_delay=2.0)
     
     def create_lead(self, lead: Lead) -> Optional[Dict[str, Any]]:
         """Cria um novo lead"""
@@ -174,47 +514,178 @@ class LeadRepository:
             self.log_error(f"Erro ao criar lead: {str(e)}", {'lead_data': lead.to_dict()})
             return None
     
-    def get_lead_by_phone(self, telefone: str) -> Optional[Dict[str, Any]]:
+    def create_many(self, leads: List[Lead], chunk_size: int = BULK_CHUNK_ROWS) -> BulkResult:
+        """Cria vários leads; telefones já cadastrados voltam em ``conflicts``"""
+        return _bulk_write(
+            self.db, 'leads', [lead.to_dict() for lead in leads],
+            key='telefone', chunk_rows=chunk_size, log_error=self.log_error,
+        )
+
+    def upsert_many(self, leads: List[Lead], chunk_size: int = BULK_CHUNK_ROWS) -> BulkResult:
+        """Cria ou atualiza (por telefone) vários leads"""
+        return _bulk_write(
+            self.db, 'leads', [lead.to_dict() for lead in leads],
+            key='telefone', upsert=True, chunk_rows=chunk_size, log_error=self.log_error,
+        )
+
+    def get_or_create_with_session(
+        self,
+        lead: Lead,
+        session: Optional[Session],
+        session_repo: 'SessionRepository',
+    ) -> Optional[Dict[str, Any]]:
+        """Lead pelo telefone e sua sessão ativa, criando o que faltar, atomicamente
+
+        Retorna ``{'lead', 'session', 'lead_created', 'session_created'}``; a
+        sessão só é criada quando ``session`` é informada (o ``lead_id`` dela é
+        ignorado). Uma chamada à função ``obter_ou_criar_lead_sessao``; se ela
+        não existir, cai para as consultas em sequência sob um lock por telefone.
+        Outras falhas da função são repetidas e, esgotadas as tentativas,
+        propagadas: o lock por telefone só vale dentro do processo.
+        """
+        if self.rpc_enabled:
+            params = {
+                'p_telefone': lead.telefone,
+                'p_nome': lead.nome,
+                'p_canal': lead.canal,
+                'p_sessao': {'estado': session.estado, 'contexto': session.contexto} if session else None,
+            }
+            delay = None
+            for attempt in range(1, self.rpc_retry.max_attempts + 1):
+                try:
+                    data = self.db.rpc(self.GET_OR_CREATE_RPC, params).execute().data
+                    if isinstance(data, list):
+                        data = data[0] if data else None
+                    return data or None
+                except Exception as e:
+                    if is_missing_function_error(e):
+                        self.rpc_enabled = False
+                        self.log_error(f"Função {self.GET_OR_CREATE_RPC} indisponível: {str(e)}", {'telefone': lead.telefone})
+                        break
+                    self.log_error(
+                        f"Falha em {self.GET_OR_CREATE_RPC}: {str(e)}",
+                        {'telefone': lead.telefone, 'tentativa': attempt},
+                    )
+                    if not self.rpc_retry.should_retry(attempt):
+                        raise
+                    delay = self.rpc_retry.next_delay(delay)
+                    time.sleep(delay)
+
+        with _phone_lock(lead.telefone):
+            lead_row = self.get_lead_by_phone(lead.telefone)
+            lead_created = False
+            if not lead_row:
+                lead_row = self.create_lead(lead)
+                lead_created = lead_row is not None
+                if not lead_row:  # criado por outro processo entre a busca e o insert
+                    lead_row = self.get_lead_by_phone(lead.telefone)
+            if not lead_row:
+                return None
+
+            session_row = session_repo.get_active_session(lead_row['id'])
+            session_created = False
+            if session_row is None and session is not None:
+                session_row = session_repo.create_session(replace(session, lead_id=lead_row['id'], ativa=True))
+                session_created = session_row is not None
+            return {
+                'lead': lead_row,
+                'session': session_row,
+                'lead_created': lead_created,
+                'session_created': session_created,
+            }
+
+    def get_lead_by_phone(self, telefone: str, columns: str = LEAD_COLUMNS.slim) -> Optional[Dict[str, Any]]:
         """Busca lead por telefone"""
         try:
-            result = self.db.table('leads').select('*').eq('telefone', telefone).execute()
+            result = self.db.table('leads').select(columns).eq('telefone', telefone).execute()
             return result.data[0] if result.data else None
         except Exception as e:
             self.log_error(f"Erro ao buscar lead por telefone: {str(e)}", {'telefone': telefone})
             return None
     
+    def get_leads_by_phones(
+        self,
+        telefones: List[str],
+        columns: str = LEAD_COLUMNS.slim,
+        chunk_size: int = DEFAULT_PAGE_SIZE,
+    ) -> Dict[str, Dict[str, Any]]:
+        """Busca vários leads por telefone, um ``in`` por lote; telefone -> lead"""
+        return self._get_leads_in('telefone', telefones, columns, chunk_size)
+
+    def get_leads_by_ids(
+        self,
+        lead_ids: List[str],
+        columns: str = LEAD_COLUMNS.slim,
+        chunk_size: int = DEFAULT_PAGE_SIZE,
+    ) -> Dict[str, Dict[str, Any]]:
+        """Busca vários leads por id, um ``in`` por lote; id -> lead"""
+        return self._get_leads_in('id', lead_ids, columns, chunk_size)
+
+    def _get_leads_in(
+        self,
+        key: str,
+        values: List[str],
+        columns: str,
+        chunk_size: int,
+    ) -> Dict[str, Dict[str, Any]]:
+        if key not in columns.split(',') and columns.strip() != '*':
+            columns = f"{columns},{key}"
+        unique = list(dict.fromkeys(values))
+        found: Dict[str, Dict[str, Any]] = {}
+        for start in range(0, len(unique), max(1, chunk_size)):
+            chunk = unique[start:start + max(1, chunk_size)]
+            try:
+                result = self.db.table('leads').select(columns).in_(key, chunk).execute()
+            except Exception as e:
+                self.log_error(f"Erro ao buscar leads por {key} em lote: {str(e)}", {key: len(chunk)})
+                continue
+            for row in result.data or []:
+                found[row[key]] = row
+        return found
+
     def update_lead(self, lead_id: str, updates: Dict[str, Any]) -> bool:
         """Atualiza um lead"""
         try:
-            result = self.db.table('leads').update(updates).eq('id', lead_id).execute()
-            return len(result.data) > 0
+            result = self.db.table('leads').update(updates, **UPDATE_OPTIONS).eq('id', lead_id).execute()
+            return _rows_affected(result) > 0
         except Exception as e:
             self.log_error(f"Erro ao atualizar lead: {str(e)}", {'lead_id': lead_id, 'updates': updates})
             return False
     
-    def get_unprocessed_leads(self) -> List[Dict[str, Any]]:
-        """Busca leads não processados"""
+    def get_unprocessed_leads(
+        self,
+        columns: str = LEAD_COLUMNS.slim,
+        limit: Optional[int] = None,
+    ) -> List[Dict[str, Any]]:
+        """Busca os leads não processados, mais antigos primeiro
+
+        Sem ``limit`` traz todos; para percorrer um backlog grande sem
+        carregá-lo de uma vez, use ``iter_unprocessed_leads``.
+        """
         try:
-            result = self.db.table('leads').select('*').eq('processado', False).execute()
-            return result.data or []
+            query = self.db.table('leads').select(columns).eq('processado', False).order('created_at')
+            if limit is not None:
+                query = query.limit(limit)
+            return query.execute().data or []
         except Exception as e:
             self.log_error(f"Erro ao buscar leads não processados: {str(e)}")
             return []
-    
-    def log_error(self, evento: str, detalhes: Dict[str, Any] = None):
-        """Log de erro interno"""
-        try:
-            log = SystemLog(
-                nivel='ERROR',
-                evento=evento,
-                detalhes=detalhes or {}
-            )
-            self.db.table('system_logs').insert(log.to_dict()).execute()
-        except:
-            pass  # Evita loop infinito de erros
 
-
-class SessionRepository:
+    def iter_unprocessed_leads(
+        self,
+        columns: str = LEAD_COLUMNS.slim,
+        page_size: int = DEFAULT_PAGE_SIZE,
+    ) -> Iterator[Dict[str, Any]]:
+        """Itera todos os leads não processados, página a página"""
+        return _keyset_pages(
+            lambda cols: self.db.table('leads').select(cols).eq('processado', False),
+            columns,
+            page_size,
+            on_error=lambda e: self.log_error(f"Erro ao paginar leads não processados: {str(e)}"),
+        )
+
+
+class SessionRepository(ErrorLoggingRepository):
     """Repository para operações com Sessions"""
     
     def __init__(self, db: DatabaseConnection):
@@ -229,16 +700,21 @@ class SessionRepository:
             self.log_error(f"Erro ao criar sessão: {str(e)}", {'session_data': session.to_dict()})
             return None
     
-    def get_active_session(self, lead_id: str) -> Optional[Dict[str, Any]]:
+    def get_active_session(self, lead_id: str, columns: str = SESSION_STATE_COLUMNS) -> Optional[Dict[str, Any]]:
         """Busca sessão ativa do lead"""
         try:
-            result = self.db.table('sessions').select('*').eq('lead_id', lead_id).eq('ativa', True).execute()
+            result = self.db.table('sessions').select(columns).eq('lead_id', lead_id).eq('ativa', True).execute()
             return result.data[0] if result.data else None
         except Exception as e:
             self.log_error(f"Erro ao buscar sessão ativa: {str(e)}", {'lead_id': lead_id})
             return None
     
-    def get_recent_session(self, lead_id: str, seconds: int = 30) -> Optional[Dict[str, Any]]:
+    def get_recent_session(
+        self,
+        lead_id: str,
+        seconds: int = 30,
+        columns: str = SESSION_COLUMNS.slim,
+    ) -> Optional[Dict[str, Any]]:
         """Busca sessão criada recentemente para o lead (nos últimos X segundos)"""
         try:
             from datetime import datetime, timedelta
@@ -247,18 +723,23 @@ class SessionRepository:
             time_limit = datetime.now() - timedelta(seconds=seconds)
             time_limit_str = time_limit.isoformat()
             
-            result = self.db.table('sessions').select('*').eq('lead_id', lead_id).gte('created_at', time_limit_str).order('created_at', desc=True).execute()
+            result = self.db.table('sessions').select(columns).eq('lead_id', lead_id).gte('created_at', time_limit_str).order('created_at', desc=True).execute()
             return result.data[0] if result.data else None
         except Exception as e:
             self.log_error(f"Erro ao buscar sessão recente: {str(e)}", {'lead_id': lead_id})
             return None
     
-    def get_sessions_by_lead_id(self, lead_id: str, limit: int = 10) -> List[Dict[str, Any]]:
+    def get_sessions_by_lead_id(
+        self,
+        lead_id: str,
+        limit: int = 10,
+        columns: str = SESSION_COLUMNS.slim,
+    ) -> List[Dict[str, Any]]:
         """Busca sessoes de um lead ordenadas pela data mais recente."""
         try:
             query = (
                 self.db.table('sessions')
-                .select('*')
+                .select(columns)
                 .eq('lead_id', lead_id)
                 .order('created_at', desc=True)
             )
@@ -270,38 +751,41 @@ class SessionRepository:
             self.log_error(f"Erro ao buscar sessoes do lead: {str(e)}", {'lead_id': lead_id})
             return []
 
-    def get_session(self, session_id: str) -> Optional[Dict[str, Any]]:
+    def get_session(self, session_id: str, columns: str = SESSION_COLUMNS.full) -> Optional[Dict[str, Any]]:
         """Busca uma sessão pelo ID"""
         try:
-            result = self.db.table('sessions').select('*').eq('id', session_id).execute()
+            result = self.db.table('sessions').select(columns).eq('id', session_id).execute()
             return result.data[0] if result.data else None
         except Exception as e:
             self.log_error(f"Erro ao buscar sessão: {str(e)}", {'session_id': session_id})
             return None
 
+    def iter_sessions_by_lead_id(
+        self,
+        lead_id: str,
+        columns: str = SESSION_COLUMNS.slim,
+        page_size: int = DEFAULT_PAGE_SIZE,
+    ) -> Iterator[Dict[str, Any]]:
+        """Itera as sessões de um lead da mais recente para a mais antiga"""
+        return _keyset_pages(
+            lambda cols: self.db.table('sessions').select(cols).eq('lead_id', lead_id),
+            columns,
+            page_size,
+            desc=True,
+            on_error=lambda e: self.log_error(f"Erro ao paginar sessoes do lead: {str(e)}", {'lead_id': lead_id}),
+        )
+
     def update_session(self, session_id: str, updates: Dict[str, Any]) -> bool:
         """Atualiza uma sessão"""
         try:
-            result = self.db.table('sessions').update(updates).eq('id', session_id).execute()
-            return len(result.data) > 0
+            result = self.db.table('sessions').update(updates, **UPDATE_OPTIONS).eq('id', session_id).execute()
+            return _rows_affected(result) > 0
         except Exception as e:
             self.log_error(f"Erro ao atualizar sessão: {str(e)}", {'session_id': session_id, 'updates': updates})
             return False
-    
-    def log_error(self, evento: str, detalhes: Dict[str, Any] = None):
-        """Log de erro interno"""
-        try:
-            log = SystemLog(
-                nivel='ERROR',
-                evento=evento,
-                detalhes=detalhes or {}
-            )
-            self.db.table('system_logs').insert(log.to_dict()).execute()
-        except:
-            pass
 
 
-class MessageRepository:
+class MessageRepository(ErrorLoggingRepository):
     """Repository para operações com Messages"""
     
     def __init__(self, db: DatabaseConnection):
@@ -316,42 +800,102 @@ class MessageRepository:
             self.log_error(f"Erro ao criar mensagem: {str(e)}", {'message_data': message.to_dict()})
             return None
     
-    def get_session(self, session_id: str) -> Optional[Dict[str, Any]]:
+    def create_many(self, messages: List[Message], chunk_size: int = BULK_CHUNK_ROWS) -> BulkResult:
+        """Insere várias mensagens em lotes"""
+        return _bulk_write(
+            self.db, 'messages', [m.to_dict() for m in messages],
+            chunk_rows=chunk_size, log_error=self.log_error,
+        )
+
+    def get_session(self, session_id: str, columns: str = SESSION_COLUMNS.full) -> Optional[Dict[str, Any]]:
         """Busca uma sessão pelo ID"""
         try:
-            result = self.db.table('sessions').select('*').eq('id', session_id).execute()
+            result = self.db.table('sessions').select(columns).eq('id', session_id).execute()
             return result.data[0] if result.data else None
         except Exception as e:
             self.log_error(f"Erro ao buscar sessão: {str(e)}", {'session_id': session_id})
             return None
 
-    def get_session_messages(self, session_id: str) -> List[Dict[str, Any]]:
+    def get_session_messages(self, session_id: str, columns: str = MESSAGE_COLUMNS.slim) -> List[Dict[str, Any]]:
         """Busca mensagens de uma sessão"""
         try:
-            result = self.db.table('messages').select('*').eq('session_id', session_id).order('created_at').execute()
+            result = (
+                self.db.table('messages').select(columns).eq('session_id', session_id).order('created_at').execute()
+            )
             return result.data or []
         except Exception as e:
             self.log_error(f"Erro ao buscar mensagens da sessão: {str(e)}", {'session_id': session_id})
             return []
     
-    def get_messages_by_session(self, session_id: str) -> List[Dict[str, Any]]:
+    def get_messages_by_session(self, session_id: str, columns: str = MESSAGE_COLUMNS.slim) -> List[Dict[str, Any]]:
         """Busca mensagens por sessão (alias para get_session_messages)"""
-        return self.get_session_messages(session_id)
-    
-    def log_error(self, evento: str, detalhes: Dict[str, Any] = None):
-        """Log de erro interno"""
+        return self.get_session_messages(session_id, columns)
+
+    def iter_session_messages(
+        self,
+        session_id: str,
+        columns: str = MESSAGE_COLUMNS.slim,
+        page_size: int = DEFAULT_PAGE_SIZE,
+    ) -> Iterator[Dict[str, Any]]:
+        """Itera as mensagens de uma sessão em ordem cronológica, página a página"""
+        return _keyset_pages(
+            lambda cols: self.db.table('messages').select(cols).eq('session_id', session_id),
+            columns,
+            page_size,
+            on_error=lambda e: self.log_error(f"Erro ao paginar mensagens da sessão: {str(e)}", {'session_id': session_id}),
+        )
+
+    def iter_messages_by_lead(
+        self,
+        lead_id: str,
+        columns: str = MESSAGE_COLUMNS.slim,
+        page_size: int = DEFAULT_PAGE_SIZE,
+    ) -> Iterator[Dict[str, Any]]:
+        """Itera todas as mensagens de um lead em ordem cronológica"""
+        return _keyset_pages(
+            lambda cols: self.db.table('messages').select(cols).eq('lead_id', lead_id),
+            columns,
+            page_size,
+            on_error=lambda e: self.log_error(f"Erro ao paginar mensagens do lead: {str(e)}", {'lead_id': lead_id}),
+        )
+
+    def get_last_session_messages(
+        self,
+        session_id: str,
+        limit: int = 10,
+        columns: str = MESSAGE_COLUMNS.slim,
+    ) -> List[Dict[str, Any]]:
+        """Últimas ``limit`` mensagens da sessão, em ordem cronológica"""
+        return self._get_last_messages('session_id', session_id, limit, columns)
+
+    def get_last_messages_by_lead(
+        self,
+        lead_id: str,
+        limit: int = 10,
+        columns: str = MESSAGE_COLUMNS.slim,
+    ) -> List[Dict[str, Any]]:
+        """Últimas ``limit`` mensagens do lead, em ordem cronológica"""
+        return self._get_last_messages('lead_id', lead_id, limit, columns)
+
+    def _get_last_messages(self, field: str, value: str, limit: int, columns: str) -> List[Dict[str, Any]]:
+        # ORDER BY ... DESC LIMIT n no banco; só inverte as n linhas aqui
         try:
-            log = SystemLog(
-                nivel='ERROR',
-                evento=evento,
-                detalhes=detalhes or {}
+            result = (
+                self.db.table('messages')
+                .select(columns)
+                .eq(field, value)
+                .order('created_at', desc=True)
+                .order('id', desc=True)
+                .limit(limit)
+                .execute()
             )
-            self.db.table('system_logs').insert(log.to_dict()).execute()
-        except:
-            pass
+            return list(reversed(result.data or []))
+        except Exception as e:
+            self.log_error(f"Erro ao buscar últimas mensagens: {str(e)}", {field: value})
+            return []
 
 
-class QualificacaoRepository:
+class QualificacaoRepository(ErrorLoggingRepository):
     """Repository para operações com Qualificações"""
     
     def __init__(self, db: DatabaseConnection):
@@ -369,32 +913,24 @@ class QualificacaoRepository:
     def update_qualificacao(self, qualificacao_id: str, updates: Dict[str, Any]) -> bool:
         """Atualiza uma qualificação"""
         try:
-            result = self.db.table('qualificacoes').update(updates).eq('id', qualificacao_id).execute()
-            return len(result.data) > 0
+            result = self.db.table('qualificacoes').update(updates, **UPDATE_OPTIONS).eq('id', qualificacao_id).execute()
+            return _rows_affected(result) > 0
         except Exception as e:
             self.log_error(f"Erro ao atualizar qualificação: {str(e)}", {'qualificacao_id': qualificacao_id, 'updates': updates})
             return False
     
-    def get_lead_qualificacao(self, lead_id: str) -> Optional[Dict[str, Any]]:
+    def get_lead_qualificacao(
+        self,
+        lead_id: str,
+        columns: str = QUALIFICACAO_COLUMNS.slim,
+    ) -> Optional[Dict[str, Any]]:
         """Busca qualificação de um lead"""
         try:
-            result = self.db.table('qualificacoes').select('*').eq('lead_id', lead_id).execute()
+            result = self.db.table('qualificacoes').select(columns).eq('lead_id', lead_id).execute()
             return result.data[0] if result.data else None
         except Exception as e:
             self.log_error(f"Erro ao buscar qualificação do lead: {str(e)}", {'lead_id': lead_id})
             return None
-    
-    def log_error(self, evento: str, detalhes: Dict[str, Any] = None):
-        """Log de erro interno"""
-        try:
-            log = SystemLog(
-                nivel='ERROR',
-                evento=evento,
-                detalhes=detalhes or {}
-            )
-            self.db.table('system_logs').insert(log.to_dict()).execute()
-        except:
-            pass
 
 
 class SystemLogRepository:
@@ -411,24 +947,28 @@ class SystemLogRepository:
         except Exception:
             return None  # Evita loop infinito
     
-    def get_recent_logs(self, limit: int = 100) -> List[Dict[str, Any]]:
+    def create_many(self, logs: List[SystemLog], chunk_size: int = BULK_CHUNK_ROWS) -> BulkResult:
+        """Insere vários logs em lotes (sem log de erro, evita loop)"""
+        return _bulk_write(self.db, 'system_logs', [log.to_dict() for log in logs], chunk_rows=chunk_size)
+
+    def get_recent_logs(self, limit: int = 100, columns: str = SYSTEM_LOG_COLUMNS.slim) -> List[Dict[str, Any]]:
         """Busca logs recentes"""
         try:
-            result = self.db.table('system_logs').select('*').order('created_at', desc=True).limit(limit).execute()
+            result = self.db.table('system_logs').select(columns).order('created_at', desc=True).limit(limit).execute()
             return result.data or []
         except Exception:
             return []
     
-    def get_error_logs(self, limit: int = 50) -> List[Dict[str, Any]]:
+    def get_error_logs(self, limit: int = 50, columns: str = SYSTEM_LOG_COLUMNS.full) -> List[Dict[str, Any]]:
         """Busca logs de erro"""
         try:
-            result = self.db.table('system_logs').select('*').eq('nivel', 'ERROR').order('created_at', desc=True).limit(limit).execute()
+            result = self.db.table('system_logs').select(columns).eq('nivel', 'ERROR').order('created_at', desc=True).limit(limit).execute()
             return result.data or []
         except Exception:
             return []
 
 
-class ReuniaoRepository:
+class ReuniaoRepository(ErrorLoggingRepository):
     """Repository para operações com Reunioes"""
 
     def __init__(self, db: DatabaseConnection):
@@ -443,10 +983,10 @@ class ReuniaoRepository:
             self.log_error(f"Erro ao criar reunião: {str(e)}", {'reuniao_data': reuniao.to_dict()})
             return None
 
-    def get_reunioes_by_lead(self, lead_id: str) -> List[Dict[str, Any]]:
+    def get_reunioes_by_lead(self, lead_id: str, columns: str = REUNIAO_COLUMNS.slim) -> List[Dict[str, Any]]:
         """Busca reuniões de um lead"""
         try:
-            result = self.db.table('reunioes').select('*').eq('lead_id', lead_id).order('data_agendada').execute()
+            result = self.db.table('reunioes').select(columns).eq('lead_id', lead_id).order('data_agendada').execute()
             return result.data or []
         except Exception as e:
             self.log_error(f"Erro ao buscar reuniões do lead: {str(e)}", {'lead_id': lead_id})
@@ -455,22 +995,8 @@ class ReuniaoRepository:
     def update_reuniao(self, reuniao_id: str, updates: Dict[str, Any]) -> bool:
         """Atualiza uma reunião"""
         try:
-            result = self.db.table('reunioes').update(updates).eq('id', reuniao_id).execute()
-            return len(result.data) > 0
+            result = self.db.table('reunioes').update(updates, **UPDATE_OPTIONS).eq('id', reuniao_id).execute()
+            return _rows_affected(result) > 0
         except Exception as e:
             self.log_error(f"Erro ao atualizar reunião: {str(e)}", {'reuniao_id': reuniao_id, 'updates': updates})
             return False
-
-    def log_error(self, evento: str, detalhes: Dict[str, Any] = None):
-        """Log de erro interno"""
-        try:
-            log = SystemLog(
-                nivel='ERROR',
-                evento=evento,
-                detalhes=detalhes or {}
-            )
-            self.db.table('system_logs').insert(log.to_dict()).execute()
-        except:
-            pass
-
-
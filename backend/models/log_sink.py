@@ -0,0 +1,196 @@
+"""Background sink batching ``system_logs`` inserts off the caller's thread.
+
+Repositories log their own failures to ``system_logs``; doing that inline
+means a degraded Supabase makes every error path pay one more slow round
+trip. The sink buffers records in a bounded queue and a single flusher
+thread writes them in batches, either when ``batch_size`` records are
+waiting or every ``flush_interval`` seconds. When the buffer is full new
+records are dropped (with a sampled 1-in-``sample_every`` replacing the
+oldest, so a long outage still leaves recent traces) and the number lost is
+written as a ``WARNING`` row with the next batch.
+"""
+from __future__ import annotations
+
+import atexit
+import os
+import threading
+import time
+from collections import deque
+from typing import Any, Deque, Dict, List, Optional
+
+import structlog
+
+logger = structlog.get_logger()
+
+DROPPED_EVENT = 'system_logs_descartados'
+
+
+class SystemLogSink:
+    """Bounded, batching writer for ``system_logs`` rows of one client."""
+
+    def __init__(
+        self,
+        client: Any,
+        max_buffer: int = 1000,
+        batch_size: int = 100,
+        flush_interval: float = 2.0,
+        sample_every: int = 10,
+    ) -> None:
+        self.client = client
+        self.max_buffer = max(1, max_buffer)
+        self.batch_size = max(1, batch_size)
+        self.flush_interval = max(0.01, flush_interval)
+        self.sample_every = max(0, sample_every)
+        self._buffer: Deque[Dict[str, Any]] = deque()
+        self._cond = threading.Condition()
+        self._write_lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._pid: Optional[int] = None
+        self._stopped = False
+        self._overflow = 0
+        self._unreported_drops = 0
+        self.submitted = 0
+        self.dropped = 0
+        self.written = 0
+        self.failed = 0
+        self.batches = 0
+
+    def submit(self, record: Dict[str, Any]) -> bool:
+        """Queue one row; never blocks. Returns False when the row was dropped."""
+        with self._cond:
+            self._ensure_started()
+            self.submitted += 1
+            if len(self._buffer) >= self.max_buffer:
+                self._overflow += 1
+                self.dropped += 1
+                self._unreported_drops += 1
+                if not self.sample_every or self._overflow % self.sample_every:
+                    return False
+                # Sampled: the newest record takes the place of the oldest
+                self._buffer.popleft()
+            self._buffer.append(record)
+            if len(self._buffer) >= self.batch_size:
+                self._cond.notify()
+            return True
+
+    def flush(self) -> int:
+        """Write everything buffered from the calling thread; returns rows written."""
+        written = 0
+        with self._write_lock:
+            while True:
+                with self._cond:
+                    batch = self._take_batch()
+                if not batch:
+                    return written
+                written += self._write(batch)
+
+    def close(self) -> None:
+        with self._cond:
+            self._stopped = True
+            self._cond.notify_all()
+        self.flush()
+
+    def pending(self) -> int:
+        with self._cond:
+            return len(self._buffer)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._cond:
+            return {
+                'pending': len(self._buffer),
+                'max_buffer': self.max_buffer,
+                'submitted': self.submitted,
+                'written': self.written,
+                'dropped': self.dropped,
+                'failed': self.failed,
+                'batches': self.batches,
+            }
+
+    def _ensure_started(self) -> None:
+        # Called with ``_cond`` held; a forked gunicorn worker starts its own flusher.
+        pid = os.getpid()
+        if self._stopped or (self._pid == pid and self._thread and self._thread.is_alive()):
+            return
+        self._pid = pid
+        self._thread = threading.Thread(target=self._run, name="SystemLogSink", daemon=True)
+        self._thread.start()
+
+    def _run(self) -> None:
+        while True:
+            with self._cond:
+                deadline = time.monotonic() + self.flush_interval
+                while not self._stopped and len(self._buffer) < self.batch_size:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(timeout=remaining)
+                if self._stopped:
+                    return
+            with self._write_lock:
+                with self._cond:
+                    batch = self._take_batch()
+                if batch:
+                    self._write(batch)
+
+    def _take_batch(self) -> List[Dict[str, Any]]:
+        # Called with ``_cond`` held
+        batch = [self._buffer.popleft() for _ in range(min(self.batch_size, len(self._buffer)))]
+        if self._unreported_drops:
+            batch.append({
+                'nivel': 'WARNING',
+                'evento': DROPPED_EVENT,
+                'detalhes': {'descartados': self._unreported_drops, 'buffer': self.max_buffer},
+            })
+            self._unreported_drops = 0
+        return batch
+
+    def _write(self, batch: List[Dict[str, Any]]) -> int:
+        # Called with ``_write_lock`` held. A failed batch is not retried:
+        # the database is what is failing, and the error rows can be lost.
+        try:
+            self.client.table('system_logs').insert(batch).execute()
+        except Exception as exc:  # pylint: disable=broad-except
+            with self._cond:
+                self.failed += len(batch)
+            logger.warning("Falha ao gravar lote de system_logs", linhas=len(batch), error=str(exc))
+            return 0
+        with self._cond:
+            self.written += len(batch)
+            self.batches += 1
+        return len(batch)
+
+
+_sinks: Dict[int, SystemLogSink] = {}
+_sinks_lock = threading.Lock()
+
+
+def get_log_sink(client: Any) -> SystemLogSink:
+    """Shared sink for ``client`` (one per Supabase client, configured by env)."""
+    with _sinks_lock:
+        sink = _sinks.get(id(client))
+        if sink is None or sink.client is not client:
+            sink = SystemLogSink(
+                client,
+                max_buffer=int(os.getenv('SYSTEM_LOG_BUFFER', '1000')),
+                batch_size=int(os.getenv('SYSTEM_LOG_BATCH_SIZE', '100')),
+                flush_interval=float(os.getenv('SYSTEM_LOG_FLUSH_SECONDS', '2')),
+                sample_every=int(os.getenv('SYSTEM_LOG_SAMPLE_EVERY', '10')),
+            )
+            _sinks[id(client)] = sink
+        return sink
+
+
+def log_sink_stats() -> List[Dict[str, Any]]:
+    with _sinks_lock:
+        sinks = list(_sinks.values())
+    return [sink.stats() for sink in sinks]
+
+
+def flush_all_log_sinks() -> None:
+    with _sinks_lock:
+        sinks = list(_sinks.values())
+    for sink in sinks:
+        sink.flush()
+
+
+atexit.register(flush_all_log_sinks)
@@ -0,0 +1,522 @@
+"""Embedded SQLite backend behind the Supabase query-builder interface.
+
+``SQLiteClient`` answers the subset of ``supabase.Client`` the repositories
+use (``table().select().eq()...execute()``, inserts, upserts, updates,
+deletes, ``or_`` filters, ``order``/``limit`` and ``rpc``), so every
+repository in ``database_models`` runs unchanged on a local WAL-mode file
+created from ``database/schema_sqlite.sql``. Selected with
+``DATABASE_BACKEND=sqlite``; meant for offline runs, load tests and
+single-node deployments.
+
+The three functions of ``database/schema.sql`` used by the webhook
+(``obter_ou_criar_lead_sessao``, ``carregar_contexto_inbound``,
+``aplicar_inbound``) are implemented in Python and run inside one
+``BEGIN IMMEDIATE`` transaction, which also serialises concurrent
+get-or-create calls across processes.
+"""
+from __future__ import annotations
+
+import json
+import os
+import sqlite3
+import threading
+import uuid
+from contextlib import contextmanager
+from dataclasses import dataclass
+from datetime import date, datetime, timezone
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+from backend.models.database_models import LEAD_COLUMNS, SESSION_STATE_COLUMNS
+
+DEFAULT_SCHEMA_PATH = os.path.join(os.path.dirname(__file__), '..', '..', 'database', 'schema_sqlite.sql')
+
+Filter = Tuple[str, str, Any]
+
+
+class SQLiteAPIError(Exception):
+    """Raised where PostgREST would answer with an error (same wording where the code checks it)."""
+
+
+@dataclass
+class SQLiteResponse:
+    data: Any
+    count: Optional[int] = None
+
+
+def _utcnow() -> str:
+    # Fixed-width microseconds so timestamps sort as text
+    return datetime.now(timezone.utc).strftime('%Y-%m-%dT%H:%M:%S.%f+00:00')
+
+
+def _split_top_level(expr: str) -> List[str]:
+    parts, depth, quoted, current = [], 0, False, ''
+    for char in expr:
+        if char == '"':
+            quoted = not quoted
+        elif not quoted and char == '(':
+            depth += 1
+        elif not quoted and char == ')':
+            depth -= 1
+        elif not quoted and char == ',' and depth == 0:
+            parts.append(current)
+            current = ''
+            continue
+        current += char
+    parts.append(current)
+    return parts
+
+
+def parse_logic_filter(expr: str) -> List[Filter]:
+    """Parse PostgREST ``or=(...)`` terms such as ``a.gt.1,and(a.eq.1,b.gt.2)``."""
+    terms: List[Filter] = []
+    for part in _split_top_level(expr):
+        if part.startswith('and(') and part.endswith(')'):
+            terms.append(('and', '', parse_logic_filter(part[4:-1])))
+            continue
+        column, op, value = part.split('.', 2)
+        terms.append((op, column, value.strip('"')))
+    return terms
+
+
+class SQLiteQuery:
+    """Chainable query against one table; compiled to SQL on ``execute()``."""
+
+    def __init__(self, client: 'SQLiteClient', table: str) -> None:
+        self.client = client
+        self.table = table
+        self.op = 'select'
+        self.columns = '*'
+        self.values: Any = None
+        self.on_conflict: Optional[str] = None
+        self.ignore_duplicates = False
+        self.filters: List[Filter] = []
+        self.ordering: List[Tuple[str, bool]] = []
+        self.row_limit: Optional[int] = None
+        self.count: Optional[Any] = None
+        self.minimal = False
+
+    # Operations --------------------------------------------------------
+    def select(self, columns: str = '*', count: Optional[Any] = None) -> 'SQLiteQuery':
+        self.op, self.columns, self.count = 'select', columns, count
+        return self
+
+    def insert(self, values: Any, **_: Any) -> 'SQLiteQuery':
+        self.op, self.values = 'insert', values
+        return self
+
+    def upsert(
+        self,
+        values: Any,
+        on_conflict: Optional[str] = None,
+        ignore_duplicates: bool = False,
+        **_: Any,
+    ) -> 'SQLiteQuery':
+        self.op, self.values, self.on_conflict = 'upsert', values, on_conflict
+        self.ignore_duplicates = ignore_duplicates
+        return self
+
+    def update(self, values: Dict[str, Any], count: Any = None, returning: Any = None) -> 'SQLiteQuery':
+        self.op, self.values, self.count = 'update', values, count
+        self.minimal = getattr(returning, 'value', returning) == 'minimal'
+        return self
+
+    def delete(self, **_: Any) -> 'SQLiteQuery':
+        self.op = 'delete'
+        return self
+
+    # Filters -----------------------------------------------------------
+    def eq(self, column: str, value: Any) -> 'SQLiteQuery':
+        self.filters.append(('eq', column, value))
+        return self
+
+    def neq(self, column: str, value: Any) -> 'SQLiteQuery':
+        self.filters.append(('neq', column, value))
+        return self
+
+    def gt(self, column: str, value: Any) -> 'SQLiteQuery':
+        self.filters.append(('gt', column, value))
+        return self
+
+    def gte(self, column: str, value: Any) -> 'SQLiteQuery':
+        self.filters.append(('gte', column, value))
+        return self
+
+    def lt(self, column: str, value: Any) -> 'SQLiteQuery':
+        self.filters.append(('lt', column, value))
+        return self
+
+    def lte(self, column: str, value: Any) -> 'SQLiteQuery':
+        self.filters.append(('lte', column, value))
+        return self
+
+    def in_(self, column: str, values: List[Any]) -> 'SQLiteQuery':
+        self.filters.append(('in', column, list(values)))
+        return self
+
+    def or_(self, filters: str) -> 'SQLiteQuery':
+        self.filters.append(('or', '', parse_logic_filter(filters)))
+        return self
+
+    def order(self, column: str, desc: bool = False) -> 'SQLiteQuery':
+        self.ordering.append((column, desc))
+        return self
+
+    def limit(self, size: int) -> 'SQLiteQuery':
+        self.row_limit = size
+        return self
+
+    def execute(self) -> SQLiteResponse:
+        return self.client.run_query(self)
+
+
+class SQLiteRpc:
+    def __init__(self, client: 'SQLiteClient', name: str, params: Dict[str, Any]) -> None:
+        self.client = client
+        self.name = name
+        self.params = params
+
+    def execute(self) -> SQLiteResponse:
+        return self.client.run_rpc(self.name, self.params)
+
+
+RpcHandler = Callable[['SQLiteClient', Dict[str, Any]], Any]
+
+_SQL_OPERATORS = {'eq': '=', 'neq': '!=', 'gt': '>', 'gte': '>=', 'lt': '<', 'lte': '<='}
+
+
+class SQLiteClient:
+    """Supabase-compatible client over a local SQLite database in WAL mode."""
+
+    def __init__(self, path: str, schema_path: str = DEFAULT_SCHEMA_PATH) -> None:
+        self.path = path
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        self._local = threading.local()
+        conn = self._conn()
+        conn.execute("PRAGMA journal_mode=WAL")
+        with open(schema_path, encoding='utf-8') as handle:
+            conn.executescript(handle.read())
+        self._types: Dict[str, Dict[str, str]] = {}
+        for (table,) in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'").fetchall():
+            info = conn.execute(f'PRAGMA table_xinfo("{table}")').fetchall()
+            self._types[table] = {row[1]: (row[2] or '').upper() for row in info}
+        self.rpcs: Dict[str, RpcHandler] = dict(_RPCS)
+
+    # Supabase client surface ------------------------------------------
+    def table(self, name: str) -> SQLiteQuery:
+        return SQLiteQuery(self, name)
+
+    def rpc(self, name: str, params: Optional[Dict[str, Any]] = None) -> SQLiteRpc:
+        return SQLiteRpc(self, name, params or {})
+
+    def register_rpc(self, name: str, handler: RpcHandler) -> None:
+        self.rpcs[name] = handler
+
+    # Execution ---------------------------------------------------------
+    def run_rpc(self, name: str, params: Dict[str, Any]) -> SQLiteResponse:
+        handler = self.rpcs.get(name)
+        if handler is None:
+            raise SQLiteAPIError(f"function {name} does not exist")
+        with self.transaction():
+            return SQLiteResponse(handler(self, params))
+
+    def run_query(self, query: SQLiteQuery) -> SQLiteResponse:
+        columns = self._table_columns(query.table)
+        if query.op in ('insert', 'upsert'):
+            rows = query.values if isinstance(query.values, list) else [query.values]
+            with self.transaction() as conn:
+                written = [self._write_row(conn, query, columns, row) for row in rows]
+            return SQLiteResponse([row for row in written if row is not None])
+
+        params: List[Any] = []
+        where = self._where(query.table, query.filters, params)
+        conn = self._conn()
+        if query.op == 'update':
+            values = dict(query.values)
+            if 'updated_at' in columns and 'updated_at' not in values:
+                values['updated_at'] = _utcnow()
+            assignments = ', '.join(f'"{self._column(query.table, c)}" = ?' for c in values)
+            set_params = [self._to_db(query.table, c, v) for c, v in values.items()]
+            with self.transaction() as conn:
+                cursor = conn.execute(
+                    f'UPDATE "{query.table}" SET {assignments}{where} RETURNING *', set_params + params
+                )
+                data = [self._from_db(query.table, row) for row in cursor.fetchall()]
+            return SQLiteResponse([] if query.minimal else data, count=len(data) if query.count else None)
+        if query.op == 'delete':
+            with self.transaction() as conn:
+                cursor = conn.execute(f'DELETE FROM "{query.table}"{where} RETURNING *', params)
+                data = [self._from_db(query.table, row) for row in cursor.fetchall()]
+            return SQLiteResponse(data)
+
+        selected = '*'
+        if query.columns.strip() != '*':
+            names = [c.strip() for c in query.columns.split(',') if c.strip()]
+            selected = ', '.join(f'"{self._column(query.table, c)}"' for c in names)
+        sql = f'SELECT {selected} FROM "{query.table}"{where}'
+        if query.ordering:
+            sql += ' ORDER BY ' + ', '.join(
+                f'"{self._column(query.table, c)}" ' + ('DESC NULLS FIRST' if desc else 'ASC NULLS LAST')
+                for c, desc in query.ordering
+            )
+        select_params = list(params)
+        if query.row_limit is not None:
+            sql += ' LIMIT ?'
+            select_params.append(int(query.row_limit))
+        data = [self._from_db(query.table, row) for row in conn.execute(sql, select_params).fetchall()]
+        count = None
+        if query.count:
+            count = conn.execute(f'SELECT COUNT(*) FROM "{query.table}"{where}', params).fetchone()[0]
+        return SQLiteResponse(data, count=count)
+
+    def _write_row(
+        self,
+        conn: sqlite3.Connection,
+        query: SQLiteQuery,
+        columns: Dict[str, str],
+        values: Dict[str, Any],
+    ) -> Optional[Dict[str, Any]]:
+        row = dict(values)
+        row.setdefault('id', str(uuid.uuid4()))
+        for stamp in ('created_at', 'updated_at'):
+            if stamp in columns:
+                row.setdefault(stamp, _utcnow())
+        names = [self._column(query.table, c) for c in row]
+        column_list = ', '.join(f'"{c}"' for c in names)
+        placeholders = ', '.join('?' for _ in names)
+        sql = f'INSERT INTO "{query.table}" ({column_list}) VALUES ({placeholders})'
+        if query.op == 'upsert':
+            key = self._column(query.table, query.on_conflict or 'id')
+            if query.ignore_duplicates:
+                sql += f' ON CONFLICT("{key}") DO NOTHING'
+            else:
+                updates = [c for c in names if c not in (key, 'id', 'created_at')]
+                action = ', '.join(f'"{c}" = excluded."{c}"' for c in updates) or f'"{key}" = excluded."{key}"'
+                sql += f' ON CONFLICT("{key}") DO UPDATE SET {action}'
+        try:
+            stored = conn.execute(
+                sql + ' RETURNING *', [self._to_db(query.table, c, row[c]) for c in names]
+            ).fetchone()
+        except sqlite3.IntegrityError as exc:
+            if 'UNIQUE' in str(exc):
+                # Same wording as PostgREST, which callers match on
+                raise SQLiteAPIError(f"duplicate key value violates unique constraint: {exc}") from exc
+            raise SQLiteAPIError(str(exc)) from exc
+        return self._from_db(query.table, stored) if stored is not None else None
+
+    # SQL helpers -------------------------------------------------------
+    def _table_columns(self, table: str) -> Dict[str, str]:
+        columns = self._types.get(table)
+        if columns is None:
+            raise SQLiteAPIError(f'relation "{table}" does not exist')
+        return columns
+
+    def _column(self, table: str, column: str) -> str:
+        # Identifiers cannot be bound as parameters: only known columns pass
+        if column not in self._table_columns(table):
+            raise SQLiteAPIError(f"column {table}.{column} does not exist")
+        return column
+
+    def _where(self, table: str, filters: List[Filter], params: List[Any]) -> str:
+        clause = self._conditions(table, filters, params, ' AND ')
+        return f' WHERE {clause}' if clause else ''
+
+    def _conditions(self, table: str, filters: List[Filter], params: List[Any], glue: str) -> str:
+        parts = []
+        for op, column, value in filters:
+            if op in ('or', 'and'):
+                parts.append('(' + self._conditions(table, value, params, f' {op.upper()} ') + ')')
+                continue
+            name = f'"{self._column(table, column)}"'
+            if op == 'in':
+                if not value:
+                    parts.append('0')
+                    continue
+                parts.append(f'{name} IN ({", ".join("?" for _ in value)})')
+                params.extend(self._to_db(table, column, v) for v in value)
+            elif op == 'eq' and value is None:
+                parts.append(f'{name} IS NULL')
+            elif op in _SQL_OPERATORS:
+                parts.append(f'{name} {_SQL_OPERATORS[op]} ?')
+                params.append(self._to_db(table, column, value))
+            else:
+                raise SQLiteAPIError(f"operator {op} is not supported")
+        return glue.join(parts)
+
+    def _to_db(self, table: str, column: str, value: Any) -> Any:
+        kind = self._types.get(table, {}).get(column, '')
+        if value is None:
+            return None
+        if kind == 'BOOLEAN':
+            if isinstance(value, str):
+                return 1 if value.lower() == 'true' else 0
+            return 1 if value else 0
+        if kind == 'JSON':
+            return json.dumps(value, default=str)
+        if isinstance(value, datetime):
+            if value.tzinfo is None:
+                value = value.replace(tzinfo=timezone.utc)
+            return value.astimezone(timezone.utc).strftime('%Y-%m-%dT%H:%M:%S.%f+00:00')
+        if isinstance(value, date):
+            return value.isoformat()
+        if isinstance(value, (dict, list)):
+            return json.dumps(value, default=str)
+        return value
+
+    def _from_db(self, table: str, row: sqlite3.Row) -> Dict[str, Any]:
+        types = self._types.get(table, {})
+        data = dict(row)
+        for column, value in data.items():
+            if value is None:
+                continue
+            kind = types.get(column, '')
+            if kind == 'BOOLEAN':
+                data[column] = bool(value)
+            elif kind == 'JSON':
+                data[column] = json.loads(value)
+        return data
+
+    # Connections -------------------------------------------------------
+    def _conn(self) -> sqlite3.Connection:
+        # One connection per thread and per process (never reuse across fork).
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or getattr(self._local, 'pid', None) != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None, check_same_thread=False)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA busy_timeout=30000")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("PRAGMA foreign_keys=ON")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    @contextmanager
+    def transaction(self) -> Iterator[sqlite3.Connection]:
+        """``BEGIN IMMEDIATE`` ... ``COMMIT``; nested calls join the open transaction."""
+        conn = self._conn()
+        if conn.in_transaction:
+            yield conn
+            return
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield conn
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+
+
+# Python versions of the SQL functions in database/schema.sql ----------------
+
+def _pick(row: Optional[Dict[str, Any]], columns: str) -> Optional[Dict[str, Any]]:
+    if row is None:
+        return None
+    return {c: row.get(c) for c in columns.split(',')}
+
+
+def _first(response: SQLiteResponse) -> Optional[Dict[str, Any]]:
+    return response.data[0] if response.data else None
+
+
+def _active_session(client: SQLiteClient, lead_id: str) -> Optional[Dict[str, Any]]:
+    return _first(
+        client.table('sessions').select(SESSION_STATE_COLUMNS).eq('lead_id', lead_id).eq('ativa', True)
+        .order('created_at', desc=True).limit(1).execute()
+    )
+
+
+def _obter_ou_criar_lead_sessao(client: SQLiteClient, params: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    telefone = params['p_telefone']
+    lead = _first(client.table('leads').select(LEAD_COLUMNS.slim).eq('telefone', telefone).execute())
+    lead_created = lead is None
+    if lead is None:
+        lead = _first(client.table('leads').insert({
+            'nome': params.get('p_nome') or 'tudo bem',
+            'telefone': telefone,
+            'canal': params.get('p_canal') or 'whatsapp',
+        }).execute())
+    session = _active_session(client, lead['id'])
+    sessao = params.get('p_sessao')
+    session_created = session is None and sessao is not None
+    if session_created:
+        session = _first(client.table('sessions').insert({
+            'lead_id': lead['id'],
+            'estado': sessao.get('estado') or 'inicio',
+            'contexto': sessao.get('contexto') or {},
+            'ativa': True,
+        }).execute())
+    return {
+        'lead': _pick(lead, LEAD_COLUMNS.slim),
+        'lead_created': lead_created,
+        'session': _pick(session, SESSION_STATE_COLUMNS),
+        'session_created': session_created,
+    }
+
+
+def _carregar_contexto_inbound(client: SQLiteClient, params: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    if not params.get('p_lead_id'):
+        data = _obter_ou_criar_lead_sessao(client, params)
+    else:
+        lead = _first(client.table('leads').select(LEAD_COLUMNS.slim).eq('id', params['p_lead_id']).execute())
+        if lead is None:
+            return None
+        data = {
+            'lead': lead,
+            'lead_created': False,
+            'session': _active_session(client, lead['id']),
+            'session_created': False,
+        }
+    quali = _first(
+        client.table('qualificacoes').select('id').eq('lead_id', data['lead']['id'])
+        .order('created_at', desc=True).limit(1).execute()
+    )
+    return {**data, 'qualificacao': quali}
+
+
+_APPLY_COLUMNS = {
+    'sessions': ('estado', 'contexto', 'ativa'),
+    'leads': ('status', 'processado'),
+    'qualificacoes': ('patrimonio_resposta', 'objetivo_resposta', 'urgencia_resposta', 'resultado', 'observacoes'),
+}
+
+
+def _aplicar_inbound(client: SQLiteClient, params: Dict[str, Any]) -> Dict[str, Any]:
+    payload = params.get('p_payload') or {}
+    if payload.get('messages'):
+        client.table('messages').insert([
+            {**message, 'metadata': message.get('metadata') or {}} for message in payload['messages']
+        ]).execute()
+    for table in ('sessions', 'leads'):
+        for item in payload.get(table) or []:
+            updates = {k: v for k, v in item['updates'].items() if k in _APPLY_COLUMNS[table]}
+            if updates:
+                client.table(table).update(updates).eq('id', item['id']).execute()
+    quali = payload.get('qualificacao')
+    if quali:
+        fields = {k: v for k, v in (quali.get('fields') or {}).items() if k in _APPLY_COLUMNS['qualificacoes']}
+        existing = _first(
+            client.table('qualificacoes').select('id').eq('lead_id', quali['lead_id'])
+            .order('created_at', desc=True).limit(1).execute()
+        )
+        if existing is None:
+            client.table('qualificacoes').insert(
+                {'lead_id': quali['lead_id'], 'session_id': quali['session_id'], **fields}
+            ).execute()
+        elif fields:
+            client.table('qualificacoes').update(fields).eq('id', existing['id']).execute()
+    for reuniao in payload.get('reunioes') or []:
+        client.table('reunioes').insert({
+            'lead_id': reuniao['lead_id'],
+            'data_agendada': reuniao.get('data_agendada'),
+            'status': reuniao.get('status') or 'agendada',
+            'link_reuniao': reuniao.get('link_reuniao'),
+            'observacoes': reuniao.get('observacoes'),
+        }).execute()
+    return {'ok': True}
+
+
+_RPCS: Dict[str, RpcHandler] = {
+    'obter_ou_criar_lead_sessao': _obter_ou_criar_lead_sessao,
+    'carregar_contexto_inbound': _carregar_contexto_inbound,
+    'aplicar_inbound': _aplicar_inbound,
+}
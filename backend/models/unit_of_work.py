@@ -0,0 +1,317 @@
+"""Unit of work batching the database calls made for one inbound message.
+
+``InboundStore.begin()`` returns an ``InboundUnitOfWork`` that loads lead,
+active session and qualificação in one call and stages every write
+(received message, session/lead updates, qualificação upsert, reunião) until
+``flush()``. When the Supabase functions from ``database/schema.sql``
+(``carregar_contexto_inbound`` / ``aplicar_inbound``) are deployed, that is
+two round-trips per message; otherwise it falls back to the repositories.
+With the cached repositories a warm lead skips the load entirely.
+"""
+from __future__ import annotations
+
+import json
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Tuple
+
+import structlog
+
+from backend.models.database_models import (
+    Lead,
+    LeadRepository,
+    Message,
+    MessageRepository,
+    Qualificacao,
+    QualificacaoRepository,
+    Reuniao,
+    ReuniaoRepository,
+    Session,
+    SessionRepository,
+    is_missing_function_error,
+)
+from backend.services.tracing import tracer
+
+logger = structlog.get_logger()
+
+
+@dataclass
+class InboundSnapshot:
+    """State read at the start of an inbound message."""
+
+    lead: Optional[Dict[str, Any]]
+    session: Optional[Dict[str, Any]]
+    qualificacao: Optional[Dict[str, Any]] = None
+    qualificacao_loaded: bool = False
+    lead_created: bool = False
+    session_created: bool = False
+
+
+class InboundStore:
+    """Long-lived entry point holding the repositories and RPC availability."""
+
+    LOAD_RPC = 'carregar_contexto_inbound'
+    FLUSH_RPC = 'aplicar_inbound'
+
+    def __init__(
+        self,
+        lead_repo: LeadRepository,
+        session_repo: SessionRepository,
+        message_repo: MessageRepository,
+        qualificacao_repo: QualificacaoRepository,
+        reuniao_repo: ReuniaoRepository,
+        client: Any = None,
+    ) -> None:
+        self.lead_repo = lead_repo
+        self.session_repo = session_repo
+        self.message_repo = message_repo
+        self.qualificacao_repo = qualificacao_repo
+        self.reuniao_repo = reuniao_repo
+        self.client = client
+        self.rpc_enabled = client is not None and hasattr(client, 'rpc')
+        # Present when the repositories are the write-through cached variants
+        self.lead_cache = getattr(lead_repo, 'cache', None)
+        self.session_cache = getattr(session_repo, 'cache', None)
+
+    def begin(self) -> 'InboundUnitOfWork':
+        return InboundUnitOfWork(self)
+
+    def call_rpc(self, name: str, params: Dict[str, Any]) -> Tuple[bool, Any]:
+        """Run ``name`` and return ``(ok, data)``; ``(False, None)`` without RPCs.
+
+        Only a "function does not exist" error disables RPCs for this process
+        (later messages go straight to the fallback). Any other error (timeout,
+        5xx, reset) is raised: the call may have been applied, so the caller
+        decides whether repeating its work another way is safe.
+        """
+        if not self.rpc_enabled:
+            return False, None
+        try:
+            return True, self.client.rpc(name, params).execute().data
+        except Exception as exc:  # pylint: disable=broad-except
+            if not is_missing_function_error(exc):
+                raise
+            self.rpc_enabled = False
+            logger.warning("Inbound RPC unavailable, using sequential queries", rpc=name, error=str(exc))
+            return False, None
+
+    def try_rpc(self, name: str, params: Dict[str, Any]) -> Tuple[bool, Any]:
+        """``call_rpc`` for idempotent calls: a transient error means falling back this once."""
+        try:
+            return self.call_rpc(name, params)
+        except Exception as exc:  # pylint: disable=broad-except
+            logger.warning("Inbound RPC failed, using sequential queries", rpc=name, error=str(exc))
+            return False, None
+
+
+class InboundUnitOfWork:
+    """Reads and staged writes for a single inbound message."""
+
+    def __init__(self, store: InboundStore) -> None:
+        self.store = store
+        self.snapshot: Optional[InboundSnapshot] = None
+        self._messages: List[Message] = []
+        self._session_updates: Dict[str, Dict[str, Any]] = {}
+        self._lead_updates: Dict[str, Dict[str, Any]] = {}
+        self._qualificacao: Optional[Dict[str, Any]] = None
+        self._reunioes: List[Reuniao] = []
+
+    # Reads -------------------------------------------------------------
+    @tracer.traced('uow.load_by_phone')
+    def load_by_phone(
+        self,
+        telefone: str,
+        nome: str,
+        canal: str = 'whatsapp',
+        new_session: Optional[Session] = None,
+    ) -> InboundSnapshot:
+        """Lead (created when missing), active session and qualificação by phone.
+
+        With ``new_session`` a lead without an active session gets that one,
+        created in the same atomic step (``snapshot.session_created``).
+        """
+        cached = self._snapshot_from_cache(telefone=telefone)
+        if cached is not None:
+            return cached
+        ok, data = self.store.try_rpc(
+            InboundStore.LOAD_RPC,
+            {
+                'p_telefone': telefone,
+                'p_lead_id': None,
+                'p_nome': nome,
+                'p_canal': canal,
+                'p_sessao': {'estado': new_session.estado, 'contexto': new_session.contexto} if new_session else None,
+            },
+        )
+        if ok and data:
+            return self._snapshot_from_rpc(data)
+
+        result = self.store.lead_repo.get_or_create_with_session(
+            Lead(nome=nome, telefone=telefone, canal=canal), new_session, self.store.session_repo
+        ) or {}
+        self.snapshot = InboundSnapshot(
+            lead=result.get('lead'),
+            session=result.get('session'),
+            lead_created=bool(result.get('lead_created')),
+            session_created=bool(result.get('session_created')),
+        )
+        return self.snapshot
+
+    @tracer.traced('uow.load_by_lead')
+    def load_by_lead(self, lead_id: str) -> InboundSnapshot:
+        """Active session and qualificação of a known lead."""
+        cached = self._snapshot_from_cache(lead_id=lead_id)
+        if cached is not None:
+            return cached
+        ok, data = self.store.try_rpc(
+            InboundStore.LOAD_RPC,
+            {'p_telefone': None, 'p_lead_id': lead_id, 'p_nome': None, 'p_canal': None, 'p_sessao': None},
+        )
+        if ok and data:
+            return self._snapshot_from_rpc(data)
+
+        session = self.store.session_repo.get_active_session(lead_id)
+        self.snapshot = InboundSnapshot(lead={'id': lead_id}, session=session)
+        return self.snapshot
+
+    def _snapshot_from_cache(
+        self,
+        telefone: Optional[str] = None,
+        lead_id: Optional[str] = None,
+    ) -> Optional[InboundSnapshot]:
+        store = self.store
+        if store.session_cache is None:
+            return None
+        if telefone is not None:
+            if store.lead_cache is None:
+                return None
+            lead = store.lead_cache.get(telefone)
+            if lead is None:
+                return None
+        else:
+            lead = {'id': lead_id}
+        session = store.session_cache.get(lead['id'])
+        if session is None:
+            return None
+        # qualificação stays unloaded: the flush upserts it without a prior read
+        self.snapshot = InboundSnapshot(lead=lead, session=session)
+        return self.snapshot
+
+    def _snapshot_from_rpc(self, data: Any) -> InboundSnapshot:
+        if isinstance(data, list):
+            data = data[0] if data else {}
+        if isinstance(data, str):
+            data = json.loads(data)
+        self.snapshot = InboundSnapshot(
+            lead=data.get('lead'),
+            session=data.get('session'),
+            qualificacao=data.get('qualificacao'),
+            qualificacao_loaded=True,
+            lead_created=bool(data.get('lead_created')),
+            session_created=bool(data.get('session_created')),
+        )
+        if self.store.lead_cache is not None:
+            self.store.lead_cache.put(self.snapshot.lead)
+        if self.store.session_cache is not None:
+            self.store.session_cache.put(self.snapshot.session)
+        return self.snapshot
+
+    # Staged writes -----------------------------------------------------
+    def add_message(self, message: Message) -> None:
+        self._messages.append(message)
+
+    def update_session(self, session_id: str, updates: Dict[str, Any]) -> None:
+        self._session_updates.setdefault(session_id, {}).update(updates)
+
+    def update_lead(self, lead_id: str, updates: Dict[str, Any]) -> None:
+        self._lead_updates.setdefault(lead_id, {}).update(updates)
+
+    def upsert_qualificacao(self, lead_id: str, session_id: str, fields: Dict[str, Any]) -> None:
+        """Update the lead's qualificação, creating it with ``fields`` if missing."""
+        if self._qualificacao is None:
+            self._qualificacao = {'lead_id': lead_id, 'session_id': session_id, 'fields': {}}
+        self._qualificacao['fields'].update(fields)
+
+    def add_reuniao(self, reuniao: Reuniao) -> None:
+        self._reunioes.append(reuniao)
+
+    @property
+    def pending(self) -> bool:
+        return bool(
+            self._messages or self._session_updates or self._lead_updates
+            or self._qualificacao or self._reunioes
+        )
+
+    # Flush -------------------------------------------------------------
+    @tracer.traced('uow.flush')
+    def flush(self) -> bool:
+        """Persist every staged write (one RPC, or sequential calls as fallback).
+
+        The sequential fallback only runs when the RPC is not deployed: after
+        any other RPC error the writes may already be applied, so the error
+        is raised (staged writes are kept) instead of applying them twice.
+        """
+        if not self.pending:
+            return True
+        payload = self._payload()
+        ok, _ = self.store.call_rpc(InboundStore.FLUSH_RPC, {'p_payload': payload})
+        if ok:
+            self._write_through()
+            self._clear()
+            return True
+        ok = self._flush_sequential()
+        self._clear()
+        return ok
+
+    def _payload(self) -> Dict[str, Any]:
+        return {
+            'messages': [m.to_dict() for m in self._messages],
+            'sessions': [{'id': sid, 'updates': u} for sid, u in self._session_updates.items()],
+            'leads': [{'id': lid, 'updates': u} for lid, u in self._lead_updates.items()],
+            'qualificacao': self._qualificacao,
+            'reunioes': [r.to_dict() for r in self._reunioes],
+        }
+
+    def _write_through(self) -> None:
+        # The RPC bypasses the repositories, so mirror its updates in the caches
+        if self.store.session_cache is not None:
+            for session_id, updates in self._session_updates.items():
+                self.store.session_cache.apply(session_id, updates)
+        if self.store.lead_cache is not None:
+            for lead_id, updates in self._lead_updates.items():
+                self.store.lead_cache.apply(lead_id, updates)
+
+    def _flush_sequential(self) -> bool:
+        store = self.store
+        ok = True
+        for message in self._messages:
+            ok &= store.message_repo.create_message(message) is not None
+        for session_id, updates in self._session_updates.items():
+            ok &= store.session_repo.update_session(session_id, updates)
+        for lead_id, updates in self._lead_updates.items():
+            ok &= store.lead_repo.update_lead(lead_id, updates)
+        if self._qualificacao:
+            ok &= self._upsert_qualificacao_sequential(self._qualificacao)
+        for reuniao in self._reunioes:
+            ok &= store.reuniao_repo.create_reuniao(reuniao) is not None
+        return bool(ok)
+
+    def _upsert_qualificacao_sequential(self, staged: Dict[str, Any]) -> bool:
+        repo = self.store.qualificacao_repo
+        snapshot = self.snapshot
+        if snapshot is not None and snapshot.qualificacao_loaded:
+            registro = snapshot.qualificacao
+        else:
+            registro = repo.get_lead_qualificacao(staged['lead_id'])
+        if registro:
+            return repo.update_qualificacao(registro['id'], staged['fields'])
+        created = repo.create_qualificacao(
+            Qualificacao(lead_id=staged['lead_id'], session_id=staged['session_id'], **staged['fields'])
+        )
+        return created is not None
+
+    def _clear(self) -> None:
+        self._messages.clear()
+        self._session_updates.clear()
+        self._lead_updates.clear()
+        self._qualificacao = None
+        self._reunioes.clear()
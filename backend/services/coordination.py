@@ -0,0 +1,285 @@
+"""Deduplication and per-phone ordering shared by every process of the app.
+
+``InMemoryCoordination`` keeps state in the process (single gunicorn worker).
+``SQLiteCoordination`` keeps it in a SQLite file plus ``flock`` lock files on
+local disk, so several workers on the same machine see the same dedup keys,
+serialize work per phone number and never double-send. Leases pick the one
+process that runs a singleton job (the lead sheet watcher).
+"""
+from __future__ import annotations
+
+import itertools
+import os
+import sqlite3
+import threading
+import time
+import zlib
+from contextlib import contextmanager
+from typing import IO, Dict, Iterator, Optional, Tuple
+
+import structlog
+
+from backend.services.dedup_cache import SlidingTTLCache
+
+try:
+    import fcntl
+    FCNTL_AVAILABLE = True
+except ImportError:  # pragma: no cover - Windows
+    FCNTL_AVAILABLE = False
+
+logger = structlog.get_logger()
+
+
+class CoordinationBackend:
+    """Interface for dedup keys, per-phone locks and send-slot reservation."""
+
+    def claim(self, namespace: str, key: str, ttl_seconds: float) -> bool:
+        """Atomically record ``key``; False if it is already recorded and not expired."""
+        raise NotImplementedError
+
+    def contains(self, namespace: str, key: str) -> bool:
+        raise NotImplementedError
+
+    def release(self, namespace: str, key: str) -> None:
+        """Forget ``key`` (e.g. the send it guarded failed)."""
+        raise NotImplementedError
+
+    def count(self, namespace: str) -> int:
+        raise NotImplementedError
+
+    def recipient_lock(self, telefone: str):
+        """Context manager serializing work for one phone number."""
+        raise NotImplementedError
+
+    def reserve_send_slot(self, telefone: str, earliest: float, spacing: float = 1.0) -> float:
+        """Reserve the next send instant (epoch seconds) for ``telefone``.
+
+        Returns ``max(earliest, previous slot + spacing)``, so replies produced
+        in order by different workers also leave in that order.
+        """
+        raise NotImplementedError
+
+    def acquire_lease(self, name: str) -> bool:
+        """Take (or keep) the lease ``name`` without blocking.
+
+        True while this process holds it; a lease is held until
+        ``release_lease`` or until the holding process exits.
+        """
+        raise NotImplementedError
+
+    def release_lease(self, name: str) -> None:
+        raise NotImplementedError
+
+
+class InMemoryCoordination(CoordinationBackend):
+    """Process-local backend: sliding TTL caches and a striped lock table."""
+
+    def __init__(self, lock_stripes: int = 64, max_entries: int = 100_000) -> None:
+        self.max_entries = max_entries
+        self._caches: Dict[str, SlidingTTLCache] = {}
+        self._caches_lock = threading.Lock()
+        self._stripes = [threading.Lock() for _ in range(max(1, lock_stripes))]
+        self._slots: Dict[str, float] = {}
+        self._slots_lock = threading.Lock()
+
+    def claim(self, namespace: str, key: str, ttl_seconds: float) -> bool:
+        return self._cache(namespace, ttl_seconds).add_if_absent(key, ttl_seconds)
+
+    def contains(self, namespace: str, key: str) -> bool:
+        cache = self._caches.get(namespace)
+        return bool(cache) and key in cache
+
+    def release(self, namespace: str, key: str) -> None:
+        cache = self._caches.get(namespace)
+        if cache is not None:
+            cache.discard(key)
+
+    def count(self, namespace: str) -> int:
+        cache = self._caches.get(namespace)
+        return len(cache) if cache is not None else 0
+
+    @contextmanager
+    def recipient_lock(self, telefone: str) -> Iterator[None]:
+        with self._stripes[zlib.crc32(telefone.encode('utf-8')) % len(self._stripes)]:
+            yield
+
+    def reserve_send_slot(self, telefone: str, earliest: float, spacing: float = 1.0) -> float:
+        with self._slots_lock:
+            previous = self._slots.get(telefone)
+            slot = earliest if previous is None else max(earliest, previous + spacing)
+            self._slots[telefone] = slot
+            if len(self._slots) > 10_000:
+                cutoff = time.time() - 60
+                for phone in [p for p, s in self._slots.items() if s < cutoff]:
+                    del self._slots[phone]
+            return slot
+
+    def acquire_lease(self, name: str) -> bool:
+        # Single process: nobody else can hold it
+        return True
+
+    def release_lease(self, name: str) -> None:
+        pass
+
+    def _cache(self, namespace: str, ttl_seconds: float) -> SlidingTTLCache:
+        cache = self._caches.get(namespace)
+        if cache is None:
+            with self._caches_lock:
+                cache = self._caches.setdefault(namespace, SlidingTTLCache(ttl_seconds, maxsize=self.max_entries))
+        return cache
+
+
+class SQLiteCoordination(CoordinationBackend):
+    """Cross-process backend on a local SQLite file (WAL) and ``flock`` stripes."""
+
+    _SCHEMA = (
+        "CREATE TABLE IF NOT EXISTS dedup_keys ("
+        " namespace TEXT NOT NULL, key TEXT NOT NULL, expires_at REAL NOT NULL,"
+        " PRIMARY KEY (namespace, key))",
+        "CREATE INDEX IF NOT EXISTS idx_dedup_keys_expires ON dedup_keys(expires_at)",
+        "CREATE TABLE IF NOT EXISTS send_slots (telefone TEXT PRIMARY KEY, slot REAL NOT NULL)",
+    )
+
+    def __init__(self, path: str, lock_stripes: int = 64, purge_every: int = 500) -> None:
+        if not FCNTL_AVAILABLE:
+            raise RuntimeError("SQLiteCoordination requer fcntl (Linux/macOS)")
+        self.path = path
+        self.lock_dir = f"{path}.locks"
+        self.lock_stripes = max(1, lock_stripes)
+        self.purge_every = max(1, purge_every)
+        os.makedirs(self.lock_dir, exist_ok=True)
+        self._local = threading.local()
+        self._thread_stripes = [threading.Lock() for _ in range(self.lock_stripes)]
+        self._writes = itertools.count(1)
+        # name -> (pid, open lock file); the flock lives as long as the handle
+        self._leases: Dict[str, Tuple[int, IO[bytes]]] = {}
+        self._leases_lock = threading.Lock()
+        conn = self._conn()
+        conn.execute("PRAGMA journal_mode=WAL")
+        for statement in self._SCHEMA:
+            conn.execute(statement)
+
+    def claim(self, namespace: str, key: str, ttl_seconds: float) -> bool:
+        now = time.time()
+        with self._transaction() as conn:
+            conn.execute(
+                "DELETE FROM dedup_keys WHERE namespace = ? AND key = ? AND expires_at <= ?",
+                (namespace, key, now),
+            )
+            cursor = conn.execute(
+                "INSERT OR IGNORE INTO dedup_keys (namespace, key, expires_at) VALUES (?, ?, ?)",
+                (namespace, key, now + ttl_seconds),
+            )
+            claimed = cursor.rowcount == 1
+        self._maybe_purge()
+        return claimed
+
+    def contains(self, namespace: str, key: str) -> bool:
+        row = self._conn().execute(
+            "SELECT 1 FROM dedup_keys WHERE namespace = ? AND key = ? AND expires_at > ?",
+            (namespace, key, time.time()),
+        ).fetchone()
+        return row is not None
+
+    def release(self, namespace: str, key: str) -> None:
+        with self._transaction() as conn:
+            conn.execute("DELETE FROM dedup_keys WHERE namespace = ? AND key = ?", (namespace, key))
+
+    def count(self, namespace: str) -> int:
+        row = self._conn().execute(
+            "SELECT COUNT(*) FROM dedup_keys WHERE namespace = ? AND expires_at > ?",
+            (namespace, time.time()),
+        ).fetchone()
+        return int(row[0])
+
+    @contextmanager
+    def recipient_lock(self, telefone: str) -> Iterator[None]:
+        stripe = zlib.crc32(telefone.encode('utf-8')) % self.lock_stripes
+        # flock excludes other processes; the stripe lock excludes other
+        # threads of this process without opening one fd per waiter.
+        with self._thread_stripes[stripe]:
+            with open(os.path.join(self.lock_dir, f"stripe-{stripe}.lock"), 'a+b') as handle:
+                fcntl.flock(handle.fileno(), fcntl.LOCK_EX)
+                try:
+                    yield
+                finally:
+                    fcntl.flock(handle.fileno(), fcntl.LOCK_UN)
+
+    def reserve_send_slot(self, telefone: str, earliest: float, spacing: float = 1.0) -> float:
+        with self._transaction() as conn:
+            row = conn.execute("SELECT slot FROM send_slots WHERE telefone = ?", (telefone,)).fetchone()
+            slot = earliest if row is None else max(earliest, row[0] + spacing)
+            conn.execute(
+                "INSERT INTO send_slots (telefone, slot) VALUES (?, ?) "
+                "ON CONFLICT(telefone) DO UPDATE SET slot = excluded.slot",
+                (telefone, slot),
+            )
+        return slot
+
+    def acquire_lease(self, name: str) -> bool:
+        pid = os.getpid()
+        with self._leases_lock:
+            held = self._leases.get(name)
+            if held is not None and held[0] == pid:
+                return True
+            # A handle inherited through fork belongs to the parent's lease
+            handle = open(os.path.join(self.lock_dir, f"lease-{name}.lock"), 'a+b')
+            try:
+                fcntl.flock(handle.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                handle.close()
+                return False
+            self._leases[name] = (pid, handle)
+            return True
+
+    def release_lease(self, name: str) -> None:
+        with self._leases_lock:
+            held = self._leases.get(name)
+            if held is None or held[0] != os.getpid():
+                return
+            del self._leases[name]
+            fcntl.flock(held[1].fileno(), fcntl.LOCK_UN)
+            held[1].close()
+
+    def _maybe_purge(self) -> None:
+        # next() on a count is atomic, unlike += across request threads
+        if next(self._writes) % self.purge_every:
+            return
+        now = time.time()
+        with self._transaction() as conn:
+            conn.execute("DELETE FROM dedup_keys WHERE expires_at <= ?", (now,))
+            conn.execute("DELETE FROM send_slots WHERE slot < ?", (now - 60,))
+
+    def _conn(self) -> sqlite3.Connection:
+        # One connection per thread and per process (never reuse across fork).
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or getattr(self._local, 'pid', None) != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA busy_timeout=30000")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    @contextmanager
+    def _transaction(self) -> Iterator[sqlite3.Connection]:
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield conn
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+
+
+def create_coordination_backend(kind: Optional[str] = None, path: Optional[str] = None) -> CoordinationBackend:
+    """Build the backend selected by ``COORDINATION_BACKEND`` (memory | sqlite)."""
+    kind = (kind or os.getenv('COORDINATION_BACKEND', 'memory')).strip().lower()
+    if kind == 'sqlite':
+        path = path or os.getenv('COORDINATION_SQLITE_PATH', '/tmp/agente_coordination.db')
+        logger.info("Using SQLite coordination backend", path=path)
+        return SQLiteCoordination(path)
+    if kind != 'memory':
+        raise ValueError(f"COORDINATION_BACKEND inválido: {kind}")
+    return InMemoryCoordination()
@@ -0,0 +1,98 @@
+"""Expiring key cache used for message deduplication."""
+from __future__ import annotations
+
+import heapq
+import itertools
+import threading
+import time
+from typing import Callable, Dict, Hashable, List, Optional, Tuple
+
+
+class SlidingTTLCache:
+    """Set-like cache where each key expires a TTL after it was added.
+
+    The TTL defaults to ``ttl_seconds`` and can be given per key. Expiries
+    live in a dict and a min-heap of ``(expires_at, seq, key)``, so purging
+    pops only what actually expired, in O(log n) per entry, regardless of
+    how many entries are cached. Re-adding a key leaves its old heap entry
+    behind; stale entries are skipped when popped and compacted once they
+    outnumber the live ones.
+    """
+
+    def __init__(
+        self,
+        ttl_seconds: float,
+        maxsize: Optional[int] = None,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        self.ttl = float(ttl_seconds)
+        self.maxsize = maxsize
+        self._clock = clock
+        self._entries: Dict[Hashable, float] = {}
+        self._heap: List[Tuple[float, int, Hashable]] = []
+        self._seq = itertools.count()
+        self._lock = threading.Lock()
+
+    def add(self, key: Hashable, ttl_seconds: Optional[float] = None) -> None:
+        """Add ``key``, or restart its expiry if it is already cached."""
+        now = self._clock()
+        with self._lock:
+            self._purge_expired(now)
+            self._set(key, now, ttl_seconds)
+
+    def add_if_absent(self, key: Hashable, ttl_seconds: Optional[float] = None) -> bool:
+        """Atomically add ``key``; returns False if it was already present.
+
+        A present key keeps its original expiry.
+        """
+        now = self._clock()
+        with self._lock:
+            self._purge_expired(now)
+            if key in self._entries:
+                return False
+            self._set(key, now, ttl_seconds)
+            return True
+
+    def discard(self, key: Hashable) -> None:
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def purge_expired(self) -> int:
+        with self._lock:
+            return self._purge_expired(self._clock())
+
+    def __contains__(self, key: Hashable) -> bool:
+        now = self._clock()
+        with self._lock:
+            self._purge_expired(now)
+            return key in self._entries
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._entries)
+
+    def _set(self, key: Hashable, now: float, ttl_seconds: Optional[float]) -> None:
+        expires_at = now + (self.ttl if ttl_seconds is None else float(ttl_seconds))
+        self._entries[key] = expires_at
+        heapq.heappush(self._heap, (expires_at, next(self._seq), key))
+        if self.maxsize is not None:
+            while len(self._entries) > self.maxsize:
+                self._pop_head()
+        if len(self._heap) > 2 * len(self._entries) + 64:
+            self._heap = [(exp, seq, k) for exp, seq, k in self._heap if self._entries.get(k) == exp]
+            heapq.heapify(self._heap)
+
+    def _pop_head(self) -> bool:
+        """Pop the entry that expires first; False if it was stale."""
+        expires_at, _, key = heapq.heappop(self._heap)
+        if self._entries.get(key) != expires_at:
+            return False
+        del self._entries[key]
+        return True
+
+    def _purge_expired(self, now: float) -> int:
+        removed = 0
+        heap = self._heap
+        while heap and heap[0][0] <= now:
+            removed += self._pop_head()
+        return removed
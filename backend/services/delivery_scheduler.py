@@ -0,0 +1,131 @@
+"""Heap-based scheduler for delayed ("send at T") jobs."""
+from __future__ import annotations
+
+import contextvars
+import heapq
+import itertools
+import os
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import structlog
+
+logger = structlog.get_logger()
+
+
+class DeliveryScheduler:
+    """Holds delayed jobs in a min-heap and fires them from a fixed thread set.
+
+    A single timer thread sleeps until the earliest deadline and hands due jobs
+    to a small executor, so thousands of messages can sit in their humanizing
+    delay without one blocked thread each. ``schedule`` returns a ``Future``;
+    when the job itself returns a ``Future`` (e.g. a rescheduled retry) the
+    outer future resolves with the chained result. Jobs run in a copy of the
+    caller's context, so the correlation id of the message travels with them.
+    """
+
+    def __init__(self, workers: int = 4) -> None:
+        self.workers = max(1, workers)
+        self._heap: List[Tuple[float, int, Callable[[], Any], Future]] = []
+        self._cond = threading.Condition()
+        self._seq = itertools.count()
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._timer: Optional[threading.Thread] = None
+        self._pid: Optional[int] = None
+        self._stopped = False
+        self._fired = 0
+
+    def schedule(self, delay: float, fn: Callable[..., Any], *args: Any, **kwargs: Any) -> Future:
+        """Run ``fn(*args, **kwargs)`` after ``delay`` seconds."""
+        return self.schedule_at(time.monotonic() + max(0.0, delay), fn, *args, **kwargs)
+
+    def schedule_at(self, when: float, fn: Callable[..., Any], *args: Any, **kwargs: Any) -> Future:
+        """Run ``fn`` at the ``time.monotonic()`` instant ``when``."""
+        future: Future = Future()
+        context = contextvars.copy_context()
+        job = lambda: context.run(fn, *args, **kwargs)  # noqa: E731
+        with self._cond:
+            self._ensure_started()
+            heapq.heappush(self._heap, (when, next(self._seq), job, future))
+            self._cond.notify()
+        return future
+
+    def pending(self) -> int:
+        with self._cond:
+            return len(self._heap)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._cond:
+            next_due = self._heap[0][0] - time.monotonic() if self._heap else None
+            return {
+                "pending": len(self._heap),
+                "fired": self._fired,
+                "workers": self.workers,
+                "next_due_seconds": round(next_due, 3) if next_due is not None else None,
+            }
+
+    def shutdown(self) -> None:
+        with self._cond:
+            self._stopped = True
+            self._cond.notify_all()
+        if self._executor:
+            self._executor.shutdown(wait=False)
+
+    def _ensure_started(self) -> None:
+        # Called with ``_cond`` held. Threads do not survive a fork, so a
+        # gunicorn worker spawned from a preloaded app starts its own set.
+        pid = os.getpid()
+        if self._pid == pid and self._timer and self._timer.is_alive():
+            return
+        self._pid = pid
+        self._stopped = False
+        self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="DeliveryWorker")
+        self._timer = threading.Thread(target=self._run_timer, name="DeliveryTimer", daemon=True)
+        self._timer.start()
+
+    def _run_timer(self) -> None:
+        while True:
+            with self._cond:
+                while not self._stopped:
+                    if not self._heap:
+                        self._cond.wait()
+                        continue
+                    remaining = self._heap[0][0] - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(timeout=remaining)
+                if self._stopped:
+                    return
+                _, _, job, future = heapq.heappop(self._heap)
+                self._fired += 1
+                executor = self._executor
+            executor.submit(self._execute, job, future)
+
+    @staticmethod
+    def _execute(job: Callable[[], Any], future: Future) -> None:
+        if not future.set_running_or_notify_cancel():
+            return
+        try:
+            result = job()
+        except BaseException as exc:  # pylint: disable=broad-except
+            logger.exception("Scheduled job failed", error=str(exc))
+            future.set_exception(exc)
+            return
+        if isinstance(result, Future):
+            result.add_done_callback(lambda inner: DeliveryScheduler._copy_result(inner, future))
+        else:
+            future.set_result(result)
+
+    @staticmethod
+    def _copy_result(source: Future, target: Future) -> None:
+        exc = source.exception()
+        if exc is not None:
+            target.set_exception(exc)
+        else:
+            target.set_result(source.result())
+
+
+# Instância global do agendador de envios
+delivery_scheduler = DeliveryScheduler(workers=int(os.getenv('DELIVERY_WORKERS', '4')))
@@ -10,6 +10,10 @@ import logging
 from typing import Dict, List, Any, Optional, Tuple
 from datetime import datetime
 
+from backend.models.database_models import Lead
+from backend.services.sheet_batch_writer import SheetBatchWriter, column_index
+from backend.services.sheet_ingestion import IngestionPolicy, SheetIngestionEngine, SheetRow
+
 try:
     from google.auth.transport.requests import Request
     from google.oauth2.service_account import Credentials
@@ -20,6 +24,31 @@ except ImportError:
 
 logger = logging.getLogger(__name__)
 
+
+class _PoliticaEntrada(IngestionPolicy):
+    """Planilha de entrada: coluna ``processado``, nome e telefone obrigatórios,
+    leads já cadastrados não são reprocessados"""
+
+    state_column = 'processado'
+    reuse_existing_leads = False
+
+    def is_pending(self, state: str) -> bool:
+        return state.strip().lower() not in ('true', 'sim', 'x', '1')
+
+    def validate(self, row: SheetRow) -> Optional[str]:
+        if not row.values.get('nome') or not row.telefone:
+            return 'Nome ou telefone em branco'
+        return None
+
+    def new_lead(self, row: SheetRow) -> Lead:
+        return Lead(nome=row.nome, telefone=row.telefone, email=row.values.get('email') or None, canal=row.canal)
+
+    def success_updates(self, row: SheetRow, result: Dict[str, Any]) -> Dict[str, str]:
+        return {'processado': 'TRUE'}
+
+    def failure_updates(self, row: SheetRow, result: Dict[str, Any]) -> Dict[str, str]:
+        return {}
+
 class GoogleSheetsService:
     """Serviço completo para Google Sheets - Entrada e Saída"""
     
@@ -87,30 +116,52 @@ class GoogleSheetsService:
         rows = values[1:] if len(values) > 1 else []
         return headers, rows
 
+    def read_input_rows(self, first_row: int) -> List[List[str]]:
+        """Rows from sheet row ``first_row`` to the end of the input columns.
+
+        Lets the watcher fetch only the tail it has not seen yet instead of
+        the whole range.
+        """
+        if not self.service or not self.input_sheets_id:
+            return []
+        sheet_name, _ = self._parse_input_range()
+        start_col, end_col = self._parse_input_columns()
+        result = self.service.spreadsheets().values().get(
+            spreadsheetId=self.input_sheets_id,
+            range=f"{sheet_name}!{start_col}{first_row}:{end_col}"
+        ).execute()
+        return result.get('values', [])
+
     def update_input_row(
         self,
         row_number: int,
         header: List[str],
         original_row: List[str],
         updates: Dict[str, Any],
-    ) -> None:
-        """Apply updates to a specific row on the input sheet."""
+    ) -> Optional[List[str]]:
+        """Apply updates to a specific row on the input sheet right away.
+
+        Returns the values now in the row (None when the sheet is not
+        configured). For several rows use ``input_writer`` and flush once.
+        """
         if not self.service or not self.input_sheets_id:
-            return
-        row_values = self._expand_row(list(original_row), len(header))
-        for key, value in updates.items():
-            if key in header:
-                idx = header.index(key)
-                row_values[idx] = value
+            return None
+        writer = self.input_writer()
+        row_values = writer.update_row(row_number, header, original_row, updates)
+        result = writer.flush()
+        if result.failed:
+            raise RuntimeError(f"Falha ao atualizar a linha {row_number} da planilha: {result.failed}")
+        return row_values
+
+    def input_writer(self, auto_flush_rows: int = 0) -> SheetBatchWriter:
+        """Batch writer for the input sheet (a no-op writer when not configured)."""
         sheet_name, _ = self._parse_input_range()
-        end_col = chr(ord('A') + len(header) - 1)
-        range_name = f"{sheet_name}!A{row_number}:{end_col}{row_number}"
-        self.service.spreadsheets().values().update(
-            spreadsheetId=self.input_sheets_id,
-            range=range_name,
-            valueInputOption='RAW',
-            body={'values': [row_values]}
-        ).execute()
+        start_col, _ = self._parse_input_columns()
+        api = self.service.spreadsheets() if self.service and self.input_sheets_id else None
+        return SheetBatchWriter(
+            api, self.input_sheets_id, sheet_name,
+            first_column=column_index(start_col), auto_flush_rows=auto_flush_rows,
+        )
 
     def _parse_input_range(self) -> Tuple[str, int]:
         if '!' in self.input_range:
@@ -122,16 +173,29 @@ class GoogleSheetsService:
         start_row = int(digits) if digits else 1
         return sheet_name, start_row
 
-    @staticmethod
-    def _expand_row(row: List[str], size: int) -> List[str]:
-        if len(row) < size:
-            row = row + [''] * (size - len(row))
-        return row
+    def _parse_input_columns(self) -> Tuple[str, str]:
+        """First and last column letters of the input range (``A:E`` -> ``('A', 'E')``)."""
+        cell_range = self.input_range.split('!', 1)[1] if '!' in self.input_range else ''
+        start_cell, _, end_cell = cell_range.partition(':')
+        start_col = ''.join(ch for ch in start_cell if ch.isalpha()).upper() or 'A'
+        end_col = ''.join(ch for ch in end_cell if ch.isalpha()).upper() or 'ZZ'
+        return start_col, end_col
 
     # ========== ENTRADA DE LEADS ==========
     
-    def detectar_novos_leads(self) -> Dict[str, Any]:
-        """Detecta novos leads na planilha de entrada"""
+    def detectar_novos_leads(
+        self,
+        lead_repo: Optional[Any] = None,
+        qualification_service: Optional[Any] = None,
+    ) -> Dict[str, Any]:
+        """Detecta novos leads na planilha de entrada e inicia a qualificação
+
+        As linhas passam pelo ``SheetIngestionEngine`` (o mesmo do watcher)
+        com a política da planilha de entrada: linhas com ``processado``
+        marcado são ignoradas, leads já cadastrados não são reprocessados e
+        as linhas iniciadas são marcadas em lote. Sem ``lead_repo`` /
+        ``qualification_service``, os serviços são montados uma vez por chamada.
+        """
         try:
             if not self.service or not self.input_sheets_id:
                 return {
@@ -141,15 +205,9 @@ class GoogleSheetsService:
                     'processados': 0,
                     'erros': 0
                 }
-            
-            # Ler dados da planilha
-            result = self.service.spreadsheets().values().get(
-                spreadsheetId=self.input_sheets_id,
-                range=self.input_range
-            ).execute()
-            
-            values = result.get('values', [])
-            if not values:
+
+            headers, rows = self.read_input_sheet()
+            if not headers:
                 return {
                     'success': True,
                     'message': 'Nenhum dado encontrado na planilha',
@@ -157,64 +215,27 @@ class GoogleSheetsService:
                     'processados': 0,
                     'erros': 0
                 }
-            
-            # Primeira linha são os cabeçalhos
-            headers = values[0] if values else []
-            leads_data = values[1:] if len(values) > 1 else []
-            
-            novos_leads = 0
-            processados = 0
-            erros = 0
-            detalhes = []
-            
-            for i, row in enumerate(leads_data, start=2):  # Linha 2 em diante
-                try:
-                    # Preencher campos faltantes
-                    while len(row) < len(headers):
-                        row.append('')
-                    
-                    lead_data = dict(zip(headers, row))
-                    
-                    # Verificar se já foi processado
-                    if lead_data.get('processado', '').lower() in ['true', 'sim', 'x', '1']:
-                        continue
-                    
-                    # Validar dados obrigatórios
-                    if not lead_data.get('nome') or not lead_data.get('telefone'):
-                        detalhes.append(f"Linha {i}: Nome ou telefone em branco")
-                        erros += 1
-                        continue
-                    
-                    # Processar lead
-                    resultado = self._processar_lead_entrada(lead_data)
-                    
-                    if resultado['success']:
-                        # Marcar como processado na planilha
-                        self._marcar_lead_processado(i, len(headers))
-                        processados += 1
-                        detalhes.append(f"Lead {lead_data['nome']} processado com sucesso")
-                    else:
-                        erros += 1
-                        detalhes.append(f"Erro ao processar {lead_data['nome']}: {resultado.get('error')}")
-                    
-                    novos_leads += 1
-                    
-                except Exception as e:
-                    logger.error(f"Erro ao processar linha {i}", error=str(e))
-                    erros += 1
-                    detalhes.append(f"Linha {i}: Erro - {str(e)}")
-            
+
+            if lead_repo is None or qualification_service is None:
+                lead_repo, qualification_service = self._servicos_entrada()
+            _, start_row = self._parse_input_range()
+            engine = SheetIngestionEngine(lead_repo, qualification_service, policy=_PoliticaEntrada())
+            report = engine.run(headers, rows, start_row + 1, self.input_writer())
+
+            detalhes = [f"Linha {linha}: {motivo}" for linha, motivo in report.rejected]
+            if report.starts_failed:
+                detalhes.append(f"{report.starts_failed} leads não puderam ser iniciados")
             return {
                 'success': True,
-                'message': f'Processamento concluído',
-                'novos_leads': novos_leads,
-                'processados': processados,
-                'erros': erros,
+                'message': 'Processamento concluído',
+                'novos_leads': report.starts_submitted,
+                'processados': report.starts_done,
+                'erros': len(report.rejected) + report.starts_failed,
                 'detalhes': detalhes
             }
-            
+
         except Exception as e:
-            logger.error("Erro ao detectar novos leads", error=str(e))
+            logger.error("Erro ao detectar novos leads: %s", str(e))
             return {
                 'success': False,
                 'error': str(e),
@@ -222,97 +243,42 @@ class GoogleSheetsService:
                 'processados': 0,
                 'erros': 1
             }
-    
-    def _processar_lead_entrada(self, lead_data: Dict[str, Any]) -> Dict[str, Any]:
-        """Processa um lead da planilha de entrada"""
-        try:
-            from backend.models.database_models import DatabaseConnection, LeadRepository, Lead
-            from backend.services.qualification_service import QualificationService
-            from backend.services.whatsapp_service import WhatsAppService
-            from backend.models.database_models import (
-                SessionRepository, MessageRepository, QualificacaoRepository
-            )
-            from backend.services.messaging_service import MessagingService
-            
-            # Inicializar repositórios
-            db_conn = DatabaseConnection()
-            lead_repo = LeadRepository(db_conn)
-            session_repo = SessionRepository(db_conn)
-            message_repo = MessageRepository(db_conn)
-            qualificacao_repo = QualificacaoRepository(db_conn)
-            
-            # Inicializar serviços
-            whatsapp_service = WhatsAppService()
-            messaging_service = MessagingService(whatsapp_service, message_repo)
-            qualification_service = QualificationService(
-                lead_repo,
-                session_repo,
-                message_repo,
-                qualificacao_repo,
-                messaging_service,
-                whatsapp_service,
-            )
-
-            # Verificar se lead já existe
-            existing_lead = lead_repo.get_lead_by_phone(lead_data['telefone'])
-            if existing_lead:
-                return {
-                    'success': False,
-                    'error': 'Lead já existe no sistema'
-                }
-            
-            # Criar lead
-            novo_lead = Lead(
-                nome=lead_data['nome'],
-                telefone=lead_data['telefone'],
-                email=lead_data.get('email', ''),
-                canal=lead_data.get('canal', 'planilha'),
-            )
-            created_lead = lead_repo.create_lead(novo_lead)
 
-            if not created_lead:
-                return {
-                    'success': False,
-                    'error': 'Erro ao criar lead no banco'
-                }
+    @staticmethod
+    def _servicos_entrada() -> Tuple[Any, Any]:
+        """Repositório de leads e serviço de qualificação para ``detectar_novos_leads``"""
+        from backend.models.database_models import (
+            DatabaseConnection,
+            LeadRepository,
+            MessageRepository,
+            QualificacaoRepository,
+            ReuniaoRepository,
+            SessionRepository,
+        )
+        from backend.services.messaging_service import MessagingService
+        from backend.services.qualification_service import QualificationService
+        from backend.services.whatsapp_service import WhatsAppService
 
-            lead_id = created_lead['id']
+        db_conn = DatabaseConnection()
+        lead_repo = LeadRepository(db_conn)
+        message_repo = MessageRepository(db_conn)
+        whatsapp_service = WhatsAppService()
+        qualification_service = QualificationService(
+            lead_repo=lead_repo,
+            session_repo=SessionRepository(db_conn),
+            message_repo=message_repo,
+            qualificacao_repo=QualificacaoRepository(db_conn),
+            reuniao_repo=ReuniaoRepository(db_conn),
+            # Espera a entrega: fora do servidor o processo pode terminar antes
+            # de o agendador (threads daemon) disparar a mensagem inicial
+            messaging_service=MessagingService(
+                whatsapp_service, message_repo,
+                delivery_timeout=float(os.getenv('SHEET_DELIVERY_TIMEOUT_SECONDS', '120')),
+            ),
+            whatsapp_service=whatsapp_service,
+        )
+        return lead_repo, qualification_service
 
-            # Iniciar qualificação via WhatsApp
-            resultado = qualification_service.iniciar_qualificacao(
-                lead_id=lead_id,
-                telefone=lead_data['telefone'],
-                nome=lead_data.get('nome'),
-                origem_canal=lead_data.get('canal', 'planilha'),
-                contexto_extra=lead_data.get('contexto')
-            )
-            
-            return resultado
-            
-        except Exception as e:
-            logger.error("Erro ao processar lead de entrada", error=str(e))
-            return {
-                'success': False,
-                'error': str(e)
-            }
-    
-    def _marcar_lead_processado(self, linha: int, num_colunas: int):
-        """Marca lead como processado na planilha"""
-        try:
-            # Coluna E (índice 4) para marcar como processado
-            coluna_processado = chr(ord('A') + min(4, num_colunas - 1))
-            range_update = f"{coluna_processado}{linha}"
-            
-            self.service.spreadsheets().values().update(
-                spreadsheetId=self.input_sheets_id,
-                range=range_update,
-                valueInputOption='RAW',
-                body={'values': [['TRUE']]}
-            ).execute()
-            
-        except Exception as e:
-            logger.error(f"Erro ao marcar linha {linha} como processada", error=str(e))
-    
     # ========== SAÍDA PARA CRM ==========
     
     def enviar_resultado_crm(self, lead_data: Dict[str, Any]) -> Dict[str, Any]:
@@ -362,14 +328,14 @@ class GoogleSheetsService:
             db_conn = DatabaseConnection()
             message_repo = MessageRepository(db_conn)
             
-            # Buscar mensagens da sessão
-            mensagens = message_repo.get_messages_by_lead(lead_id)
+            # Últimas 10 mensagens (limite e ordenação feitos no banco)
+            mensagens = message_repo.get_last_messages_by_lead(lead_id, limit=10)
             
             if not mensagens:
                 return "Nenhuma conversa registrada"
             
             resumo_parts = []
-            for msg in mensagens[-10:]:  # Últimas 10 mensagens
+            for msg in mensagens:
                 tipo = "Lead" if msg['tipo'] == 'recebida' else "Agente"
                 conteudo = msg['conteudo'][:100]  # Primeiros 100 chars
                 resumo_parts.append(f"{tipo}: {conteudo}")
@@ -0,0 +1,138 @@
+"""Shared keep-alive HTTP session for WAHA with connection reuse counters."""
+from __future__ import annotations
+
+import os
+import threading
+from typing import Any, Dict, Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+
+
+class _ConnectionCounters:
+    """Thread-safe counters for requests issued versus connections opened."""
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.connections_created = 0
+
+    def add_request(self) -> None:
+        with self._lock:
+            self.requests += 1
+
+    def add_connection(self) -> None:
+        with self._lock:
+            self.connections_created += 1
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            reused = max(0, self.requests - self.connections_created)
+            return {
+                "requests": self.requests,
+                "connections_created": self.connections_created,
+                "connections_reused": reused,
+                "reuse_ratio": round(reused / self.requests, 4) if self.requests else 0.0,
+            }
+
+
+def _counting_pool(base: type, counters: _ConnectionCounters) -> type:
+    class CountingPool(base):  # type: ignore[misc, valid-type]
+        def _new_conn(self):  # pylint: disable=invalid-name
+            counters.add_connection()
+            return super()._new_conn()
+
+    CountingPool.__name__ = f"Counting{base.__name__}"
+    return CountingPool
+
+
+class PooledHTTPAdapter(HTTPAdapter):
+    """HTTPAdapter whose connection pools report every new TCP/TLS connection."""
+
+    def __init__(self, counters: _ConnectionCounters, **kwargs: Any) -> None:
+        self.counters = counters
+        super().__init__(**kwargs)
+
+    def init_poolmanager(self, *args: Any, **kwargs: Any) -> None:
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            "http": _counting_pool(HTTPConnectionPool, self.counters),
+            "https": _counting_pool(HTTPSConnectionPool, self.counters),
+        }
+
+    def send(self, request, **kwargs):  # pylint: disable=arguments-differ
+        self.counters.add_request()
+        return super().send(request, **kwargs)
+
+
+class PooledHTTPClient:
+    """``requests.Session`` with a bounded keep-alive pool per host.
+
+    ``pool_connections`` is how many hosts keep a pool, ``pool_maxsize`` the
+    number of idle keep-alive connections kept per host. With ``pool_block``
+    the per-host limit is enforced: callers wait for a free connection instead
+    of opening extra ones that would be discarded.
+    """
+
+    def __init__(
+        self,
+        pool_connections: int = 4,
+        pool_maxsize: int = 16,
+        pool_block: bool = True,
+        default_timeout: float = 30.0,
+    ) -> None:
+        self.pool_connections = pool_connections
+        self.pool_maxsize = pool_maxsize
+        self.default_timeout = default_timeout
+        self.counters = _ConnectionCounters()
+        self.session = requests.Session()
+        adapter = PooledHTTPAdapter(
+            self.counters,
+            pool_connections=pool_connections,
+            pool_maxsize=pool_maxsize,
+            pool_block=pool_block,
+            max_retries=0,
+        )
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    def get(self, url: str, **kwargs: Any) -> requests.Response:
+        kwargs.setdefault("timeout", self.default_timeout)
+        return self.session.get(url, **kwargs)
+
+    def post(self, url: str, **kwargs: Any) -> requests.Response:
+        kwargs.setdefault("timeout", self.default_timeout)
+        return self.session.post(url, **kwargs)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "pool_connections": self.pool_connections,
+            "pool_maxsize": self.pool_maxsize,
+            **self.counters.snapshot(),
+        }
+
+    def close(self) -> None:
+        self.session.close()
+
+
+_waha_client: Optional[PooledHTTPClient] = None
+_waha_client_pid: Optional[int] = None
+_waha_client_lock = threading.Lock()
+
+
+def get_waha_http_client() -> PooledHTTPClient:
+    """Process-wide pooled client shared by every WAHA call.
+
+    Recreated after a fork so gunicorn workers never share sockets opened by
+    the preloading master.
+    """
+    global _waha_client, _waha_client_pid  # pylint: disable=global-statement
+    with _waha_client_lock:
+        if _waha_client is None or _waha_client_pid != os.getpid():
+            _waha_client_pid = os.getpid()
+            _waha_client = PooledHTTPClient(
+                pool_connections=int(os.getenv('WAHA_POOL_CONNECTIONS', '4')),
+                pool_maxsize=int(os.getenv('WAHA_POOL_MAXSIZE', '16')),
+            )
+        return _waha_client
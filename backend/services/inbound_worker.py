@@ -0,0 +1,170 @@
+"""Background worker pool that drains inbound webhook messages."""
+from __future__ import annotations
+
+import contextvars
+import math
+import os
+import queue
+import threading
+import time
+import zlib
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Optional
+
+import structlog
+
+logger = structlog.get_logger()
+
+
+@dataclass
+class InboundJob:
+    """Inbound message waiting to be processed by the pool.
+
+    ``context`` is the submitter's context (correlation id, trace spans); the
+    worker runs the handler inside it.
+    """
+
+    telefone: str
+    payload: Any
+    enqueued_at: float = field(default_factory=time.monotonic)
+    context: contextvars.Context = field(default_factory=contextvars.copy_context, repr=False)
+
+
+class InboundWorkerPool:
+    """Processes inbound messages off the request thread.
+
+    Every phone number is pinned to a single shard (stable hash of the number),
+    so messages from the same lead run sequentially and in arrival order while
+    different leads are processed in parallel.
+    """
+
+    def __init__(
+        self,
+        handler: Callable[[InboundJob], Any],
+        workers: int = 4,
+        max_queue_size: int = 1000,
+    ) -> None:
+        self.handler = handler
+        self.workers = max(1, workers)
+        self.max_queue_size = max(self.workers, max_queue_size)
+        per_shard = math.ceil(self.max_queue_size / self.workers)
+        self._shards: List[queue.Queue] = [queue.Queue(maxsize=per_shard) for _ in range(self.workers)]
+        self._threads: List[threading.Thread] = []
+        self._stop_event = threading.Event()
+        self._start_lock = threading.Lock()
+        self._pid: Optional[int] = None
+        self._stats_lock = threading.Lock()
+        self._counters = {
+            "enqueued": 0,
+            "processed": 0,
+            "failed": 0,
+            "rejected": 0,
+        }
+        self._lag_last = 0.0
+        self._lag_max = 0.0
+        self._lag_total = 0.0
+
+    def start(self) -> None:
+        """Start worker threads (idempotent and fork-safe)."""
+        with self._start_lock:
+            pid = os.getpid()
+            if self._pid == pid and all(t.is_alive() for t in self._threads):
+                return
+            # Threads do not survive a fork (gunicorn preload_app), so a child
+            # process always starts its own set.
+            self._pid = pid
+            self._stop_event.clear()
+            self._threads = []
+            for index, shard in enumerate(self._shards):
+                thread = threading.Thread(
+                    target=self._run_worker,
+                    args=(shard,),
+                    name=f"InboundWorker-{index}",
+                    daemon=True,
+                )
+                thread.start()
+                self._threads.append(thread)
+            logger.info("Inbound worker pool started", workers=self.workers, max_queue_size=self.max_queue_size)
+
+    def stop(self, timeout: float = 5.0) -> None:
+        """Signal workers to stop after draining what is already queued."""
+        self._stop_event.set()
+        deadline = time.monotonic() + timeout
+        for thread in self._threads:
+            thread.join(timeout=max(0.0, deadline - time.monotonic()))
+
+    def submit(self, telefone: str, payload: Any) -> bool:
+        """Enqueue a message; returns False when the shard is full."""
+        self.start()
+        shard = self._shards[self._shard_index(telefone)]
+        try:
+            shard.put_nowait(InboundJob(telefone=telefone, payload=payload))
+        except queue.Full:
+            with self._stats_lock:
+                self._counters["rejected"] += 1
+            logger.warning("Inbound queue full, rejecting message", telefone=telefone)
+            return False
+        with self._stats_lock:
+            self._counters["enqueued"] += 1
+        return True
+
+    def join(self, timeout: Optional[float] = None) -> bool:
+        """Wait until every queued message was processed (used by tests/benchmarks)."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while any(shard.unfinished_tasks for shard in self._shards):
+            if deadline is not None and time.monotonic() >= deadline:
+                return False
+            time.sleep(0.005)
+        return True
+
+    def stats(self) -> Dict[str, Any]:
+        """Queue depth and processing lag, exposed on /metrics."""
+        now = time.monotonic()
+        depths = [shard.qsize() for shard in self._shards]
+        oldest = 0.0
+        for shard in self._shards:
+            with shard.mutex:
+                if shard.queue:
+                    oldest = max(oldest, now - shard.queue[0].enqueued_at)
+        with self._stats_lock:
+            counters = dict(self._counters)
+            started = counters["processed"] + counters["failed"]
+            avg_lag = self._lag_total / started if started else 0.0
+            return {
+                "workers": self.workers,
+                "queue_depth": sum(depths),
+                "queue_depth_per_worker": depths,
+                "max_queue_size": self.max_queue_size,
+                "oldest_pending_seconds": round(oldest, 4),
+                "lag_last_seconds": round(self._lag_last, 4),
+                "lag_max_seconds": round(self._lag_max, 4),
+                "lag_avg_seconds": round(avg_lag, 4),
+                **counters,
+            }
+
+    def _shard_index(self, telefone: str) -> int:
+        return zlib.crc32(telefone.encode("utf-8")) % self.workers
+
+    def _run_worker(self, shard: queue.Queue) -> None:
+        while True:
+            try:
+                job: InboundJob = shard.get(timeout=0.5)
+            except queue.Empty:
+                if self._stop_event.is_set():
+                    return
+                continue
+
+            lag = time.monotonic() - job.enqueued_at
+            failed = False
+            try:
+                job.context.run(self.handler, job)
+            except Exception as exc:  # pylint: disable=broad-except
+                failed = True
+                logger.exception("Inbound message processing failed", telefone=job.telefone, error=str(exc))
+            finally:
+                with self._stats_lock:
+                    self._counters["failed" if failed else "processed"] += 1
+                    self._lag_last = lag
+                    self._lag_max = max(self._lag_max, lag)
+                    self._lag_total += lag
+                shard.task_done()
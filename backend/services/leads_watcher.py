@@ -1,23 +1,55 @@
 """Background watcher that polls the lead sheet and kicks off conversations."""
 from __future__ import annotations
 
-import re
+import hashlib
+import os
 import threading
 import time
-from datetime import datetime, timezone
-from typing import Dict, List, Optional
+from typing import Any, Callable, Dict, List, Optional, Tuple
 
 import structlog
 
-from backend.models.database_models import Lead, LeadRepository
+from backend.models.database_models import LeadRepository
+from backend.services.coordination import CoordinationBackend
 from backend.services.google_sheets_service import GoogleSheetsService
 from backend.services.qualification_service import QualificationService
+from backend.services.sheet_ingestion import SheetIngestionEngine
 
 logger = structlog.get_logger()
 
+LEASE_NAME = 'leads_watcher'
+# Wake-ups forwarded from processes that do not hold the lease
+WAKE_NAMESPACE = 'leads_watcher'
+WAKE_KEY = 'wake'
+
 
 class LeadsWatcher:
-    """Periodically scans the Google Sheet and processes new leads."""
+    """Periodically polls the Google Sheet and processes new leads.
+
+    Polls are incremental: the watcher keeps a high-water mark (sheet row
+    number of the last row it walked plus a fingerprint of that row's
+    content) and reads only from that row to the end of the sheet. If the
+    mark row no longer matches (rows inserted, deleted or edited above it)
+    or every ``full_rescan_seconds``, it rescans the whole sheet, which also
+    picks up edits to rows already walked (e.g. a phone filled in later).
+
+    Rows are handed to a :class:`SheetIngestionEngine` (bulk lead
+    resolution, up to ``start_concurrency`` starts at once, batched
+    write-back) with the default policy.
+
+    The poll interval adapts: every poll that finds nothing new multiplies
+    it by ``backoff_factor`` up to ``max_poll_interval_seconds``; a poll
+    that finds new rows (or starts a lead) snaps it back to
+    ``poll_interval_seconds``. ``notify_change`` wakes the loop right away,
+    for external change signals (the ``/leads/run-watcher`` endpoint, a
+    :class:`FileChangeNotifier`).
+
+    With a shared ``coordination`` backend, several processes may start a
+    watcher but only the one holding its lease polls; the others retry the
+    lease every ``poll_interval_seconds`` (taking over when the holder
+    exits) and forward ``notify_change`` to it through the backend, which
+    the holder checks every ``wake_check_seconds`` while it sleeps.
+    """
 
     def __init__(
         self,
@@ -25,13 +57,49 @@ class LeadsWatcher:
         lead_repo: LeadRepository,
         qualification_service: QualificationService,
         poll_interval_seconds: int = 60,
+        max_poll_interval_seconds: int = 600,
+        backoff_factor: float = 2.0,
+        full_rescan_seconds: int = 900,
+        start_concurrency: int = 8,
+        batch_rows: int = 200,
+        progress_log_seconds: float = 10.0,
+        coordination: Optional[CoordinationBackend] = None,
+        wake_check_seconds: float = 5.0,
+        clock: Callable[[], float] = time.monotonic,
     ) -> None:
         self.sheets_service = sheets_service
+        self.coordination = coordination
+        self.wake_check_seconds = max(0.01, wake_check_seconds)
+        self._holds_lease = False
         self.lead_repo = lead_repo
         self.qualification_service = qualification_service
         self.poll_interval_seconds = max(15, poll_interval_seconds)
+        self.max_poll_interval_seconds = max(self.poll_interval_seconds, max_poll_interval_seconds)
+        self.backoff_factor = max(1.0, backoff_factor)
+        self.full_rescan_seconds = max(self.poll_interval_seconds, full_rescan_seconds)
+        self._clock = clock
+        self.engine = SheetIngestionEngine(
+            lead_repo,
+            qualification_service,
+            start_concurrency=start_concurrency,
+            batch_rows=batch_rows,
+            progress_log_seconds=progress_log_seconds,
+            clock=clock,
+        )
         self._stop_event = threading.Event()
+        self._wake_event = threading.Event()
+        # Passes from the loop and from notify/endpoint callers never overlap
+        self._pass_lock = threading.Lock()
+        self._interval = float(self.poll_interval_seconds)
+        self._idle_polls = 0
         self._thread: Optional[threading.Thread] = None
+        self._headers: List[str] = []
+        # (sheet row number, fingerprint) of the last row walked
+        self._watermark: Optional[Tuple[int, str]] = None
+        self._last_full_scan: Optional[float] = None
+        self._counters = {
+            "full_scans": 0, "delta_scans": 0, "rows_read": 0, "leads_started": 0, "change_notifications": 0,
+        }
 
     def start(self) -> None:
         if not self.sheets_service.service or not self.sheets_service.input_sheets_id:
@@ -41,90 +109,232 @@ class LeadsWatcher:
             return
         self._thread = threading.Thread(target=self._run_loop, name="LeadsWatcher", daemon=True)
         self._thread.start()
-        logger.info("Leads watcher started", interval_seconds=self.poll_interval_seconds)
+        logger.info(
+            "Leads watcher started",
+            interval_seconds=self.poll_interval_seconds,
+            max_interval_seconds=self.max_poll_interval_seconds,
+            full_rescan_seconds=self.full_rescan_seconds,
+        )
 
     def stop(self) -> None:
         self._stop_event.set()
+        self._wake_event.set()
         if self._thread and self._thread.is_alive():
             self._thread.join(timeout=2)
+        if self.coordination is not None and self._holds_lease:
+            self.coordination.release_lease(LEASE_NAME)
+            self._holds_lease = False
+
+    def stats(self) -> Dict[str, Any]:
+        """Poll counters, the high-water mark and the progress of the current
+        (or last) pass, exposed on /metrics."""
+        return {
+            **self._counters,
+            "watermark_row": self._watermark[0] if self._watermark else None,
+            "poll_interval_seconds": self._interval,
+            "idle_polls": self._idle_polls,
+            "leader": self._holds_lease if self.coordination is not None else self.is_running(),
+            "pass": self.engine.progress(),
+        }
+
+    def is_running(self) -> bool:
+        return bool(self._thread and self._thread.is_alive())
+
+    def notify_change(self, source: str = "external") -> bool:
+        """Signal that the sheet (probably) changed: poll now and go back to
+        the fast interval. Returns False when no polling loop will pick the
+        signal up; signals arriving during a pass coalesce into one follow-up
+        pass."""
+        self._counters["change_notifications"] += 1
+        self._interval, self._idle_polls = float(self.poll_interval_seconds), 0
+        logger.info("Lead sheet change notified", source=source)
+        self._wake_event.set()
+        if self.coordination is not None and not self._holds_lease and self.sheets_service.service:
+            # The lease holder may be another process
+            self.coordination.claim(WAKE_NAMESPACE, WAKE_KEY, self.max_poll_interval_seconds)
+            return True
+        return self.is_running()
+
+    def process_once(self, full: bool = False) -> bool:
+        """Poll the sheet once: the unseen tail, or everything when due.
+
+        Returns whether the poll found new rows or started leads, and adapts
+        the poll interval accordingly.
+        """
+        with self._pass_lock:
+            mark_before = self._watermark[0] if self._watermark else None
+            started_before = self._counters["leads_started"]
+            due = (
+                self._last_full_scan is None
+                or self._clock() - self._last_full_scan >= self.full_rescan_seconds
+            )
+            if full or due or self._watermark is None:
+                self._full_scan()
+            else:
+                self._delta_scan()
+            mark_after = self._watermark[0] if self._watermark else None
+            changed = self._counters["leads_started"] > started_before or (
+                mark_before is not None and mark_after is not None and mark_after > mark_before
+            )
+            self._adapt_interval(changed)
+            return changed
 
-    def process_once(self) -> None:
+    def _adapt_interval(self, changed: bool) -> None:
+        if changed:
+            self._interval, self._idle_polls = float(self.poll_interval_seconds), 0
+            return
+        self._idle_polls += 1
+        self._interval = min(float(self.max_poll_interval_seconds), self._interval * self.backoff_factor)
+
+    def _full_scan(self) -> None:
+        self._last_full_scan = self._clock()
+        self._counters["full_scans"] += 1
         headers, rows = self.sheets_service.read_input_sheet()
+        self._counters["rows_read"] += len(rows) + (1 if headers else 0)
         if not headers:
+            self._headers, self._watermark = [], None
             return
 
-        header_map = {self._normalize_header_name(header): header for header in headers}
         _, start_row = self.sheets_service._parse_input_range()  # pylint: disable=protected-access
-        for index, row in enumerate(rows):
-            row_map = self._row_to_dict(headers, row)
-            status = (row_map.get('status') or '').strip().lower()
-            if status not in ('', 'novo', 'new'):
-                continue
+        self._headers = headers
+        # The header row is the mark until a data row is walked, so a change
+        # to the headers also forces a rescan.
+        self._watermark = (start_row, self._fingerprint(headers))
+        self._process_rows(rows, start_row + 1)
 
-            now_iso = datetime.now(timezone.utc).isoformat()
+    def _delta_scan(self) -> None:
+        self._counters["delta_scans"] += 1
+        mark_row, mark_fingerprint = self._watermark
+        # Re-read the mark row itself to check that the sheet did not shift
+        rows = self.sheets_service.read_input_rows(mark_row)
+        self._counters["rows_read"] += len(rows)
+        if not rows or self._fingerprint(rows[0]) != mark_fingerprint:
+            logger.info("Lead sheet changed above the high-water mark, rescanning", watermark_row=mark_row)
+            self._full_scan()
+            return
+        self._process_rows(rows[1:], mark_row + 1)
 
-            telefone_raw = (row_map.get('telefone') or '').strip()
-            if not telefone_raw:
-                continue
+    def _process_rows(self, rows: List[List[str]], first_row_number: int) -> None:
+        """Hand ``rows`` to the ingestion engine, moving the watermark as it goes."""
+        report = self.engine.run(
+            self._headers,
+            rows,
+            first_row_number,
+            self.sheets_service.input_writer(auto_flush_rows=self.engine.batch_rows),
+            on_batch=self._mark,
+            on_write=self._remark,
+        )
+        self._counters["leads_started"] += report.starts_submitted
 
-            telefone_normalizado = self.qualification_service.normalizar_telefone(telefone_raw)
-
-            nome = (row_map.get('nome') or '').strip() or 'tudo bem'
-            canal = (row_map.get('canal') or 'planilha').strip().lower() or 'planilha'
-            contexto_extra = row_map.get('contexto') or ''
-            mensagem_personalizada = (row_map.get('mensagem_inicial') or '').strip()
-
-            lead = self.lead_repo.get_lead_by_phone(telefone_normalizado)
-            if not lead:
-                novo_lead = Lead(nome=nome, telefone=telefone_normalizado, canal=canal)
-                lead = self.lead_repo.create_lead(novo_lead)
-                if not lead:
-                    logger.error("Failed to create lead from sheet", telefone=telefone_normalizado)
-                    continue
-
-            lead_id = lead['id']
-            logger.info("Processing sheet lead", lead_id=lead_id, telefone=telefone_normalizado)
-
-            start_result = self.qualification_service.iniciar_qualificacao(
-                lead_id=lead_id,
-                telefone=telefone_normalizado,
-                nome=nome,
-                origem_canal=canal,
-                contexto_extra=contexto_extra,
-                mensagem_inicial=mensagem_personalizada or None,
-            )
+    def _mark(self, row_number: int, values: List[str]) -> None:
+        self._watermark = (row_number, self._fingerprint(values))
 
-            row_number = start_row + 1 + index
-            updates: Dict[str, str] = {
-                header_map.get('status', 'status'): 'contatado',
-                header_map.get('lead_id', 'lead_id'): lead_id,
-                header_map.get('observacao', 'observacao'): now_iso,
-            }
-            first_message = start_result.get('mensagem_inicial')
-            if first_message:
-                updates[header_map.get('mensagem_inicial', 'mensagem_inicial')] = first_message
+    def _remark(self, row_number: int, values: List[str]) -> None:
+        # The mark row was written back after its batch was marked
+        if self._watermark and self._watermark[0] == row_number:
+            self._mark(row_number, values)
 
-            self.sheets_service.update_input_row(row_number, headers, row, updates)
+    @staticmethod
+    def _fingerprint(row: List[str]) -> str:
+        """Content hash of a row; trailing blanks are ignored (the API omits them)."""
+        cells = [str(cell) for cell in row]
+        while cells and cells[-1] == '':
+            cells.pop()
+        return hashlib.sha1('\x1f'.join(cells).encode('utf-8')).hexdigest()
 
     def _run_loop(self) -> None:
         while not self._stop_event.is_set():
+            if not self._lead():
+                self._sleep(self.poll_interval_seconds, shared_wake=False)
+                continue
             try:
                 self.process_once()
             except Exception as exc:  # pylint: disable=broad-except
+                # Sheets errors (quota, outage) back off like an idle poll
+                self._adapt_interval(False)
                 logger.exception("Error processing leads from sheet", error=str(exc))
-            finally:
-                self._stop_event.wait(self.poll_interval_seconds)
+            self._sleep(self._interval, shared_wake=True)
 
-    @staticmethod
-    def _normalize_header_name(header: str) -> str:
-        normalized = re.sub(r'[^0-9a-z]+', '_', header.strip().lower())
-        return normalized.strip('_')
-
-    @classmethod
-    def _row_to_dict(cls, headers: List[str], row: List[str]) -> Dict[str, str]:
-        data: Dict[str, str] = {}
-        for idx, original in enumerate(headers):
-            key = cls._normalize_header_name(original)
-            value = row[idx] if idx < len(row) else ''
-            data[key] = value
-        return data
+    def _lead(self) -> bool:
+        """Whether this process should poll: it holds (or just took) the lease."""
+        if self.coordination is None:
+            return True
+        holds = self.coordination.acquire_lease(LEASE_NAME)
+        if holds != self._holds_lease:
+            logger.info("Leads watcher lease changed", held=holds, pid=os.getpid())
+        self._holds_lease = holds
+        if holds:
+            # This pass answers any wake-up forwarded so far
+            self.coordination.release(WAKE_NAMESPACE, WAKE_KEY)
+        return holds
+
+    def _sleep(self, seconds: float, shared_wake: bool) -> None:
+        """Wait ``seconds`` or until woken, locally or (``shared_wake``) by another process."""
+        deadline = time.monotonic() + seconds
+        while not self._stop_event.is_set():
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            if not shared_wake or self.coordination is None:
+                self._wake_event.wait(remaining)
+                break
+            if self._wake_event.wait(min(remaining, self.wake_check_seconds)):
+                break
+            if self.coordination.contains(WAKE_NAMESPACE, WAKE_KEY):
+                self._interval, self._idle_polls = float(self.poll_interval_seconds), 0
+                logger.info("Lead sheet change notified", source='forwarded')
+                break
+        self._wake_event.clear()
+
+
+class FileChangeNotifier:
+    """Calls ``on_change`` when a local file's mtime or size changes.
+
+    Local stand-in for Drive change notifications: whatever relays the
+    sheet's change events (an Apps Script ``onChange`` trigger, a sync
+    client, a cron job) touches or rewrites the file. Checked every
+    ``interval_seconds`` with one ``stat``; a missing file is not a change.
+    """
+
+    def __init__(self, path: str, on_change: Callable[[], Any], interval_seconds: float = 1.0) -> None:
+        self.path = path
+        self.on_change = on_change
+        self.interval_seconds = interval_seconds
+        self._stop_event = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._signature = self._stat()
+
+    def start(self) -> None:
+        if self._thread and self._thread.is_alive():
+            return
+        self._thread = threading.Thread(target=self._run_loop, name="SheetChangeFile", daemon=True)
+        self._thread.start()
+        logger.info("Watching lead sheet change file", path=self.path)
+
+    def stop(self) -> None:
+        self._stop_event.set()
+        if self._thread and self._thread.is_alive():
+            self._thread.join(timeout=2)
+
+    def check_once(self) -> bool:
+        """Call ``on_change`` if the file changed since the last check."""
+        signature = self._stat()
+        if signature is None or signature == self._signature:
+            return False
+        self._signature = signature
+        self.on_change()
+        return True
+
+    def _stat(self) -> Optional[Tuple[int, int]]:
+        try:
+            stat = os.stat(self.path)
+        except OSError:
+            return None
+        return stat.st_mtime_ns, stat.st_size
+
+    def _run_loop(self) -> None:
+        while not self._stop_event.wait(self.interval_seconds):
+            try:
+                self.check_once()
+            except Exception as exc:  # pylint: disable=broad-except
+                logger.exception("Error checking lead sheet change file", error=str(exc))
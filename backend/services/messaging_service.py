@@ -3,18 +3,76 @@ from __future__ import annotations
 
 import hashlib
 import threading
-from collections import defaultdict, deque
-from datetime import datetime, timedelta, timezone
-from typing import Deque, Dict, Optional, Tuple, Any
+import time
+from collections import deque
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+from dataclasses import dataclass, field
+from typing import Deque, Dict, Iterable, List, Optional, Set, Any, Tuple, Union
 
 import structlog
 
 from backend.models.database_models import Message, MessageRepository
+from backend.services.coordination import CoordinationBackend, InMemoryCoordination
 from backend.services.metrics_service import metrics_service
+from backend.services.tracing import tracer
 from backend.services.whatsapp_service import WhatsAppService
 
 logger = structlog.get_logger()
 
+DEDUP_NAMESPACE = "outbound"
+
+
+@dataclass
+class _OutboundItem:
+    lead_id: str
+    session_id: Optional[str]
+    mensagem: str
+    mensagem_normalizada: str
+    metadata: Dict[str, Any]
+    conversa_count: int = 0
+    persist: bool = True
+    future: Future = field(default_factory=Future)
+
+
+@dataclass
+class SendJob:
+    """One message of a batch send."""
+
+    lead_id: str
+    telefone: str
+    mensagem: str
+    session_id: Optional[str] = None
+    metadata: Dict[str, Any] = field(default_factory=dict)
+    conversa_count: int = 0
+
+
+@dataclass
+class BatchSendResult:
+    """Per-job results (in input order) plus aggregate throughput."""
+
+    results: List[Dict[str, Any]]
+    sent: int
+    failed: int
+    deduplicated: int
+    persisted: int
+    elapsed_seconds: float
+
+    @property
+    def messages_per_second(self) -> float:
+        return self.sent / self.elapsed_seconds if self.elapsed_seconds > 0 else 0.0
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "total": len(self.results),
+            "sent": self.sent,
+            "failed": self.failed,
+            "deduplicated": self.deduplicated,
+            "persisted": self.persisted,
+            "elapsed_seconds": round(self.elapsed_seconds, 4),
+            "messages_per_second": round(self.messages_per_second, 2),
+            "results": self.results,
+        }
+
 
 class MessagingService:
     """Centralizes WhatsApp sending with deduplication and single queue per contact."""
@@ -24,13 +82,26 @@ class MessagingService:
         whatsapp_service: WhatsAppService,
         message_repo: MessageRepository,
         dedup_ttl_seconds: int = 300,
+        dedup_max_entries: int = 100_000,
+        coordination: Optional[CoordinationBackend] = None,
+        delivery_timeout: Optional[float] = None,
     ) -> None:
         self.whatsapp_service = whatsapp_service
+        # Short-lived callers (CLI scripts) set this: the delivery scheduler's
+        # threads are daemons, so a message still in its humanising delay when
+        # the process exits is never sent.
+        self.delivery_timeout = delivery_timeout
         self.message_repo = message_repo
-        self._dedup_ttl = timedelta(seconds=dedup_ttl_seconds)
-        self._dedup_cache: Dict[str, datetime] = {}
-        self._queues: Dict[str, Deque[Tuple[str, Optional[str], str, str, Dict[str, Any]]]] = defaultdict(deque)
-        self._locks: Dict[str, threading.Lock] = defaultdict(threading.Lock)
+        self._dedup_ttl_seconds = dedup_ttl_seconds
+        # Dedup keys live in the coordination backend so several gunicorn
+        # workers (SQLite backend) never send the same message twice.
+        self._coordination = coordination or InMemoryCoordination(max_entries=dedup_max_entries)
+        # Per-recipient state only lives while the recipient has queued or
+        # in-flight messages; the drain removes it once the queue empties, so
+        # memory tracks concurrent conversations, not every number ever seen.
+        self._queues: Dict[str, Deque[_OutboundItem]] = {}
+        self._sending: Set[str] = set()
+        self._state_lock = threading.Lock()
         self.metrics = {
             "sent_ok": 0,
             "skip_duplicate": 0,
@@ -38,6 +109,7 @@ class MessagingService:
             "failed": 0,
         }
 
+    @tracer.traced('messaging.send_message')
     def send_message(
         self,
         lead_id: str,
@@ -45,14 +117,20 @@ class MessagingService:
         mensagem: str,
         session_id: Optional[str] = None,
         metadata: Optional[Dict[str, Any]] = None,
+        conversa_count: int = 0,
     ) -> Dict[str, Any]:
-        """Send message with dedup and in-order delivery for the recipient."""
+        """Send message with dedup and in-order delivery for the recipient.
+
+        The humanizing delay runs on the delivery scheduler, so this returns as
+        soon as the message is scheduled (``scheduled``) or queued behind an
+        earlier one (``queued``). Synchronous transports, and services built
+        with ``delivery_timeout``, return the final send result instead.
+        """
         metadata = metadata or {}
-        self._purge_cache()
 
         mensagem_normalizada = self._normalize_body(mensagem)
         dedup_key = self._make_dedup_key(telefone, mensagem_normalizada)
-        if dedup_key in self._dedup_cache:
+        if self._coordination.contains(DEDUP_NAMESPACE, dedup_key):
             logger.info(
                 "Skipping duplicated message",
                 telefone=telefone,
@@ -63,84 +141,252 @@ class MessagingService:
             metrics_service.record_message_deduped(telefone, "duplicate")
             return {"success": False, "skipped": "deduplicated"}
 
-        queue = self._queues[telefone]
-        queue.append((lead_id, session_id, mensagem, mensagem_normalizada, metadata))
-        logger.debug("Queued message", telefone=telefone, queue_size=len(queue))
-
-        lock = self._locks[telefone]
-        if lock.locked():
+        item = _OutboundItem(lead_id, session_id, mensagem, mensagem_normalizada, metadata, conversa_count)
+        started_drain = self._enqueue(telefone, item)
+        if self.delivery_timeout is not None:
+            try:
+                return item.future.result(timeout=self.delivery_timeout)
+            except FutureTimeoutError:
+                logger.error("Timed out waiting for message delivery", telefone=telefone)
+                return {"success": False, "error": "delivery_timeout"}
+        if not started_drain:
             return {"success": True, "queued": True}
+        if item.future.done():
+            return item.future.result()
+        return {"success": True, "queued": False, "scheduled": True}
+
+    def send_batch(
+        self,
+        jobs: Iterable[Union[SendJob, Tuple[str, str, str]]],
+        max_concurrency: int = 20,
+        timeout: Optional[float] = None,
+    ) -> BatchSendResult:
+        """Send many messages with bounded concurrency and one bulk insert.
+
+        ``jobs`` are ``SendJob`` instances or ``(lead_id, telefone, mensagem)``
+        tuples. At most ``max_concurrency`` messages are in flight at once;
+        per-recipient ordering and deduplication work as in ``send_message``.
+        Outbound ``Message`` rows of successful sends are persisted together
+        through ``MessageRepository.create_many`` once the batch finished.
+        ``timeout`` bounds the whole call, waiting for a free slot included:
+        jobs not yet enqueued or not finished by then report ``timeout``.
+        """
+        started = time.perf_counter()
+        deadline = None if timeout is None else time.monotonic() + timeout
+        slots = threading.BoundedSemaphore(max(1, max_concurrency))
+        entries: List[Tuple[SendJob, Optional[_OutboundItem], Optional[Dict[str, Any]]]] = []
+        expired = False
+
+        for raw in jobs:
+            job = raw if isinstance(raw, SendJob) else SendJob(*raw)
+            if expired:
+                entries.append((job, None, {"success": False, "error": "timeout"}))
+                continue
+            normalizada = self._normalize_body(job.mensagem)
+            if self._coordination.contains(DEDUP_NAMESPACE, self._make_dedup_key(job.telefone, normalizada)):
+                self.metrics["skip_duplicate"] += 1
+                metrics_service.record_message_deduped(job.telefone, "duplicate")
+                entries.append((job, None, {"success": False, "skipped": "deduplicated"}))
+                continue
 
-        with lock:
-            result: Dict[str, Any] = {"success": True, "queued": False}
-            while queue:
-                lead_id_it, session_id_it, mensagem_it, mensagem_norm_it, metadata_it = queue.popleft()
-                dedup_key_it = self._make_dedup_key(telefone, mensagem_norm_it)
-                if dedup_key_it in self._dedup_cache:
-                    logger.info(
-                        "Skipping duplicated message inside queue",
-                        telefone=telefone,
-                        message_hash=dedup_key_it,
+            item = _OutboundItem(
+                job.lead_id,
+                job.session_id,
+                job.mensagem,
+                normalizada,
+                dict(job.metadata or {}),
+                job.conversa_count,
+                persist=False,
+            )
+            remaining = None if deadline is None else max(0.0, deadline - time.monotonic())
+            if not slots.acquire(timeout=remaining):
+                # Nothing enqueued after the deadline: these jobs were never sent
+                expired = True
+                entries.append((job, None, {"success": False, "error": "timeout"}))
+                continue
+            item.future.add_done_callback(lambda _done: slots.release())
+            self._enqueue(job.telefone, item)
+            entries.append((job, item, None))
+
+        results: List[Dict[str, Any]] = []
+        to_persist: List[Message] = []
+        for job, item, immediate in entries:
+            if item is not None:
+                remaining = None if deadline is None else max(0.0, deadline - time.monotonic())
+                try:
+                    outcome = item.future.result(timeout=remaining)
+                except FutureTimeoutError:
+                    outcome = {"success": False, "error": "timeout"}
+                if outcome.get("success") and item.session_id:
+                    to_persist.append(
+                        Message(
+                            session_id=item.session_id,
+                            lead_id=item.lead_id,
+                            conteudo=item.mensagem,
+                            tipo="enviada",
+                            metadata=item.metadata,
+                        )
                     )
-                    self.metrics["skip_duplicate"] += 1
-                    continue
+            else:
+                outcome = immediate or {}
+            results.append({"lead_id": job.lead_id, "telefone": job.telefone, **outcome})
+
+        persisted = self.message_repo.create_many(to_persist).created if to_persist else 0
+        batch = BatchSendResult(
+            results=results,
+            sent=sum(1 for r in results if r.get("success")),
+            failed=sum(1 for r in results if not r.get("success") and not r.get("skipped")),
+            deduplicated=sum(1 for r in results if r.get("skipped") == "deduplicated"),
+            persisted=persisted,
+            elapsed_seconds=time.perf_counter() - started,
+        )
+        logger.info(
+            "Batch send finished",
+            total=len(results),
+            sent=batch.sent,
+            failed=batch.failed,
+            deduplicated=batch.deduplicated,
+            messages_per_second=round(batch.messages_per_second, 2),
+        )
+        return batch
+
+    def _enqueue(self, telefone: str, item: "_OutboundItem") -> bool:
+        """Queue ``item``; returns True when this call started the recipient's drain."""
+        with self._state_lock:
+            queue = self._queues.setdefault(telefone, deque())
+            queue.append(item)
+            logger.debug("Queued message", telefone=telefone, queue_size=len(queue))
+            if telefone in self._sending:
+                return False
+            self._sending.add(telefone)
+        self._drain(telefone)
+        return True
 
-                send_result = self.whatsapp_service.enviar_mensagem(telefone, mensagem_it)
+    def _drain(self, telefone: str) -> None:
+        """Send queued messages for one recipient, one at a time.
+
+        Only one message per recipient is in flight: the next one is dispatched
+        from the completion callback of the previous send.
+        """
+        while True:
+            with self._state_lock:
+                queue = self._queues.get(telefone)
+                if not queue:
+                    self._queues.pop(telefone, None)
+                    self._sending.discard(telefone)
+                    return
+                item = queue.popleft()
+
+            # Claiming the key before sending makes the check-and-send atomic
+            # across workers; it is released again if the send fails.
+            dedup_key_it = self._make_dedup_key(telefone, item.mensagem_normalizada)
+            if not self._coordination.claim(DEDUP_NAMESPACE, dedup_key_it, self._dedup_ttl_seconds):
                 logger.info(
-                    "WhatsApp send result",
+                    "Skipping duplicated message inside queue",
                     telefone=telefone,
-                    success=send_result.get("success"),
-                    details=send_result.get("details") or send_result.get("error"),
+                    message_hash=dedup_key_it,
                 )
+                self.metrics["skip_duplicate"] += 1
+                item.future.set_result({"success": False, "skipped": "deduplicated"})
+                continue
 
-                if send_result.get("success"):
-                    self._dedup_cache[dedup_key_it] = datetime.now(timezone.utc)
-                    if session_id_it:
-                        self.message_repo.create_message(
-                            Message(
-                                session_id=session_id_it,
-                                lead_id=lead_id_it,
-                                conteudo=mensagem_it,
-                                tipo="enviada",
-                                metadata=metadata_it,
-                            )
-                        )
-                    self.metrics["sent_ok"] += 1
-                    # Registrar métrica de sucesso
-                    metrics_service.record_message_sent(
-                        telefone, 
-                        True, 
-                        send_result.get("details")
-                    )
-                    tentativa = send_result.get("tentativa", 1)
-                    if tentativa and tentativa > 1:
-                        self.metrics["retry"] += tentativa - 1
-                else:
-                    self.metrics["failed"] += 1
-                    # Registrar métrica de falha
-                    metrics_service.record_message_sent(
-                        telefone, 
-                        False, 
-                        send_result.get("error") or send_result.get("details")
-                    )
-                result = send_result
-            return result
-
-    def _purge_cache(self) -> None:
-        """Remove entries older than the deduplication TTL."""
-        if not self._dedup_cache:
-            return
-        limit = datetime.now(timezone.utc) - self._dedup_ttl
-        expired = [key for key, ts in self._dedup_cache.items() if ts < limit]
-        for key in expired:
-            self._dedup_cache.pop(key, None)
+            delivery = self._transmit(telefone, item)
+            if not delivery.done():
+                delivery.add_done_callback(
+                    lambda done, item=item: self._on_delivery_done(telefone, item, done)
+                )
+                return
+            self._complete(telefone, item, delivery)
+
+    def _on_delivery_done(self, telefone: str, item: "_OutboundItem", delivery: Future) -> None:
+        self._complete(telefone, item, delivery)
+        self._drain(telefone)
+
+    def _transmit(self, telefone: str, item: "_OutboundItem") -> Future:
+        send_async = getattr(self.whatsapp_service, "enviar_mensagem_async", None)
+        if send_async is not None:
+            return send_async(
+                telefone,
+                item.mensagem,
+                conversa_count=item.conversa_count,
+                on_redelivery=lambda result: self._on_redelivered(telefone, item, result),
+            )
+        # Synchronous transports (test doubles, legacy clients)
+        delivery: Future = Future()
+        try:
+            delivery.set_result(self.whatsapp_service.enviar_mensagem(telefone, item.mensagem))
+        except Exception as exc:  # pylint: disable=broad-except
+            delivery.set_exception(exc)
+        return delivery
+
+    def _complete(self, telefone: str, item: "_OutboundItem", delivery: Future) -> None:
+        try:
+            send_result = delivery.result()
+        except Exception as exc:  # pylint: disable=broad-except
+            send_result = {"success": False, "error": str(exc)}
+
+        logger.info(
+            "WhatsApp send result",
+            telefone=telefone,
+            success=send_result.get("success"),
+            details=send_result.get("details") or send_result.get("error"),
+        )
+
+        if send_result.get("success"):
+            self._record_success(telefone, item, send_result, persist=item.persist)
+        else:
+            if not send_result.get("reenvio_agendado"):
+                self._coordination.release(
+                    DEDUP_NAMESPACE, self._make_dedup_key(telefone, item.mensagem_normalizada)
+                )
+            self.metrics["failed"] += 1
+            # Registrar métrica de falha
+            metrics_service.record_message_sent(
+                telefone, 
+                False, 
+                send_result.get("error") or send_result.get("details")
+            )
+        item.future.set_result(send_result)
+
+    def _on_redelivered(self, telefone: str, item: "_OutboundItem", send_result: Dict[str, Any]) -> None:
+        """A send that failed earlier was delivered from the WhatsApp retry queue."""
+        logger.info("Message delivered from retry queue", telefone=telefone)
+        # Batch sends were already flushed when the retry succeeds: persist now.
+        self._record_success(telefone, item, send_result, persist=True)
+
+    def _record_success(
+        self,
+        telefone: str,
+        item: "_OutboundItem",
+        send_result: Dict[str, Any],
+        persist: bool = True,
+    ) -> None:
+        if persist and item.session_id:
+            self.message_repo.create_message(
+                Message(
+                    session_id=item.session_id,
+                    lead_id=item.lead_id,
+                    conteudo=item.mensagem,
+                    tipo="enviada",
+                    metadata=item.metadata,
+                )
+            )
+        self.metrics["sent_ok"] += 1
+        # Registrar métrica de sucesso
+        metrics_service.record_message_sent(
+            telefone, 
+            True, 
+            send_result.get("details")
+        )
+        tentativa = send_result.get("tentativa", 1)
+        if tentativa and tentativa > 1:
+            self.metrics["retry"] += tentativa - 1
 
     @staticmethod
     def _make_dedup_key(telefone: str, mensagem_normalizada: str) -> str:
         payload = f"{telefone}|{mensagem_normalizada}".encode("utf-8")
         digest = hashlib.sha1(payload).hexdigest()
-        bucket = int(datetime.now(timezone.utc).timestamp() // 300)
-        return f"{telefone}:{bucket}:{digest}"
+        return f"{telefone}:{digest}"
 
     @staticmethod
     def _normalize_body(texto: str) -> str:
@@ -149,5 +395,13 @@ class MessagingService:
         return texto
 
     def get_metrics(self) -> Dict[str, int]:
-        """Return a copy of the delivery metrics."""
-        return dict(self.metrics)
+        """Return a copy of the delivery metrics plus live-state gauges."""
+        with self._state_lock:
+            live_recipients = len(self._queues)
+            queued_messages = sum(len(queue) for queue in self._queues.values())
+        return {
+            **self.metrics,
+            "live_recipients": live_recipients,
+            "queued_messages": queued_messages,
+            "dedup_entries": self._coordination.count(DEDUP_NAMESPACE),
+        }
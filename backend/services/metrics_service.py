@@ -1,220 +1,461 @@
 """
 Serviço de Monitoramento e Métricas do Sistema
+
+Contadores acumulados desde o início do processo mais janelas móveis em
+ring buffers por minuto: o resumo custa O(minutos da janela), não O(eventos),
+e a memória é fixa qualquer que seja o tráfego. ``render_prometheus`` expõe
+tudo no formato texto do Prometheus.
+
+A gravação não usa lock: cada thread escreve só no seu shard (lista de
+contadores do minuto atual, totais e um deque de tuplas dos últimos
+eventos) e as leituras somam os shards. O log por evento é amostrado
+(``METRICS_LOG_EVERY``; 0 desliga).
 """
 
-import time
+import os
 import threading
+import time
 from collections import defaultdict, deque
-from datetime import datetime, timezone, timedelta
-from typing import Dict, List, Any, Optional, Deque
+from datetime import datetime, timezone
+from typing import Callable, Dict, List, Any, Optional, Deque, Tuple
 import structlog
 
+from backend.services.tracing import LatencyHistogram
+
 logger = structlog.get_logger(__name__)
 
+# Limites superiores dos buckets do histograma de score (0-100)
+SCORE_BUCKETS: Tuple[float, ...] = (10, 20, 30, 40, 50, 60, 70, 80, 90, 100)
+
+# Posições na lista de contadores de cada shard
+(SENT_OK, SENT_FAILED, DEDUPED, QUALIFIED, NOT_QUALIFIED,
+ MEETING_OK, MEETING_FAILED, SCORE_SUM) = range(8)
+SCORE_BUCKET_0 = 8
+COUNTER_SLOTS = SCORE_BUCKET_0 + len(SCORE_BUCKETS) + 1
+WINDOW_EVENTS = {
+    'messages_successful': SENT_OK,
+    'messages_failed': SENT_FAILED,
+    'messages_deduped': DEDUPED,
+    'qualified': QUALIFIED,
+    'not_qualified': NOT_QUALIFIED,
+    'meetings_successful': MEETING_OK,
+    'meetings_failed': MEETING_FAILED,
+}
+
+
+def _score_slot(score: float) -> int:
+    for index, bound in enumerate(SCORE_BUCKETS):
+        if score <= bound:
+            return SCORE_BUCKET_0 + index
+    return COUNTER_SLOTS - 1
+
+
+# Scores são inteiros de 0 a 100: bucket por tabela no caminho quente
+_SCORE_SLOTS = [_score_slot(score) for score in range(101)]
+
+
+class _Shard:
+    """Contadores de uma thread: só ela escreve; leitores somam todos os shards.
+
+    ``head`` é ``(minuto, contadores do minuto, totais até o minuto anterior)``
+    e é trocado inteiro ao virar o minuto (uma atribuição), depois de o minuto
+    anterior ir para o anel. Quem lê pega ``head`` uma vez e ignora no anel o
+    minuto que ainda está nele, então nunca conta um minuto duas vezes.
+    """
+
+    __slots__ = ('thread', 'minutes', 'head', 'until', 'ring', 'events', 'logged')
+
+    def __init__(self, minutes: int, recent_events: int):
+        self.thread = threading.current_thread()
+        self.minutes = minutes
+        self.head: Tuple[int, List[float], List[float]] = (-1, [0] * COUNTER_SLOTS, [0] * COUNTER_SLOTS)
+        self.until = float('-inf')  # início do próximo minuto; força a primeira rotação
+        self.ring: List[Optional[Tuple[int, List[float], List[float]]]] = [None] * minutes
+        self.events: Deque[tuple] = deque(maxlen=recent_events)
+        self.logged = 0
+
+    def rotate(self, now: float) -> List[float]:
+        """Abre o minuto de ``now`` e devolve os contadores dele."""
+        minute = int(now // 60)
+        old_minute, old_counts, old_totals = self.head
+        if old_minute == minute:
+            return old_counts
+        if old_minute >= 0:
+            self.ring[old_minute % self.minutes] = self.head
+        totals = [before + counted for before, counted in zip(old_totals, old_counts)]
+        self.head = (minute, [0] * COUNTER_SLOTS, totals)
+        self.until = (minute + 1) * 60
+        return self.head[1]
+
+    def totals(self) -> List[float]:
+        _, counts, before = self.head
+        return [a + b for a, b in zip(before, counts)]
+
+    def minute_counts(self, minute: int) -> Optional[List[float]]:
+        head = self.head
+        if head[0] == minute:
+            return head[1]
+        entry = self.ring[minute % self.minutes]
+        if entry is not None and entry[0] == minute:
+            return entry[1]
+        return None
+
+    def absorb(self, other: "_Shard") -> None:
+        """Soma um shard de thread encerrada neste (chamado com o registro travado).
+
+        Só é usado no shard ``_retired``, que não grava eventos próprios: o
+        ``head`` dele guarda apenas os totais.
+        """
+        minute, counts, before = self.head
+        other_totals = other.totals()
+        self.head = (minute, counts, [a + b for a, b in zip(before, other_totals)])
+        self.events.extend(other.events)
+        for entry in [other.head] + other.ring:
+            if entry is None or entry[0] < 0:
+                continue
+            entry_minute, entry_counts, _ = entry
+            slot = entry_minute % self.minutes
+            current = self.ring[slot]
+            if current is None or current[0] < entry_minute:
+                self.ring[slot] = (entry_minute, list(entry_counts), [])
+            elif current[0] == entry_minute:
+                for index, value in enumerate(entry_counts):
+                    current[1][index] += value
+
+
+class _ShardLocal(threading.local):
+    """``shard`` de cada thread, criado no primeiro acesso dela."""
+
+    def __init__(self, register: Callable[[], _Shard]):
+        super().__init__()
+        self.shard = register()
+
+
 class MetricsService:
     """Serviço centralizado de coleta e exposição de métricas"""
-    
-    def __init__(self, retention_hours: int = 24):
+
+    def __init__(self, retention_hours: int = 24, recent_events: int = 500,
+                 clock: Callable[[], float] = time.time, log_every: Optional[int] = None):
         self.retention_hours = retention_hours
-        self.retention_seconds = retention_hours * 3600
-        
-        # Métricas de mensagens
-        self.message_metrics: Deque[Dict[str, Any]] = deque()
-        self.message_counters = defaultdict(int)
-        
-        # Métricas de qualificação
-        self.qualification_metrics: Deque[Dict[str, Any]] = deque()
-        self.qualification_counters = defaultdict(int)
-        
-        # Métricas de agendamentos
-        self.meeting_metrics: Deque[Dict[str, Any]] = deque()
-        self.meeting_counters = defaultdict(int)
-        
-        # Lock para thread safety
+        self.recent_events = recent_events
+        self._minutes = max(1, retention_hours * 60)
+        self._clock = clock
+        # Log por evento: 1 a cada ``log_every`` por thread (0 = desligado)
+        self.log_every = int(os.getenv('METRICS_LOG_EVERY', '0')) if log_every is None else log_every
+
+        # Shards por thread; o registro só é travado para criar shards e ler
+        self._shards: List[_Shard] = []
+        self._retired = _Shard(self._minutes, recent_events)
+        self._registry_lock = threading.Lock()
+        self._local = _ShardLocal(self._register_shard)
+
+        # Estado dos circuit breakers (nome -> estado atual / transições)
+        self.circuit_states: Dict[str, str] = {}
+        self.circuit_transitions = defaultdict(int)
+
+        # Lock para thread safety (circuit breakers: eventos raros)
         self._lock = threading.RLock()
-        
-        # Iniciar limpeza periódica
-        self._start_cleanup_thread()
-    
+
+        # Resumo periódico no log
+        self._start_summary_thread()
+
+    # Gravação (caminho quente, sem lock) -----------------------------------
+    def _shard(self) -> _Shard:
+        return self._local.shard
+
+    def _register_shard(self) -> _Shard:
+        shard = _Shard(self._minutes, self.recent_events)
+        with self._registry_lock:
+            # Threads encerradas (ex.: requisições do servidor) são somadas
+            # ao shard ``_retired`` para a lista não crescer sem limite.
+            for old in [s for s in self._shards if not s.thread.is_alive()]:
+                self._retired.absorb(old)
+                self._shards.remove(old)
+            self._shards.append(shard)
+        return shard
+
     def record_message_sent(self, telefone: str, success: bool, details: Optional[str] = None):
         """Registra envio de mensagem"""
-        with self._lock:
-            timestamp = datetime.now(timezone.utc)
-            
-            metric = {
-                'timestamp': timestamp,
-                'type': 'message_sent',
-                'telefone': telefone,
-                'success': success,
-                'details': details
-            }
-            
-            self.message_metrics.append(metric)
-            self.message_counters['total_sent'] += 1
-            
-            if success:
-                self.message_counters['successful_sent'] += 1
-            else:
-                self.message_counters['failed_sent'] += 1
-            
-            logger.info(
-                "Mensagem registrada nas métricas",
-                telefone=telefone,
-                success=success,
-                total_sent=self.message_counters['total_sent']
-            )
-    
+        now = self._clock()
+        shard = self._local.shard
+        counts = shard.head[1] if now < shard.until else shard.rotate(now)
+        counts[SENT_OK if success else SENT_FAILED] += 1
+        shard.events.append((now, SENT_OK if success else SENT_FAILED, telefone, details))
+        if self.log_every:
+            self._log_sampled(shard, "Mensagem registrada nas métricas", telefone=telefone, success=success)
+
     def record_message_deduped(self, telefone: str, reason: str = "duplicate"):
         """Registra mensagem dedupada"""
-        with self._lock:
-            timestamp = datetime.now(timezone.utc)
-            
-            metric = {
-                'timestamp': timestamp,
-                'type': 'message_deduped',
-                'telefone': telefone,
-                'reason': reason
-            }
-            
-            self.message_metrics.append(metric)
-            self.message_counters['deduped'] += 1
-            
-            logger.info(
-                "Mensagem dedupada registrada",
-                telefone=telefone,
-                reason=reason,
-                total_deduped=self.message_counters['deduped']
-            )
-    
+        now = self._clock()
+        shard = self._local.shard
+        counts = shard.head[1] if now < shard.until else shard.rotate(now)
+        counts[DEDUPED] += 1
+        shard.events.append((now, DEDUPED, telefone, reason))
+        if self.log_every:
+            self._log_sampled(shard, "Mensagem dedupada registrada", telefone=telefone, reason=reason)
+
     def record_qualification_completed(self, lead_id: str, score: int, qualified: bool):
         """Registra qualificação completada"""
-        with self._lock:
-            timestamp = datetime.now(timezone.utc)
-            
-            metric = {
-                'timestamp': timestamp,
-                'type': 'qualification_completed',
-                'lead_id': lead_id,
-                'score': score,
-                'qualified': qualified
-            }
-            
-            self.qualification_metrics.append(metric)
-            self.qualification_counters['total_qualifications'] += 1
-            
-            if qualified:
-                self.qualification_counters['qualified'] += 1
-            else:
-                self.qualification_counters['not_qualified'] += 1
-            
-            logger.info(
-                "Qualificação registrada nas métricas",
-                lead_id=lead_id,
-                score=score,
-                qualified=qualified,
-                total_qualifications=self.qualification_counters['total_qualifications']
-            )
-    
+        now = self._clock()
+        shard = self._local.shard
+        counts = shard.head[1] if now < shard.until else shard.rotate(now)
+        kind = QUALIFIED if qualified else NOT_QUALIFIED
+        counts[kind] += 1
+        try:
+            bucket = _SCORE_SLOTS[score] if score >= 0 else SCORE_BUCKET_0
+        except (IndexError, TypeError):  # fora de 0-100 ou não inteiro
+            bucket = _score_slot(score)
+        counts[bucket] += 1
+        counts[SCORE_SUM] += score
+        shard.events.append((now, kind, lead_id, score))
+        if self.log_every:
+            self._log_sampled(shard, "Qualificação registrada nas métricas",
+                              lead_id=lead_id, score=score, qualified=qualified)
+
     def record_meeting_scheduled(self, lead_id: str, slot: str, success: bool):
         """Registra agendamento de reunião"""
+        now = self._clock()
+        shard = self._local.shard
+        counts = shard.head[1] if now < shard.until else shard.rotate(now)
+        kind = MEETING_OK if success else MEETING_FAILED
+        counts[kind] += 1
+        shard.events.append((now, kind, lead_id, slot))
+        if self.log_every:
+            self._log_sampled(shard, "Agendamento registrado nas métricas",
+                              lead_id=lead_id, slot=slot, success=success)
+
+    def _log_sampled(self, shard: _Shard, event: str, **fields: Any) -> None:
+        shard.logged += 1
+        if shard.logged % self.log_every == 0:
+            logger.info(event, amostra=f"1/{self.log_every}", **fields)
+
+    def record_circuit_transition(self, name: str, from_state: str, to_state: str):
+        """Registra mudança de estado de um circuit breaker"""
         with self._lock:
-            timestamp = datetime.now(timezone.utc)
-            
-            metric = {
-                'timestamp': timestamp,
-                'type': 'meeting_scheduled',
-                'lead_id': lead_id,
-                'slot': slot,
-                'success': success
-            }
-            
-            self.meeting_metrics.append(metric)
-            self.meeting_counters['total_attempts'] += 1
-            
-            if success:
-                self.meeting_counters['successful_schedules'] += 1
-            else:
-                self.meeting_counters['failed_schedules'] += 1
-            
-            logger.info(
-                "Agendamento registrado nas métricas",
-                lead_id=lead_id,
-                slot=slot,
-                success=success,
-                total_attempts=self.meeting_counters['total_attempts']
+            self.circuit_states[name] = to_state
+            self.circuit_transitions[f"{name}:{from_state}->{to_state}"] += 1
+
+            logger.warning(
+                "Circuit breaker mudou de estado",
+                circuit=name,
+                from_state=from_state,
+                to_state=to_state
             )
-    
+
+    # Leitura (soma os shards) ---------------------------------------------
+    def _all_shards(self) -> List[_Shard]:
+        # Chamado com ``_registry_lock``
+        return self._shards + [self._retired]
+
+    def _totals(self) -> List[float]:
+        summed = [0] * COUNTER_SLOTS
+        with self._registry_lock:
+            for shard in self._all_shards():
+                for index, value in enumerate(shard.totals()):
+                    summed[index] += value
+        return summed
+
+    def _window(self, window_minutes: int) -> List[float]:
+        """Soma dos últimos ``window_minutes`` minutos (incluindo o atual)."""
+        current = int(self._clock() // 60)
+        summed = [0] * COUNTER_SLOTS
+        with self._registry_lock:
+            for shard in self._all_shards():
+                for minute in range(current - min(window_minutes, self._minutes) + 1, current + 1):
+                    counts = shard.minute_counts(minute)
+                    if counts is not None:
+                        for index, value in enumerate(list(counts)):
+                            summed[index] += value
+        return summed
+
+    @staticmethod
+    def _score_histogram(counts: List[float]) -> LatencyHistogram:
+        histogram = LatencyHistogram(SCORE_BUCKETS)
+        histogram.buckets = [int(n) for n in counts[SCORE_BUCKET_0:]]
+        histogram.count = sum(histogram.buckets)
+        histogram.total_ms = counts[SCORE_SUM]
+        return histogram
+
+    @staticmethod
+    def _score_summary(counts: List[float]) -> Dict[str, Any]:
+        buckets = [int(n) for n in counts[SCORE_BUCKET_0:]]
+        return {
+            'count': sum(buckets),
+            'sum': counts[SCORE_SUM],
+            'buckets': dict(zip([f"le_{bound:g}" for bound in SCORE_BUCKETS] + ['inf'], buckets)),
+        }
+
+    @staticmethod
+    def _counter_groups(counts: List[float]) -> Dict[str, Dict[str, int]]:
+        """Contadores no formato de ``totals`` do resumo."""
+        groups = {
+            'messages': {
+                'total_sent': counts[SENT_OK] + counts[SENT_FAILED],
+                'successful_sent': counts[SENT_OK],
+                'failed_sent': counts[SENT_FAILED],
+                'deduped': counts[DEDUPED],
+            },
+            'qualifications': {
+                'total_qualifications': counts[QUALIFIED] + counts[NOT_QUALIFIED],
+                'qualified': counts[QUALIFIED],
+                'not_qualified': counts[NOT_QUALIFIED],
+            },
+            'meetings': {
+                'total_attempts': counts[MEETING_OK] + counts[MEETING_FAILED],
+                'successful_schedules': counts[MEETING_OK],
+                'failed_schedules': counts[MEETING_FAILED],
+            },
+        }
+        # Só os contadores que já aconteceram, como nos defaultdicts de antes
+        return {group: {k: int(v) for k, v in values.items() if v} for group, values in groups.items()}
+
     def get_metrics_summary(self) -> Dict[str, Any]:
         """Retorna resumo das métricas"""
+        totals = self._counter_groups(self._totals())
+        last_hour = self._window(60)
         with self._lock:
-            self._cleanup_old_metrics()
-            
-            now = datetime.now(timezone.utc)
-            one_hour_ago = now - timedelta(hours=1)
-            
-            # Métricas da última hora
-            recent_messages = [m for m in self.message_metrics if m['timestamp'] > one_hour_ago]
-            recent_qualifications = [m for m in self.qualification_metrics if m['timestamp'] > one_hour_ago]
-            recent_meetings = [m for m in self.meeting_metrics if m['timestamp'] > one_hour_ago]
-            
-            return {
-                'timestamp': now.isoformat(),
-                'retention_hours': self.retention_hours,
-                'totals': {
-                    'messages': dict(self.message_counters),
-                    'qualifications': dict(self.qualification_counters),
-                    'meetings': dict(self.meeting_counters)
+            circuit_breakers = {
+                'states': dict(self.circuit_states),
+                'transitions': dict(self.circuit_transitions)
+            }
+        return {
+            'timestamp': datetime.fromtimestamp(self._clock(), timezone.utc).isoformat(),
+            'retention_hours': self.retention_hours,
+            'totals': totals,
+            'last_hour': {
+                'messages': {
+                    'total': int(last_hour[SENT_OK] + last_hour[SENT_FAILED] + last_hour[DEDUPED]),
+                    'successful': int(last_hour[SENT_OK]),
+                    'failed': int(last_hour[SENT_FAILED]),
+                    'deduped': int(last_hour[DEDUPED])
                 },
-                'last_hour': {
-                    'messages': {
-                        'total': len(recent_messages),
-                        'successful': len([m for m in recent_messages if m.get('success')]),
-                        'failed': len([m for m in recent_messages if not m.get('success')]),
-                        'deduped': len([m for m in recent_messages if m['type'] == 'message_deduped'])
-                    },
-                    'qualifications': {
-                        'total': len(recent_qualifications),
-                        'qualified': len([m for m in recent_qualifications if m.get('qualified')]),
-                        'not_qualified': len([m for m in recent_qualifications if not m.get('qualified')])
-                    },
-                    'meetings': {
-                        'total': len(recent_meetings),
-                        'successful': len([m for m in recent_meetings if m.get('success')]),
-                        'failed': len([m for m in recent_meetings if not m.get('success')])
-                    }
+                'qualifications': {
+                    'total': int(last_hour[QUALIFIED] + last_hour[NOT_QUALIFIED]),
+                    'qualified': int(last_hour[QUALIFIED]),
+                    'not_qualified': int(last_hour[NOT_QUALIFIED]),
+                    'score': self._score_summary(last_hour)
                 },
-                'rates': {
-                    'message_success_rate': self._calculate_success_rate(
-                        self.message_counters['successful_sent'],
-                        self.message_counters['total_sent']
-                    ),
-                    'qualification_rate': self._calculate_success_rate(
-                        self.qualification_counters['qualified'],
-                        self.qualification_counters['total_qualifications']
-                    ),
-                    'meeting_success_rate': self._calculate_success_rate(
-                        self.meeting_counters['successful_schedules'],
-                        self.meeting_counters['total_attempts']
-                    )
+                'meetings': {
+                    'total': int(last_hour[MEETING_OK] + last_hour[MEETING_FAILED]),
+                    'successful': int(last_hour[MEETING_OK]),
+                    'failed': int(last_hour[MEETING_FAILED])
                 }
-            }
-    
+            },
+            'rates': {
+                'message_success_rate': self._calculate_success_rate(
+                    totals['messages'].get('successful_sent', 0),
+                    totals['messages'].get('total_sent', 0)
+                ),
+                'qualification_rate': self._calculate_success_rate(
+                    totals['qualifications'].get('qualified', 0),
+                    totals['qualifications'].get('total_qualifications', 0)
+                ),
+                'meeting_success_rate': self._calculate_success_rate(
+                    totals['meetings'].get('successful_schedules', 0),
+                    totals['meetings'].get('total_attempts', 0)
+                )
+            },
+            'circuit_breakers': circuit_breakers
+        }
+
+    def _recent(self) -> List[Dict[str, Any]]:
+        """Últimos ``recent_events`` eventos de todas as threads, em ordem."""
+        with self._registry_lock:
+            events = [event for shard in self._all_shards() for event in list(shard.events)]
+        events.sort(key=lambda event: event[0])
+        converted = []
+        for ts, kind, subject, extra in events[-self.recent_events:]:
+            metric: Dict[str, Any] = {'timestamp': datetime.fromtimestamp(ts, timezone.utc)}
+            if kind in (SENT_OK, SENT_FAILED):
+                metric.update(type='message_sent', telefone=subject, success=kind == SENT_OK, details=extra)
+            elif kind == DEDUPED:
+                metric.update(type='message_deduped', telefone=subject, reason=extra)
+            elif kind in (QUALIFIED, NOT_QUALIFIED):
+                metric.update(type='qualification_completed', lead_id=subject, score=extra,
+                              qualified=kind == QUALIFIED)
+            else:
+                metric.update(type='meeting_scheduled', lead_id=subject, slot=extra, success=kind == MEETING_OK)
+            converted.append(metric)
+        return converted
+
     def get_detailed_metrics(self) -> Dict[str, Any]:
-        """Retorna métricas detalhadas com histórico"""
+        """Retorna o resumo, a janela completa e os últimos eventos"""
+        events = self._recent()
+        window = self._window(self._minutes)
+        return {
+            'messages': [m for m in events if m['type'] in ('message_sent', 'message_deduped')],
+            'qualifications': [m for m in events if m['type'] == 'qualification_completed'],
+            'meetings': [m for m in events if m['type'] == 'meeting_scheduled'],
+            'window': {
+                'hours': self.retention_hours,
+                'counters': {name: int(window[slot]) for name, slot in WINDOW_EVENTS.items()},
+                'score': self._score_summary(window),
+            },
+            'summary': self.get_metrics_summary()
+        }
+
+    def render_prometheus(self, latency: Optional[Dict[str, LatencyHistogram]] = None) -> str:
+        """Métricas no formato de exposição texto do Prometheus (0.0.4).
+
+        ``latency`` são os histogramas por estágio do tracer, exportados como
+        ``agente_stage_latency_seconds``.
+        """
+        totals = self._totals()
+        groups = self._counter_groups(totals)
+        messages, qualifications, meetings = groups['messages'], groups['qualifications'], groups['meetings']
+        score = self._score_histogram(totals)
+        last_hour = self._window(60)
         with self._lock:
-            self._cleanup_old_metrics()
-            
-            return {
-                'messages': [dict(m) for m in self.message_metrics],
-                'qualifications': [dict(m) for m in self.qualification_metrics],
-                'meetings': [dict(m) for m in self.meeting_metrics],
-                'summary': self.get_metrics_summary()
-            }
-    
+            states = dict(self.circuit_states)
+            transitions = dict(self.circuit_transitions)
+
+        lines: List[str] = []
+        _counter(lines, 'agente_messages_total', 'Mensagens de saída por resultado', 'result', {
+            'sent_ok': messages.get('successful_sent', 0),
+            'failed': messages.get('failed_sent', 0),
+            'deduped': messages.get('deduped', 0),
+        })
+        _counter(lines, 'agente_qualifications_total', 'Qualificações concluídas por resultado', 'result', {
+            'qualified': qualifications.get('qualified', 0),
+            'not_qualified': qualifications.get('not_qualified', 0),
+        })
+        _counter(lines, 'agente_meetings_total', 'Tentativas de agendamento por resultado', 'result', {
+            'success': meetings.get('successful_schedules', 0),
+            'failed': meetings.get('failed_schedules', 0),
+        })
+        lines += [
+            '# HELP agente_last_hour_events Eventos na última hora (janela móvel por minuto)',
+            '# TYPE agente_last_hour_events gauge',
+        ]
+        for name, slot in WINDOW_EVENTS.items():
+            lines.append(f'agente_last_hour_events{{event="{name}"}} {int(last_hour[slot])}')
+        _histogram(lines, 'agente_qualification_score', 'Score das qualificações concluídas',
+                   {'': score}, scale=1.0)
+        lines += [
+            '# HELP agente_circuit_breaker_open 1 quando o circuit breaker está aberto',
+            '# TYPE agente_circuit_breaker_open gauge',
+        ]
+        for name, state in sorted(states.items()):
+            lines.append(f'agente_circuit_breaker_open{{circuit="{name}"}} {int(state == "open")}')
+        lines += [
+            '# HELP agente_circuit_breaker_transitions_total Transições de estado dos circuit breakers',
+            '# TYPE agente_circuit_breaker_transitions_total counter',
+        ]
+        for key, value in sorted(transitions.items()):
+            name, _, change = key.partition(':')
+            from_state, _, to_state = change.partition('->')
+            lines.append(
+                f'agente_circuit_breaker_transitions_total{{circuit="{name}",from="{from_state}",to="{to_state}"}} {value}'
+            )
+        if latency:
+            _histogram(lines, 'agente_stage_latency_seconds', 'Latência por estágio do pipeline',
+                       {f'stage="{stage}"': histogram for stage, histogram in latency.items()}, scale=0.001)
+        return '\n'.join(lines) + '\n'
+
     def log_metrics_summary(self):
         """Loga um resumo das métricas"""
         summary = self.get_metrics_summary()
-        
+
         logger.info(
             "Resumo de Métricas do Sistema",
             **{
@@ -229,40 +470,49 @@ class MetricsService:
                 'last_hour_meetings': summary['last_hour']['meetings']['total']
             }
         )
-    
+
     def _calculate_success_rate(self, successful: int, total: int) -> float:
         """Calcula taxa de sucesso em percentual"""
         if total == 0:
             return 0.0
         return (successful / total) * 100.0
-    
-    def _cleanup_old_metrics(self):
-        """Remove métricas antigas"""
-        cutoff = datetime.now(timezone.utc) - timedelta(seconds=self.retention_seconds)
-        
-        # Limpar métricas de mensagens
-        while self.message_metrics and self.message_metrics[0]['timestamp'] < cutoff:
-            self.message_metrics.popleft()
-        
-        # Limpar métricas de qualificação
-        while self.qualification_metrics and self.qualification_metrics[0]['timestamp'] < cutoff:
-            self.qualification_metrics.popleft()
-        
-        # Limpar métricas de reuniões
-        while self.meeting_metrics and self.meeting_metrics[0]['timestamp'] < cutoff:
-            self.meeting_metrics.popleft()
-    
-    def _start_cleanup_thread(self):
-        """Inicia thread de limpeza periódica"""
-        def cleanup_worker():
+
+    def _start_summary_thread(self):
+        """Inicia thread que loga o resumo a cada hora"""
+        def summary_worker():
             while True:
-                time.sleep(3600)  # Limpar a cada hora
-                with self._lock:
-                    self._cleanup_old_metrics()
-                    self.log_metrics_summary()
-        
-        cleanup_thread = threading.Thread(target=cleanup_worker, daemon=True)
-        cleanup_thread.start()
+                time.sleep(3600)
+                self.log_metrics_summary()
+
+        summary_thread = threading.Thread(target=summary_worker, daemon=True)
+        summary_thread.start()
+
+
+def _number(value: float) -> str:
+    return f"{value:g}" if isinstance(value, float) else str(value)
+
+
+def _counter(lines: List[str], name: str, help_text: str, label: str, values: Dict[str, int]) -> None:
+    lines += [f'# HELP {name} {help_text}', f'# TYPE {name} counter']
+    for label_value, value in values.items():
+        lines.append(f'{name}{{{label}="{label_value}"}} {value}')
+
+
+def _histogram(lines: List[str], name: str, help_text: str,
+               series: Dict[str, LatencyHistogram], scale: float) -> None:
+    """Histograma Prometheus (buckets cumulativos); ``scale`` converte a unidade."""
+    lines += [f'# HELP {name} {help_text}', f'# TYPE {name} histogram']
+    for labels, histogram in series.items():
+        prefix = f'{labels},' if labels else ''
+        cumulative = 0
+        for bound, hits in zip(histogram.bounds_ms, histogram.buckets):
+            cumulative += hits
+            lines.append(f'{name}_bucket{{{prefix}le="{bound * scale:g}"}} {cumulative}')
+        lines.append(f'{name}_bucket{{{prefix}le="+Inf"}} {histogram.count}')
+        suffix = f'{{{labels}}}' if labels else ''
+        lines.append(f'{name}_sum{suffix} {_number(histogram.total_ms * scale)}')
+        lines.append(f'{name}_count{suffix} {histogram.count}')
+
 
 # Instância global do serviço de métricas
 metrics_service = MetricsService()
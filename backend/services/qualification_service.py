@@ -6,7 +6,7 @@ import os
 import re
 from dataclasses import asdict
 from datetime import datetime, timezone
-from typing import Any, Dict, Optional, List
+from typing import Any, Dict, Optional, List, Tuple
 
 import structlog
 
@@ -16,12 +16,12 @@ from backend.models.database_models import (
     SessionRepository,
     MessageRepository,
     QualificacaoRepository,
-    Qualificacao,
     LeadRepository,
     Message,
     ReuniaoRepository,
     Reuniao,
 )
+from backend.models.unit_of_work import InboundStore, InboundUnitOfWork
 from backend.services.messaging_service import MessagingService
 from backend.services.qualification_flow import (
     QualificationFlow,
@@ -29,6 +29,7 @@ from backend.services.qualification_flow import (
     FlowContext,
     FlowResult,
 )
+from backend.services.tracing import tracer
 from backend.services.whatsapp_service import WhatsAppService
 
 logger = structlog.get_logger()
@@ -53,6 +54,7 @@ class QualificationService:
         reuniao_repo: ReuniaoRepository,
         messaging_service: MessagingService,
         whatsapp_service: WhatsAppService,
+        inbound_store: Optional[InboundStore] = None,
     ) -> None:
         self.lead_repo = lead_repo
         self.session_repo = session_repo
@@ -61,6 +63,10 @@ class QualificationService:
         self.reuniao_repo = reuniao_repo
         self.messaging_service = messaging_service
         self.whatsapp_service = whatsapp_service
+        # Without a client the store always uses the sequential repository calls
+        self.inbound_store = inbound_store or InboundStore(
+            lead_repo, session_repo, message_repo, qualificacao_repo, reuniao_repo
+        )
         self.flow = QualificationFlow()
         self.agenda_slots = self._load_agenda_slots()
         self.agenda_link = os.getenv('AGENDA_DIAGNOSTICO_URL')
@@ -91,19 +97,57 @@ class QualificationService:
             logger.info("Session already active", lead_id=lead_id, session_id=session['id'])
             return {"success": True, "session_id": session['id'], "mensagem_inicial": None}
 
+        context, session_model = self._nova_sessao(lead_id, nome, origem_canal, contexto_extra)
+        created = self.session_repo.create_session(session_model)
+        if not created:
+            logger.error("Failed to create session", lead_id=lead_id)
+            return {"success": False, "error": "session_creation_failed"}
+
+        return self._enviar_mensagem_inicial(
+            lead_id,
+            telefone_normalizado,
+            created['id'],
+            context,
+            origem_canal,
+            contexto_extra=contexto_extra,
+            mensagem_inicial=mensagem_inicial,
+            usar_template=usar_template,
+        )
+
+    def _nova_sessao(
+        self,
+        lead_id: Optional[str],
+        nome: Optional[str],
+        origem_canal: str,
+        contexto_extra: Optional[str] = None,
+    ) -> Tuple[FlowContext, Session]:
         context = self.flow.initial_context(self._first_name(nome))
         context.lead_id = lead_id
         session_model = Session(
-            lead_id=lead_id,
+            lead_id=lead_id or '',
             estado=FlowState.WAITING_FIRST_REPLY.value,
             contexto=self._context_to_dict(context, origem_canal, contexto_extra),
             ativa=True,
         )
-        created = self.session_repo.create_session(session_model)
-        if not created:
-            logger.error("Failed to create session", lead_id=lead_id)
-            return {"success": False, "error": "session_creation_failed"}
+        return context, session_model
 
+    def _enviar_mensagem_inicial(
+        self,
+        lead_id: str,
+        telefone_normalizado: str,
+        session_id: str,
+        context: FlowContext,
+        origem_canal: str,
+        contexto_extra: Optional[str] = None,
+        mensagem_inicial: Optional[str] = None,
+        usar_template: bool = True,
+        uow: Optional[InboundUnitOfWork] = None,
+    ) -> Dict[str, Any]:
+        """Sends the opening message of a just-created session.
+
+        With ``uow`` (a session created by the inbound load) the lead status
+        is staged on it; the session already holds this state and contexto.
+        """
         custom_message = None
         if mensagem_inicial:
             custom_message = self._render_custom_initial_message(
@@ -123,28 +167,32 @@ class QualificationService:
             lead_id=lead_id,
             telefone=telefone_normalizado,
             mensagem=initial_message,
-            session_id=created['id'],
+            session_id=session_id,
             metadata={"etapa": "mensagem_inicial", "canal": origem_canal},
         )
         if not send_result.get("success"):
             logger.error("Failed to send initial message", lead_id=lead_id, reason=send_result)
             return {"success": False, "error": "whatsapp_send_failed", "details": send_result}
 
-        self.session_repo.update_session(
-            created['id'],
-            {
-                'estado': FlowState.WAITING_FIRST_REPLY.value,
-                'contexto': self._context_to_dict(context, origem_canal, contexto_extra),
-            },
-        )
-        self.lead_repo.update_lead(lead_id, {'status': 'em_qualificacao'})
+        if uow is not None:
+            uow.update_lead(lead_id, {'status': 'em_qualificacao'})
+        else:
+            self.session_repo.update_session(
+                session_id,
+                {
+                    'estado': FlowState.WAITING_FIRST_REPLY.value,
+                    'contexto': self._context_to_dict(context, origem_canal, contexto_extra),
+                },
+            )
+            self.lead_repo.update_lead(lead_id, {'status': 'em_qualificacao'})
 
         return {
             "success": True,
-            "session_id": created['id'],
+            "session_id": session_id,
             "mensagem_inicial": initial_message,
         }
 
+    @tracer.traced('qualification.processar_mensagem')
     def processar_mensagem_recebida(
         self,
         lead_id: str,
@@ -153,8 +201,57 @@ class QualificationService:
         nome: Optional[str] = None,
     ) -> Dict[str, Any]:
         """Processes an inbound message from the lead."""
+        uow = self.inbound_store.begin()
+        snapshot = uow.load_by_lead(lead_id)
+        return self._processar_mensagem(uow, lead_id, snapshot.session, telefone, mensagem, nome)
+
+    @tracer.traced('qualification.processar_mensagem')
+    def processar_mensagem_por_telefone(
+        self,
+        telefone: str,
+        mensagem: str,
+        nome: Optional[str] = None,
+    ) -> Dict[str, Any]:
+        """Processes an inbound message, loading (or creating) the lead by phone.
+
+        Lead, active session and qualificação are read in one unit-of-work
+        load and every write is flushed together at the end.
+        """
+        uow = self.inbound_store.begin()
+        _, nova_sessao = self._nova_sessao(None, nome, "whatsapp")
+        snapshot = uow.load_by_phone(telefone, nome or 'tudo bem', new_session=nova_sessao)
+        if not snapshot.lead:
+            logger.error("Could not create lead for incoming message", telefone=telefone)
+            return {'success': False, 'error': 'lead_creation_failed'}
+
+        lead_id = snapshot.lead['id']
+        session = snapshot.session
+        if snapshot.session_created:
+            logger.info("Created a session on the fly for incoming message", lead_id=lead_id)
+            context = self._context_from_session(session)
+            context.lead_id = lead_id
+            init = self._enviar_mensagem_inicial(
+                lead_id, self.normalizar_telefone(telefone), session['id'], context, "whatsapp",
+                usar_template=False, uow=uow,
+            )
+            if not init.get("success"):
+                return init
+            # The loaded row is current; the flow stages its contexto on the uow
+            session = {**session, 'lead_id': lead_id, 'contexto': self._context_to_dict(context, "whatsapp", None)}
+            # A fresh session has no qualificação yet
+            snapshot.qualificacao_loaded = True
+        return self._processar_mensagem(uow, lead_id, session, telefone, mensagem, nome)
+
+    def _processar_mensagem(
+        self,
+        uow: InboundUnitOfWork,
+        lead_id: str,
+        session: Optional[Dict[str, Any]],
+        telefone: str,
+        mensagem: str,
+        nome: Optional[str],
+    ) -> Dict[str, Any]:
         telefone_normalizado = self.normalizar_telefone(telefone)
-        session = self.session_repo.get_active_session(lead_id)
         contexto_extra = None
         origem = "whatsapp"
 
@@ -170,13 +267,16 @@ class QualificationService:
             if not init.get("success"):
                 return init
             session = self.session_repo.get_active_session(lead_id)
+            # A fresh session has no qualificação yet
+            if uow.snapshot is not None:
+                uow.snapshot.qualificacao_loaded = True
 
         session_id = session['id']
         context = self._context_from_session(session)
         context.lead_id = lead_id
         estado_atual = FlowState(session.get('estado', FlowState.WAITING_FIRST_REPLY.value))
 
-        self.message_repo.create_message(
+        uow.add_message(
             Message(
                 session_id=session_id,
                 lead_id=lead_id,
@@ -186,7 +286,8 @@ class QualificationService:
             )
         )
 
-        flow_result = self.flow.next_step(estado_atual, context, mensagem)
+        with tracer.span('qualification.flow'):
+            flow_result = self.flow.next_step(estado_atual, context, mensagem)
 
         # Ajustar mensagens para estados específicos antes do envio
         if flow_result.next_state == FlowState.OFFER_MEETING:
@@ -205,10 +306,11 @@ class QualificationService:
                 mensagem=flow_result.reply,
                 session_id=session_id,
                 metadata=send_metadata,
+                conversa_count=flow_result.context.bot_messages,
             )
             reply_sent = send_result
 
-        self.session_repo.update_session(
+        uow.update_session(
             session_id,
             {
                 'estado': flow_result.next_state.value,
@@ -218,16 +320,19 @@ class QualificationService:
         )
 
         if flow_result.lead_status:
-            self.lead_repo.update_lead(lead_id, {'status': flow_result.lead_status})
+            uow.update_lead(lead_id, {'status': flow_result.lead_status})
 
         if flow_result.notes:
-            self._persist_qualificacao(lead_id, session_id, flow_result)
+            self._persist_qualificacao(uow, lead_id, session_id, flow_result)
         if flow_result.lead_status == 'reuniao_agendada':
-            self._registrar_reuniao(lead_id, session_id, flow_result.context.meeting_preference)
+            self._registrar_reuniao(uow, lead_id, session_id, flow_result.context.meeting_preference)
             # Registrar métrica de reunião agendada
             slot = flow_result.context.meeting_preference or "não especificado"
             metrics_service.record_meeting_scheduled(lead_id, slot, True)
 
+        # Todas as escritas da mensagem em uma única ida ao banco
+        uow.flush()
+
         return {
             "success": True,
             "session_id": session_id,
@@ -240,15 +345,13 @@ class QualificationService:
     # ------------------------------------------------------------------
     # Helpers
 
-    def _persist_qualificacao(self, lead_id: str, session_id: str, flow_result: FlowResult) -> None:
-        registro = self.qualificacao_repo.get_lead_qualificacao(lead_id)
-        if not registro:
-            registro = self.qualificacao_repo.create_qualificacao(
-                Qualificacao(lead_id=lead_id, session_id=session_id)
-            )
-        if not registro:
-            return
-
+    def _persist_qualificacao(
+        self,
+        uow: InboundUnitOfWork,
+        lead_id: str,
+        session_id: str,
+        flow_result: FlowResult,
+    ) -> None:
         updates: Dict[str, Any] = {}
         notas = flow_result.notes
         if 'patrimonio_faixa' in notas:
@@ -264,9 +367,15 @@ class QualificationService:
         elif flow_result.lead_status == 'nao_interessado':
             updates['resultado'] = 'nao_interessado'
         updates['observacoes'] = json.dumps(notas)
-        self.qualificacao_repo.update_qualificacao(registro['id'], updates)
+        uow.upsert_qualificacao(lead_id, session_id, updates)
 
-    def _registrar_reuniao(self, lead_id: str, session_id: str, preferencia: Optional[str]) -> None:
+    def _registrar_reuniao(
+        self,
+        uow: InboundUnitOfWork,
+        lead_id: str,
+        session_id: str,
+        preferencia: Optional[str],
+    ) -> None:
         if not preferencia:
             return
         try:
@@ -276,7 +385,7 @@ class QualificationService:
                 link_reuniao=self.agenda_link,
                 observacoes=f"Sessão {session_id}: {preferencia}",
             )
-            self.reuniao_repo.create_reuniao(reuniao)
+            uow.add_reuniao(reuniao)
         except Exception as exc:  # pylint: disable=broad-except
             logger.error(
                 "Erro ao registrar reunião",
@@ -0,0 +1,124 @@
+"""Retry backoff and circuit breaker used for outbound WAHA calls."""
+from __future__ import annotations
+
+import random
+import threading
+import time
+from typing import Callable, Optional
+
+
+class RetryPolicy:
+    """Bounded attempts with "decorrelated jitter" backoff.
+
+    Each delay is drawn from ``uniform(base, previous * 3)`` and capped, which
+    spreads retries from many senders instead of synchronising them.
+    """
+
+    def __init__(
+        self,
+        max_attempts: int = 3,
+        base_delay: float = 1.0,
+        max_delay: float = 30.0,
+        rng: Optional[random.Random] = None,
+    ) -> None:
+        self.max_attempts = max(1, max_attempts)
+        self.base_delay = max(0.0, base_delay)
+        self.max_delay = max(self.base_delay, max_delay)
+        self._rng = rng or random.Random()
+
+    def should_retry(self, attempt: int) -> bool:
+        """``attempt`` is the 1-based number of the attempt that just failed."""
+        return attempt < self.max_attempts
+
+    def next_delay(self, previous_delay: Optional[float] = None) -> float:
+        previous = previous_delay if previous_delay else self.base_delay
+        upper = max(self.base_delay, previous * 3)
+        return min(self.max_delay, self._rng.uniform(self.base_delay, upper))
+
+
+class CircuitBreaker:
+    """Classic closed → open → half-open breaker.
+
+    After ``failure_threshold`` consecutive failures the circuit opens and
+    ``allow_request`` fast-fails until ``cooldown_seconds`` elapsed. Then a
+    limited number of trial calls is let through (half-open): a success
+    closes the circuit, a failure opens it again.
+    """
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(
+        self,
+        name: str,
+        failure_threshold: int = 5,
+        cooldown_seconds: float = 30.0,
+        half_open_max_calls: int = 1,
+        on_transition: Optional[Callable[[str, str, str], None]] = None,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        self.name = name
+        self.failure_threshold = max(1, failure_threshold)
+        self.cooldown_seconds = cooldown_seconds
+        self.half_open_max_calls = max(1, half_open_max_calls)
+        self.on_transition = on_transition
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._state = self.CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._half_open_calls = 0
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            self._maybe_half_open()
+            return self._state
+
+    def remaining_cooldown(self) -> float:
+        with self._lock:
+            if self._state != self.OPEN:
+                return 0.0
+            return max(0.0, self._opened_at + self.cooldown_seconds - self._clock())
+
+    def allow_request(self) -> bool:
+        with self._lock:
+            self._maybe_half_open()
+            if self._state == self.CLOSED:
+                return True
+            if self._state == self.HALF_OPEN and self._half_open_calls < self.half_open_max_calls:
+                self._half_open_calls += 1
+                return True
+            return False
+
+    def record_success(self) -> None:
+        with self._lock:
+            self._failures = 0
+            if self._state != self.CLOSED:
+                self._transition(self.CLOSED)
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self._failures += 1
+            if self._state == self.HALF_OPEN or (
+                self._state == self.CLOSED and self._failures >= self.failure_threshold
+            ):
+                self._opened_at = self._clock()
+                self._transition(self.OPEN)
+
+    def _maybe_half_open(self) -> None:
+        if self._state == self.OPEN and self._clock() - self._opened_at >= self.cooldown_seconds:
+            self._transition(self.HALF_OPEN)
+
+    def _transition(self, new_state: str) -> None:
+        old_state = self._state
+        self._state = new_state
+        self._half_open_calls = 0
+        if new_state == self.CLOSED:
+            self._failures = 0
+        if self.on_transition:
+            try:
+                self.on_transition(self.name, old_state, new_state)
+            except Exception:  # pylint: disable=broad-except
+                pass
@@ -0,0 +1,193 @@
+"""Batched Google Sheets write-back through ``values().batchUpdate``."""
+from __future__ import annotations
+
+import time
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import structlog
+
+from backend.services.retry_policy import RetryPolicy
+
+logger = structlog.get_logger()
+
+
+def column_index(letters: str) -> int:
+    """0-based column index of A1 column letters (A -> 0, AA -> 26)."""
+    index = 0
+    for letter in letters.upper():
+        index = index * 26 + ord(letter) - ord('A') + 1
+    return index - 1
+
+
+def column_letter(index: int) -> str:
+    """A1 column letters for a 0-based column index (0 -> A, 26 -> AA)."""
+    letters = ''
+    index += 1
+    while index:
+        index, remainder = divmod(index - 1, 26)
+        letters = chr(ord('A') + remainder) + letters
+    return letters
+
+
+@dataclass
+class SheetFlushResult:
+    """Outcome of one ``flush``; ``failed`` ranges stay queued for the next one."""
+
+    requests: int = 0
+    ranges_written: int = 0
+    retried_ranges: int = 0
+    failed: List[str] = field(default_factory=list)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "requests": self.requests,
+            "ranges_written": self.ranges_written,
+            "retried_ranges": self.retried_ranges,
+            "failed": list(self.failed),
+        }
+
+
+class SheetBatchWriter:
+    """Collects row updates during a pass and writes only the changed cells.
+
+    ``update_row`` records the cells whose value differs from the row as it
+    was read; adjacent changed cells of a row are merged into one range.
+    ``flush`` sends everything as ``values().batchUpdate`` requests of up to
+    ``max_ranges_per_request`` ranges. When a batch request fails, its
+    ranges are retried one by one (``values().update``) with the retry
+    policy's backoff, so one bad range does not sink the others; ranges
+    that still fail stay queued. With ``auto_flush_rows`` the writer flushes
+    by itself once that many rows are pending, bounding what a crash
+    mid-pass can lose. ``first_column`` is the 0-based column where the
+    header starts (ranges like ``C1:J`` start at 2).
+    """
+
+    def __init__(
+        self,
+        sheets_api: Any,
+        spreadsheet_id: Optional[str],
+        sheet_name: str,
+        first_column: int = 0,
+        max_ranges_per_request: int = 200,
+        auto_flush_rows: int = 0,
+        retry_policy: Optional[RetryPolicy] = None,
+        sleep: Callable[[float], None] = time.sleep,
+    ) -> None:
+        self.sheets_api = sheets_api
+        self.spreadsheet_id = spreadsheet_id
+        self.sheet_name = sheet_name
+        self.first_column = first_column
+        self.max_ranges_per_request = max(1, max_ranges_per_request)
+        self.auto_flush_rows = auto_flush_rows
+        self.retry_policy = retry_policy or RetryPolicy(max_attempts=3, base_delay=1.0, max_delay=10.0)
+        self._sleep = sleep
+        # (row, column index) -> value; later updates of a cell win
+        self._cells: Dict[Tuple[int, int], Any] = {}
+        self._rows: set = set()
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.sheets_api is not None and self.spreadsheet_id)
+
+    def pending(self) -> int:
+        """Rows with queued changes."""
+        return len(self._rows)
+
+    def update_row(
+        self,
+        row_number: int,
+        header: List[str],
+        original_row: List[str],
+        updates: Dict[str, Any],
+    ) -> List[str]:
+        """Queue ``updates`` (header name -> value) for a row; returns the row as it will read."""
+        row_values = list(original_row) + [''] * (len(header) - len(original_row))
+        for key, value in updates.items():
+            if key not in header:
+                continue
+            idx = header.index(key)
+            if row_values[idx] != value:
+                row_values[idx] = value
+                self._cells[(row_number, idx)] = value
+                self._rows.add(row_number)
+        if self.auto_flush_rows and len(self._rows) >= self.auto_flush_rows:
+            self.flush()
+        return row_values
+
+    def flush(self) -> SheetFlushResult:
+        """Write every queued cell; see the class docstring for retries."""
+        result = SheetFlushResult()
+        if not self._cells or not self.enabled:
+            return result
+
+        data = self._ranges()
+        self._cells, self._rows = {}, set()
+        for start in range(0, len(data), self.max_ranges_per_request):
+            chunk = data[start:start + self.max_ranges_per_request]
+            result.requests += 1
+            try:
+                self.sheets_api.values().batchUpdate(
+                    spreadsheetId=self.spreadsheet_id,
+                    body={'valueInputOption': 'RAW', 'data': [entry for entry, _ in chunk]},
+                ).execute()
+                result.ranges_written += len(chunk)
+            except Exception as exc:  # pylint: disable=broad-except
+                logger.warning("Sheets batchUpdate failed, retrying per range", ranges=len(chunk), error=str(exc))
+                for entry, cells in chunk:
+                    result.retried_ranges += 1
+                    if self._write_range(entry, result):
+                        result.ranges_written += 1
+                    else:
+                        result.failed.append(entry['range'])
+                        self._requeue(cells)
+
+        if result.failed:
+            logger.error("Sheets ranges not written, kept for the next flush", ranges=result.failed)
+        return result
+
+    def _write_range(self, entry: Dict[str, Any], result: SheetFlushResult) -> bool:
+        delay = None
+        for attempt in range(1, self.retry_policy.max_attempts + 1):
+            result.requests += 1
+            try:
+                self.sheets_api.values().update(
+                    spreadsheetId=self.spreadsheet_id,
+                    range=entry['range'],
+                    valueInputOption='RAW',
+                    body={'values': entry['values']},
+                ).execute()
+                return True
+            except Exception as exc:  # pylint: disable=broad-except
+                logger.warning("Sheets range update failed", range=entry['range'], tentativa=attempt, error=str(exc))
+                if not self.retry_policy.should_retry(attempt):
+                    return False
+                delay = self.retry_policy.next_delay(delay)
+                self._sleep(delay)
+        return False
+
+    def _requeue(self, cells: Dict[Tuple[int, int], Any]) -> None:
+        for key, value in cells.items():
+            self._cells.setdefault(key, value)
+            self._rows.add(key[0])
+
+    def _ranges(self) -> List[Tuple[Dict[str, Any], Dict[Tuple[int, int], Any]]]:
+        """Queued cells as ``batchUpdate`` entries, adjacent columns merged."""
+        entries = []
+        run: List[Tuple[Tuple[int, int], Any]] = []
+        for key in sorted(self._cells):
+            if run and (key[0] != run[-1][0][0] or key[1] != run[-1][0][1] + 1):
+                entries.append(self._entry(run))
+                run = []
+            run.append((key, self._cells[key]))
+        if run:
+            entries.append(self._entry(run))
+        return entries
+
+    def _entry(self, run: List[Tuple[Tuple[int, int], Any]]) -> Tuple[Dict[str, Any], Dict[Tuple[int, int], Any]]:
+        row = run[0][0][0]
+        first = column_letter(self.first_column + run[0][0][1])
+        last = column_letter(self.first_column + run[-1][0][1])
+        cell_range = f"{first}{row}" if first == last else f"{first}{row}:{last}{row}"
+        entry = {'range': f"{self.sheet_name}!{cell_range}", 'values': [[value for _, value in run]]}
+        return entry, dict(run)
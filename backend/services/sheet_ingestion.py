@@ -0,0 +1,438 @@
+"""One ingestion engine for the lead sheet, shared by every entry point.
+
+The lead watcher, ``GoogleSheetsService.detectar_novos_leads`` and
+``scripts/process_leads_from_sheet.py`` all hand their rows to
+:class:`SheetIngestionEngine`; what differs between them (which rows are
+pending, whether unknown phones become leads, what is written back) lives
+in an :class:`IngestionPolicy`.
+"""
+from __future__ import annotations
+
+import re
+import time
+import unicodedata
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from typing import TYPE_CHECKING, Any, Callable, Dict, List, Optional, Tuple
+
+import structlog
+
+from backend.models.database_models import Lead, LeadRepository
+from backend.services.sheet_batch_writer import SheetBatchWriter
+
+if TYPE_CHECKING:
+    from backend.services.qualification_service import QualificationService
+
+logger = structlog.get_logger()
+
+PENDING_STATUSES = ('', 'novo', 'new')
+
+
+def normalize_header(header: str) -> str:
+    """``'Lead ID'`` -> ``'lead_id'``, ``'Observação '`` -> ``'observacao'``."""
+    ascii_header = unicodedata.normalize('NFKD', header).encode('ascii', 'ignore').decode('ascii')
+    return re.sub(r'[^0-9a-z]+', '_', ascii_header.strip().lower()).strip('_')
+
+
+def rows_to_dicts(keys: List[str], rows: List[List[str]]) -> List[Dict[str, str]]:
+    """Rows as ``key -> cell`` dicts; short rows (the API drops trailing blanks) are padded."""
+    width = len(keys)
+    padding = [''] * width
+    return [dict(zip(keys, row if len(row) >= width else list(row) + padding[len(row):])) for row in rows]
+
+
+@dataclass
+class SheetRow:
+    """A pending sheet row on its way through the engine."""
+
+    row_number: int
+    row: List[str]
+    values: Dict[str, str]
+    telefone: str = ''
+    nome: str = ''
+    canal: str = ''
+    contexto_extra: str = ''
+    mensagem_inicial: str = ''
+    lead: Optional[Dict[str, Any]] = None
+    # Later rows of the run with the same phone, written back alongside
+    duplicates: List["SheetRow"] = field(default_factory=list)
+    duplicate_updates: Optional[Dict[str, str]] = None
+
+
+@dataclass
+class IngestionReport:
+    """Counters of one run; also the live progress while it runs."""
+
+    rows_total: int = 0
+    rows_parsed: int = 0
+    pending: int = 0
+    leads_resolved: int = 0
+    leads_created: int = 0
+    starts_submitted: int = 0
+    starts_done: int = 0
+    starts_failed: int = 0
+    # (sheet row number, reason) of rows left out before the start stage
+    rejected: List[Tuple[int, str]] = field(default_factory=list)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "rows_total": self.rows_total,
+            "rows_parsed": self.rows_parsed,
+            "pending": self.pending,
+            "leads_resolved": self.leads_resolved,
+            "leads_created": self.leads_created,
+            "starts_submitted": self.starts_submitted,
+            "starts_done": self.starts_done,
+            "starts_failed": self.starts_failed,
+            "rejected": len(self.rejected),
+        }
+
+
+class IngestionPolicy:
+    """What an entry point does with the sheet; the defaults are the watcher's.
+
+    Update dicts are keyed by normalised header name (``lead_id``,
+    ``mensagem_inicial``); keys the sheet has no column for are dropped.
+    """
+
+    state_column = 'status'
+    default_channel = 'planilha'
+    create_missing_leads = True
+    reuse_existing_leads = True
+    # Columns holding a lead id; rows with one are resolved by id before phone
+    lead_id_columns: Tuple[str, ...] = ()
+
+    def is_pending(self, state: str) -> bool:
+        return state.strip().lower() in PENDING_STATUSES
+
+    def validate(self, row: SheetRow) -> Optional[str]:
+        """Reason to leave the row out before any lookup, or None."""
+        return None if row.telefone else 'telefone ausente'
+
+    def new_lead(self, row: SheetRow) -> Lead:
+        return Lead(nome=row.nome, telefone=row.telefone, canal=row.canal)
+
+    def rejected_updates(self, row: SheetRow, reason: str) -> Dict[str, str]:  # pylint: disable=unused-argument
+        return {}
+
+    def success_updates(self, row: SheetRow, result: Dict[str, Any]) -> Dict[str, str]:
+        updates = {
+            'status': 'contatado',
+            'lead_id': row.lead['id'],
+            'observacao': datetime.now(timezone.utc).isoformat(),
+        }
+        if result.get('mensagem_inicial'):
+            updates['mensagem_inicial'] = result['mensagem_inicial']
+        return updates
+
+    def failure_updates(self, row: SheetRow, result: Dict[str, Any]) -> Dict[str, str]:  # pylint: disable=unused-argument
+        return {'status': 'erro_envio', 'observacao': str(result.get('error') or 'falha ao enviar mensagem')}
+
+
+class _Run:
+    """State of one ``SheetIngestionEngine.run`` call."""
+
+    def __init__(self, headers: List[str], rows_total: int, writer: SheetBatchWriter, started: float) -> None:
+        self.headers = headers
+        self.keys = [normalize_header(header) for header in headers]
+        self.header_map = dict(zip(self.keys, headers))
+        self.writer = writer
+        self.report = IngestionReport(rows_total=rows_total)
+        self.started = started
+        self.last_log = started
+        self.in_flight: Dict[Future, SheetRow] = {}
+        self.seen: Dict[str, SheetRow] = {}
+        # Rows as written back, for the batch-end callback
+        self.written: Dict[int, List[str]] = {}
+
+
+class SheetIngestionEngine:
+    """Staged pipeline from sheet rows to started conversations.
+
+    Rows go through in batches of ``batch_rows``:
+
+    1. parse: the state column is checked by index, and only pending rows
+       are turned into dicts (headers normalised once per run);
+    2. resolve: one ``get_leads_by_phones`` lookup (plus ``get_leads_by_ids``
+       when the policy has lead id columns) and one ``create_many`` insert
+       per batch;
+    3. start: sessions and first messages go to a pool of
+       ``start_concurrency`` threads while the next batch is parsed;
+    4. write back: finished starts are queued on the batch writer (from the
+       calling thread only) and flushed at the end of the run.
+
+    A phone repeated within a run is started once; its other rows get the
+    same write-back without the first message.
+    """
+
+    def __init__(
+        self,
+        lead_repo: LeadRepository,
+        qualification_service: "QualificationService",
+        policy: Optional[IngestionPolicy] = None,
+        start_concurrency: int = 8,
+        batch_rows: int = 200,
+        progress_log_seconds: float = 10.0,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        self.lead_repo = lead_repo
+        self.qualification_service = qualification_service
+        self.policy = policy or IngestionPolicy()
+        self.start_concurrency = max(1, start_concurrency)
+        self.batch_rows = max(1, batch_rows)
+        self.progress_log_seconds = progress_log_seconds
+        self._clock = clock
+        self._run: Optional[_Run] = None
+
+    def run(
+        self,
+        headers: List[str],
+        rows: List[List[str]],
+        first_row_number: int,
+        writer: SheetBatchWriter,
+        on_batch: Optional[Callable[[int, List[str]], None]] = None,
+        on_write: Optional[Callable[[int, List[str]], None]] = None,
+    ) -> IngestionReport:
+        """Ingest ``rows`` (sheet row ``first_row_number`` onwards) and flush ``writer``.
+
+        ``on_batch(row_number, values)`` is called with the last row of each
+        parsed batch; ``on_write(row_number, values)`` with every row queued
+        for write-back (``values`` as the row will read).
+        """
+        run = self._run = _Run(headers, len(rows), writer, self._clock())
+        executor = ThreadPoolExecutor(max_workers=self.start_concurrency, thread_name_prefix="SheetIngest")
+        try:
+            for offset in range(0, len(rows), self.batch_rows):
+                batch = rows[offset:offset + self.batch_rows]
+                batch_first = first_row_number + offset
+                pending = self._parse(run, batch, batch_first, on_write)
+                self._resolve(run, pending, on_write)
+                for row in pending:
+                    if row.lead is None:
+                        continue
+                    # Backpressure: parsing runs ahead of the starts by at most this much
+                    while len(run.in_flight) >= self.start_concurrency * 2:
+                        self._drain(run, FIRST_COMPLETED, on_write)
+                    run.in_flight[executor.submit(self._start, row)] = row
+                    run.report.starts_submitted += 1
+                if on_batch is not None:
+                    last = batch_first + len(batch) - 1
+                    on_batch(last, run.written.get(last, batch[-1]))
+                self._drain(run, None, on_write)
+                self._log_progress(run)
+        finally:
+            while run.in_flight:
+                self._drain(run, FIRST_COMPLETED, on_write)
+            executor.shutdown(wait=True)
+            flush = writer.flush()
+            if flush.requests:
+                logger.info("Lead sheet updated", **flush.to_dict())
+            self._log_progress(run, final=True)
+        return run.report
+
+    def progress(self) -> Dict[str, Any]:
+        """Counters, throughput and per-stage backlog of the current (or last) run."""
+        run = self._run
+        if run is None:
+            return {}
+        report = run.report
+        snapshot = report.to_dict()
+        elapsed = max(0.0, self._clock() - run.started)
+        finished = report.starts_done + report.starts_failed
+        snapshot.update({
+            "elapsed_seconds": round(elapsed, 1),
+            "rows_per_second": round(report.rows_parsed / elapsed, 1) if elapsed else None,
+            "starts_per_second": round(finished / elapsed, 2) if elapsed else None,
+            "backlog": {
+                "parse": report.rows_total - report.rows_parsed,
+                "start": report.starts_submitted - finished,
+                "write": run.writer.pending(),
+            },
+        })
+        return snapshot
+
+    def _parse(
+        self,
+        run: _Run,
+        batch: List[List[str]],
+        first_row_number: int,
+        on_write: Optional[Callable[[int, List[str]], None]],
+    ) -> List[SheetRow]:
+        """Stage 1: pending rows of the batch, one entry per phone in the run."""
+        policy = self.policy
+        run.report.rows_parsed += len(batch)
+        try:
+            state_index = run.keys.index(policy.state_column)
+        except ValueError:
+            state_index = None
+        numbered = [
+            (first_row_number + index, row)
+            for index, row in enumerate(batch)
+            if policy.is_pending(row[state_index] if state_index is not None and state_index < len(row) else '')
+        ]
+        run.report.pending += len(numbered)
+
+        pending: List[SheetRow] = []
+        for (row_number, row), values in zip(numbered, rows_to_dicts(run.keys, [row for _, row in numbered])):
+            telefone = (values.get('telefone') or values.get('phone') or '').strip()
+            item = SheetRow(
+                row_number=row_number,
+                row=row,
+                values=values,
+                telefone=self.qualification_service.normalizar_telefone(telefone) if telefone else '',
+                nome=(values.get('nome') or values.get('name') or '').strip() or 'tudo bem',
+                canal=(values.get('canal') or '').strip().lower() or policy.default_channel,
+                contexto_extra=values.get('contexto') or values.get('notes') or '',
+                mensagem_inicial=(values.get('mensagem_inicial') or '').strip(),
+            )
+            reason = policy.validate(item)
+            if reason:
+                self._reject(run, item, reason, on_write)
+                continue
+            first = run.seen.get(item.telefone)
+            if first is not None:
+                if first.duplicate_updates is not None:  # already started
+                    self._write_back(run, item, first.duplicate_updates, on_write)
+                else:
+                    first.duplicates.append(item)
+                continue
+            run.seen[item.telefone] = item
+            pending.append(item)
+        return pending
+
+    def _resolve(
+        self,
+        run: _Run,
+        pending: List[SheetRow],
+        on_write: Optional[Callable[[int, List[str]], None]],
+    ) -> None:
+        """Stage 2: find (and, if the policy says so, create) the batch's leads in bulk."""
+        if not pending:
+            return
+        policy = self.policy
+        by_id = self._leads_by_sheet_id(pending)
+        found = self.lead_repo.get_leads_by_phones([row.telefone for row in pending if row.row_number not in by_id])
+        if not policy.reuse_existing_leads:
+            for row in pending:
+                if row.row_number in by_id or row.telefone in found:
+                    self._reject(run, row, 'Lead já existe no sistema', on_write)
+            pending = [row for row in pending if row.row_number not in by_id and row.telefone not in found]
+            by_id, found = {}, {}
+
+        missing = [row for row in pending if row.row_number not in by_id and row.telefone not in found]
+        if missing and policy.create_missing_leads:
+            created = self.lead_repo.create_many([policy.new_lead(row) for row in missing])
+            raced = []
+            for index, row in enumerate(missing):
+                lead_id = created.ids[index] if index < len(created.ids) else None
+                if lead_id:
+                    found[row.telefone] = {'id': lead_id, 'nome': row.nome, 'telefone': row.telefone, 'canal': row.canal}
+                    run.report.leads_created += 1
+                elif index in created.conflicts and policy.reuse_existing_leads:
+                    raced.append(row.telefone)  # created elsewhere since the lookup
+                else:
+                    logger.error("Failed to create lead from sheet", telefone=row.telefone,
+                                 error=created.errors.get(index) or created.conflicts.get(index))
+            if raced:
+                found.update(self.lead_repo.get_leads_by_phones(raced))
+
+        for row in pending:
+            row.lead = by_id.get(row.row_number) or found.get(row.telefone)
+            if row.lead:
+                run.report.leads_resolved += 1
+            elif not policy.create_missing_leads:
+                self._reject(run, row, 'lead não encontrado', on_write)
+
+    def _leads_by_sheet_id(self, pending: List[SheetRow]) -> Dict[int, Dict[str, Any]]:
+        """Row number -> lead for rows whose lead id column matches a lead."""
+        wanted: Dict[int, str] = {}
+        for row in pending:
+            for column in self.policy.lead_id_columns:
+                lead_id = (row.values.get(column) or '').strip()
+                if lead_id:
+                    wanted[row.row_number] = lead_id
+                    break
+        if not wanted:
+            return {}
+        leads = self.lead_repo.get_leads_by_ids(list(wanted.values()))
+        return {row_number: leads[lead_id] for row_number, lead_id in wanted.items() if lead_id in leads}
+
+    def _start(self, row: SheetRow) -> Dict[str, Any]:
+        """Stage 3 (pool thread): open the session and send the first message."""
+        lead_id = row.lead['id']
+        logger.info("Processing sheet lead", lead_id=lead_id, telefone=row.telefone)
+        return self.qualification_service.iniciar_qualificacao(
+            lead_id=lead_id,
+            telefone=row.telefone,
+            nome=row.nome,
+            origem_canal=row.canal,
+            contexto_extra=row.contexto_extra,
+            mensagem_inicial=row.mensagem_inicial or None,
+        )
+
+    def _drain(
+        self,
+        run: _Run,
+        return_when: Optional[str],
+        on_write: Optional[Callable[[int, List[str]], None]],
+    ) -> None:
+        """Stage 4: queue the write-back of finished starts (``None``: don't block)."""
+        if not run.in_flight:
+            return
+        if return_when is None:
+            done = [future for future in run.in_flight if future.done()]
+        else:
+            done, _ = wait(list(run.in_flight), return_when=return_when)
+        for future in done:
+            row = run.in_flight.pop(future)
+            try:
+                result = future.result()
+            except Exception as exc:  # pylint: disable=broad-except
+                run.report.starts_failed += 1
+                logger.exception("Failed to start sheet lead", telefone=row.telefone, error=str(exc))
+                continue
+            if result.get('success', True):
+                run.report.starts_done += 1
+                updates = self.policy.success_updates(row, result)
+            else:
+                run.report.starts_failed += 1
+                updates = self.policy.failure_updates(row, result)
+            self._write_back(run, row, updates, on_write)
+            row.duplicate_updates = {key: value for key, value in updates.items() if key != 'mensagem_inicial'}
+            for duplicate in row.duplicates:
+                self._write_back(run, duplicate, row.duplicate_updates, on_write)
+
+    def _reject(
+        self,
+        run: _Run,
+        row: SheetRow,
+        reason: str,
+        on_write: Optional[Callable[[int, List[str]], None]],
+    ) -> None:
+        run.report.rejected.append((row.row_number, reason))
+        updates = self.policy.rejected_updates(row, reason)
+        if updates:
+            self._write_back(run, row, updates, on_write)
+
+    @staticmethod
+    def _write_back(
+        run: _Run,
+        row: SheetRow,
+        updates: Dict[str, str],
+        on_write: Optional[Callable[[int, List[str]], None]],
+    ) -> None:
+        named = {run.header_map.get(key, key): value for key, value in updates.items()}
+        current = run.writer.update_row(row.row_number, run.headers, row.row, named)
+        run.written[row.row_number] = current
+        if on_write is not None:
+            on_write(row.row_number, current)
+
+    def _log_progress(self, run: _Run, final: bool = False) -> None:
+        now = self._clock()
+        if final:
+            if run.report.starts_submitted or run.report.rows_total > self.batch_rows:
+                logger.info("Lead sheet pass finished", **self.progress())
+        elif now - run.last_log >= self.progress_log_seconds:
+            run.last_log = now
+            logger.info("Lead sheet pass progress", **self.progress())
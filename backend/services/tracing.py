@@ -0,0 +1,163 @@
+"""Per-stage latency spans, histograms and per-message correlation ids."""
+from __future__ import annotations
+
+import bisect
+import contextvars
+import functools
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+import structlog
+
+# Upper bounds (ms) of the histogram buckets; the last bucket is open-ended
+BUCKET_BOUNDS_MS: Tuple[float, ...] = (
+    1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 30000,
+)
+
+_correlation_id: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar("correlation_id", default=None)
+# Spans of the current message as ``(stage, seconds)``; the list is shared by
+# the copies of the context handed to worker and scheduler threads.
+_trace_spans: contextvars.ContextVar[Optional[List[Tuple[str, float]]]] = contextvars.ContextVar(
+    "trace_spans", default=None
+)
+
+
+class LatencyHistogram:
+    """Fixed-bucket latency histogram; percentiles are bucket upper bounds."""
+
+    def __init__(self, bounds_ms: Tuple[float, ...] = BUCKET_BOUNDS_MS) -> None:
+        self.bounds_ms = bounds_ms
+        self.buckets = [0] * (len(bounds_ms) + 1)
+        self.count = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+
+    def observe(self, ms: float) -> None:
+        self.buckets[bisect.bisect_left(self.bounds_ms, ms)] += 1
+        self.count += 1
+        self.total_ms += ms
+        self.max_ms = max(self.max_ms, ms)
+
+    def copy(self) -> "LatencyHistogram":
+        clone = LatencyHistogram(self.bounds_ms)
+        clone.buckets = list(self.buckets)
+        clone.count, clone.total_ms, clone.max_ms = self.count, self.total_ms, self.max_ms
+        return clone
+
+    def percentile(self, pct: float) -> float:
+        if not self.count:
+            return 0.0
+        rank = pct / 100 * self.count
+        seen = 0
+        for index, hits in enumerate(self.buckets):
+            seen += hits
+            if seen >= rank:
+                return self.bounds_ms[index] if index < len(self.bounds_ms) else self.max_ms
+        return self.max_ms
+
+    def to_dict(self) -> Dict[str, Any]:
+        labels = [f"le_{bound:g}ms" for bound in self.bounds_ms] + ["inf"]
+        return {
+            "count": self.count,
+            "avg_ms": round(self.total_ms / self.count, 3) if self.count else 0.0,
+            "max_ms": round(self.max_ms, 3),
+            "p50_ms": self.percentile(50),
+            "p95_ms": self.percentile(95),
+            "p99_ms": self.percentile(99),
+            "buckets": dict(zip(labels, self.buckets)),
+        }
+
+
+class Tracer:
+    """Times named pipeline stages into one latency histogram per stage."""
+
+    def __init__(self) -> None:
+        self._histograms: Dict[str, LatencyHistogram] = {}
+        self._lock = threading.Lock()
+
+    def record(self, stage: str, seconds: float) -> None:
+        """Add a duration measured elsewhere (queue lag, scheduled delay)."""
+        ms = seconds * 1000.0
+        with self._lock:
+            histogram = self._histograms.get(stage)
+            if histogram is None:
+                histogram = self._histograms[stage] = LatencyHistogram()
+            histogram.observe(ms)
+        spans = _trace_spans.get()
+        if spans is not None:
+            spans.append((stage, seconds))
+
+    @contextmanager
+    def span(self, stage: str) -> Iterator[None]:
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(stage, time.perf_counter() - started)
+
+    def traced(self, stage: str) -> Callable[[Callable[..., Any]], Callable[..., Any]]:
+        """Decorator form of :meth:`span`."""
+        def decorator(fn: Callable[..., Any]) -> Callable[..., Any]:
+            @functools.wraps(fn)
+            def wrapper(*args: Any, **kwargs: Any) -> Any:
+                with self.span(stage):
+                    return fn(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def histograms(self) -> Dict[str, LatencyHistogram]:
+        """Point-in-time copies of the per-stage histograms (for exposition)."""
+        with self._lock:
+            return {stage: histogram.copy() for stage, histogram in sorted(self._histograms.items())}
+
+    def stats(self) -> Dict[str, Any]:
+        """Histogram summary per stage, exposed on /metrics."""
+        with self._lock:
+            return {stage: histogram.to_dict() for stage, histogram in sorted(self._histograms.items())}
+
+    def reset(self) -> None:
+        with self._lock:
+            self._histograms.clear()
+
+
+def new_correlation_id() -> str:
+    return uuid.uuid4().hex[:16]
+
+
+def current_correlation_id() -> Optional[str]:
+    return _correlation_id.get()
+
+
+@contextmanager
+def correlation_scope(correlation_id: Optional[str] = None) -> Iterator[str]:
+    """Bind a correlation id (and a fresh span list) to everything run inside.
+
+    The id is also bound into structlog's context variables, so every log
+    line emitted while handling the message carries ``correlation_id``.
+    Worker and scheduler threads inherit it from the copied context.
+    """
+    correlation_id = correlation_id or new_correlation_id()
+    id_token = _correlation_id.set(correlation_id)
+    spans_token = _trace_spans.set([])
+    log_tokens = structlog.contextvars.bind_contextvars(correlation_id=correlation_id)
+    try:
+        yield correlation_id
+    finally:
+        structlog.contextvars.reset_contextvars(**log_tokens)
+        _trace_spans.reset(spans_token)
+        _correlation_id.reset(id_token)
+
+
+def trace_summary() -> Dict[str, float]:
+    """Milliseconds spent per stage so far by the current message."""
+    summary: Dict[str, float] = {}
+    for stage, seconds in list(_trace_spans.get() or ()):
+        summary[stage] = round(summary.get(stage, 0.0) + seconds * 1000.0, 3)
+    return summary
+
+
+# Instância global do tracer
+tracer = Tracer()
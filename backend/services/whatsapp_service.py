@@ -3,23 +3,69 @@ Serviço de integração com WAHA (WhatsApp HTTP API)
 Gerencia envio e recebimento de mensagens via WhatsApp
 """
 import os
-import requests
+import random
+import threading
 import time
-from typing import Dict, Any, Optional
+import requests
+from collections import deque
+from concurrent.futures import Future
+from dataclasses import dataclass
+from typing import Callable, Deque, Dict, Any, Optional
 import structlog
 
+from backend.services.coordination import CoordinationBackend
+from backend.services.delivery_scheduler import DeliveryScheduler, delivery_scheduler
+from backend.services.http_client import PooledHTTPClient, get_waha_http_client
+from backend.services.metrics_service import metrics_service
+from backend.services.retry_policy import CircuitBreaker, RetryPolicy
+from backend.services.tracing import tracer
+
 logger = structlog.get_logger()
 
 
+@dataclass
+class _EnvioPendente:
+    """Mensagem aguardando (re)envio ao WAHA."""
+    telefone: str
+    mensagem: str
+    on_redelivery: Optional[Callable[[Dict[str, Any]], None]] = None
+    reenvios: int = 0
+
+
 class WhatsAppService:
     """Serviço para integração com WAHA"""
     
-    def __init__(self):
+    def __init__(
+        self,
+        scheduler: Optional[DeliveryScheduler] = None,
+        http_client: Optional[PooledHTTPClient] = None,
+        coordination: Optional[CoordinationBackend] = None,
+    ):
+        self.scheduler = scheduler or delivery_scheduler
+        self._http_client = http_client
+        self.coordination = coordination
         self.base_url = os.getenv('WAHA_BASE_URL', 'http://localhost:3000')
         self.session_name = os.getenv('WAHA_SESSION_NAME', 'default')
         self.webhook_url = os.getenv('WAHA_WEBHOOK_URL')
         self.api_key = os.getenv('WAHA_API_KEY')
         self.max_tentativas = int(os.getenv('MAX_TENTATIVAS_ENVIO', '3'))
+        self.max_reenvios = int(os.getenv('WAHA_MAX_REENVIOS', '3'))
+        self.retry_policy = RetryPolicy(
+            max_attempts=self.max_tentativas,
+            base_delay=float(os.getenv('WAHA_RETRY_BASE_SECONDS', '1')),
+            max_delay=float(os.getenv('WAHA_RETRY_MAX_SECONDS', '30')),
+        )
+        self.circuit_breaker = CircuitBreaker(
+            name='waha',
+            failure_threshold=int(os.getenv('WAHA_CIRCUIT_FAILURES', '5')),
+            cooldown_seconds=float(os.getenv('WAHA_CIRCUIT_COOLDOWN_SECONDS', '30')),
+            on_transition=metrics_service.record_circuit_transition,
+        )
+        self._fila_reenvio: Deque[_EnvioPendente] = deque()
+        self._fila_reenvio_max = int(os.getenv('WAHA_FILA_REENVIO_MAX', '1000'))
+        self._fila_lock = threading.Lock()
+        self._drenagem_agendada = False
+        self._reenvios_descartados = 0
         
         self.identidade_base = (
             "Aqui é a LDC Capital, consultoria independente do interior do RS. "
@@ -135,8 +181,29 @@ Qual sua preferência? 🎯
             """.strip()
         }
     
-    def enviar_mensagem(self, telefone: str, mensagem: str, tentativa: int = 1, conversa_count: int = 0) -> Dict[str, Any]:
-        """Envia mensagem via WAHA com sistema de retentativas e delay inteligente."""
+    @tracer.traced('whatsapp.enviar_mensagem')
+    def enviar_mensagem(self, telefone: str, mensagem: str, conversa_count: int = 0) -> Dict[str, Any]:
+        """Envia mensagem via WAHA e aguarda o resultado (bloqueia o chamador).
+
+        Prefira ``enviar_mensagem_async`` em código de servidor: o delay
+        humanizado e as retentativas ficam no agendador, sem prender a thread.
+        """
+        return self.enviar_mensagem_async(telefone, mensagem, conversa_count=conversa_count).result()
+
+    def enviar_mensagem_async(
+        self,
+        telefone: str,
+        mensagem: str,
+        conversa_count: int = 0,
+        on_redelivery: Optional[Callable[[Dict[str, Any]], None]] = None,
+    ) -> Future:
+        """Agenda o envio após o delay humanizado e retorna um ``Future`` com o resultado.
+
+        Se todas as tentativas falharem (ou o circuito estiver aberto) o
+        resultado é ``success=False`` com ``reenvio_agendado=True`` e a
+        mensagem vai para a fila de reenvio; ``on_redelivery`` é chamado se
+        ela for entregue depois.
+        """
 
         # Normaliza mensagem para string simples
         if not isinstance(mensagem, str):
@@ -148,103 +215,202 @@ Qual sua preferência? 🎯
                         telefone=repr(telefone), 
                         tipo_telefone=type(telefone).__name__,
                         mensagem_preview=mensagem[:50].replace("\n", " "))
-            return {
+            return self._resultado_imediato({
                 'success': False,
                 'error': 'Número de telefone inválido',
                 'telefone': telefone,
                 'bloqueado': True
-            }
-
+            })
+
+        envio = _EnvioPendente(telefone=telefone, mensagem=mensagem, on_redelivery=on_redelivery)
+
+        # Circuito aberto: falha rápida, sem ocupar o agendador com tentativas
+        if self.circuit_breaker.state == CircuitBreaker.OPEN:
+            return self._resultado_imediato(self._falha_definitiva(envio, 'circuit_open', tentativa=0))
+
+        delay = self.calcular_delay_humanizado(conversa_count)
+        if self.coordination is not None:
+            # Reserva um horário de envio por telefone compartilhado entre workers,
+            # mantendo a ordem das respostas mesmo com mais de um processo.
+            agora = time.time()
+            horario = self.coordination.reserve_send_slot(telefone, agora + delay)
+            delay = max(0.0, horario - agora)
+        # O delay não prende thread, mas é parte da latência da resposta
+        tracer.record('whatsapp.delay_humanizado', delay)
+        logger.info("Envio agendado com delay inteligente",
+                   delay_segundos=round(delay, 2),
+                   telefone=telefone,
+                   conversa_count=conversa_count)
+        return self.scheduler.schedule(delay, self._tentar_envio, envio, 1, None)
+
+    @property
+    def http(self) -> PooledHTTPClient:
+        """Cliente HTTP com pool keep-alive compartilhado por todas as chamadas WAHA."""
+        return self._http_client or get_waha_http_client()
+
+    @staticmethod
+    def calcular_delay_humanizado(conversa_count: int = 0) -> float:
+        """Delay progressivo: mais mensagens na conversa = mais delay (mais humano)."""
+        base_delay = 5  # Mínimo 5 segundos
+        conversa_bonus = min(conversa_count * 0.5, 5)  # Até 5s extras baseado na conversa
+        max_delay = 15  # Máximo 15 segundos
+
+        delay_min = base_delay + conversa_bonus
+        delay_max = min(delay_min + 7, max_delay)
+        return random.uniform(delay_min, delay_max)
+
+    def _tentar_envio(self, envio: "_EnvioPendente", tentativa: int, delay_anterior: Optional[float]):
+        """Executa uma tentativa de envio; falhas são reagendadas em vez de dormir."""
+        if not self.circuit_breaker.allow_request():
+            return self._falha_definitiva(envio, 'circuit_open', tentativa=tentativa)
+
+        telefone = envio.telefone
         try:
-            # Delay inteligente baseado no número de mensagens da conversa
-            import random
-
-            # Delay progressivo: mais mensagens = mais delay (mais humano)
-            base_delay = 5  # Mínimo 5 segundos
-            conversa_bonus = min(conversa_count * 0.5, 5)  # Até 5s extras baseado na conversa
-            max_delay = 15  # Máximo 15 segundos
-
-            delay_min = base_delay + conversa_bonus
-            delay_max = min(delay_min + 7, max_delay)
-            delay = random.uniform(delay_min, delay_max)
-
-            logger.info("Aguardando delay inteligente antes do envio",
-                       delay_segundos=round(delay, 2),
-                       telefone=telefone,
-                       conversa_count=conversa_count)
-            time.sleep(delay)
-            
             # 2. Limpeza e formatação segura do telefone
-            try:
-                telefone_limpo = self._limpar_telefone(telefone)
-            except ValueError as e:
-                logger.error("🚨 ENVIO FALHOU - Erro na limpeza do telefone", 
-                            telefone_raw=telefone, 
-                            error=str(e))
-                return {'success': False, 'error': str(e)}
+            telefone_limpo = self._limpar_telefone(telefone)
+        except ValueError as e:
+            logger.error("🚨 ENVIO FALHOU - Erro na limpeza do telefone", 
+                        telefone_raw=telefone, 
+                        error=str(e))
+            return {'success': False, 'error': str(e)}
 
-            payload = {
-                "chatId": f"{telefone_limpo}@c.us",
-                "text": mensagem,
-                "session": self.session_name
-            }
-            
-            # Preparar headers com API key
-            headers = {'Content-Type': 'application/json'}
-            if self.api_key:
-                headers['X-API-KEY'] = self.api_key
-            
-            response = requests.post(
-                f"{self.base_url}/api/sendText",
-                json=payload,
-                headers=headers,
-                timeout=30
-            )
-            
+        payload = {
+            "chatId": f"{telefone_limpo}@c.us",
+            "text": envio.mensagem,
+            "session": self.session_name
+        }
+        
+        # Preparar headers com API key
+        headers = {'Content-Type': 'application/json'}
+        if self.api_key:
+            headers['X-API-KEY'] = self.api_key
+
+        try:
+            with tracer.span('whatsapp.send_text'):
+                response = self.http.post(
+                    f"{self.base_url}/api/sendText",
+                    json=payload,
+                    headers=headers,
+                    timeout=30
+                )
+        except requests.exceptions.Timeout:
+            logger.error("Timeout ao enviar mensagem", telefone=telefone, tentativa=tentativa)
+            erro = 'timeout'
+        except requests.exceptions.RequestException as e:
+            logger.error("Erro de conexão ao enviar mensagem", telefone=telefone, tentativa=tentativa, error=str(e))
+            erro = str(e)
+        else:
             if response.status_code in [200, 201]:
+                self.circuit_breaker.record_success()
                 logger.info("Mensagem enviada com sucesso", 
                            telefone=telefone_limpo, 
                            tentativa=tentativa)
+                try:
+                    message_id = response.json().get('id')
+                except ValueError:
+                    message_id = None
                 return {
                     'success': True,
-                    'message_id': response.json().get('id'),
+                    'message_id': message_id,
                     'tentativa': tentativa
                 }
+
+            logger.warning("Falha no envio da mensagem", 
+                          telefone=telefone_limpo,
+                          status_code=response.status_code,
+                          response=response.text,
+                          tentativa=tentativa)
+            if 400 <= response.status_code < 500 and response.status_code != 429:
+                # Erro do cliente (payload/número inválido): repetir não resolve
+                return {
+                    'success': False,
+                    'error': f'HTTP {response.status_code}: {response.text}',
+                    'tentativa': tentativa
+                }
+            erro = f'HTTP {response.status_code}'
+
+        self.circuit_breaker.record_failure()
+        if self.retry_policy.should_retry(tentativa) and self.circuit_breaker.state != CircuitBreaker.OPEN:
+            delay = self.retry_policy.next_delay(delay_anterior)
+            return self.scheduler.schedule(delay, self._tentar_envio, envio, tentativa + 1, delay)
+        return self._falha_definitiva(envio, erro, tentativa=tentativa)
+
+    def _falha_definitiva(self, envio: "_EnvioPendente", erro: str, tentativa: int) -> Dict[str, Any]:
+        """Move o envio para a fila de reenvio e informa a falha real ao chamador."""
+        enfileirado = self._enfileirar_reenvio(envio)
+        logger.warning("Envio não concluído - mensagem na fila de reenvio" if enfileirado
+                       else "Envio não concluído - mensagem descartada",
+                       telefone=envio.telefone,
+                       error=erro,
+                       tentativa=tentativa,
+                       reenvios=envio.reenvios)
+        return {
+            'success': False,
+            'error': erro,
+            'tentativa': tentativa,
+            'reenvio_agendado': enfileirado,
+        }
+
+    def _enfileirar_reenvio(self, envio: "_EnvioPendente") -> bool:
+        with self._fila_lock:
+            if envio.reenvios >= self.max_reenvios or len(self._fila_reenvio) >= self._fila_reenvio_max:
+                self._reenvios_descartados += 1
+                return False
+            self._fila_reenvio.append(envio)
+            if not self._drenagem_agendada:
+                self._drenagem_agendada = True
+                espera = max(self.circuit_breaker.remaining_cooldown(), self.retry_policy.base_delay)
+                self.scheduler.schedule(espera, self.reprocessar_fila_reenvio)
+        return True
+
+    def reprocessar_fila_reenvio(self, limite: int = 50) -> int:
+        """Reenvia mensagens da fila quando o circuito permite. Retorna quantas foram reenviadas."""
+        with self._fila_lock:
+            self._drenagem_agendada = False
+            if self.circuit_breaker.state == CircuitBreaker.OPEN:
+                lote = []
             else:
-                logger.warning("Falha no envio da mensagem", 
-                              telefone=telefone_limpo,
-                              status_code=response.status_code,
-                              response=response.text,
-                              tentativa=tentativa)
-                
-                # Tentar novamente se não excedeu o limite
-                if tentativa < self.max_tentativas:
-                    time.sleep(2 ** tentativa)  # Backoff exponencial
-                    return self.enviar_mensagem(telefone, mensagem, tentativa + 1)
-                
-                # 🎯 SOLUÇÃO DEFINITIVA: Simular sucesso quando WAHA falha
-                logger.warning("🚨 WAHA falhou - usando simulação", telefone=telefone_limpo)
-                return self._simular_envio_sucesso(telefone_limpo, mensagem)
-                
-        except requests.exceptions.Timeout:
-            logger.error("Timeout ao enviar mensagem", telefone=telefone, tentativa=tentativa)
-            
-            if tentativa < self.max_tentativas:
-                time.sleep(2 ** tentativa)
-                return self.enviar_mensagem(telefone, mensagem, tentativa + 1)
-            
-            # 🎯 SOLUÇÃO DEFINITIVA: Simular sucesso em timeout
-            logger.warning("🚨 Timeout WAHA - usando simulação", telefone=telefone)
-            return self._simular_envio_sucesso(telefone, mensagem)
-            
-        except Exception as e:
-            logger.error("Erro ao enviar mensagem - usando simulação", 
-                        telefone=telefone, 
-                        tentativa=tentativa,
-                        error=str(e))
-            
-            # 🎯 SOLUÇÃO DEFINITIVA: Simular sucesso em qualquer erro
-            return self._simular_envio_sucesso(telefone, mensagem)
+                lote = [self._fila_reenvio.popleft() for _ in range(min(limite, len(self._fila_reenvio)))]
+            restante = len(self._fila_reenvio)
+            if restante and not self._drenagem_agendada:
+                self._drenagem_agendada = True
+                espera = max(self.circuit_breaker.remaining_cooldown(), self.retry_policy.base_delay)
+                self.scheduler.schedule(espera, self.reprocessar_fila_reenvio)
+
+        for envio in lote:
+            envio.reenvios += 1
+            future = self.scheduler.schedule(0, self._tentar_envio, envio, 1, None)
+            if envio.on_redelivery:
+                future.add_done_callback(lambda done, envio=envio: self._notificar_reenvio(envio, done))
+        if lote:
+            logger.info("Fila de reenvio processada", reenviadas=len(lote), restantes=restante)
+        return len(lote)
+
+    @staticmethod
+    def _notificar_reenvio(envio: "_EnvioPendente", done: Future) -> None:
+        if done.exception() is not None:
+            return
+        resultado = done.result()
+        if resultado.get('success'):
+            try:
+                envio.on_redelivery(resultado)
+            except Exception as exc:  # pylint: disable=broad-except
+                logger.error("Erro no callback de reenvio", telefone=envio.telefone, error=str(exc))
+
+    def estatisticas_envio(self) -> Dict[str, Any]:
+        """Estado do circuito e da fila de reenvio (exposto em /metrics)."""
+        with self._fila_lock:
+            return {
+                'circuit_state': self.circuit_breaker.state,
+                'fila_reenvio': len(self._fila_reenvio),
+                'reenvios_descartados': self._reenvios_descartados,
+            }
+
+    @staticmethod
+    def _resultado_imediato(resultado: Dict[str, Any]) -> Future:
+        future: Future = Future()
+        future.set_result(resultado)
+        return future
     
     def obter_mensagem_inicial(self, canal: str, nome: Optional[str] = None, contexto_extra: Optional[str] = None) -> str:
         """Retorna mensagem inicial personalizada por canal"""
@@ -262,7 +428,7 @@ Qual sua preferência? 🎯
                 headers['X-API-KEY'] = self.api_key
             
             # Testar endpoint de sessões
-            response = requests.get(
+            response = self.http.get(
                 f"{self.base_url}/api/sessions",
                 headers=headers,
                 timeout=10
@@ -356,23 +522,6 @@ Mande qualquer mensagem para reativar nosso chat! 😊
         """.strip()
     
 
-    def _simular_envio_sucesso(self, telefone: str, mensagem: str) -> Dict[str, Any]:
-        """Simula envio bem-sucedido quando WAHA não está disponível"""
-        if not isinstance(mensagem, str):
-            mensagem = "" if mensagem is None else str(mensagem)
-
-        logger.warning("🚨 SIMULANDO ENVIO - WAHA indisponível", 
-                      telefone=telefone,
-                      mensagem_preview=mensagem[:50])
-        
-        return {
-            'success': True,
-            'message_id': f'sim_{int(time.time())}',
-            'tentativa': 1,
-            'simulado': True,
-            'mensagem_enviada': mensagem
-        }
-
     def _limpar_telefone(self, telefone: str) -> str:
         """Limpa e formata número de telefone"""
         if not telefone:
@@ -463,7 +612,7 @@ Mande qualquer mensagem para reativar nosso chat! 😊
     def verificar_status_sessao(self) -> Dict[str, Any]:
         """Verifica status da sessão WAHA"""
         try:
-            response = requests.get(
+            response = self.http.get(
                 f"{self.base_url}/api/sessions/{self.session_name}",
                 timeout=10
             )
@@ -505,7 +654,7 @@ Mande qualquer mensagem para reativar nosso chat! 😊
                 "session": self.session_name
             }
             
-            response = requests.post(
+            response = self.http.post(
                 f"{self.base_url}/api/webhooks",
                 json=payload,
                 timeout=10
@@ -0,0 +1 @@
+"""Micro and load benchmarks. Run each module with ``python -m benchmarks.<name>``."""
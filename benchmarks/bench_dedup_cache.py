@@ -0,0 +1,67 @@
+"""Per-send cost of the MessagingService dedup cache as the cache grows.
+
+Compares the sliding TTL cache with the previous approach (a plain dict
+scanned in full on every send). Usage::
+
+    python -m benchmarks.bench_dedup_cache [--sends 20000]
+"""
+from __future__ import annotations
+
+import argparse
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Dict
+
+from backend.services.dedup_cache import SlidingTTLCache
+from backend.services.messaging_service import MessagingService
+
+SIZES = (1_000, 10_000, 100_000)
+
+
+def _bench_sliding(size: int, sends: int) -> float:
+    cache = SlidingTTLCache(ttl_seconds=3600)
+    for n in range(size):
+        cache.add(MessagingService._make_dedup_key(f"55119{n:08d}", "oi"))  # pylint: disable=protected-access
+
+    started = time.perf_counter()
+    for n in range(sends):
+        key = MessagingService._make_dedup_key(f"55118{n:08d}", "oi")  # pylint: disable=protected-access
+        if key not in cache:
+            cache.add(key)
+    return (time.perf_counter() - started) / sends
+
+
+def _bench_full_scan(size: int, sends: int) -> float:
+    ttl = timedelta(seconds=3600)
+    cache: Dict[str, datetime] = {}
+    now = datetime.now(timezone.utc)
+    for n in range(size):
+        cache[f"55119{n:08d}"] = now
+
+    started = time.perf_counter()
+    for n in range(sends):
+        limit = datetime.now(timezone.utc) - ttl
+        expired = [key for key, ts in cache.items() if ts < limit]
+        for key in expired:
+            cache.pop(key, None)
+        key = MessagingService._make_dedup_key(f"55118{n:08d}", "oi")  # pylint: disable=protected-access
+        if key not in cache:
+            cache[key] = datetime.now(timezone.utc)
+    return (time.perf_counter() - started) / sends
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--sends", type=int, default=20_000)
+    args = parser.parse_args()
+
+    print(f"{'cached entries':>15} | {'sliding TTL (us/send)':>22} | {'full scan (us/send)':>20}")
+    for size in SIZES:
+        sliding = _bench_sliding(size, args.sends)
+        # the full scan is O(n) per send: keep its sample small
+        scan = _bench_full_scan(size, max(20, args.sends // size * 10))
+        print(f"{size:>15,} | {sliding * 1e6:>22.2f} | {scan * 1e6:>20.2f}")
+
+
+if __name__ == "__main__":
+    main()
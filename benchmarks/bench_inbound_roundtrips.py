@@ -0,0 +1,121 @@
+"""Database round-trips per inbound message, sequential vs unit of work.
+
+Replays a full qualification conversation through
+``QualificationService.processar_mensagem_por_telefone`` against the
+in-process Supabase stand-in, once with the sequential repository calls
+(functions not deployed), once with the ``carregar_contexto_inbound`` /
+``aplicar_inbound`` RPCs and once more with the write-through lead/session
+caches in front of the load. Usage::
+
+    python -m benchmarks.bench_inbound_roundtrips [--leads 20] [--latency-ms 25]
+"""
+from __future__ import annotations
+
+import argparse
+import logging
+import time
+from typing import Dict
+
+import structlog
+
+from backend.models.cached_repositories import CachedLeadRepository, CachedSessionRepository
+from backend.models.database_models import (
+    LeadRepository,
+    MessageRepository,
+    QualificacaoRepository,
+    ReuniaoRepository,
+    SessionRepository,
+)
+from backend.models.unit_of_work import InboundStore
+from backend.services.qualification_service import QualificationService
+from benchmarks.fake_supabase import FakeDatabaseConnection, FakeSupabase, install_inbound_rpcs
+
+CONVERSATION = (
+    "oi, tudo bem",
+    "tenho uns 800 mil",
+    "invisto na XP e no banco",
+    "poderia ser melhor",
+    "aposentadoria",
+    "agora, esse mês",
+    "sim, pode ser",
+    "terça às 10h",
+)
+
+
+class _NoopMessaging:
+    """Messaging stand-in: outbound persistence is not part of this measure."""
+
+    def send_message(self, **_: object) -> Dict[str, object]:
+        return {"success": True, "queued": False}
+
+
+class _PassthroughWhatsApp:
+    def normalizar_telefone(self, telefone: str) -> str:
+        return telefone
+
+
+def _run(leads: int, latency: float, use_rpc: bool, cached: bool = False) -> Dict[str, float]:
+    client = FakeSupabase(latency=latency)
+    if use_rpc:
+        install_inbound_rpcs(client)
+    db = FakeDatabaseConnection(client)
+    repos = dict(
+        lead_repo=CachedLeadRepository(db) if cached else LeadRepository(db),
+        session_repo=CachedSessionRepository(db) if cached else SessionRepository(db),
+        message_repo=MessageRepository(db),
+        qualificacao_repo=QualificacaoRepository(db),
+        reuniao_repo=ReuniaoRepository(db),
+    )
+    store = InboundStore(*repos.values(), client=client if use_rpc else None)
+    service = QualificationService(
+        **repos,
+        messaging_service=_NoopMessaging(),
+        whatsapp_service=_PassthroughWhatsApp(),
+        inbound_store=store,
+    )
+
+    # First contact gets-or-creates lead and session (and sends the opening
+    # message); every following message is the steady state.
+    for n in range(leads):
+        service.processar_mensagem_por_telefone(f"55119{n:08d}", CONVERSATION[0], nome="Ana")
+    first_contact = client.round_trips / leads
+    client.reset_counters()
+
+    started = time.perf_counter()
+    messages = 0
+    for text in CONVERSATION[1:]:
+        for n in range(leads):
+            service.processar_mensagem_por_telefone(f"55119{n:08d}", text, nome="Ana")
+            messages += 1
+    elapsed = time.perf_counter() - started
+    return {
+        "first_contact": first_contact,
+        "round_trips": client.round_trips / messages,
+        "latency_ms": elapsed / messages * 1000,
+        "kb": (client.bytes_sent + client.bytes_received) / messages / 1024,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--leads", type=int, default=20)
+    parser.add_argument("--latency-ms", type=float, default=25.0, help="simulated network hop per call")
+    args = parser.parse_args()
+    structlog.configure(wrapper_class=structlog.make_filtering_bound_logger(logging.WARNING))
+
+    print(f"{'mode':>22} | {'1st msg trips':>13} | {'round-trips/msg':>15} | {'ms/msg':>8} | {'KB/msg':>7}")
+    modes = (
+        ("sequential repos", False, False),
+        ("unit of work (RPC)", True, False),
+        ("unit of work + cache", True, True),
+    )
+    for label, use_rpc, cached in modes:
+        result = _run(args.leads, args.latency_ms / 1000, use_rpc, cached)
+        print(
+            f"{label:>22} | {result['first_contact']:>13.2f} | {result['round_trips']:>15.2f} | "
+            f"{result['latency_ms']:>8.1f} | {result['kb']:>7.2f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
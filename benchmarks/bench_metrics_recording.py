@@ -0,0 +1,92 @@
+"""Per-call cost of MetricsService recording on the hot path.
+
+Times each ``record_*`` method with per-event logging off (the default),
+from one thread and from several at once. Exits with status 1 when a call
+costs more than ``--max-ns``. Usage::
+
+    python -m benchmarks.bench_metrics_recording [--calls 200000] [--threads 4] [--max-ns 1000]
+"""
+from __future__ import annotations
+
+import argparse
+import sys
+import threading
+import time
+from typing import Callable, Dict, List
+
+from backend.services.metrics_service import MetricsService
+
+
+def _recorders(metrics: MetricsService) -> Dict[str, Callable[[int], None]]:
+    return {
+        "record_message_sent": lambda n: metrics.record_message_sent("5511999999999", n & 3 != 0),
+        "record_message_deduped": lambda n: metrics.record_message_deduped("5511999999999"),
+        "record_qualification_completed": lambda n: metrics.record_qualification_completed("lead-1", n % 101, n & 1 == 0),
+        "record_meeting_scheduled": lambda n: metrics.record_meeting_scheduled("lead-1", "terça 10h", True),
+    }
+
+
+def _loop_overhead(calls: int) -> float:
+    noop = lambda n: None  # noqa: E731
+    started = time.perf_counter()
+    for n in range(calls):
+        noop(n)
+    return time.perf_counter() - started
+
+
+def _time_calls(record: Callable[[int], None], calls: int) -> float:
+    started = time.perf_counter()
+    for n in range(calls):
+        record(n)
+    return time.perf_counter() - started
+
+
+def _bench(name: str, calls: int, threads: int) -> float:
+    """Nanoseconds per call (wall time per thread, minus the loop and lambda)."""
+    metrics = MetricsService(log_every=0)
+    record = _recorders(metrics)[name]
+    record(0)  # registers the shard outside the timed loop
+    overhead = _loop_overhead(calls)
+    if threads == 1:
+        return (_time_calls(record, calls) - overhead) / calls * 1e9
+
+    elapsed: List[float] = []
+    barrier = threading.Barrier(threads)
+
+    def worker() -> None:
+        record(0)
+        barrier.wait()
+        elapsed.append(_time_calls(record, calls))
+
+    workers = [threading.Thread(target=worker) for _ in range(threads)]
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    # With the GIL the threads interleave; cost per call is total CPU / total calls
+    return (max(elapsed) - overhead * threads) / (calls * threads) * 1e9
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n", maxsplit=1)[0])
+    parser.add_argument("--calls", type=int, default=200_000)
+    parser.add_argument("--threads", type=int, default=4)
+    parser.add_argument("--max-ns", type=float, default=1000.0, help="fail above this cost per call")
+    args = parser.parse_args()
+
+    failures = []
+    print(f"{'method':>32} | {'1 thread ns':>11} | {f'{args.threads} threads ns':>12}")
+    for name in _recorders(MetricsService(log_every=0)):
+        single = _bench(name, args.calls, 1)
+        multi = _bench(name, args.calls // args.threads, args.threads)
+        print(f"{name:>32} | {single:>11.0f} | {multi:>12.0f}")
+        if max(single, multi) > args.max_ns:
+            failures.append(f"{name}: {max(single, multi):.0f}ns > {args.max_ns:.0f}ns")
+
+    for failure in failures:
+        print(f"REGRESSION: {failure}")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
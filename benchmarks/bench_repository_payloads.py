@@ -0,0 +1,100 @@
+"""Response payload per repository read: ``select('*')`` vs column projection.
+
+Seeds the in-process Supabase stand-in with a lead in the middle of a long
+conversation (large session ``contexto``, messages with ``metadata``, logs
+with ``detalhes``) and measures the JSON returned by each repository method
+with every column and with its default projection. Usage::
+
+    python -m benchmarks.bench_repository_payloads [--messages 200]
+"""
+from __future__ import annotations
+
+import argparse
+from typing import Callable, List, Tuple
+
+from backend.models.database_models import (
+    LeadRepository,
+    MessageRepository,
+    QualificacaoRepository,
+    ReuniaoRepository,
+    SessionRepository,
+    SystemLogRepository,
+)
+from benchmarks.fake_supabase import FakeDatabaseConnection, FakeSupabase
+
+
+def _seed(client: FakeSupabase, messages: int) -> Tuple[str, str]:
+    lead = client.write_row('leads', {
+        'nome': 'Ana Souza', 'telefone': '5511999999999', 'email': 'ana@example.com',
+        'canal': 'whatsapp', 'status': 'em_qualificacao', 'score': 0, 'processado': False,
+        'updated_at': '2024-01-01T00:00:00+00:00',
+    })
+    contexto = {
+        'first_name': 'Ana',
+        'bot_messages': messages // 2,
+        'responses': {f"pergunta_{n}": "resposta detalhada do lead " * 8 for n in range(40)},
+        'origem_canal': 'whatsapp',
+    }
+    session = client.write_row('sessions', {
+        'lead_id': lead['id'], 'estado': 'perguntar_objetivo', 'contexto': contexto, 'ativa': True,
+        'updated_at': '2024-01-01T00:00:00+00:00',
+    })
+    for n in range(messages):
+        client.write_row('messages', {
+            'session_id': session['id'], 'lead_id': lead['id'],
+            'conteudo': f"mensagem {n} " + "texto " * 20,
+            'tipo': 'recebida' if n % 2 else 'enviada',
+            'metadata': {'etapa': 'perguntar_objetivo', 'whatsapp': {'id': f"wamid.{n:032d}", 'ack': 1}},
+        })
+    client.write_row('qualificacoes', {
+        'lead_id': lead['id'], 'session_id': session['id'],
+        'patrimonio_resposta': '500k a 1M', 'patrimonio_pontos': 20,
+        'objetivo_resposta': 'aposentadoria', 'objetivo_pontos': 20,
+        'urgencia_resposta': 'este ano', 'urgencia_pontos': 20,
+        'interesse_resposta': 'sim', 'interesse_pontos': 20, 'score_total': 80,
+        'resultado': 'qualificado', 'observacoes': '{"notas": "' + 'x' * 400 + '"}',
+    })
+    for n in range(100):
+        client.write_row('system_logs', {
+            'nivel': 'ERROR' if n % 5 == 0 else 'INFO', 'evento': f"evento_{n}", 'lead_id': lead['id'],
+            'detalhes': {'trace': 'Traceback (most recent call last): ' * 10, 'n': n},
+        })
+    return lead['id'], session['id']
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--messages", type=int, default=200)
+    args = parser.parse_args()
+
+    client = FakeSupabase()
+    db = FakeDatabaseConnection(client)
+    lead_id, session_id = _seed(client, args.messages)
+    leads, sessions, messages = LeadRepository(db), SessionRepository(db), MessageRepository(db)
+    qualificacoes, logs, reunioes = QualificacaoRepository(db), SystemLogRepository(db), ReuniaoRepository(db)
+
+    cases: List[Tuple[str, Callable[..., object]]] = [
+        ("get_lead_by_phone", lambda **kw: leads.get_lead_by_phone('5511999999999', **kw)),
+        ("get_unprocessed_leads", lambda **kw: leads.get_unprocessed_leads(**kw)),
+        ("get_active_session", lambda **kw: sessions.get_active_session(lead_id, **kw)),
+        ("get_sessions_by_lead_id", lambda **kw: sessions.get_sessions_by_lead_id(lead_id, **kw)),
+        ("get_session_messages", lambda **kw: messages.get_session_messages(session_id, **kw)),
+        ("get_lead_qualificacao", lambda **kw: qualificacoes.get_lead_qualificacao(lead_id, **kw)),
+        ("get_recent_logs", lambda **kw: logs.get_recent_logs(**kw)),
+        ("get_reunioes_by_lead", lambda **kw: reunioes.get_reunioes_by_lead(lead_id, **kw)),
+    ]
+
+    print(f"{'method':>24} | {'select(*) bytes':>15} | {'projected bytes':>15} | {'saved':>6}")
+    for name, call in cases:
+        client.reset_counters()
+        call(columns='*')
+        full = client.bytes_received
+        client.reset_counters()
+        call()
+        slim = client.bytes_received
+        saved = f"{(1 - slim / full) * 100:5.1f}%" if full > 2 else "   n/a"
+        print(f"{name:>24} | {full:>15,} | {slim:>15,} | {saved:>6}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,142 @@
+"""Lead sheet ingestion over a synthetic sheet, staged engine vs row at a time.
+
+Builds a ``--rows`` sheet (a ``--pending`` fraction of them new leads, the
+rest already contacted) in the in-process Sheets stand-in and ingests it
+with ``SheetIngestionEngine`` against the Supabase stand-in, through the
+real ``QualificationService`` with a no-op send that takes ``--send-ms``.
+The row-at-a-time baseline (one lookup/insert, start and sheet write per
+row) runs over the first ``--baseline-rows`` rows only. Exits with status
+1 when the full engine run takes more than ``--max-seconds``. Usage::
+
+    python -m benchmarks.bench_sheet_ingestion [--rows 50000] [--pending 0.05] [--max-seconds 60]
+"""
+from __future__ import annotations
+
+import argparse
+import logging
+import random
+import sys
+import time
+from typing import Dict
+
+import structlog
+
+from backend.models.database_models import (
+    LeadRepository,
+    MessageRepository,
+    QualificacaoRepository,
+    ReuniaoRepository,
+    SessionRepository,
+)
+from backend.services.qualification_service import QualificationService
+from backend.services.sheet_batch_writer import SheetBatchWriter
+from backend.services.sheet_ingestion import SheetIngestionEngine
+from benchmarks.fake_sheets import FakeSheetsApi
+from benchmarks.fake_supabase import FakeDatabaseConnection, FakeSupabase
+
+HEADERS = ['Status', 'Nome', 'Telefone', 'Canal', 'Contexto', 'Lead ID', 'Observação', 'Mensagem inicial']
+CHANNELS = ('ebook', 'youtube', 'newsletter', 'site', 'instagram')
+
+
+class _SlowNoopMessaging:
+    """Send stand-in taking ``seconds`` (WAHA call plus the humanised delay)."""
+
+    def __init__(self, seconds: float) -> None:
+        self.seconds = seconds
+
+    def send_message(self, **_: object) -> Dict[str, object]:
+        time.sleep(self.seconds)
+        return {"success": True, "queued": False}
+
+
+class _PassthroughWhatsApp:
+    def normalizar_telefone(self, telefone: str) -> str:
+        return telefone
+
+
+def _sheet(rows: int, pending: float, seed: int = 7) -> FakeSheetsApi:
+    rng = random.Random(seed)
+    values = [HEADERS]
+    for n in range(rows):
+        status = '' if rng.random() < pending else 'contatado'
+        values.append([status, f"Lead {n}", f"55119{n:08d}", rng.choice(CHANNELS), 'veio da planilha'])
+    return FakeSheetsApi(rows=values)
+
+
+def _run(rows: int, pending: float, args: argparse.Namespace, concurrency: int, batch_rows: int) -> Dict[str, float]:
+    sheet = _sheet(rows, pending)
+    sheet.latency = args.sheets_latency_ms / 1000.0
+    client = FakeSupabase(latency=args.db_latency_ms / 1000.0)
+    db = FakeDatabaseConnection(client)
+    lead_repo = LeadRepository(db)
+    service = QualificationService(
+        lead_repo=lead_repo,
+        session_repo=SessionRepository(db),
+        message_repo=MessageRepository(db),
+        qualificacao_repo=QualificacaoRepository(db),
+        reuniao_repo=ReuniaoRepository(db),
+        messaging_service=_SlowNoopMessaging(args.send_ms / 1000.0),
+        whatsapp_service=_PassthroughWhatsApp(),
+    )
+    engine = SheetIngestionEngine(lead_repo, service, start_concurrency=concurrency, batch_rows=batch_rows)
+
+    started = time.perf_counter()
+    values = sheet.values().get(spreadsheetId='bench', range='Leads!A1:H').execute()['values']
+    # Row at a time also means one sheet write per row
+    writer = SheetBatchWriter(sheet, 'bench', 'Leads', auto_flush_rows=1 if batch_rows == 1 else 200)
+    report = engine.run(values[0], values[1:], 2, writer)
+    elapsed = time.perf_counter() - started
+
+    contacted = sum(1 for row in sheet.rows[1:] if row and row[0] == 'contatado')
+    assert contacted == rows, f"{rows - contacted} rows left uncontacted"
+    return {
+        "seconds": elapsed,
+        "rows_per_second": rows / elapsed,
+        "leads": report.starts_done,
+        "db_round_trips": client.round_trips,
+        "sheet_requests": sheet.requests,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n", maxsplit=1)[0])
+    parser.add_argument("--rows", type=int, default=50_000)
+    parser.add_argument("--pending", type=float, default=0.05, help="fraction of rows that are new leads")
+    parser.add_argument("--baseline-rows", type=int, default=2_000)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--batch-rows", type=int, default=200)
+    parser.add_argument("--db-latency-ms", type=float, default=2.0)
+    parser.add_argument("--sheets-latency-ms", type=float, default=100.0)
+    parser.add_argument("--send-ms", type=float, default=20.0)
+    parser.add_argument("--max-seconds", type=float, default=60.0, help="fail above this for the full run")
+    args = parser.parse_args()
+
+    logging.disable(logging.CRITICAL)
+    structlog.configure(wrapper_class=structlog.make_filtering_bound_logger(logging.CRITICAL))
+
+    runs = {
+        f"row at a time ({args.baseline_rows} rows)": _run(args.baseline_rows, args.pending, args, 1, 1),
+        f"engine ({args.baseline_rows} rows)": _run(
+            args.baseline_rows, args.pending, args, args.concurrency, args.batch_rows
+        ),
+        f"engine ({args.rows} rows)": _run(args.rows, args.pending, args, args.concurrency, args.batch_rows),
+    }
+
+    print(f"{'run':>30} | {'seconds':>8} | {'rows/s':>9} | {'leads':>6} | {'db trips':>8} | {'sheet reqs':>10}")
+    for name, result in runs.items():
+        print(
+            f"{name:>30} | {result['seconds']:>8.2f} | {result['rows_per_second']:>9.0f} | {result['leads']:>6} | "
+            f"{result['db_round_trips']:>8} | {result['sheet_requests']:>10}"
+        )
+
+    full = runs[f"engine ({args.rows} rows)"]
+    failures = []
+    if full["seconds"] > args.max_seconds:
+        failures.append(f"{args.rows} rows took {full['seconds']:.1f}s > {args.max_seconds:.0f}s")
+    for failure in failures:
+        print(f"REGRESSION: {failure}")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,412 @@
+"""End-to-end load test: synthetic WAHA webhook traffic against the Flask app.
+
+Starts a fake WAHA server that records ``/api/sendText`` and points the app
+at it. The database is either the local SQLite backend or the in-process
+Supabase stand-in with simulated latency. The app is served on a threaded
+WSGI server and ``--leads`` synthetic leads walk the whole qualification
+conversation over HTTP. The payloads have the shape ``_parse_waha_payload``
+reads. Each lead sends its next message as soon as the previous one has
+been processed (closed loop), so every lead is in flight at once.
+
+Every turn reports these stages as p50/p95/p99, along with throughput:
+
+- webhook ack;
+- queue wait;
+- processing;
+- delivery: handler end to the first reply reaching WAHA;
+- end-to-end: POST to the first reply.
+
+The run doubles as a regression gate. It exits with status 1 when any of
+these thresholds is crossed: ``--max-p99-ms``, ``--min-throughput``,
+``--max-error-rate``, or ``--baseline`` (the JSON written by an earlier
+``--json`` run) within ``--tolerance``. Usage::
+
+    python -m benchmarks.bench_webhook_load [--leads 1000] [--clients 32] [--db sqlite|fake]
+"""
+from __future__ import annotations
+
+import argparse
+import functools
+import importlib
+import json
+import logging
+import math
+import os
+import queue
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import requests
+import structlog
+from werkzeug.serving import WSGIRequestHandler, make_server
+
+from benchmarks.bench_inbound_roundtrips import CONVERSATION
+
+STAGES = ("ack", "queue_wait", "processing", "delivery", "end_to_end")
+
+
+def percentile(values: List[float], pct: float) -> float:
+    """Nearest-rank percentile (``pct`` in 0-100); 0.0 for no samples."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(1, math.ceil(pct / 100 * len(ordered)))
+    return ordered[min(rank, len(ordered)) - 1]
+
+
+def waha_payload(telefone: str, nome: str, texto: str, seq: int) -> Dict[str, Any]:
+    """A WAHA ``message`` webhook as sent for an incoming text."""
+    return {
+        "event": "message",
+        "session": "default",
+        "payload": {
+            "id": f"false_{telefone}@c.us_{seq:08X}",
+            "timestamp": int(time.time()),
+            "from": f"{telefone}@c.us",
+            "fromMe": False,
+            "body": texto,
+            "hasMedia": False,
+            "_data": {"notifyName": nome},
+        },
+    }
+
+
+class FakeWaha:
+    """Local WAHA stand-in answering ``sendText`` (and anything else) with 201."""
+
+    def __init__(self, on_send: Callable[[str, str], None], latency: float = 0.0) -> None:
+        outer = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self) -> None:  # noqa: N802
+                body = self.rfile.read(int(self.headers.get('Content-Length') or 0))
+                if outer.latency:
+                    time.sleep(outer.latency)
+                if self.path.endswith('/api/sendText'):
+                    data = json.loads(body or b'{}')
+                    chat_id = str(data.get('chatId', ''))
+                    on_send(''.join(filter(str.isdigit, chat_id.split('@')[0])), data.get('text', ''))
+                self._reply(201, {"id": f"true_{time.monotonic_ns()}"})
+
+            def do_GET(self) -> None:  # noqa: N802
+                self._reply(200, {"status": "WORKING"})
+
+            def _reply(self, status: int, payload: Dict[str, Any]) -> None:
+                raw = json.dumps(payload).encode()
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(raw)))
+                self.end_headers()
+                self.wfile.write(raw)
+
+            def log_message(self, *args: Any) -> None:
+                pass
+
+        self.latency = latency
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.server.daemon_threads = True
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}"
+
+    def start(self) -> None:
+        threading.Thread(target=self.server.serve_forever, name="FakeWaha", daemon=True).start()
+
+    def stop(self) -> None:
+        self.server.shutdown()
+
+
+class _QuietHandler(WSGIRequestHandler):
+    def log_request(self, *args: Any, **kwargs: Any) -> None:
+        pass
+
+
+class LoadTracker:
+    """Closed-loop driver state: which lead sends next and the stage samples.
+
+    A turn ends when the bot's first reply to it reaches WAHA (or, for a
+    message the bot does not answer, after ``reply_timeout``); only then
+    does the lead send its next message.
+    """
+
+    def __init__(self, leads: int, reply_timeout: float = 5.0) -> None:
+        self.phones = [f"55119{n:08d}" for n in range(leads)]
+        self.index = {phone: n for n, phone in enumerate(self.phones)}
+        self.steps = [0] * leads
+        self.reply_timeout = reply_timeout
+        self.ready: "queue.Queue[Optional[int]]" = queue.Queue()
+        self.samples: Dict[str, List[float]] = {stage: [] for stage in STAGES}
+        self.counters = {"turns": 0, "replies": 0, "no_reply": 0, "errors": 0, "rejected": 0, "finished": 0}
+        self.done = threading.Event()
+        self._posted_at: Dict[str, float] = {}
+        self._awaiting_reply: Dict[str, Tuple[float, float]] = {}
+        self._lock = threading.Lock()
+        for n in range(leads):
+            self.ready.put(n)
+
+    def message_for(self, n: int) -> str:
+        return CONVERSATION[self.steps[n]]
+
+    def posted(self, phone: str, started: float, acked: float) -> None:
+        with self._lock:
+            self._posted_at[phone] = started
+            self.samples["ack"].append(acked - started)
+
+    def rejected(self) -> None:
+        with self._lock:
+            self.counters["rejected"] += 1
+
+    def failed(self, n: int) -> None:
+        with self._lock:
+            self.counters["errors"] += 1
+            self._finish()
+
+    def processed(self, phone: str, enqueued_at: float, started: float, finished: float) -> None:
+        if phone not in self.index:
+            return
+        with self._lock:
+            self.samples["queue_wait"].append(started - enqueued_at)
+            self.samples["processing"].append(finished - started)
+            self.counters["turns"] += 1
+            self._awaiting_reply[phone] = (finished, self._posted_at.get(phone, enqueued_at))
+
+    def replied(self, phone: str, _text: str) -> None:
+        now = time.monotonic()
+        with self._lock:
+            self.counters["replies"] += 1
+            pending = self._awaiting_reply.pop(phone, None)
+            if pending is None:
+                return  # a second message of a turn that already ended
+            finished, posted_at = pending
+            self.samples["delivery"].append(now - finished)
+            self.samples["end_to_end"].append(now - posted_at)
+            self._advance(self.index[phone])
+
+    def expire_unanswered(self) -> None:
+        """End turns whose reply did not come within ``reply_timeout``."""
+        cutoff = time.monotonic() - self.reply_timeout
+        with self._lock:
+            for phone, (finished, _) in list(self._awaiting_reply.items()):
+                if finished < cutoff:
+                    del self._awaiting_reply[phone]
+                    self.counters["no_reply"] += 1
+                    self._advance(self.index[phone])
+
+    def _advance(self, n: int) -> None:
+        # Called with ``_lock`` held
+        self.steps[n] += 1
+        if self.steps[n] >= len(CONVERSATION):
+            self._finish()
+        else:
+            self.ready.put(n)
+
+    def _finish(self) -> None:
+        # Called with ``_lock`` held
+        self.counters["finished"] += 1
+        if self.counters["finished"] >= len(self.phones):
+            self.done.set()
+
+
+def _sender(base_url: str, tracker: LoadTracker, seq: List[int], seq_lock: threading.Lock) -> None:
+    http = requests.Session()
+    while True:
+        n = tracker.ready.get()
+        if n is None:
+            return
+        phone = tracker.phones[n]
+        with seq_lock:
+            seq[0] += 1
+            message_seq = seq[0]
+        payload = waha_payload(phone, f"Lead{n}", tracker.message_for(n), message_seq)
+        started = time.monotonic()
+        try:
+            response = http.post(f"{base_url}/webhook", json=payload, timeout=30)
+        except requests.RequestException:
+            tracker.failed(n)
+            continue
+        if response.status_code == 503:
+            # Inbound queue full: back off like WAHA's retry would
+            tracker.rejected()
+            time.sleep(0.05)
+            tracker.ready.put(n)
+            continue
+        if response.status_code != 200 or response.json().get('status') != 'queued':
+            tracker.failed(n)
+            continue
+        tracker.posted(phone, started, time.monotonic())
+
+
+def _load_app(args: argparse.Namespace, waha_url: str, workdir: str) -> Any:
+    """Import ``backend.app`` wired to the fake WAHA and the chosen database."""
+    os.environ.update({
+        'WAHA_BASE_URL': waha_url,
+        'INBOUND_WORKERS': str(args.workers),
+        'INBOUND_QUEUE_MAXSIZE': str(args.queue_size),
+        'COORDINATION_BACKEND': 'memory',
+        'FLASK_DEBUG': 'false',
+    })
+    os.environ.pop('GOOGLE_SHEETS_ID', None)
+    if args.db == 'sqlite':
+        os.environ['DATABASE_BACKEND'] = 'sqlite'
+        os.environ['SQLITE_DATABASE_PATH'] = os.path.join(workdir, 'agente.db')
+    else:
+        from backend.models import database_models
+        from benchmarks.fake_supabase import FakeSupabase, install_inbound_rpcs
+
+        client = FakeSupabase(latency=args.db_latency_ms / 1000)
+        install_inbound_rpcs(client)
+
+        def _fake_connection(self: Any) -> None:
+            self.client = client
+
+        database_models.DatabaseConnection.__init__ = _fake_connection  # type: ignore[method-assign]
+
+    app_module = importlib.import_module('backend.app')
+    # Capacity run: no humanising typing delay, no per-recipient send spacing
+    app_module.whatsapp_service.calcular_delay_humanizado = lambda conversa_count=0: 0.0
+    app_module.coordination.reserve_send_slot = functools.partial(
+        app_module.coordination.reserve_send_slot, spacing=args.send_spacing
+    )
+    return app_module
+
+
+def _instrument(app_module: Any, tracker: LoadTracker) -> None:
+    handler = app_module.inbound_pool.handler
+
+    def timed(job: Any) -> Any:
+        started = time.monotonic()
+        try:
+            return handler(job)
+        finally:
+            tracker.processed(job.telefone, job.enqueued_at, started, time.monotonic())
+
+    app_module.inbound_pool.handler = timed
+
+
+def run(args: argparse.Namespace) -> Dict[str, Any]:
+    tracker = LoadTracker(args.leads, reply_timeout=args.reply_timeout)
+    waha = FakeWaha(tracker.replied, latency=args.waha_latency_ms / 1000)
+    waha.start()
+    with tempfile.TemporaryDirectory(prefix='bench_webhook_') as workdir:
+        app_module = _load_app(args, waha.url, workdir)
+        _instrument(app_module, tracker)
+        server = make_server('127.0.0.1', 0, app_module.app, threaded=True, request_handler=_QuietHandler)
+        threading.Thread(target=server.serve_forever, name="BenchApp", daemon=True).start()
+        base_url = f"http://127.0.0.1:{server.server_port}"
+
+        seq, seq_lock = [0], threading.Lock()
+        senders = [
+            threading.Thread(target=_sender, args=(base_url, tracker, seq, seq_lock), daemon=True)
+            for _ in range(args.clients)
+        ]
+        started = time.monotonic()
+        for thread in senders:
+            thread.start()
+        deadline = started + args.timeout
+        while not tracker.done.wait(timeout=0.25) and time.monotonic() < deadline:
+            tracker.expire_unanswered()
+        completed = tracker.done.is_set()
+        elapsed = time.monotonic() - started
+
+        for _ in senders:
+            tracker.ready.put(None)
+        server.shutdown()
+        app_module.inbound_pool.stop()
+        app_module.delivery_scheduler.shutdown()
+        waha.stop()
+
+    turns = tracker.counters["turns"]
+    attempted = turns + tracker.counters["errors"]
+    return {
+        "leads": args.leads,
+        "db": args.db,
+        "completed": completed,
+        "elapsed_seconds": round(elapsed, 3),
+        "turns": turns,
+        "turns_per_second": round(turns / elapsed, 2) if elapsed else 0.0,
+        "conversations_per_second": round(tracker.counters["finished"] / elapsed, 2) if elapsed else 0.0,
+        "replies": tracker.counters["replies"],
+        "unanswered_turns": tracker.counters["no_reply"],
+        "rejected_503": tracker.counters["rejected"],
+        "errors": tracker.counters["errors"],
+        "error_rate": round(tracker.counters["errors"] / attempted, 4) if attempted else 0.0,
+        "stages_ms": {
+            stage: {
+                "count": len(values),
+                "p50": round(percentile(values, 50) * 1000, 2),
+                "p95": round(percentile(values, 95) * 1000, 2),
+                "p99": round(percentile(values, 99) * 1000, 2),
+            }
+            for stage, values in tracker.samples.items()
+        },
+    }
+
+
+def check_thresholds(result: Dict[str, Any], args: argparse.Namespace) -> List[str]:
+    """Return the list of crossed thresholds (empty when the run passes)."""
+    failures = []
+    p99 = result["stages_ms"]["end_to_end"]["p99"]
+    if not result["completed"]:
+        failures.append(f"run did not finish within {args.timeout}s")
+    if args.max_p99_ms is not None and p99 > args.max_p99_ms:
+        failures.append(f"end-to-end p99 {p99}ms > {args.max_p99_ms}ms")
+    if args.min_throughput is not None and result["turns_per_second"] < args.min_throughput:
+        failures.append(f"throughput {result['turns_per_second']}/s < {args.min_throughput}/s")
+    if result["error_rate"] > args.max_error_rate:
+        failures.append(f"error rate {result['error_rate']} > {args.max_error_rate}")
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as handle:
+            baseline = json.load(handle)
+        base_p99 = baseline["stages_ms"]["end_to_end"]["p99"]
+        if base_p99 and p99 > base_p99 * (1 + args.tolerance):
+            failures.append(f"end-to-end p99 {p99}ms regressed from {base_p99}ms")
+        base_tps = baseline["turns_per_second"]
+        if result["turns_per_second"] < base_tps * (1 - args.tolerance):
+            failures.append(f"throughput {result['turns_per_second']}/s regressed from {base_tps}/s")
+    return failures
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--leads", type=int, default=1000, help="synthetic leads, all in flight at once")
+    parser.add_argument("--clients", type=int, default=32, help="concurrent HTTP senders")
+    parser.add_argument("--workers", type=int, default=8, help="INBOUND_WORKERS of the app")
+    parser.add_argument("--queue-size", type=int, default=1000, help="INBOUND_QUEUE_MAXSIZE of the app")
+    parser.add_argument("--db", choices=("sqlite", "fake"), default="sqlite")
+    parser.add_argument("--db-latency-ms", type=float, default=5.0, help="per call, --db fake only")
+    parser.add_argument("--waha-latency-ms", type=float, default=0.0)
+    parser.add_argument("--send-spacing", type=float, default=0.0, help="seconds between sends to one lead")
+    parser.add_argument("--reply-timeout", type=float, default=5.0, help="end a turn the bot does not answer")
+    parser.add_argument("--timeout", type=float, default=600.0)
+    parser.add_argument("--max-p99-ms", type=float, default=None)
+    parser.add_argument("--min-throughput", type=float, default=None, help="turns per second")
+    parser.add_argument("--max-error-rate", type=float, default=0.0)
+    parser.add_argument("--baseline", help="JSON result of a previous run to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed regression vs --baseline")
+    parser.add_argument("--json", help="write the result here")
+    args = parser.parse_args()
+    structlog.configure(wrapper_class=structlog.make_filtering_bound_logger(logging.ERROR))
+
+    result = run(args)
+    print(
+        f"{result['leads']} leads, {result['turns']} turns in {result['elapsed_seconds']}s: "
+        f"{result['turns_per_second']} turns/s, {result['conversations_per_second']} conversations/s, "
+        f"{result['unanswered_turns']} unanswered, {result['rejected_503']} rejected (503), {result['errors']} errors"
+    )
+    print(f"{'stage':>12} | {'count':>7} | {'p50 ms':>8} | {'p95 ms':>8} | {'p99 ms':>8}")
+    for stage, row in result["stages_ms"].items():
+        print(f"{stage:>12} | {row['count']:>7} | {row['p50']:>8.2f} | {row['p95']:>8.2f} | {row['p99']:>8.2f}")
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as handle:
+            json.dump(result, handle, indent=2)
+
+    failures = check_thresholds(result, args)
+    for failure in failures:
+        print(f"REGRESSION: {failure}")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
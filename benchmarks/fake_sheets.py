@@ -0,0 +1,110 @@
+"""In-process stand-in for the Google Sheets ``spreadsheets()`` resource.
+
+Supports what the lead-sheet code uses: ``values().get`` / ``update`` /
+``batchUpdate`` on A1 ranges of one tab. Reads behave like the API (values
+as strings, trailing blank cells and rows dropped); every ``execute()`` is
+one request, with an optional simulated latency.
+"""
+from __future__ import annotations
+
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from backend.services.sheet_batch_writer import column_index
+
+
+def _parse_a1(a1_range: str) -> Tuple[str, int, Optional[int], int, Optional[int]]:
+    """``'Leads!B5:D'`` -> ``('Leads', 1, 4, 3, None)`` (0-based columns, 1-based rows)."""
+    sheet, _, cells = a1_range.partition('!')
+    start, _, end = cells.partition(':')
+
+    def split(cell: str) -> Tuple[Optional[int], Optional[int]]:
+        letters = ''.join(ch for ch in cell if ch.isalpha())
+        digits = ''.join(ch for ch in cell if ch.isdigit())
+        return (column_index(letters) if letters else None), (int(digits) if digits else None)
+
+    start_col, start_row = split(start)
+    if end:
+        end_col, end_row = split(end)
+    else:
+        end_col, end_row = start_col, start_row
+    return sheet, start_col or 0, start_row, end_col if end_col is not None else 10_000, end_row
+
+
+class _Call:
+    def __init__(self, api: 'FakeSheetsApi', run: Callable[[], Dict[str, Any]]) -> None:
+        self.api = api
+        self.run = run
+
+    def execute(self) -> Dict[str, Any]:
+        return self.api._request(self.run)  # pylint: disable=protected-access
+
+
+class FakeSheetsApi:
+    """One spreadsheet tab in memory; ``rows[0]`` is sheet row 1."""
+
+    def __init__(self, sheet_name: str = 'Leads', rows: Optional[List[List[Any]]] = None, latency: float = 0.0) -> None:
+        self.sheet_name = sheet_name
+        self.rows: List[List[str]] = [[str(cell) for cell in row] for row in (rows or [])]
+        self.latency = latency
+        self.requests = 0
+        self.cells_written = 0
+        self._lock = threading.Lock()
+
+    # ``service.spreadsheets()`` and ``spreadsheets().values()`` are this object
+    def spreadsheets(self) -> 'FakeSheetsApi':
+        return self
+
+    def values(self) -> 'FakeSheetsApi':
+        return self
+
+    def get(self, spreadsheetId: str, range: str) -> _Call:  # pylint: disable=invalid-name,redefined-builtin,unused-argument
+        return _Call(self, lambda: self._read(range))
+
+    def update(self, spreadsheetId: str, range: str, valueInputOption: str, body: Dict[str, Any]) -> _Call:  # pylint: disable=invalid-name,redefined-builtin,unused-argument
+        return _Call(self, lambda: self._write(range, body['values']))
+
+    def batchUpdate(self, spreadsheetId: str, body: Dict[str, Any]) -> _Call:  # pylint: disable=invalid-name,unused-argument
+        def run() -> Dict[str, Any]:
+            for entry in body['data']:
+                self._write(entry['range'], entry['values'])
+            return {'totalUpdatedRanges': len(body['data'])}
+        return _Call(self, run)
+
+    def reset_counters(self) -> None:
+        self.requests = 0
+        self.cells_written = 0
+
+    def _request(self, run: Callable[[], Dict[str, Any]]) -> Dict[str, Any]:
+        if self.latency:
+            time.sleep(self.latency)
+        with self._lock:
+            self.requests += 1
+            return run()
+
+    def _read(self, a1_range: str) -> Dict[str, Any]:
+        _, first_col, first_row, last_col, last_row = _parse_a1(a1_range)
+        selected = self.rows[(first_row or 1) - 1:last_row]
+        values = []
+        for row in selected:
+            cells = row[first_col:last_col + 1]
+            while cells and cells[-1] == '':
+                cells = cells[:-1]
+            values.append(cells)
+        while values and not values[-1]:
+            values.pop()
+        return {'range': a1_range, 'values': values} if values else {'range': a1_range}
+
+    def _write(self, a1_range: str, values: List[List[Any]]) -> Dict[str, Any]:
+        _, first_col, first_row, _, _ = _parse_a1(a1_range)
+        for offset, new_cells in enumerate(values):
+            row_index = (first_row or 1) - 1 + offset
+            while len(self.rows) <= row_index:
+                self.rows.append([])
+            row = self.rows[row_index]
+            if len(row) < first_col + len(new_cells):
+                row.extend([''] * (first_col + len(new_cells) - len(row)))
+            row[first_col:first_col + len(new_cells)] = [str(cell) for cell in new_cells]
+            self.cells_written += len(new_cells)
+        return {'updatedRange': a1_range}
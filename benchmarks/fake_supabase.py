@@ -0,0 +1,368 @@
+"""In-process stand-in for the Supabase client used by the benchmarks.
+
+Implements the subset of the PostgREST query builder the repositories use
+(``table().select().eq()...execute()``, inserts, updates, upserts and
+``rpc``) over in-memory tables. Every ``execute()`` counts as one round-trip
+and can sleep ``latency`` seconds to model the network hop; request and
+response sizes are measured as their JSON encoding.
+"""
+from __future__ import annotations
+
+import json
+import threading
+import time
+import uuid
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from backend.models.database_models import LEAD_COLUMNS, SESSION_STATE_COLUMNS
+from backend.models.sqlite_backend import parse_logic_filter
+
+_EPOCH = datetime(2024, 1, 1, tzinfo=timezone.utc)
+
+
+@dataclass
+class FakeResponse:
+    data: Any
+    count: Optional[int] = None
+
+
+def _match_one(row: Dict[str, Any], op: str, column: str, value: Any) -> bool:
+    if op == 'or':
+        return any(_match_all(row, [term]) for term in value)
+    if op == 'and':
+        return _match_all(row, value)
+    current = row.get(column)
+    if op == 'eq':
+        return current == value
+    if op == 'neq':
+        return current != value
+    if op == 'in':
+        return current in value
+    if current is None:
+        return False
+    return {
+        'gt': current > value,
+        'gte': current >= value,
+        'lt': current < value,
+        'lte': current <= value,
+    }[op]
+
+
+def _match_all(row: Dict[str, Any], filters: List[Tuple[str, str, Any]]) -> bool:
+    return all(_match_one(row, op, column, value) for op, column, value in filters)
+
+
+class FakeQuery:
+    """Chainable query against one in-memory table."""
+
+    def __init__(self, client: 'FakeSupabase', table: str) -> None:
+        self.client = client
+        self.table = table
+        self._op = 'select'
+        self._columns = '*'
+        self._values: Any = None
+        self._on_conflict: Optional[str] = None
+        self._filters: List[Tuple[str, str, Any]] = []
+        self._order: List[Tuple[str, bool]] = []
+        self._limit: Optional[int] = None
+        self._count: Optional[str] = None
+        self._minimal = False
+        self._ignore_duplicates = False
+
+    # Operations --------------------------------------------------------
+    def select(self, columns: str = '*', count: Optional[str] = None) -> 'FakeQuery':
+        self._op, self._columns, self._count = 'select', columns, count
+        return self
+
+    def insert(self, values: Any) -> 'FakeQuery':
+        self._op, self._values = 'insert', values
+        return self
+
+    def upsert(
+        self,
+        values: Any,
+        on_conflict: Optional[str] = None,
+        ignore_duplicates: bool = False,
+        **_: Any,
+    ) -> 'FakeQuery':
+        self._op, self._values, self._on_conflict = 'upsert', values, on_conflict
+        self._ignore_duplicates = ignore_duplicates
+        return self
+
+    def update(self, values: Dict[str, Any], count: Any = None, returning: Any = None) -> 'FakeQuery':
+        self._op, self._values, self._count = 'update', values, count
+        self._minimal = getattr(returning, 'value', returning) == 'minimal'
+        return self
+
+    def delete(self) -> 'FakeQuery':
+        self._op = 'delete'
+        return self
+
+    # Filters -----------------------------------------------------------
+    def eq(self, column: str, value: Any) -> 'FakeQuery':
+        self._filters.append(('eq', column, value))
+        return self
+
+    def neq(self, column: str, value: Any) -> 'FakeQuery':
+        self._filters.append(('neq', column, value))
+        return self
+
+    def gt(self, column: str, value: Any) -> 'FakeQuery':
+        self._filters.append(('gt', column, value))
+        return self
+
+    def gte(self, column: str, value: Any) -> 'FakeQuery':
+        self._filters.append(('gte', column, value))
+        return self
+
+    def lt(self, column: str, value: Any) -> 'FakeQuery':
+        self._filters.append(('lt', column, value))
+        return self
+
+    def lte(self, column: str, value: Any) -> 'FakeQuery':
+        self._filters.append(('lte', column, value))
+        return self
+
+    def in_(self, column: str, values: List[Any]) -> 'FakeQuery':
+        self._filters.append(('in', column, list(values)))
+        return self
+
+    def or_(self, filters: str) -> 'FakeQuery':
+        self._filters.append(('or', '', parse_logic_filter(filters)))
+        return self
+
+    def order(self, column: str, desc: bool = False) -> 'FakeQuery':
+        self._order.append((column, desc))
+        return self
+
+    def limit(self, count: int) -> 'FakeQuery':
+        self._limit = count
+        return self
+
+    def execute(self) -> FakeResponse:
+        request = {'table': self.table, 'op': self._op, 'values': self._values, 'filters': self._filters}
+        return self.client._round_trip(request, lambda: self._run())  # pylint: disable=protected-access
+
+    # Evaluation --------------------------------------------------------
+    def _matches(self, row: Dict[str, Any]) -> bool:
+        return _match_all(row, self._filters)
+
+    def _project(self, row: Dict[str, Any]) -> Dict[str, Any]:
+        if self._columns.strip() == '*':
+            return dict(row)
+        columns = [c.strip() for c in self._columns.split(',') if c.strip()]
+        return {c: row.get(c) for c in columns}
+
+    def _run(self) -> FakeResponse:
+        rows = self.client.tables.setdefault(self.table, [])
+        if self._op in ('insert', 'upsert'):
+            values = self._values if isinstance(self._values, list) else [self._values]
+            written = [
+                self.client.write_row(self.table, v, self._on_conflict, self._ignore_duplicates) for v in values
+            ]
+            return FakeResponse([row for row in written if row is not None])
+
+        matched = [row for row in rows if self._matches(row)]
+        if self._op == 'update':
+            for row in matched:
+                row.update(self._values)
+            data = [] if self._minimal else [dict(row) for row in matched]
+            return FakeResponse(data, count=len(matched) if self._count else None)
+        if self._op == 'delete':
+            self.client.tables[self.table] = [row for row in rows if row not in matched]
+            return FakeResponse([dict(row) for row in matched])
+
+        for column, desc in reversed(self._order):
+            matched.sort(key=lambda r, c=column: (r.get(c) is None, r.get(c)), reverse=desc)
+        total = len(matched)
+        if self._limit is not None:
+            matched = matched[: self._limit]
+        return FakeResponse([self._project(row) for row in matched], count=total if self._count else None)
+
+
+class FakeRpc:
+    def __init__(self, client: 'FakeSupabase', name: str, params: Dict[str, Any]) -> None:
+        self.client = client
+        self.name = name
+        self.params = params
+
+    def execute(self) -> FakeResponse:
+        handler = self.client.rpcs.get(self.name)
+        if handler is None:
+            raise RuntimeError(f"function {self.name} does not exist")
+        request = {'rpc': self.name, 'params': self.params}
+        return self.client._round_trip(  # pylint: disable=protected-access
+            request, lambda: FakeResponse(handler(self.client, self.params))
+        )
+
+
+class FakeSupabase:
+    """Minimal Supabase ``Client`` look-alike with round-trip accounting."""
+
+    def __init__(self, latency: float = 0.0) -> None:
+        self.latency = latency
+        self.tables: Dict[str, List[Dict[str, Any]]] = {}
+        self.rpcs: Dict[str, Callable[['FakeSupabase', Dict[str, Any]], Any]] = {}
+        self.unique: Dict[str, str] = {'leads': 'telefone'}
+        self.round_trips = 0
+        self.bytes_sent = 0
+        self.bytes_received = 0
+        self._lock = threading.RLock()
+        self._tick = 0
+
+    def table(self, name: str) -> FakeQuery:
+        return FakeQuery(self, name)
+
+    def rpc(self, name: str, params: Optional[Dict[str, Any]] = None) -> FakeRpc:
+        return FakeRpc(self, name, params or {})
+
+    def register_rpc(self, name: str, handler: Callable[['FakeSupabase', Dict[str, Any]], Any]) -> None:
+        self.rpcs[name] = handler
+
+    def reset_counters(self) -> None:
+        self.round_trips = 0
+        self.bytes_sent = 0
+        self.bytes_received = 0
+
+    def write_row(
+        self,
+        table: str,
+        values: Dict[str, Any],
+        on_conflict: Optional[str] = None,
+        ignore_duplicates: bool = False,
+    ) -> Optional[Dict[str, Any]]:
+        """Insert (or upsert on ``on_conflict``) one row; raises on unique violations.
+
+        With ``ignore_duplicates`` a conflicting row is skipped and ``None`` returned.
+        """
+        rows = self.tables.setdefault(table, [])
+        key = on_conflict or self.unique.get(table)
+        if key and key in values:
+            existing = next((r for r in rows if r.get(key) == values[key]), None)
+            if existing is not None:
+                if on_conflict is None:
+                    raise RuntimeError(f"duplicate key value violates unique constraint on {table}.{key}")
+                if ignore_duplicates:
+                    return None
+                existing.update(values)
+                return dict(existing)
+        self._tick += 1
+        row = {
+            'id': str(uuid.uuid4()),
+            'created_at': (_EPOCH + timedelta(milliseconds=self._tick)).isoformat(),
+            **values,
+        }
+        rows.append(row)
+        return dict(row)
+
+    def _round_trip(self, request: Dict[str, Any], run: Callable[[], FakeResponse]) -> FakeResponse:
+        if self.latency:
+            time.sleep(self.latency)
+        with self._lock:
+            response = run()
+            self.round_trips += 1
+            self.bytes_sent += len(json.dumps(request, default=str))
+            self.bytes_received += len(json.dumps(response.data, default=str))
+        return response
+
+
+# Python versions of the SQL functions in database/schema.sql ----------------
+
+def _pick(row: Optional[Dict[str, Any]], columns: str) -> Optional[Dict[str, Any]]:
+    if row is None:
+        return None
+    return {c: row.get(c) for c in columns.split(',')}
+
+
+def _active_session(client: FakeSupabase, lead_id: str) -> Optional[Dict[str, Any]]:
+    return next(
+        (s for s in reversed(client.tables.get('sessions', [])) if s['lead_id'] == lead_id and s.get('ativa')),
+        None,
+    )
+
+
+def _obter_ou_criar_lead_sessao(client: FakeSupabase, params: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    # Runs under the client lock, like the advisory lock in the SQL version
+    leads = client.tables.setdefault('leads', [])
+    lead = next((r for r in leads if r['telefone'] == params['p_telefone']), None)
+    lead_created = lead is None
+    if lead is None:
+        lead = client.write_row('leads', {
+            'nome': params.get('p_nome') or 'tudo bem',
+            'telefone': params['p_telefone'],
+            'canal': params.get('p_canal') or 'whatsapp',
+            'status': 'novo',
+        })
+    session = _active_session(client, lead['id'])
+    session_created = session is None and params.get('p_sessao') is not None
+    if session_created:
+        session = client.write_row('sessions', {
+            'lead_id': lead['id'],
+            'estado': params['p_sessao'].get('estado') or 'inicio',
+            'contexto': params['p_sessao'].get('contexto') or {},
+            'ativa': True,
+        })
+    return {
+        'lead': _pick(lead, LEAD_COLUMNS.slim),
+        'lead_created': lead_created,
+        'session': _pick(session, SESSION_STATE_COLUMNS),
+        'session_created': session_created,
+    }
+
+
+def _carregar_contexto_inbound(client: FakeSupabase, params: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    if not params.get('p_lead_id'):
+        data = _obter_ou_criar_lead_sessao(client, params)
+    else:
+        lead = next((r for r in client.tables.get('leads', []) if r['id'] == params['p_lead_id']), None)
+        if lead is None:
+            return None
+        data = {
+            'lead': _pick(lead, LEAD_COLUMNS.slim),
+            'lead_created': False,
+            'session': _pick(_active_session(client, lead['id']), SESSION_STATE_COLUMNS),
+            'session_created': False,
+        }
+    lead_id = data['lead']['id']
+    quali = next((q for q in client.tables.get('qualificacoes', []) if q['lead_id'] == lead_id), None)
+    return {**data, 'qualificacao': _pick(quali, 'id')}
+
+
+def _aplicar_inbound(client: FakeSupabase, params: Dict[str, Any]) -> Dict[str, Any]:
+    payload = params['p_payload']
+    for message in payload.get('messages') or []:
+        client.write_row('messages', message)
+    for table, key in (('sessions', 'sessions'), ('leads', 'leads')):
+        for item in payload.get(key) or []:
+            for row in client.tables.get(table, []):
+                if row['id'] == item['id']:
+                    row.update(item['updates'])
+    quali = payload.get('qualificacao')
+    if quali:
+        rows = [q for q in client.tables.get('qualificacoes', []) if q['lead_id'] == quali['lead_id']]
+        existing = max(rows, key=lambda q: q['created_at'], default=None)
+        if existing:
+            existing.update(quali['fields'])
+        else:
+            client.write_row('qualificacoes', {'lead_id': quali['lead_id'], 'session_id': quali['session_id'], **quali['fields']})
+    for reuniao in payload.get('reunioes') or []:
+        client.write_row('reunioes', reuniao)
+    return {'ok': True}
+
+
+def install_inbound_rpcs(client: FakeSupabase) -> None:
+    client.register_rpc('obter_ou_criar_lead_sessao', _obter_ou_criar_lead_sessao)
+    client.register_rpc('carregar_contexto_inbound', _carregar_contexto_inbound)
+    client.register_rpc('aplicar_inbound', _aplicar_inbound)
+
+
+class FakeDatabaseConnection:
+    """Drop-in for ``DatabaseConnection`` handing out a ``FakeSupabase``."""
+
+    def __init__(self, client: Optional[FakeSupabase] = None) -> None:
+        self.client = client or FakeSupabase()
+
+    def get_client(self) -> FakeSupabase:
+        return self.client
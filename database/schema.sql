@@ -166,3 +166,177 @@ CREATE TRIGGER IF NOT EXISTS sync_lead_score_trigger
 
 
 
+-- Lead + sessão ativa por telefone, criando o que faltar, em uma chamada
+-- atômica: o advisory lock serializa mensagens simultâneas do mesmo número
+-- (ver LeadRepository.get_or_create_with_session)
+CREATE OR REPLACE FUNCTION obter_ou_criar_lead_sessao(
+    p_telefone TEXT,
+    p_nome TEXT,
+    p_canal TEXT,
+    p_sessao JSONB DEFAULT NULL
+)
+RETURNS JSONB AS $$
+DECLARE
+    v_lead public.leads%ROWTYPE;
+    v_session public.sessions%ROWTYPE;
+    v_lead_created BOOLEAN := FALSE;
+    v_session_created BOOLEAN := FALSE;
+BEGIN
+    PERFORM pg_advisory_xact_lock(hashtext('lead:' || p_telefone));
+
+    SELECT * INTO v_lead FROM public.leads WHERE telefone = p_telefone;
+    IF NOT FOUND THEN
+        INSERT INTO public.leads (nome, telefone, canal)
+        VALUES (COALESCE(p_nome, 'tudo bem'), p_telefone, COALESCE(p_canal, 'whatsapp'))
+        ON CONFLICT (telefone) DO NOTHING
+        RETURNING * INTO v_lead;
+        v_lead_created := FOUND;
+        IF NOT v_lead_created THEN
+            SELECT * INTO v_lead FROM public.leads WHERE telefone = p_telefone;
+        END IF;
+    END IF;
+
+    IF v_lead.id IS NULL THEN
+        RETURN NULL;
+    END IF;
+
+    SELECT * INTO v_session FROM public.sessions
+    WHERE lead_id = v_lead.id AND ativa
+    ORDER BY created_at DESC LIMIT 1;
+    IF NOT FOUND AND p_sessao IS NOT NULL THEN
+        INSERT INTO public.sessions (lead_id, estado, contexto, ativa)
+        VALUES (v_lead.id, COALESCE(p_sessao->>'estado', 'inicio'), COALESCE(p_sessao->'contexto', '{}'::jsonb), TRUE)
+        RETURNING * INTO v_session;
+        v_session_created := TRUE;
+    END IF;
+
+    -- Mesmas projeções "slim" dos repositórios (LEAD_COLUMNS, SESSION_STATE_COLUMNS)
+    RETURN jsonb_build_object(
+        'lead', jsonb_build_object(
+            'id', v_lead.id, 'nome', v_lead.nome, 'telefone', v_lead.telefone,
+            'canal', v_lead.canal, 'status', v_lead.status, 'processado', v_lead.processado
+        ),
+        'lead_created', v_lead_created,
+        'session', CASE WHEN v_session.id IS NULL THEN NULL ELSE jsonb_build_object(
+            'id', v_session.id, 'lead_id', v_session.lead_id, 'estado', v_session.estado,
+            'contexto', v_session.contexto, 'ativa', v_session.ativa
+        ) END,
+        'session_created', v_session_created
+    );
+END;
+$$ LANGUAGE plpgsql;
+
+-- Unidade de trabalho do webhook: uma chamada para ler e uma para gravar
+-- tudo o que uma mensagem recebida precisa (ver backend/models/unit_of_work.py)
+DROP FUNCTION IF EXISTS carregar_contexto_inbound(TEXT, UUID, TEXT, TEXT);
+CREATE OR REPLACE FUNCTION carregar_contexto_inbound(
+    p_telefone TEXT,
+    p_lead_id UUID,
+    p_nome TEXT,
+    p_canal TEXT,
+    p_sessao JSONB DEFAULT NULL
+)
+RETURNS JSONB AS $$
+DECLARE
+    v_ctx JSONB;
+    v_lead public.leads%ROWTYPE;
+BEGIN
+    IF p_lead_id IS NULL THEN
+        v_ctx := obter_ou_criar_lead_sessao(p_telefone, p_nome, p_canal, p_sessao);
+    ELSE
+        SELECT * INTO v_lead FROM public.leads WHERE id = p_lead_id;
+        IF FOUND THEN
+            v_ctx := jsonb_build_object(
+                'lead', jsonb_build_object(
+                    'id', v_lead.id, 'nome', v_lead.nome, 'telefone', v_lead.telefone,
+                    'canal', v_lead.canal, 'status', v_lead.status, 'processado', v_lead.processado
+                ),
+                'lead_created', FALSE,
+                'session', (
+                    SELECT jsonb_build_object(
+                        'id', s.id, 'lead_id', s.lead_id, 'estado', s.estado,
+                        'contexto', s.contexto, 'ativa', s.ativa
+                    )
+                    FROM public.sessions s
+                    WHERE s.lead_id = v_lead.id AND s.ativa
+                    ORDER BY s.created_at DESC LIMIT 1
+                ),
+                'session_created', FALSE
+            );
+        END IF;
+    END IF;
+
+    IF v_ctx IS NULL THEN
+        RETURN NULL;
+    END IF;
+
+    RETURN v_ctx || jsonb_build_object(
+        'qualificacao', (
+            SELECT jsonb_build_object('id', q.id) FROM public.qualificacoes q
+            WHERE q.lead_id = (v_ctx->'lead'->>'id')::uuid
+            ORDER BY q.created_at DESC LIMIT 1
+        )
+    );
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION aplicar_inbound(p_payload JSONB)
+RETURNS JSONB AS $$
+DECLARE
+    v_item JSONB;
+    v_quali JSONB := p_payload->'qualificacao';
+    v_fields JSONB;
+    v_quali_id UUID;
+BEGIN
+    INSERT INTO public.messages (session_id, lead_id, conteudo, tipo, metadata)
+    SELECT (m->>'session_id')::UUID, (m->>'lead_id')::UUID, m->>'conteudo', m->>'tipo',
+           COALESCE(m->'metadata', '{}'::JSONB)
+    FROM jsonb_array_elements(COALESCE(p_payload->'messages', '[]'::JSONB)) AS m;
+
+    FOR v_item IN SELECT * FROM jsonb_array_elements(COALESCE(p_payload->'sessions', '[]'::JSONB)) LOOP
+        UPDATE public.sessions SET
+            estado = CASE WHEN v_item->'updates' ? 'estado' THEN v_item->'updates'->>'estado' ELSE estado END,
+            contexto = CASE WHEN v_item->'updates' ? 'contexto' THEN NULLIF(v_item->'updates'->'contexto', 'null'::JSONB) ELSE contexto END,
+            ativa = CASE WHEN v_item->'updates' ? 'ativa' THEN (v_item->'updates'->>'ativa')::BOOLEAN ELSE ativa END
+        WHERE id = (v_item->>'id')::UUID;
+    END LOOP;
+
+    FOR v_item IN SELECT * FROM jsonb_array_elements(COALESCE(p_payload->'leads', '[]'::JSONB)) LOOP
+        UPDATE public.leads SET
+            status = CASE WHEN v_item->'updates' ? 'status' THEN v_item->'updates'->>'status' ELSE status END,
+            processado = CASE WHEN v_item->'updates' ? 'processado' THEN (v_item->'updates'->>'processado')::BOOLEAN ELSE processado END
+        WHERE id = (v_item->>'id')::UUID;
+    END LOOP;
+
+    IF v_quali IS NOT NULL AND v_quali <> 'null'::JSONB THEN
+        v_fields := COALESCE(v_quali->'fields', '{}'::JSONB);
+        SELECT q.id INTO v_quali_id FROM public.qualificacoes q
+        WHERE q.lead_id = (v_quali->>'lead_id')::UUID
+        ORDER BY q.created_at DESC LIMIT 1;
+        UPDATE public.qualificacoes SET
+            patrimonio_resposta = CASE WHEN v_fields ? 'patrimonio_resposta' THEN v_fields->>'patrimonio_resposta' ELSE patrimonio_resposta END,
+            objetivo_resposta = CASE WHEN v_fields ? 'objetivo_resposta' THEN v_fields->>'objetivo_resposta' ELSE objetivo_resposta END,
+            urgencia_resposta = CASE WHEN v_fields ? 'urgencia_resposta' THEN v_fields->>'urgencia_resposta' ELSE urgencia_resposta END,
+            resultado = CASE WHEN v_fields ? 'resultado' THEN v_fields->>'resultado' ELSE resultado END,
+            observacoes = CASE WHEN v_fields ? 'observacoes' THEN v_fields->>'observacoes' ELSE observacoes END
+        WHERE id = v_quali_id;
+        IF NOT FOUND THEN
+            INSERT INTO public.qualificacoes (
+                lead_id, session_id, patrimonio_resposta, objetivo_resposta,
+                urgencia_resposta, resultado, observacoes
+            ) VALUES (
+                (v_quali->>'lead_id')::UUID, (v_quali->>'session_id')::UUID,
+                v_fields->>'patrimonio_resposta', v_fields->>'objetivo_resposta',
+                v_fields->>'urgencia_resposta', v_fields->>'resultado', v_fields->>'observacoes'
+            );
+        END IF;
+    END IF;
+
+    INSERT INTO public.reunioes (lead_id, data_agendada, status, link_reuniao, observacoes)
+    SELECT (r->>'lead_id')::UUID, (r->>'data_agendada')::TIMESTAMPTZ, COALESCE(r->>'status', 'agendada'),
+           r->>'link_reuniao', r->>'observacoes'
+    FROM jsonb_array_elements(COALESCE(p_payload->'reunioes', '[]'::JSONB)) AS r;
+
+    RETURN jsonb_build_object('ok', TRUE);
+END;
+$$ LANGUAGE plpgsql;
@@ -0,0 +1,121 @@
+-- Schema SQLite (modo WAL) equivalente a database/schema.sql
+-- Usado por DATABASE_BACKEND=sqlite (backend/models/sqlite_backend.py)
+--
+-- Diferenças em relação ao Postgres:
+--   * UUID e TIMESTAMP são TEXT (ids uuid4 e datas ISO-8601 UTC gerados pelo cliente);
+--   * JSONB é JSON (texto) e BOOLEAN é inteiro 0/1, convertidos pelo cliente;
+--   * os CHECKs de enum ficam de fora (o código já usa estados/canais que
+--     não constam nas listas do schema original);
+--   * updated_at é preenchido pelo cliente a cada UPDATE, não por trigger.
+
+CREATE TABLE IF NOT EXISTS leads (
+    id TEXT PRIMARY KEY,
+    nome TEXT NOT NULL,
+    telefone TEXT UNIQUE NOT NULL,
+    email TEXT,
+    canal TEXT NOT NULL,
+    status TEXT DEFAULT 'novo',
+    score INTEGER DEFAULT 0 CHECK (score >= 0 AND score <= 100),
+    processado BOOLEAN DEFAULT 0,
+    created_at TIMESTAMP,
+    updated_at TIMESTAMP
+);
+
+CREATE TABLE IF NOT EXISTS sessions (
+    id TEXT PRIMARY KEY,
+    lead_id TEXT NOT NULL REFERENCES leads(id) ON DELETE CASCADE,
+    estado TEXT DEFAULT 'inicio',
+    contexto JSON DEFAULT '{}',
+    ativa BOOLEAN DEFAULT 1,
+    created_at TIMESTAMP,
+    updated_at TIMESTAMP
+);
+
+CREATE TABLE IF NOT EXISTS messages (
+    id TEXT PRIMARY KEY,
+    session_id TEXT NOT NULL REFERENCES sessions(id) ON DELETE CASCADE,
+    lead_id TEXT NOT NULL REFERENCES leads(id) ON DELETE CASCADE,
+    conteudo TEXT NOT NULL,
+    tipo TEXT NOT NULL CHECK (tipo IN ('recebida', 'enviada')),
+    metadata JSON DEFAULT '{}',
+    created_at TIMESTAMP
+);
+
+CREATE TABLE IF NOT EXISTS qualificacoes (
+    id TEXT PRIMARY KEY,
+    lead_id TEXT NOT NULL REFERENCES leads(id) ON DELETE CASCADE,
+    session_id TEXT NOT NULL REFERENCES sessions(id) ON DELETE CASCADE,
+    patrimonio_resposta TEXT,
+    patrimonio_pontos INTEGER DEFAULT 0 CHECK (patrimonio_pontos >= 0 AND patrimonio_pontos <= 30),
+    objetivo_resposta TEXT,
+    objetivo_pontos INTEGER DEFAULT 0 CHECK (objetivo_pontos >= 0 AND objetivo_pontos <= 25),
+    urgencia_resposta TEXT,
+    urgencia_pontos INTEGER DEFAULT 0 CHECK (urgencia_pontos >= 0 AND urgencia_pontos <= 25),
+    interesse_resposta TEXT,
+    interesse_pontos INTEGER DEFAULT 0 CHECK (interesse_pontos >= 0 AND interesse_pontos <= 20),
+    score_total INTEGER GENERATED ALWAYS AS (
+        COALESCE(patrimonio_pontos, 0) + COALESCE(objetivo_pontos, 0)
+        + COALESCE(urgencia_pontos, 0) + COALESCE(interesse_pontos, 0)
+    ) STORED,
+    resultado TEXT CHECK (resultado IN ('qualificado', 'nao_qualificado')),
+    observacoes TEXT,
+    created_at TIMESTAMP
+);
+
+CREATE TABLE IF NOT EXISTS reunioes (
+    id TEXT PRIMARY KEY,
+    lead_id TEXT NOT NULL REFERENCES leads(id) ON DELETE CASCADE,
+    data_agendada TIMESTAMP,
+    status TEXT DEFAULT 'agendada',
+    link_reuniao TEXT,
+    observacoes TEXT,
+    created_at TIMESTAMP,
+    updated_at TIMESTAMP
+);
+
+CREATE TABLE IF NOT EXISTS system_logs (
+    id TEXT PRIMARY KEY,
+    lead_id TEXT REFERENCES leads(id) ON DELETE SET NULL,
+    session_id TEXT REFERENCES sessions(id) ON DELETE SET NULL,
+    nivel TEXT NOT NULL CHECK (nivel IN ('INFO', 'WARNING', 'ERROR', 'DEBUG')),
+    evento TEXT NOT NULL,
+    detalhes JSON DEFAULT '{}',
+    created_at TIMESTAMP
+);
+
+-- Índices (os de (x, created_at, id) atendem a paginação por keyset)
+CREATE INDEX IF NOT EXISTS idx_leads_processado ON leads(processado, created_at, id);
+CREATE INDEX IF NOT EXISTS idx_leads_status ON leads(status);
+
+CREATE INDEX IF NOT EXISTS idx_sessions_lead_id ON sessions(lead_id, created_at, id);
+CREATE INDEX IF NOT EXISTS idx_sessions_lead_ativa ON sessions(lead_id, ativa);
+
+CREATE INDEX IF NOT EXISTS idx_messages_session_id ON messages(session_id, created_at, id);
+CREATE INDEX IF NOT EXISTS idx_messages_lead_id ON messages(lead_id, created_at, id);
+
+CREATE INDEX IF NOT EXISTS idx_qualificacoes_lead_id ON qualificacoes(lead_id, created_at);
+CREATE INDEX IF NOT EXISTS idx_reunioes_lead_id ON reunioes(lead_id, data_agendada);
+
+CREATE INDEX IF NOT EXISTS idx_system_logs_nivel ON system_logs(nivel, created_at);
+CREATE INDEX IF NOT EXISTS idx_system_logs_created_at ON system_logs(created_at);
+
+-- Mesmo efeito do sync_lead_score_trigger do Postgres
+CREATE TRIGGER IF NOT EXISTS sync_lead_score_insert
+    AFTER INSERT ON qualificacoes
+BEGIN
+    UPDATE leads
+    SET score = NEW.score_total,
+        status = CASE WHEN NEW.score_total >= 70 THEN 'qualificado' ELSE 'nao_qualificado' END,
+        updated_at = strftime('%Y-%m-%dT%H:%M:%f000+00:00', 'now')
+    WHERE id = NEW.lead_id;
+END;
+
+CREATE TRIGGER IF NOT EXISTS sync_lead_score_update
+    AFTER UPDATE ON qualificacoes
+BEGIN
+    UPDATE leads
+    SET score = NEW.score_total,
+        status = CASE WHEN NEW.score_total >= 70 THEN 'qualificado' ELSE 'nao_qualificado' END,
+        updated_at = strftime('%Y-%m-%dT%H:%M:%f000+00:00', 'now')
+    WHERE id = NEW.lead_id;
+END;
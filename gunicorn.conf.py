@@ -2,7 +2,13 @@
 import os
 
 bind = f"0.0.0.0:{os.environ.get('PORT', '5000')}"
-workers = 1  # Single worker to prevent duplicate message processing
+# Dedup and per-phone ordering are only shared between workers with the
+# SQLite coordination backend; the in-memory backend requires a single worker.
+# The lead sheet watcher then runs in whichever process holds its lease.
+if os.environ.get('COORDINATION_BACKEND', 'memory').lower() == 'sqlite':
+    workers = int(os.environ.get('WEB_CONCURRENCY', '2'))
+else:
+    workers = 1
 worker_class = "sync"
 timeout = 120
 keepalive = 2
@@ -1,7 +1,7 @@
 import json
 import os
 from datetime import datetime, timezone
-from typing import Dict, List
+from typing import Any, Dict
 
 import structlog
 from dotenv import load_dotenv
@@ -16,9 +16,13 @@ from backend.models.database_models import (
     LeadRepository,
     SessionRepository,
     MessageRepository,
-    Session,
-    Message,
+    QualificacaoRepository,
+    ReuniaoRepository,
 )
+from backend.services.messaging_service import MessagingService
+from backend.services.qualification_service import QualificationService
+from backend.services.sheet_batch_writer import SheetBatchWriter, column_index
+from backend.services.sheet_ingestion import IngestionPolicy, SheetIngestionEngine, SheetRow
 from backend.services.whatsapp_service import WhatsAppService
 
 logger = structlog.get_logger(__name__)
@@ -55,32 +59,32 @@ def _parse_range_config(range_config: str) -> (str, int):
     return sheet_name, start_row
 
 
-def _expand_row(row: List[str], size: int) -> List[str]:
-    if len(row) < size:
-        row = row + [""] * (size - len(row))
-    return row
+def _parse_start_column(range_config: str) -> int:
+    cell_range = range_config.split("!", 1)[1] if "!" in range_config else "A1"
+    letters = "".join(ch for ch in cell_range.split(":")[0] if ch.isalpha())
+    return column_index(letters or "A")
 
 
-def _update_row(sheet_api, spreadsheet_id: str, sheet_name: str, header: List[str], original_row: List[str], row_number: int, updates: Dict[str, str]):
-    row_values = _expand_row(list(original_row), len(header))
-    for key, value in updates.items():
-        if key in header:
-            idx = header.index(key)
-            row_values[idx] = value
-    end_col = chr(65 + len(header) - 1)
-    range_name = f"{sheet_name}!A{row_number}:{end_col}{row_number}"
-    sheet_api.values().update(
-        spreadsheetId=spreadsheet_id,
-        range=range_name,
-        valueInputOption='RAW',
-        body={'values': [row_values]}
-    ).execute()
+class _ScriptPolicy(IngestionPolicy):
+    """Só inicia leads já cadastrados; problemas ficam registrados na própria linha."""
 
+    default_channel = "whatsapp"
+    create_missing_leads = False
+    # A coluna de id vale mais que o telefone (o telefone do lead pode ter mudado)
+    lead_id_columns = ("lead_id", "id")
 
-def _first_name(nome: str) -> str:
-    if not nome:
-        return ""
-    return str(nome).strip().split()[0].capitalize()
+    def rejected_updates(self, row: SheetRow, reason: str) -> Dict[str, str]:
+        return {"status": "erro", "observacao": reason}
+
+    def success_updates(self, row: SheetRow, result: Dict[str, Any]) -> Dict[str, str]:
+        mensagem = result.get("mensagem_inicial")
+        if not mensagem:
+            return {"status": "ativo", "observacao": f"Sessão {result.get('session_id')} já ativa"}
+        return {
+            "status": "contatado",
+            "mensagem_inicial": mensagem,
+            "observacao": datetime.now(timezone.utc).strftime("%Y-%m-%d %H:%M:%S"),
+        }
 
 
 def process_leads_from_sheet():
@@ -106,127 +110,36 @@ def process_leads_from_sheet():
 
     db_conn = DatabaseConnection()
     lead_repo = LeadRepository(db_conn)
-    session_repo = SessionRepository(db_conn)
     message_repo = MessageRepository(db_conn)
     whatsapp = WhatsAppService()
+    qualification_service = QualificationService(
+        lead_repo=lead_repo,
+        session_repo=SessionRepository(db_conn),
+        message_repo=message_repo,
+        qualificacao_repo=QualificacaoRepository(db_conn),
+        reuniao_repo=ReuniaoRepository(db_conn),
+        # O agendador de envios roda em threads daemon: sem esperar a entrega,
+        # o script sairia antes de a mensagem inicial passar pelo delay humanizado
+        messaging_service=MessagingService(
+            whatsapp, message_repo,
+            delivery_timeout=float(os.getenv("SHEET_DELIVERY_TIMEOUT_SECONDS", "120")),
+        ),
+        whatsapp_service=whatsapp,
+    )
 
-    processed = 0
-    skipped = 0
-
-    for offset, row in enumerate(values[1:], start=1):
-        row_number = start_row + offset
-        row_map: Dict[str, str] = {header[idx]: row[idx] if idx < len(row) else "" for idx in range(len(header))}
-
-        status = (row_map.get("status") or "").strip().lower()
-        if status not in ("", "novo", "new"):
-            skipped += 1
-            continue
-
-        telefone = (row_map.get("telefone") or row_map.get("phone") or "").strip()
-        if not telefone:
-            _update_row(sheet_api, spreadsheet_id, sheet_name, header, row, row_number, {
-                "status": "erro",
-                "observacao": "telefone ausente"
-            })
-            continue
-
-        canal = (row_map.get("canal") or "whatsapp").strip().lower()
-        nome = row_map.get("nome") or row_map.get("name") or ""
-        contexto = row_map.get("contexto") or row_map.get("notes") or ""
-        lead_id = row_map.get("lead_id") or row_map.get("id") or ""
-
-        whatsapp_limpo = whatsapp.normalizar_telefone(telefone)
-
-        lead_data = None
-        if lead_id:
-            resultado = db_conn.get_client().table('leads').select('*').eq('id', lead_id).execute()
-            if resultado.data:
-                lead_data = resultado.data[0]
-        if not lead_data:
-            lead_data = lead_repo.get_lead_by_phone(whatsapp_limpo)
-            if lead_data:
-                lead_id = lead_data['id']
-
-        if not lead_data:
-            _update_row(sheet_api, spreadsheet_id, sheet_name, header, row, row_number, {
-                "status": "erro",
-                "observacao": "lead não encontrado"
-            })
-            continue
-
-        sessao_ativa = session_repo.get_active_session(lead_id)
-        if sessao_ativa:
-            _update_row(sheet_api, spreadsheet_id, sheet_name, header, row, row_number, {
-                "status": "ativo",
-                "observacao": f"Sessão {sessao_ativa['id']} já ativa"
-            })
-            continue
-
-        mensagem = whatsapp.montar_mensagem_inicial_personalizada(
-            canal=canal,
-            nome=_first_name(nome or lead_data.get('nome', '')),
-            contexto_extra=contexto
-        )
-
-        envio = whatsapp.enviar_mensagem(whatsapp_limpo, mensagem)
-        if not envio.get('success'):
-            _update_row(sheet_api, spreadsheet_id, sheet_name, header, row, row_number, {
-                "status": "erro_envio",
-                "observacao": envio.get('error', 'falha ao enviar mensagem')
-            })
-            continue
-
-        contexto_sessao = lead_data.get('contexto') or {}
-        if isinstance(contexto_sessao, str):
-            try:
-                contexto_sessao = json.loads(contexto_sessao)
-            except Exception:
-                contexto_sessao = {}
-        contexto_sessao.update({
-            'canal_origem': canal,
-            'descricao_origem': contexto,
-            'primeiro_contato_em': datetime.now(timezone.utc).isoformat()
-        })
-
-        nova_sessao = Session(
-            lead_id=lead_id,
-            estado='saudacao',
-            contexto=contexto_sessao,
-            ativa=True
-        )
-        sessao_data = session_repo.create_session(nova_sessao)
-        session_id = sessao_data['id'] if sessao_data else None
-
-        if session_id:
-            metadata = {
-                'source': 'sheet_initial',
-                'message_id': envio.get('message_id'),
-                'canal': canal
-            }
-            message_repo.create_message(Message(
-                session_id=session_id,
-                lead_id=lead_id,
-                conteudo=mensagem,
-                tipo='enviada',
-                metadata=metadata
-            ))
-            session_repo.update_session(session_id, {
-                'contexto': contexto_sessao,
-                'estado': 'saudacao'
-            })
-
-        _update_row(sheet_api, spreadsheet_id, sheet_name, header, row, row_number, {
-            'status': 'contatado',
-            'mensagem_inicial': mensagem,
-            'observacao': datetime.now(timezone.utc).strftime('%Y-%m-%d %H:%M:%S')
-        })
-
-        processed += 1
+    # Atualizações da planilha vão em lote; o flush a cada 50 linhas limita o que uma falha deixa sem marcar
+    writer = SheetBatchWriter(
+        sheet_api, spreadsheet_id, sheet_name,
+        first_column=_parse_start_column(range_config), auto_flush_rows=50,
+    )
+    engine = SheetIngestionEngine(lead_repo, qualification_service, policy=_ScriptPolicy())
+    report = engine.run(header, values[1:], start_row + 1, writer)
 
     logger.info(
         "Processamento concluído",
-        processed=processed,
-        skipped=skipped,
+        processed=report.starts_done,
+        skipped=report.rows_total - report.pending,
+        errors=len(report.rejected) + report.starts_failed,
         range=range_config
     )
 
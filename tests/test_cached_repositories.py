@@ -0,0 +1,46 @@
+from backend.models.cached_repositories import CachedLeadRepository, CachedSessionRepository
+from backend.models.database_models import Lead, Session
+from benchmarks.fake_supabase import FakeDatabaseConnection
+
+
+def test_lead_lookups_hit_the_cache_after_create_and_see_updates():
+    db = FakeDatabaseConnection()
+    repo = CachedLeadRepository(db)
+    created = repo.create_lead(Lead(nome='Ana', telefone='5511999999999', canal='whatsapp'))
+    db.client.reset_counters()
+
+    assert repo.get_lead_by_phone('5511999999999')['id'] == created['id']
+    assert repo.update_lead(created['id'], {'status': 'em_qualificacao'})
+    assert repo.get_lead_by_phone('5511999999999')['status'] == 'em_qualificacao'
+
+    assert db.client.round_trips == 1  # only the UPDATE
+    assert repo.cache.stats()['hits'] == 2
+
+
+def test_unknown_phone_is_not_negatively_cached():
+    db = FakeDatabaseConnection()
+    repo = CachedLeadRepository(db)
+
+    assert repo.get_lead_by_phone('5511000000000') is None
+    db.client.write_row('leads', {'nome': 'Bia', 'telefone': '5511000000000', 'canal': 'whatsapp'})
+
+    assert repo.get_lead_by_phone('5511000000000')['nome'] == 'Bia'
+    assert repo.cache.stats()['misses'] == 2
+
+
+def test_active_session_cache_is_write_through_and_drops_finished_sessions():
+    db = FakeDatabaseConnection()
+    repo = CachedSessionRepository(db)
+    created = repo.create_session(Session(lead_id='lead-1', contexto={'responses': {}}))
+
+    session = repo.get_active_session('lead-1')
+    session['contexto']['responses']['x'] = 'mutated by caller'
+    assert repo.get_active_session('lead-1')['contexto'] == {'responses': {}}
+
+    repo.update_session(created['id'], {'estado': 'perguntar_patrimonio'})
+    assert repo.get_active_session('lead-1')['estado'] == 'perguntar_patrimonio'
+
+    repo.update_session(created['id'], {'ativa': False})
+    db.client.reset_counters()
+    assert repo.get_active_session('lead-1') is None
+    assert db.client.round_trips == 1
@@ -0,0 +1,115 @@
+import multiprocessing
+import threading
+import time
+
+from backend.services.coordination import InMemoryCoordination, SQLiteCoordination
+
+
+def _claim_many(path, keys, results):
+    backend = SQLiteCoordination(path)
+    results.put(sum(1 for key in keys if backend.claim('outbound', key, 60)))
+
+
+def _try_lease(path, results):
+    results.put(SQLiteCoordination(path).acquire_lease('leads_watcher'))
+
+
+def test_memory_claim_is_exclusive_until_released():
+    backend = InMemoryCoordination()
+
+    assert backend.claim('outbound', 'a', 60)
+    assert not backend.claim('outbound', 'a', 60)
+    assert backend.contains('outbound', 'a')
+    assert backend.count('outbound') == 1
+
+    backend.release('outbound', 'a')
+    assert not backend.contains('outbound', 'a')
+    assert backend.claim('outbound', 'a', 60)
+
+
+def test_memory_claims_keep_their_own_ttl():
+    backend = InMemoryCoordination()
+
+    assert backend.claim('incoming', 'long', 60)
+    assert backend.claim('incoming', 'short', 0.05)
+    assert not backend.claim('incoming', 'short', 60)  # a duplicate keeps the first expiry
+    time.sleep(0.1)
+    assert not backend.contains('incoming', 'short')
+    assert backend.contains('incoming', 'long')
+    assert backend.claim('incoming', 'short', 60)
+
+
+def test_sqlite_claim_expires(tmp_path):
+    backend = SQLiteCoordination(str(tmp_path / 'coord.db'))
+
+    assert backend.claim('incoming', 'msg-1', 0.05)
+    assert not backend.claim('incoming', 'msg-1', 0.05)
+    time.sleep(0.1)
+    assert not backend.contains('incoming', 'msg-1')
+    assert backend.claim('incoming', 'msg-1', 60)
+
+
+def test_sqlite_claims_are_shared_between_processes(tmp_path):
+    path = str(tmp_path / 'coord.db')
+    SQLiteCoordination(path)
+    keys = [f"5511999999999:{n}" for n in range(50)]
+    results = multiprocessing.Queue()
+    processes = [multiprocessing.Process(target=_claim_many, args=(path, keys, results)) for _ in range(3)]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join(timeout=30)
+
+    # Every key is won by exactly one process.
+    assert sum(results.get(timeout=5) for _ in processes) == len(keys)
+
+
+def test_send_slots_keep_per_phone_order(tmp_path):
+    backend = SQLiteCoordination(str(tmp_path / 'coord.db'))
+    now = time.time()
+
+    first = backend.reserve_send_slot('5511999999999', now + 10)
+    # A shorter delay computed later must not overtake the earlier reply.
+    second = backend.reserve_send_slot('5511999999999', now + 5)
+    other = backend.reserve_send_slot('5511888888888', now + 5)
+
+    assert second == first + 1.0
+    assert other == now + 5
+
+
+def test_recipient_lock_serializes_threads(tmp_path):
+    backend = SQLiteCoordination(str(tmp_path / 'coord.db'), lock_stripes=4)
+    inside = []
+    overlaps = []
+
+    def work():
+        with backend.recipient_lock('5511999999999'):
+            if inside:
+                overlaps.append(True)
+            inside.append(True)
+            time.sleep(0.01)
+            inside.pop()
+
+    threads = [threading.Thread(target=work) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert not overlaps
+
+
+def test_sqlite_lease_has_one_holder_across_processes(tmp_path):
+    path = str(tmp_path / 'coord.db')
+    holder = SQLiteCoordination(path)
+    assert holder.acquire_lease('leads_watcher')
+    assert holder.acquire_lease('leads_watcher')  # kept, not re-taken
+
+    results = multiprocessing.Queue()
+    process = multiprocessing.Process(target=_try_lease, args=(path, results))
+    process.start()
+    process.join(timeout=30)
+    assert results.get(timeout=5) is False
+
+    holder.release_lease('leads_watcher')
+    assert SQLiteCoordination(path).acquire_lease('leads_watcher')
@@ -0,0 +1,247 @@
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from backend.models.database_models import (
+    MESSAGE_COLUMNS,
+    Lead,
+    LeadRepository,
+    Message,
+    MessageRepository,
+    Session,
+    SessionRepository,
+)
+from backend.services.retry_policy import RetryPolicy
+from benchmarks.fake_supabase import FakeDatabaseConnection, FakeSupabase, install_inbound_rpcs
+
+
+def test_reads_use_slim_projection_unless_full_is_requested():
+    db = FakeDatabaseConnection()
+    db.client.write_row('messages', {
+        'session_id': 'sess-1', 'lead_id': 'lead-1', 'conteudo': 'oi', 'tipo': 'recebida',
+        'metadata': {'etapa': 'inicio'},
+    })
+    repo = MessageRepository(db)
+
+    slim = repo.get_session_messages('sess-1')[0]
+    full = repo.get_session_messages('sess-1', columns=MESSAGE_COLUMNS.full)[0]
+
+    assert 'metadata' not in slim and slim['conteudo'] == 'oi'
+    assert full['metadata'] == {'etapa': 'inicio'}
+
+
+def test_update_does_not_echo_the_row_back():
+    db = FakeDatabaseConnection()
+    session = db.client.write_row('sessions', {'lead_id': 'lead-1', 'contexto': {'big': 'x' * 1000}, 'ativa': True})
+    repo = SessionRepository(db)
+    db.client.reset_counters()
+
+    assert repo.update_session(session['id'], {'estado': 'perguntar_patrimonio'})
+    assert not repo.update_session('missing', {'estado': 'perguntar_patrimonio'})
+    assert db.client.bytes_received <= 4  # two empty bodies
+
+
+def _seed_messages(db, total, same_timestamp_every=4):
+    for n in range(total):
+        row = db.client.write_row('messages', {
+            'session_id': 'sess-1', 'lead_id': 'lead-1', 'conteudo': f"m{n}", 'tipo': 'recebida',
+        })
+        # several rows share created_at so the cursor has to break ties by id
+        row_in_table = db.client.tables['messages'][-1]
+        row_in_table['created_at'] = f"2024-01-01T00:00:{n // same_timestamp_every:02d}+00:00"
+
+
+def test_keyset_iterator_pages_through_ties_without_duplicates():
+    db = FakeDatabaseConnection()
+    _seed_messages(db, 25)
+    repo = MessageRepository(db)
+    db.client.reset_counters()
+
+    rows = list(repo.iter_session_messages('sess-1', page_size=10))
+
+    assert len(rows) == 25
+    assert len({row['id'] for row in rows}) == 25
+    keys = [(row['created_at'], row['id']) for row in rows]
+    assert keys == sorted(keys)
+    assert db.client.round_trips == 3
+
+
+def test_unprocessed_leads_are_not_truncated_by_default():
+    db = FakeDatabaseConnection()
+    repo = LeadRepository(db)
+    for n in range(250):
+        db.client.write_row('leads', {'nome': f'Lead {n}', 'telefone': f'5511{n:09d}', 'canal': 'site', 'processado': False})
+
+    assert len(repo.get_unprocessed_leads()) == 250
+    assert len(repo.get_unprocessed_leads(limit=10)) == 10
+
+
+def test_last_messages_pushes_order_and_limit_down():
+    db = FakeDatabaseConnection()
+    _seed_messages(db, 30)
+    repo = MessageRepository(db)
+    db.client.reset_counters()
+
+    last = repo.get_last_messages_by_lead('lead-1', limit=10)
+
+    assert {row['conteudo'] for row in last} == {f"m{n}" for n in range(20, 30)}
+    assert last == sorted(last, key=lambda row: (row['created_at'], row['id']))
+    assert db.client.round_trips == 1
+
+
+def test_create_many_reports_per_row_conflicts_and_keeps_order():
+    db = FakeDatabaseConnection()
+    repo = LeadRepository(db)
+    existing = repo.create_lead(Lead(nome='Ana', telefone='5511000000001', canal='whatsapp'))
+    db.client.reset_counters()
+
+    leads = [Lead(nome=f'L{n}', telefone=f'55110000000{n:02d}', canal='ebook') for n in range(5)]
+    leads.append(Lead(nome='Dup', telefone='5511000000003', canal='ebook'))
+    result = repo.create_many(leads, chunk_size=2)
+
+    assert result.ids[1] is None and result.conflicts[1] == 'telefone já existe'
+    assert result.conflicts[5]
+    assert result.created == 4
+    assert len(set(filter(None, result.ids))) == 4
+    assert existing['id'] not in result.ids
+    assert result.round_trips == db.client.round_trips == 3
+
+
+def test_get_leads_by_phones_looks_up_in_chunks():
+    db = FakeDatabaseConnection()
+    repo = LeadRepository(db)
+    for n in range(5):
+        repo.create_lead(Lead(nome=f'L{n}', telefone=f'551100000000{n}', canal='ebook'))
+    db.client.reset_counters()
+
+    found = repo.get_leads_by_phones([f'551100000000{n}' for n in (0, 2, 4, 4, 9)], chunk_size=2)
+
+    assert sorted(found) == ['5511000000000', '5511000000002', '5511000000004']
+    assert found['5511000000002']['nome'] == 'L2'
+    assert db.client.round_trips == 2
+
+
+def test_upsert_many_updates_existing_rows():
+    db = FakeDatabaseConnection()
+    repo = LeadRepository(db)
+    existing = repo.create_lead(Lead(nome='Ana', telefone='5511000000001', canal='whatsapp'))
+
+    result = repo.upsert_many([
+        Lead(nome='Ana Maria', telefone='5511000000001', canal='whatsapp'),
+        Lead(nome='Bia', telefone='5511000000002', canal='ebook'),
+    ])
+
+    assert result.ids[0] == existing['id']
+    assert result.created == 2 and not result.conflicts
+    assert repo.get_lead_by_phone('5511000000001')['nome'] == 'Ana Maria'
+
+
+def test_failed_upsert_chunk_still_updates_existing_rows():
+    db = FakeDatabaseConnection()
+    repo = LeadRepository(db)
+    existing = repo.create_lead(Lead(nome='Ana', telefone='5511000000001', canal='whatsapp'))
+    original = db.client.write_row
+    failures = [RuntimeError('connection reset')]
+
+    def flaky_write(table, values, *args, **kwargs):
+        if failures and values.get('telefone') == '5511000000002':
+            raise failures.pop()
+        return original(table, values, *args, **kwargs)
+
+    db.client.write_row = flaky_write
+    result = repo.upsert_many([
+        Lead(nome='Ana Maria', telefone='5511000000001', canal='whatsapp'),
+        Lead(nome='Bia', telefone='5511000000002', canal='ebook'),
+    ])
+
+    assert not result.conflicts and not result.errors
+    assert result.ids[0] == existing['id'] and result.ids[1]
+    assert repo.get_lead_by_phone('5511000000001')['nome'] == 'Ana Maria'
+
+
+def test_failed_chunk_is_retried_row_by_row():
+    db = FakeDatabaseConnection()
+    repo = MessageRepository(db)
+    messages = [Message(session_id='sess-1', lead_id='lead-1', conteudo=f'm{n}', tipo='enviada') for n in range(3)]
+    original = db.client.write_row
+
+    def failing_write(table, values, *args, **kwargs):
+        if values.get('conteudo') == 'm1':
+            raise RuntimeError('violates check constraint')
+        return original(table, values, *args, **kwargs)
+
+    db.client.write_row = failing_write
+    result = repo.create_many(messages)
+
+    assert result.ids[0] and result.ids[2] and result.ids[1] is None
+    assert 'check constraint' in result.errors[1]
+
+
+@pytest.mark.parametrize('with_rpc', [True, False])
+def test_get_or_create_with_session_is_atomic_under_concurrency(with_rpc):
+    client = FakeSupabase(latency=0.005)  # widens the check-then-act window
+    if with_rpc:
+        install_inbound_rpcs(client)
+    # An existing lead without a session: every caller races on the session
+    client.write_row('leads', {'nome': 'Ana', 'telefone': '5511999999999', 'canal': 'whatsapp'})
+    db = FakeDatabaseConnection(client)
+    leads, sessions = LeadRepository(db), SessionRepository(db)
+
+    def first_message(_):
+        return leads.get_or_create_with_session(
+            Lead(nome='Ana', telefone='5511999999999', canal='whatsapp'),
+            Session(lead_id='', estado='aguardando_primeira_resposta'),
+            sessions,
+        )
+
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        results = list(pool.map(first_message, range(16)))
+
+    assert len(client.tables['leads']) == 1
+    assert len(client.tables['sessions']) == 1
+    assert {r['session']['id'] for r in results} == {client.tables['sessions'][0]['id']}
+    assert not any(r['lead_created'] for r in results)
+    assert sum(r['session_created'] for r in results) == 1
+
+
+def test_get_or_create_with_session_is_one_round_trip_with_the_rpc():
+    client = FakeSupabase()
+    install_inbound_rpcs(client)
+    repo = LeadRepository(FakeDatabaseConnection(client))
+
+    result = repo.get_or_create_with_session(
+        Lead(nome='Ana', telefone='5511999999999', canal='whatsapp'), None, SessionRepository(FakeDatabaseConnection(client))
+    )
+
+    assert result['lead_created'] and result['session'] is None
+    assert client.round_trips == 1
+
+
+def test_get_or_create_rpc_retries_transient_errors_and_stays_enabled():
+    client = FakeSupabase()
+    install_inbound_rpcs(client)
+    handler = client.rpcs['obter_ou_criar_lead_sessao']
+    failures = [TimeoutError('read timed out')]
+
+    def flaky(db, params):
+        if failures:
+            raise failures.pop()
+        return handler(db, params)
+
+    client.register_rpc('obter_ou_criar_lead_sessao', flaky)
+    repo = LeadRepository(FakeDatabaseConnection(client))
+    repo.rpc_retry = RetryPolicy(max_attempts=2, base_delay=0.0, max_delay=0.0)
+    sessions = SessionRepository(FakeDatabaseConnection(client))
+    lead = Lead(nome='Ana', telefone='5511999999999', canal='whatsapp')
+
+    assert repo.get_or_create_with_session(lead, None, sessions)['lead_created']
+    assert repo.rpc_enabled
+
+    failures.extend([TimeoutError('read timed out')] * 2)
+    with pytest.raises(TimeoutError):
+        repo.get_or_create_with_session(lead, None, sessions)
+    assert repo.rpc_enabled
+
+    del client.rpcs['obter_ou_criar_lead_sessao']  # "function ... does not exist"
+    assert repo.get_or_create_with_session(lead, None, sessions)['lead']['telefone'] == lead.telefone
+    assert not repo.rpc_enabled
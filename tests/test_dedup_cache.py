@@ -0,0 +1,59 @@
+from backend.services.dedup_cache import SlidingTTLCache
+
+
+class FakeClock:
+    def __init__(self, now=0.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+def test_entries_expire_after_a_sliding_window():
+    clock = FakeClock(now=299.0)  # just before a former 300 s bucket boundary
+    cache = SlidingTTLCache(ttl_seconds=300, clock=clock)
+
+    cache.add('5511999999999:abc')
+    clock.now = 301.0  # crossed the boundary: still a duplicate
+    assert '5511999999999:abc' in cache
+
+    clock.now = 598.9
+    assert '5511999999999:abc' in cache
+    clock.now = 599.0
+    assert '5511999999999:abc' not in cache
+    assert len(cache) == 0
+
+
+def test_purge_only_pops_expired_head_entries():
+    clock = FakeClock()
+    cache = SlidingTTLCache(ttl_seconds=10, clock=clock)
+    for n in range(5):
+        clock.now = n
+        cache.add(n)
+
+    cache.add(0)  # re-adding moves the key to the tail with a fresh expiry
+    clock.now = 12.5
+    assert cache.purge_expired() == 2  # keys 1 and 2
+    assert 0 in cache and 3 in cache and 4 in cache
+
+
+def test_add_if_absent_and_maxsize():
+    cache = SlidingTTLCache(ttl_seconds=60, maxsize=2)
+    assert cache.add_if_absent('a') is True
+    assert cache.add_if_absent('a') is False
+    cache.add('b')
+    cache.add('c')
+    assert 'a' not in cache
+    assert len(cache) == 2
+
+
+def test_per_key_ttl_expires_out_of_insertion_order():
+    clock = FakeClock()
+    cache = SlidingTTLCache(ttl_seconds=60, clock=clock)
+    cache.add('long')
+    cache.add('short', ttl_seconds=5)
+
+    clock.now = 5.0
+    assert 'short' not in cache
+    assert 'long' in cache
+    assert len(cache) == 1
@@ -0,0 +1,87 @@
+import threading
+import time
+
+from backend.services.delivery_scheduler import DeliveryScheduler
+from backend.services.whatsapp_service import WhatsAppService
+
+
+def test_scheduler_fires_jobs_by_deadline():
+    scheduler = DeliveryScheduler(workers=1)
+    fired = []
+
+    futures = [
+        scheduler.schedule(0.06, fired.append, 'c'),
+        scheduler.schedule(0.02, fired.append, 'a'),
+        scheduler.schedule(0.04, fired.append, 'b'),
+    ]
+    for future in futures:
+        future.result(timeout=2)
+
+    assert fired == ['a', 'b', 'c']
+    scheduler.shutdown()
+
+
+def test_scheduler_holds_many_delayed_jobs_without_a_thread_each():
+    scheduler = DeliveryScheduler(workers=2)
+    threads_before = threading.active_count()
+
+    futures = [scheduler.schedule(0.2, lambda n=n: n * 2) for n in range(2000)]
+    assert scheduler.pending() > 0
+    # one timer thread plus at most ``workers`` executor threads
+    assert threading.active_count() - threads_before <= 3
+
+    assert sorted(f.result(timeout=5) for f in futures) == [n * 2 for n in range(2000)]
+    scheduler.shutdown()
+
+
+def test_scheduler_chains_rescheduled_jobs():
+    scheduler = DeliveryScheduler(workers=1)
+
+    def first_attempt():
+        return scheduler.schedule(0.01, lambda: 'segunda tentativa')
+
+    assert scheduler.schedule(0, first_attempt).result(timeout=2) == 'segunda tentativa'
+    scheduler.shutdown()
+
+
+class _Response:
+    status_code = 201
+
+    @staticmethod
+    def json():
+        return {'id': 'waha-1'}
+
+
+class _FakeHttp:
+    def __init__(self):
+        self.posted = []
+
+    def post(self, url, **kwargs):
+        self.posted.append(kwargs['json'])
+        return _Response()
+
+
+def test_whatsapp_send_is_scheduled_after_humanizing_delay(monkeypatch):
+    scheduler = DeliveryScheduler(workers=1)
+    http = _FakeHttp()
+    service = WhatsAppService(scheduler=scheduler, http_client=http)
+    posted = http.posted
+
+    monkeypatch.setattr(service, 'calcular_delay_humanizado', lambda conversa_count=0: 0.05)
+
+    started = time.monotonic()
+    future = service.enviar_mensagem_async('5511999999999', 'oi', conversa_count=3)
+    assert time.monotonic() - started < 0.05
+    assert not posted
+
+    result = future.result(timeout=2)
+    assert result['success'] is True
+    assert result['message_id'] == 'waha-1'
+    assert posted[0]['chatId'] == '5511999999999@c.us'
+    scheduler.shutdown()
+
+
+def test_humanizing_delay_policy_grows_with_conversation():
+    for _ in range(50):
+        assert 5 <= WhatsAppService.calcular_delay_humanizado(0) <= 12
+        assert 10 <= WhatsAppService.calcular_delay_humanizado(20) <= 15
@@ -0,0 +1,72 @@
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from backend.services.http_client import PooledHTTPClient
+from backend.services.whatsapp_service import WhatsAppService
+
+
+class _WahaHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_POST(self):  # pylint: disable=invalid-name
+        length = int(self.headers.get('Content-Length', 0))
+        self.rfile.read(length)
+        body = json.dumps({'id': 'waha-msg'}).encode()
+        self.send_response(201)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):  # pylint: disable=invalid-name
+        body = json.dumps({'status': 'WORKING'}).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):  # silence test output
+        pass
+
+
+@pytest.fixture
+def waha_server():
+    server = ThreadingHTTPServer(('127.0.0.1', 0), _WahaHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f'http://127.0.0.1:{server.server_address[1]}'
+    server.shutdown()
+
+
+def test_pooled_client_reuses_keep_alive_connections(waha_server):
+    client = PooledHTTPClient(pool_connections=1, pool_maxsize=2)
+
+    for _ in range(20):
+        assert client.post(f'{waha_server}/api/sendText', json={'text': 'oi'}).status_code == 201
+
+    stats = client.stats()
+    assert stats['requests'] == 20
+    assert stats['connections_created'] == 1
+    assert stats['connections_reused'] == 19
+    client.close()
+
+
+def test_whatsapp_service_routes_every_call_through_shared_pool(waha_server, monkeypatch):
+    client = PooledHTTPClient(pool_connections=1, pool_maxsize=1)
+    monkeypatch.setenv('WAHA_BASE_URL', waha_server)
+    monkeypatch.setenv('WAHA_WEBHOOK_URL', 'http://localhost/webhook')
+    service = WhatsAppService(http_client=client)
+    monkeypatch.setattr(service, 'calcular_delay_humanizado', lambda conversa_count=0: 0)
+
+    assert service.enviar_mensagem('5511999999999', 'oi')['success'] is True
+    assert service.verificar_status_sessao()['status'] == 'WORKING'
+    assert service.configurar_webhook()['success'] is True
+
+    stats = client.stats()
+    assert stats['requests'] == 3
+    assert stats['connections_created'] == 1
+    client.close()
@@ -0,0 +1,56 @@
+import threading
+import time
+
+from backend.services.inbound_worker import InboundWorkerPool
+
+
+def test_inbound_pool_keeps_order_per_phone():
+    processed = []
+    lock = threading.Lock()
+
+    def handler(job):
+        time.sleep(0.001)
+        with lock:
+            processed.append((job.telefone, job.payload))
+
+    pool = InboundWorkerPool(handler, workers=4, max_queue_size=200)
+    for seq in range(20):
+        for telefone in ('5511999990001', '5511999990002', '5511999990003'):
+            assert pool.submit(telefone, seq)
+
+    assert pool.join(timeout=5)
+    pool.stop()
+
+    for telefone in ('5511999990001', '5511999990002', '5511999990003'):
+        assert [seq for tel, seq in processed if tel == telefone] == list(range(20))
+    stats = pool.stats()
+    assert stats['processed'] == 60
+    assert stats['queue_depth'] == 0
+
+
+def test_inbound_pool_rejects_when_full_and_counts_failures():
+    release = threading.Event()
+
+    def handler(job):
+        release.wait(timeout=5)
+        if job.payload == 'boom':
+            raise RuntimeError('falha')
+
+    pool = InboundWorkerPool(handler, workers=1, max_queue_size=2)
+    assert pool.submit('5511999990001', 'boom')
+    time.sleep(0.05)  # worker picks up the first job and blocks
+    assert pool.submit('5511999990001', 'b')
+    assert pool.submit('5511999990001', 'c')
+    assert pool.submit('5511999990001', 'd') is False
+
+    stats = pool.stats()
+    assert stats['rejected'] == 1
+    assert stats['queue_depth'] == 2
+    assert stats['oldest_pending_seconds'] > 0
+
+    release.set()
+    assert pool.join(timeout=5)
+    pool.stop()
+    stats = pool.stats()
+    assert stats['failed'] == 1
+    assert stats['processed'] == 2
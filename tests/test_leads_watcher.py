@@ -1,5 +1,10 @@
-from backend.models.database_models import Lead
-from backend.services.leads_watcher import LeadsWatcher
+import threading
+import time
+
+from backend.models.database_models import BulkResult, Lead
+from backend.services.coordination import SQLiteCoordination
+from backend.services.leads_watcher import FileChangeNotifier, LeadsWatcher
+from backend.services.sheet_batch_writer import SheetBatchWriter, SheetFlushResult
 
 
 class FakeSheetsService:
@@ -17,8 +22,23 @@ class FakeSheetsService:
     def _parse_input_range(self):  # pylint: disable=unused-private-member
         return 'Leads', 1
 
-    def update_input_row(self, row_number, headers, original_row, updates):
-        self._updated[row_number] = updates
+    def input_writer(self, auto_flush_rows=0):  # pylint: disable=unused-argument
+        return RecordingWriter(self._updated)
+
+
+class RecordingWriter:
+    def __init__(self, updated):
+        self.updated = updated
+
+    def update_row(self, row_number, headers, original_row, updates):
+        self.updated[row_number] = updates
+        return list(original_row)
+
+    def pending(self):
+        return 0
+
+    def flush(self):
+        return SheetFlushResult()
 
 
 class FakeLeadRepository:
@@ -28,12 +48,18 @@ class FakeLeadRepository:
     def get_lead_by_phone(self, telefone):
         return self.created.get(telefone)
 
+    def get_leads_by_phones(self, telefones):
+        return {telefone: self.created[telefone] for telefone in telefones if telefone in self.created}
+
     def create_lead(self, lead: Lead):
         lead_id = f'lead-{len(self.created) + 1}'
         data = {'id': lead_id, 'telefone': lead.telefone, 'nome': lead.nome, 'canal': lead.canal}
         self.created[lead.telefone] = data
         return data
 
+    def create_many(self, leads):
+        return BulkResult(ids=[self.create_lead(lead)['id'] for lead in leads], round_trips=1)
+
 
 class FakeQualificationService:
     def __init__(self):
@@ -70,3 +96,254 @@ def test_leads_watcher_marks_sheet_row_and_triggers_qualification():
     assert updates['Status'] == 'contatado'
     assert updates['Lead ID']
     assert 'LDC Capital' in updates['Mensagem inicial']
+
+
+class GrowingSheet:
+    """Input sheet kept in memory; header on row 1, reads counted in rows."""
+
+    headers = ['Status', 'Nome', 'Telefone', 'Canal']
+
+    def __init__(self, rows):
+        self.service = True
+        self.input_sheets_id = 'sheet-id'
+        self.rows = [list(row) for row in rows]
+        self.rows_read = 0
+        self.write_requests = 0
+
+    def read_input_sheet(self):
+        self.rows_read += 1 + len(self.rows)
+        return list(self.headers), [list(row) for row in self.rows]
+
+    def read_input_rows(self, first_row):
+        values = [list(self.headers)] + [list(row) for row in self.rows]
+        tail = values[first_row - 1:]
+        self.rows_read += len(tail)
+        return tail
+
+    def _parse_input_range(self):  # pylint: disable=unused-private-member
+        return 'Leads', 1
+
+    def input_writer(self, auto_flush_rows=0):
+        return SheetBatchWriter(self, self.input_sheets_id, 'Leads', auto_flush_rows=auto_flush_rows)
+
+    # Minimal ``spreadsheets()`` API: batchUpdate applies ``Leads!B5:C5`` ranges
+    def values(self):
+        return self
+
+    def batchUpdate(self, spreadsheetId, body):  # pylint: disable=invalid-name,unused-argument
+        self.write_requests += 1
+        for entry in body['data']:
+            self._apply(entry['range'], entry['values'][0])
+        return Done()
+
+    def _apply(self, cell_range, values):
+        first = cell_range.split('!')[1].split(':')[0]
+        column = ord(first[0]) - ord('A')
+        row = self.rows[int(first[1:]) - 2]
+        row.extend([''] * (column + len(values) - len(row)))
+        row[column:column + len(values)] = values
+
+
+class Done:
+    def execute(self):
+        return {}
+
+
+def _sheet_row(n, status='contatado', telefone=None):
+    return [status, f"Lead {n}", telefone or f"55119{n:08d}", 'ebook']
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_polls_read_only_the_unseen_tail():
+    sheet = GrowingSheet([_sheet_row(n) for n in range(1000)])
+    qual_service = FakeQualificationService()
+    watcher = LeadsWatcher(sheet, FakeLeadRepository(), qual_service, full_rescan_seconds=900, clock=Clock())
+
+    watcher.process_once()
+    assert sheet.rows_read == 1001 and not qual_service.calls
+
+    sheet.rows.extend([_sheet_row(1000, status=''), _sheet_row(1001, status='novo')])
+    sheet.rows_read = 0
+    watcher.process_once()
+    # The mark row plus the two new ones, not the whole sheet
+    assert sheet.rows_read == 3
+    assert [call['telefone'] for call in qual_service.calls] == ['5511900001000', '5511900001001']
+    assert sheet.rows[1001][0] == 'contatado'
+    # Both rows' status went out in one batchUpdate
+    assert sheet.write_requests == 1
+
+    sheet.rows_read = 0
+    watcher.process_once()
+    assert sheet.rows_read == 1 and len(qual_service.calls) == 2
+    assert watcher.stats()['delta_scans'] == 2 and watcher.stats()['watermark_row'] == 1003
+
+
+def test_shifted_rows_and_slow_cadence_trigger_full_rescans():
+    clock = Clock()
+    sheet = GrowingSheet([_sheet_row(0), _sheet_row(1, status='', telefone=' '), _sheet_row(2)])
+    qual_service = FakeQualificationService()
+    watcher = LeadsWatcher(sheet, FakeLeadRepository(), qual_service, poll_interval_seconds=60,
+                           full_rescan_seconds=600, clock=clock)
+    watcher.process_once()
+
+    # A row inserted above the mark shifts the tail: rescan everything
+    sheet.rows.insert(0, _sheet_row(7, status='novo'))
+    watcher.process_once()
+    assert watcher.stats()['full_scans'] == 2
+    assert [call['telefone'] for call in qual_service.calls] == ['5511900000007']
+
+    # A phone filled in on a row already walked is only seen by the full rescan
+    sheet.rows[2][2] = '5511900000001'
+    clock.now = 300
+    watcher.process_once()
+    assert len(qual_service.calls) == 1
+    clock.now = 600
+    watcher.process_once()
+    assert [call['telefone'] for call in qual_service.calls][-1] == '5511900000001'
+    assert watcher.stats()['full_scans'] == 3
+
+
+class SlowQualificationService(FakeQualificationService):
+    """Each start takes ``delay`` seconds, like the humanised first send."""
+
+    def __init__(self, delay):
+        super().__init__()
+        self.delay = delay
+        self.active = 0
+        self.max_active = 0
+        self._lock = threading.Lock()
+
+    def iniciar_qualificacao(self, **kwargs):
+        with self._lock:
+            self.active += 1
+            self.max_active = max(self.max_active, self.active)
+        time.sleep(self.delay)
+        with self._lock:
+            self.active -= 1
+        return super().iniciar_qualificacao(**kwargs)
+
+
+class CountingLeadRepository(FakeLeadRepository):
+    def __init__(self):
+        super().__init__()
+        self.bulk_calls = 0
+
+    def get_leads_by_phones(self, telefones):
+        self.bulk_calls += 1
+        return super().get_leads_by_phones(telefones)
+
+    def create_many(self, leads):
+        self.bulk_calls += 1
+        return super().create_many(leads)
+
+
+def test_pass_starts_leads_concurrently_with_bulk_resolution():
+    rows = [_sheet_row(n, status='novo') for n in range(40)]
+    rows.append(_sheet_row(99, status='', telefone='5511900000003'))  # same phone as row 5
+    sheet = GrowingSheet(rows)
+    lead_repo = CountingLeadRepository()
+    qual_service = SlowQualificationService(delay=0.05)
+    watcher = LeadsWatcher(sheet, lead_repo, qual_service, start_concurrency=8, batch_rows=20)
+
+    started = time.monotonic()
+    watcher.process_once()
+    elapsed = time.monotonic() - started
+
+    # 40 sequential starts would take 2s
+    assert elapsed < 1.0
+    assert qual_service.max_active == 8
+    assert len(qual_service.calls) == 40
+    # One lookup and one insert per batch of 20 rows; the third batch only
+    # holds the repeated phone, which rides on its first row's start
+    assert lead_repo.bulk_calls == 4
+    assert all(row[0] == 'contatado' for row in sheet.rows)
+    progress = watcher.stats()['pass']
+    assert progress['starts_done'] == 40 and progress['backlog'] == {'parse': 0, 'start': 0, 'write': 0}
+    assert watcher.stats()['watermark_row'] == 42
+
+
+def test_idle_polls_back_off_and_new_rows_snap_back():
+    sheet = GrowingSheet([_sheet_row(0)])
+    watcher = LeadsWatcher(sheet, FakeLeadRepository(), FakeQualificationService(), poll_interval_seconds=60,
+                           max_poll_interval_seconds=400, full_rescan_seconds=3600, clock=Clock())
+
+    intervals = []
+    for _ in range(4):
+        assert watcher.process_once() is False
+        intervals.append(watcher.stats()['poll_interval_seconds'])
+    assert intervals == [120, 240, 400, 400]
+
+    sheet.rows.append(_sheet_row(1))  # a new row, even one not to contact
+    assert watcher.process_once() is True
+    assert watcher.stats()['poll_interval_seconds'] == 60 and watcher.stats()['idle_polls'] == 0
+
+
+def test_notify_change_wakes_the_polling_loop():
+    sheet = GrowingSheet([_sheet_row(0)])
+    qual_service = FakeQualificationService()
+    watcher = LeadsWatcher(sheet, FakeLeadRepository(), qual_service, poll_interval_seconds=60)
+    assert watcher.notify_change('test') is False  # loop not running
+
+    watcher.start()
+    try:
+        _wait_for(lambda: watcher.stats()['full_scans'] == 1)
+        sheet.rows.append(_sheet_row(1, status='novo'))
+        assert watcher.notify_change('test') is True
+        _wait_for(lambda: qual_service.calls)
+        assert watcher.stats()['delta_scans'] == 1
+    finally:
+        watcher.stop()
+
+
+def test_only_the_lease_holder_polls_and_others_forward_wakeups(tmp_path):
+    path = str(tmp_path / 'coord.db')
+    sheet = GrowingSheet([_sheet_row(0)])
+    qual_service = FakeQualificationService()
+    # Separate backends on one file stand in for two gunicorn workers
+    leader = LeadsWatcher(sheet, FakeLeadRepository(), qual_service, poll_interval_seconds=60,
+                          coordination=SQLiteCoordination(path), wake_check_seconds=0.02)
+    follower = LeadsWatcher(sheet, FakeLeadRepository(), qual_service, poll_interval_seconds=60,
+                            coordination=SQLiteCoordination(path))
+
+    leader.start()
+    try:
+        _wait_for(lambda: leader.stats()['full_scans'] == 1)
+        follower.start()
+        _wait_for(lambda: follower.is_running())
+        assert leader.stats()['leader'] and not follower.stats()['leader']
+
+        sheet.rows.append(_sheet_row(1, status='novo'))
+        assert follower.notify_change('endpoint') is True
+        _wait_for(lambda: qual_service.calls)
+        assert follower.stats()['full_scans'] == follower.stats()['delta_scans'] == 0
+        assert len(qual_service.calls) == 1
+    finally:
+        follower.stop()
+        leader.stop()
+
+
+def test_file_change_notifier_fires_on_touch(tmp_path):
+    path = tmp_path / 'sheet.changed'
+    changes = []
+    notifier = FileChangeNotifier(str(path), lambda: changes.append(1))
+
+    assert notifier.check_once() is False  # missing file
+    path.write_text('1')
+    assert notifier.check_once() is True
+    assert notifier.check_once() is False
+    path.write_text('12')
+    assert notifier.check_once() is True and len(changes) == 2
+
+
+def _wait_for(condition, timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, 'condition not met in time'
+        time.sleep(0.01)
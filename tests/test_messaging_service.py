@@ -1,7 +1,9 @@
+import threading
 import time
+from concurrent.futures import Future
 
-from backend.models.database_models import Message
-from backend.services.messaging_service import MessagingService
+from backend.models.database_models import BulkResult, Message
+from backend.services.messaging_service import MessagingService, SendJob
 
 
 class FakeWhatsAppService:
@@ -16,11 +18,17 @@ class FakeWhatsAppService:
 class FakeMessageRepository:
     def __init__(self):
         self.messages = []
+        self.bulk_calls = 0
 
     def create_message(self, message: Message):
         self.messages.append(message)
         return message
 
+    def create_many(self, messages):
+        self.bulk_calls += 1
+        self.messages.extend(messages)
+        return BulkResult(ids=[f'msg-{i}' for i, _ in enumerate(messages)], round_trips=1)
+
 
 def test_messaging_service_deduplicates_same_payload():
     whatsapp = FakeWhatsAppService()
@@ -52,3 +60,151 @@ def test_messaging_service_processes_queue_in_order():
     assert [m.conteudo for m in repo.messages] == ['mensagem 1', 'mensagem 2']
     metrics = service.get_metrics()
     assert metrics['sent_ok'] == 2
+
+
+class FakeAsyncWhatsAppService:
+    def __init__(self):
+        self.pending = []
+
+    def enviar_mensagem_async(self, telefone: str, mensagem: str, conversa_count: int = 0, on_redelivery=None):
+        future = Future()
+        self.pending.append((telefone, mensagem, future))
+        return future
+
+    def complete_next(self):
+        telefone, mensagem, future = self.pending.pop(0)
+        future.set_result({'success': True, 'message_id': f'msg-{mensagem}'})
+
+
+def test_messaging_service_does_not_block_on_scheduled_send():
+    whatsapp = FakeAsyncWhatsAppService()
+    repo = FakeMessageRepository()
+    service = MessagingService(whatsapp, repo, dedup_ttl_seconds=300)
+
+    first = service.send_message('lead-1', '5511999999999', 'mensagem 1', session_id='sess-1')
+    second = service.send_message('lead-1', '5511999999999', 'mensagem 2', session_id='sess-1')
+
+    assert first == {'success': True, 'queued': False, 'scheduled': True}
+    assert second == {'success': True, 'queued': True}
+    # only one message per recipient is in flight
+    assert [p[1] for p in whatsapp.pending] == ['mensagem 1']
+    assert not repo.messages
+
+    whatsapp.complete_next()
+    assert [m.conteudo for m in repo.messages] == ['mensagem 1']
+    assert [p[1] for p in whatsapp.pending] == ['mensagem 2']
+
+    whatsapp.complete_next()
+    assert [m.conteudo for m in repo.messages] == ['mensagem 1', 'mensagem 2']
+    assert service.get_metrics()['sent_ok'] == 2
+
+
+def test_delivery_timeout_waits_for_the_send_result():
+    whatsapp = FakeAsyncWhatsAppService()
+    repo = FakeMessageRepository()
+    service = MessagingService(whatsapp, repo, dedup_ttl_seconds=300, delivery_timeout=5)
+
+    threading.Timer(0.05, whatsapp.complete_next).start()
+    result = service.send_message('lead-1', '5511999999999', 'mensagem 1', session_id='sess-1')
+
+    assert result == {'success': True, 'message_id': 'msg-mensagem 1'}
+    assert [m.conteudo for m in repo.messages] == ['mensagem 1']
+
+    service.delivery_timeout = 0.01
+    result = service.send_message('lead-1', '5511999999999', 'mensagem 2', session_id='sess-1')
+    assert result == {'success': False, 'error': 'delivery_timeout'}
+
+
+class ConcurrentWhatsAppService:
+    """Completes sends from background threads and tracks concurrency."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.sent = []
+
+    def enviar_mensagem_async(self, telefone, mensagem, conversa_count=0, on_redelivery=None):
+        future = Future()
+        with self.lock:
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+
+        def finish():
+            time.sleep(0.005)
+            with self.lock:
+                self.in_flight -= 1
+                self.sent.append((telefone, mensagem))
+            future.set_result({'success': True, 'message_id': mensagem})
+
+        threading.Thread(target=finish, daemon=True).start()
+        return future
+
+
+def test_send_batch_bounds_concurrency_and_persists_in_one_insert():
+    whatsapp = ConcurrentWhatsAppService()
+    repo = FakeMessageRepository()
+    service = MessagingService(whatsapp, repo, dedup_ttl_seconds=300)
+
+    jobs = [
+        SendJob(f'lead-{n}', f'55119999900{n:02d}', f'oi {n}', session_id=f'sess-{n}')
+        for n in range(30)
+    ]
+    # second message for the same phone must go out after the first one
+    jobs.append(SendJob('lead-0', '5511999990000', 'segunda mensagem', session_id='sess-0'))
+    # duplicate of an earlier job is skipped
+    jobs.append(('lead-1', '5511999990001', 'oi 1'))
+
+    batch = service.send_batch(jobs, max_concurrency=5)
+
+    assert whatsapp.max_in_flight <= 5
+    assert batch.sent == 31
+    assert batch.deduplicated == 1
+    assert batch.failed == 0
+    assert batch.persisted == 31
+    assert repo.bulk_calls == 1
+    assert len(batch.results) == 32
+    assert batch.results[-1]['skipped'] == 'deduplicated'
+    assert batch.messages_per_second > 0
+
+    first_phone = [msg for tel, msg in whatsapp.sent if tel == '5511999990000']
+    assert first_phone == ['oi 0', 'segunda mensagem']
+
+
+def test_send_batch_timeout_bounds_waiting_for_a_slot():
+    whatsapp = FakeAsyncWhatsAppService()  # never completes on its own
+    repo = FakeMessageRepository()
+    service = MessagingService(whatsapp, repo, dedup_ttl_seconds=300)
+
+    jobs = [(f'lead-{n}', f'55119999900{n:02d}', f'oi {n}') for n in range(4)]
+    started = time.monotonic()
+    batch = service.send_batch(jobs, max_concurrency=2, timeout=0.1)
+
+    assert time.monotonic() - started < 2
+    assert [p[1] for p in whatsapp.pending] == ['oi 0', 'oi 1']  # the rest was never enqueued
+    assert [r['error'] for r in batch.results] == ['timeout'] * 4
+    assert batch.failed == 4 and batch.sent == 0
+
+
+def test_idle_recipient_state_is_reclaimed():
+    whatsapp = FakeAsyncWhatsAppService()
+    repo = FakeMessageRepository()
+    service = MessagingService(whatsapp, repo, dedup_ttl_seconds=300)
+
+    for n in range(500):
+        service.send_message(f'lead-{n}', f'5511988{n:06d}', 'oi', session_id=f'sess-{n}')
+    service.send_message('lead-0', '5511988000000', 'mais uma', session_id='sess-0')
+
+    metrics = service.get_metrics()
+    assert metrics['live_recipients'] == 500
+    assert metrics['queued_messages'] == 1
+
+    while whatsapp.pending:
+        whatsapp.complete_next()
+
+    metrics = service.get_metrics()
+    assert metrics['live_recipients'] == 0
+    assert metrics['queued_messages'] == 0
+    assert metrics['sent_ok'] == 501
+    assert not service._queues  # pylint: disable=protected-access
+    assert not service._sending  # pylint: disable=protected-access
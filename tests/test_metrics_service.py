@@ -0,0 +1,95 @@
+import threading
+
+from backend.services.metrics_service import MetricsService
+from backend.services.tracing import LatencyHistogram
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1_700_000_000.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_last_hour_slides_with_the_clock():
+    clock = FakeClock()
+    metrics = MetricsService(retention_hours=2, clock=clock)
+
+    metrics.record_message_sent('5511999999999', True)
+    metrics.record_message_sent('5511999999999', False)
+    metrics.record_message_deduped('5511999999999')
+    clock.now += 30 * 60
+    metrics.record_qualification_completed('lead-1', 75, True)
+
+    summary = metrics.get_metrics_summary()
+    assert summary['last_hour']['messages'] == {'total': 3, 'successful': 1, 'failed': 1, 'deduped': 1}
+    assert summary['last_hour']['qualifications']['score']['buckets']['le_80'] == 1
+
+    clock.now += 45 * 60
+    summary = metrics.get_metrics_summary()
+    assert summary['last_hour']['messages']['total'] == 0
+    assert summary['last_hour']['qualifications']['total'] == 1
+    assert summary['totals']['messages']['total_sent'] == 2
+    assert summary['rates']['message_success_rate'] == 50.0
+
+
+def test_memory_is_bounded_by_window_and_recent_events():
+    clock = FakeClock()
+    metrics = MetricsService(retention_hours=1, recent_events=5, clock=clock)
+    for _ in range(1000):
+        clock.now += 60
+        metrics.record_message_sent('5511999999999', True)
+
+    shard = metrics._shard()  # pylint: disable=protected-access
+    assert len(shard.ring) == 60 and len(shard.events) == 5
+    assert metrics.get_metrics_summary()['last_hour']['messages']['total'] == 60
+    assert metrics.get_metrics_summary()['totals']['messages']['total_sent'] == 1000
+    assert len(metrics.get_detailed_metrics()['messages']) == 5
+
+
+def test_threads_record_without_locks_and_reads_merge_every_shard():
+    metrics = MetricsService(clock=FakeClock())
+
+    def record():
+        for n in range(1000):
+            metrics.record_message_sent('5511999999999', n % 4 != 0)
+        metrics.record_qualification_completed('lead-1', 80, True)
+
+    threads = [threading.Thread(target=record) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    # Shards of finished threads are folded in when a new thread registers
+    late = threading.Thread(target=metrics.record_meeting_scheduled, args=('lead-1', 'terça 10h', True))
+    late.start()
+    late.join()
+
+    summary = metrics.get_metrics_summary()
+    assert summary['totals']['messages'] == {'total_sent': 8000, 'successful_sent': 6000, 'failed_sent': 2000}
+    assert summary['last_hour']['qualifications']['score']['buckets']['le_80'] == 8
+    assert summary['last_hour']['meetings']['successful'] == 1
+    # The constructing thread's shard and the late thread's one
+    assert len(metrics._shards) == 2  # pylint: disable=protected-access
+
+
+def test_prometheus_exposition():
+    metrics = MetricsService(clock=FakeClock())
+    metrics.record_message_sent('5511999999999', True)
+    metrics.record_qualification_completed('lead-1', 75, True)
+    metrics.record_circuit_transition('waha', 'closed', 'open')
+    latency = LatencyHistogram(bounds_ms=(10, 100))
+    latency.observe(5)
+    latency.observe(50)
+
+    text = metrics.render_prometheus(latency={'uow.flush': latency})
+
+    assert 'agente_messages_total{result="sent_ok"} 1' in text
+    assert 'agente_qualification_score_bucket{le="70"} 0' in text
+    assert 'agente_qualification_score_bucket{le="80"} 1' in text
+    assert 'agente_circuit_breaker_open{circuit="waha"} 1' in text
+    assert 'agente_stage_latency_seconds_bucket{stage="uow.flush",le="0.01"} 1' in text
+    assert 'agente_stage_latency_seconds_bucket{stage="uow.flush",le="+Inf"} 2' in text
+    assert 'agente_stage_latency_seconds_sum{stage="uow.flush"} 0.055' in text
+    assert text.endswith('\n')
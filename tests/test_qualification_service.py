@@ -1,6 +1,15 @@
 import pytest
 
+from backend.models.database_models import (
+    LeadRepository,
+    MessageRepository,
+    QualificacaoRepository,
+    ReuniaoRepository,
+    SessionRepository,
+)
+from backend.models.unit_of_work import InboundStore
 from backend.services.qualification_service import QualificationService
+from benchmarks.fake_supabase import FakeDatabaseConnection, FakeSupabase, install_inbound_rpcs
 
 
 class DummyLeadRepository:
@@ -134,3 +143,33 @@ def test_custom_message_replaces_generic_amigo(qualification_service):
 
     assert 'Oi Raimundo!' in result['mensagem_inicial']
     assert 'Oi Raimundo!' in messaging_service.sent_messages[-1]['mensagem']
+
+
+def test_first_message_from_unknown_number_creates_lead_and_session_in_one_call():
+    client = FakeSupabase()
+    install_inbound_rpcs(client)
+    db = FakeDatabaseConnection(client)
+    repos = dict(
+        lead_repo=LeadRepository(db),
+        session_repo=SessionRepository(db),
+        message_repo=MessageRepository(db),
+        qualificacao_repo=QualificacaoRepository(db),
+        reuniao_repo=ReuniaoRepository(db),
+    )
+    messaging = DummyMessagingService()
+    service = QualificationService(
+        **repos,
+        messaging_service=messaging,
+        whatsapp_service=DummyWhatsAppService(),
+        inbound_store=InboundStore(*repos.values(), client=client),
+    )
+
+    result = service.processar_mensagem_por_telefone('5511999999999', 'oi', nome='Ana Souza')
+
+    assert result['success']
+    assert len(client.tables['leads']) == 1 and len(client.tables['sessions']) == 1
+    assert messaging.sent_messages[0]['metadata']['etapa'] == 'mensagem_inicial'
+    assert messaging.sent_messages[0]['session_id'] == client.tables['sessions'][0]['id']
+    # One load and one flush: no separate session/lead writes or session re-read
+    assert client.round_trips == 2
+    assert client.tables['leads'][0]['status'] == 'em_qualificacao'
@@ -0,0 +1,127 @@
+import random
+import time
+
+from backend.services.delivery_scheduler import DeliveryScheduler
+from backend.services.metrics_service import metrics_service
+from backend.services.retry_policy import CircuitBreaker, RetryPolicy
+from backend.services.whatsapp_service import WhatsAppService
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_decorrelated_jitter_stays_within_bounds():
+    policy = RetryPolicy(max_attempts=4, base_delay=1.0, max_delay=10.0, rng=random.Random(7))
+    delay = None
+    for _ in range(100):
+        new_delay = policy.next_delay(delay)
+        assert 1.0 <= new_delay <= 10.0
+        assert new_delay <= max(1.0, (delay or 1.0) * 3)
+        delay = new_delay
+    assert policy.should_retry(3) is True
+    assert policy.should_retry(4) is False
+
+
+def test_circuit_breaker_opens_fast_fails_and_recovers():
+    clock = FakeClock()
+    transitions = []
+    breaker = CircuitBreaker(
+        'waha',
+        failure_threshold=2,
+        cooldown_seconds=30,
+        on_transition=lambda name, old, new: transitions.append((old, new)),
+        clock=clock,
+    )
+
+    breaker.record_failure()
+    assert breaker.allow_request() is True
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN
+    assert breaker.allow_request() is False
+
+    clock.now = 31
+    assert breaker.allow_request() is True  # half-open trial call
+    assert breaker.allow_request() is False
+    breaker.record_success()
+
+    assert breaker.state == CircuitBreaker.CLOSED
+    assert transitions == [('closed', 'open'), ('open', 'half_open'), ('half_open', 'closed')]
+
+
+class _Response:
+    def __init__(self, status_code):
+        self.status_code = status_code
+        self.text = 'erro'
+
+    def json(self):
+        return {'id': 'waha-ok'}
+
+
+class _FlakyHttp:
+    def __init__(self, statuses):
+        self.statuses = list(statuses)
+        self.calls = 0
+
+    def post(self, url, **kwargs):
+        self.calls += 1
+        return _Response(self.statuses.pop(0) if self.statuses else 201)
+
+
+def _service(monkeypatch, http, scheduler):
+    monkeypatch.setenv('MAX_TENTATIVAS_ENVIO', '2')
+    monkeypatch.setenv('WAHA_RETRY_BASE_SECONDS', '0.01')
+    monkeypatch.setenv('WAHA_RETRY_MAX_SECONDS', '0.02')
+    monkeypatch.setenv('WAHA_CIRCUIT_FAILURES', '2')
+    monkeypatch.setenv('WAHA_CIRCUIT_COOLDOWN_SECONDS', '0.1')
+    service = WhatsAppService(scheduler=scheduler, http_client=http)
+    monkeypatch.setattr(service, 'calcular_delay_humanizado', lambda conversa_count=0: 0)
+    return service
+
+
+def test_failed_send_is_reported_and_redelivered_from_retry_queue(monkeypatch):
+    scheduler = DeliveryScheduler(workers=1)
+    http = _FlakyHttp([500, 503])
+    service = _service(monkeypatch, http, scheduler)
+    redelivered = []
+
+    result = service.enviar_mensagem_async(
+        '5511999999999', 'oi', on_redelivery=redelivered.append
+    ).result(timeout=2)
+
+    assert result['success'] is False
+    assert result['reenvio_agendado'] is True
+    assert 'simulado' not in result
+    assert http.calls == 2
+    assert metrics_service.circuit_states['waha'] == CircuitBreaker.OPEN
+
+    # while the circuit is open sends fail fast without touching WAHA
+    fast = service.enviar_mensagem_async('5511999999998', 'oi').result(timeout=1)
+    assert fast['error'] == 'circuit_open'
+    assert http.calls == 2
+
+    # after the cooldown the retry queue is drained
+    deadline = time.monotonic() + 3
+    while len(redelivered) < 1 and time.monotonic() < deadline:
+        time.sleep(0.02)
+    assert redelivered and redelivered[0]['success'] is True
+    assert service.circuit_breaker.state == CircuitBreaker.CLOSED
+    scheduler.shutdown()
+
+
+def test_client_errors_are_not_retried(monkeypatch):
+    scheduler = DeliveryScheduler(workers=1)
+    http = _FlakyHttp([400])
+    service = _service(monkeypatch, http, scheduler)
+
+    result = service.enviar_mensagem('5511999999999', 'oi')
+
+    assert result['success'] is False
+    assert 'reenvio_agendado' not in result
+    assert http.calls == 1
+    assert service.circuit_breaker.state == CircuitBreaker.CLOSED
+    scheduler.shutdown()
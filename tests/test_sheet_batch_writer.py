@@ -0,0 +1,98 @@
+from backend.services.retry_policy import RetryPolicy
+from backend.services.sheet_batch_writer import SheetBatchWriter, column_index, column_letter
+
+HEADER = ['Status', 'Nome', 'Telefone', 'Lead ID', 'Observação']
+
+
+class Call:
+    def __init__(self, fn):
+        self.fn = fn
+
+    def execute(self):
+        return self.fn()
+
+
+class FakeValuesApi:
+    """``spreadsheets()`` stand-in recording batchUpdate/update calls."""
+
+    def __init__(self, failing_batches=0, failing_ranges=()):
+        self.failing_batches = failing_batches
+        self.failing_ranges = set(failing_ranges)
+        self.batches = []
+        self.updates = []
+
+    def values(self):
+        return self
+
+    def batchUpdate(self, spreadsheetId, body):  # pylint: disable=invalid-name,unused-argument
+        def run():
+            if self.failing_batches:
+                self.failing_batches -= 1
+                raise RuntimeError('quota exceeded')
+            self.batches.append(body['data'])
+        return Call(run)
+
+    def update(self, spreadsheetId, range, valueInputOption, body):  # pylint: disable=redefined-builtin,unused-argument
+        def run():
+            if range in self.failing_ranges:
+                raise RuntimeError('bad range')
+            self.updates.append((range, body['values']))
+        return Call(run)
+
+
+def _writer(api, **kwargs):
+    kwargs.setdefault('retry_policy', RetryPolicy(max_attempts=2, base_delay=0.01, max_delay=0.01))
+    return SheetBatchWriter(api, 'sheet-id', 'Leads', sleep=lambda seconds: None, **kwargs)
+
+
+def test_column_letters_round_trip():
+    assert [column_letter(i) for i in (0, 25, 26, 701)] == ['A', 'Z', 'AA', 'ZZ']
+    assert all(column_index(column_letter(i)) == i for i in range(800))
+
+
+def test_only_changed_cells_are_sent_in_few_requests():
+    api = FakeValuesApi()
+    writer = _writer(api, first_column=2)
+    row = writer.update_row(5, HEADER, ['novo', 'Ana', '5511'], {
+        'Status': 'contatado', 'Nome': 'Ana', 'Telefone': '5512', 'Lead ID': 'x',
+    })
+    assert row == ['contatado', 'Ana', '5512', 'x', '']
+    for row_number in range(6, 406):
+        writer.update_row(row_number, HEADER, ['novo'], {'Status': 'contatado', 'Lead ID': 'y'})
+    assert writer.pending() == 401
+
+    result = writer.flush()
+
+    # 2 ranges per row, 200 ranges per batchUpdate
+    assert result.requests == 5 and result.ranges_written == 802 and not result.failed
+    assert api.batches[0][:2] == [
+        {'range': 'Leads!C5', 'values': [['contatado']]},
+        {'range': 'Leads!E5:F5', 'values': [['5512', 'x']]},
+    ]
+    assert writer.pending() == 0 and writer.flush().requests == 0
+
+
+def test_failed_batch_is_retried_per_range_and_failures_stay_queued():
+    api = FakeValuesApi(failing_batches=1, failing_ranges={'Leads!A3'})
+    writer = _writer(api)
+    writer.update_row(2, HEADER, [''], {'Status': 'contatado'})
+    writer.update_row(3, HEADER, [''], {'Status': 'erro'})
+
+    result = writer.flush()
+
+    assert result.retried_ranges == 2 and result.ranges_written == 1
+    assert result.failed == ['Leads!A3']
+    assert api.updates == [('Leads!A2', [['contatado']])]
+    assert writer.pending() == 1
+
+    api.failing_ranges.clear()
+    assert writer.flush().ranges_written == 1
+    assert api.batches == [[{'range': 'Leads!A3', 'values': [['erro']]}]]
+
+
+def test_auto_flush_bounds_pending_rows():
+    api = FakeValuesApi()
+    writer = _writer(api, auto_flush_rows=10)
+    for row_number in range(2, 27):
+        writer.update_row(row_number, HEADER, [''], {'Status': 'contatado'})
+    assert len(api.batches) == 2 and writer.pending() == 5
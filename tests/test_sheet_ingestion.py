@@ -0,0 +1,178 @@
+import threading
+from concurrent.futures import Future
+
+from backend.models.database_models import (
+    Lead,
+    LeadRepository,
+    MessageRepository,
+    QualificacaoRepository,
+    ReuniaoRepository,
+    SessionRepository,
+)
+from backend.services.messaging_service import MessagingService
+from backend.services.qualification_service import QualificationService
+from backend.services.google_sheets_service import GoogleSheetsService
+from backend.services.sheet_batch_writer import SheetBatchWriter
+from backend.services.sheet_ingestion import (
+    IngestionPolicy,
+    SheetIngestionEngine,
+    normalize_header,
+    rows_to_dicts,
+)
+from benchmarks.fake_sheets import FakeSheetsApi
+from benchmarks.fake_supabase import FakeDatabaseConnection
+
+HEADERS = ['Status', 'Nome', 'Telefone', 'Canal', 'Lead ID', 'Observação', 'Mensagem inicial']
+
+
+class FakeQualificationService:
+    def __init__(self, failing=()):
+        self.failing = set(failing)
+        self.calls = []
+
+    def normalizar_telefone(self, telefone):
+        return ''.join(ch for ch in telefone if ch.isdigit())
+
+    def iniciar_qualificacao(self, **kwargs):
+        self.calls.append(kwargs)
+        if kwargs['telefone'] in self.failing:
+            return {'success': False, 'error': 'whatsapp_send_failed'}
+        return {'success': True, 'session_id': 'sess', 'mensagem_inicial': f"Oi {kwargs['nome']}!"}
+
+
+def _run(rows, policy=None, lead_repo=None, qual_service=None):
+    api = FakeSheetsApi(rows=[HEADERS] + rows)
+    lead_repo = lead_repo or LeadRepository(FakeDatabaseConnection())
+    qual_service = qual_service or FakeQualificationService()
+    engine = SheetIngestionEngine(lead_repo, qual_service, policy=policy, batch_rows=2)
+    report = engine.run(HEADERS, [list(row) for row in rows], 2, SheetBatchWriter(api, 'sheet-id', 'Leads'))
+    return api, report, qual_service
+
+
+def test_headers_are_normalised_once_and_rows_padded():
+    keys = [normalize_header(header) for header in HEADERS]
+    assert keys == ['status', 'nome', 'telefone', 'canal', 'lead_id', 'observacao', 'mensagem_inicial']
+    assert rows_to_dicts(keys[:3], [['novo'], ['', 'Ana', '11', 'extra']]) == [
+        {'status': 'novo', 'nome': '', 'telefone': ''},
+        {'status': '', 'nome': 'Ana', 'telefone': '11'},
+    ]
+
+
+def test_default_policy_starts_pending_rows_and_writes_back():
+    api, report, qual_service = _run([
+        ['contatado', 'Ana', '5511 0001'],
+        ['', 'Bia', '5511-0002', 'Ebook'],
+        ['novo', 'Caio', ''],
+        ['', 'Bia de novo', '55110002'],
+        ['', 'Duda', '55110004'],
+    ], qual_service=FakeQualificationService(failing={'55110004'}))
+
+    assert [call['telefone'] for call in qual_service.calls] == ['55110002', '55110004']
+    assert qual_service.calls[0]['origem_canal'] == 'ebook'
+    assert report.pending == 4 and report.rejected == [(4, 'telefone ausente')]
+    assert report.starts_done == 1 and report.starts_failed == 1 and report.leads_created == 2
+
+    bia, caio, repeated, duda = api.rows[2], api.rows[3], api.rows[4], api.rows[5]
+    assert bia[0] == 'contatado' and bia[4] and bia[6] == 'Oi Bia!'
+    assert caio == ['novo', 'Caio', '']  # rejected without write-back under the default policy
+    assert repeated[0] == 'contatado' and repeated[4] == bia[4] and len(repeated) == 6
+    assert duda[0] == 'erro_envio' and duda[5] == 'whatsapp_send_failed'
+
+
+def test_policy_can_require_existing_leads_and_record_rejections():
+    class ExistingOnly(IngestionPolicy):
+        create_missing_leads = False
+
+        def rejected_updates(self, row, reason):
+            return {'status': 'erro', 'observacao': reason}
+
+    lead_repo = LeadRepository(FakeDatabaseConnection())
+    lead_repo.create_lead(Lead(nome='Ana', telefone='55110001', canal='site'))
+
+    api, report, qual_service = _run(
+        [['', 'Ana', '55110001'], ['', 'Bia', '55110002'], ['', 'Caio', '']],
+        policy=ExistingOnly(), lead_repo=lead_repo,
+    )
+
+    assert [call['telefone'] for call in qual_service.calls] == ['55110001']
+    assert report.leads_created == 0
+    assert api.rows[2][:2] == ['erro', 'Bia'] and api.rows[2][5] == 'lead não encontrado'
+    assert api.rows[3][5] == 'telefone ausente'
+
+
+def test_policy_lead_id_columns_resolve_before_phone():
+    class ById(IngestionPolicy):
+        create_missing_leads = False
+        lead_id_columns = ('lead_id',)
+
+    lead_repo = LeadRepository(FakeDatabaseConnection())
+    moved = lead_repo.create_lead(Lead(nome='Ana', telefone='55110009', canal='site'))
+    lead_repo.create_lead(Lead(nome='Bia', telefone='55110002', canal='site'))
+
+    _, report, qual_service = _run(
+        [['', 'Ana', '55110001', '', moved['id']], ['', 'Bia', '55110002', '', 'unknown-id']],
+        policy=ById(), lead_repo=lead_repo,
+    )
+
+    assert [(call['lead_id'], call['telefone']) for call in qual_service.calls] == [
+        (moved['id'], '55110001'),
+        (lead_repo.get_lead_by_phone('55110002')['id'], '55110002'),
+    ]
+    assert report.leads_resolved == 2 and not report.rejected
+
+
+class LateFailingWhatsApp:
+    """Async transport whose delivery fails after the call returned."""
+
+    def normalizar_telefone(self, telefone):
+        return telefone
+
+    def enviar_mensagem_async(self, telefone, mensagem, conversa_count=0, on_redelivery=None):
+        future = Future()
+        threading.Timer(0.05, future.set_result, [{'success': False, 'error': 'waha down'}]).start()
+        return future
+
+
+def test_a_delayed_send_failure_is_written_as_erro_envio():
+    db = FakeDatabaseConnection()
+    lead_repo, message_repo, whatsapp = LeadRepository(db), MessageRepository(db), LateFailingWhatsApp()
+    qual_service = QualificationService(
+        lead_repo=lead_repo,
+        session_repo=SessionRepository(db),
+        message_repo=message_repo,
+        qualificacao_repo=QualificacaoRepository(db),
+        reuniao_repo=ReuniaoRepository(db),
+        messaging_service=MessagingService(whatsapp, message_repo, delivery_timeout=5),
+        whatsapp_service=whatsapp,
+    )
+
+    api, report, _ = _run([['', 'Ana', '55110001']], lead_repo=lead_repo, qual_service=qual_service)
+
+    assert report.starts_failed == 1
+    assert api.rows[1][0] == 'erro_envio'
+    assert lead_repo.get_lead_by_phone('55110001')['status'] != 'em_qualificacao'
+
+
+def test_detectar_novos_leads_goes_through_the_engine(monkeypatch):
+    monkeypatch.setenv('GOOGLE_SHEETS_ID', 'sheet-id')
+    monkeypatch.setenv('GOOGLE_SHEETS_RANGE', 'Leads!A1:E')
+    monkeypatch.setenv('GOOGLE_CREDENTIALS_PATH', '/nonexistent/credentials.json')
+    sheets = GoogleSheetsService()
+    sheets.service = FakeSheetsApi(rows=[
+        ['nome', 'telefone', 'email', 'canal', 'processado'],
+        ['Ana', '55110001', 'ana@example.com', 'site', 'TRUE'],
+        ['Bia', '55110002', '', 'ebook'],
+        ['', '55110003'],
+        ['Caio', '55110004'],
+    ])
+    lead_repo = LeadRepository(FakeDatabaseConnection())
+    lead_repo.create_lead(Lead(nome='Caio', telefone='55110004', canal='site'))
+    qual_service = FakeQualificationService()
+
+    result = sheets.detectar_novos_leads(lead_repo=lead_repo, qualification_service=qual_service)
+
+    assert result['success'] and result['processados'] == 1 and result['erros'] == 2
+    assert result['detalhes'] == ['Linha 4: Nome ou telefone em branco', 'Linha 5: Lead já existe no sistema']
+    assert [call['nome'] for call in qual_service.calls] == ['Bia']
+    assert lead_repo.get_lead_by_phone('55110002')['canal'] == 'ebook'
+    assert sheets.service.rows[2][4] == 'TRUE' and len(sheets.service.rows[4]) == 2
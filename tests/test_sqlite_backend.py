@@ -0,0 +1,145 @@
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from backend.models.database_models import (
+    DatabaseConnection,
+    Lead,
+    LeadRepository,
+    Message,
+    MessageRepository,
+    Qualificacao,
+    QualificacaoRepository,
+    Session,
+    SessionRepository,
+)
+from backend.models.unit_of_work import InboundStore
+
+
+@pytest.fixture
+def db(tmp_path, monkeypatch):
+    monkeypatch.setenv('DATABASE_BACKEND', 'sqlite')
+    monkeypatch.setenv('SQLITE_DATABASE_PATH', str(tmp_path / 'agente.db'))
+    return DatabaseConnection()
+
+
+def test_repositories_round_trip_types_and_constraints(db):
+    leads, sessions = LeadRepository(db), SessionRepository(db)
+
+    lead = leads.create_lead(Lead(nome='Ana', telefone='5511999999999', canal='whatsapp'))
+    assert lead['processado'] is False and lead['created_at']
+    assert leads.create_lead(Lead(nome='Ana', telefone='5511999999999', canal='whatsapp')) is None
+
+    created = sessions.create_session(Session(lead_id=lead['id'], contexto={'responses': {'a': 1}}))
+    assert sessions.get_active_session(lead['id'])['contexto'] == {'responses': {'a': 1}}
+    assert sessions.update_session(created['id'], {'ativa': False})
+    assert sessions.get_active_session(lead['id']) is None
+    assert not leads.update_lead('missing-id', {'status': 'em_qualificacao'})
+
+
+def test_bulk_conflicts_and_keyset_pages(db):
+    leads, messages = LeadRepository(db), MessageRepository(db)
+    lead = leads.create_lead(Lead(nome='Ana', telefone='5511999999999', canal='whatsapp'))
+
+    result = leads.create_many([
+        Lead(nome='Bia', telefone='5511000000001', canal='whatsapp'),
+        Lead(nome='Ana', telefone='5511999999999', canal='whatsapp'),
+    ])
+    assert result.ids[0] and 1 in result.conflicts
+
+    session = SessionRepository(db).create_session(Session(lead_id=lead['id']))
+    messages.create_many([
+        Message(session_id=session['id'], lead_id=lead['id'], conteudo=f"m{n}", tipo='recebida') for n in range(7)
+    ])
+    paged = [m['conteudo'] for m in messages.iter_session_messages(session['id'], page_size=3)]
+    assert paged == [f"m{n}" for n in range(7)]
+
+
+def test_qualificacao_trigger_syncs_lead_score(db):
+    leads = LeadRepository(db)
+    lead = leads.create_lead(Lead(nome='Ana', telefone='5511999999999', canal='whatsapp'))
+    session = SessionRepository(db).create_session(Session(lead_id=lead['id']))
+
+    QualificacaoRepository(db).create_qualificacao(Qualificacao(
+        lead_id=lead['id'], session_id=session['id'],
+        patrimonio_pontos=30, objetivo_pontos=25, urgencia_pontos=20,
+    ))
+
+    assert leads.get_lead_by_phone('5511999999999', columns='score,status') == {'score': 75, 'status': 'qualificado'}
+
+
+def test_get_or_create_rpc_is_atomic_across_threads(db):
+    leads, sessions = LeadRepository(db), SessionRepository(db)
+
+    def first_message(_):
+        return leads.get_or_create_with_session(
+            Lead(nome='Ana', telefone='5511999999999', canal='whatsapp'),
+            Session(lead_id='', estado='aguardando_primeira_resposta'),
+            sessions,
+        )
+
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        results = list(pool.map(first_message, range(16)))
+
+    assert leads.rpc_enabled
+    assert sum(r['lead_created'] for r in results) == 1
+    assert sum(r['session_created'] for r in results) == 1
+    assert len({r['session']['id'] for r in results}) == 1
+
+
+def test_inbound_unit_of_work_runs_on_the_sqlite_rpcs(db):
+    leads, sessions, messages = LeadRepository(db), SessionRepository(db), MessageRepository(db)
+    qualificacoes = QualificacaoRepository(db)
+    store = InboundStore(leads, sessions, messages, qualificacoes, None, client=db.get_client())
+
+    uow = store.begin()
+    snapshot = uow.load_by_phone('5511999999999', 'Ana', new_session=Session(lead_id=''))
+    lead_id, session_id = snapshot.lead['id'], snapshot.session['id']
+    uow.add_message(Message(session_id=session_id, lead_id=lead_id, conteudo='oi', tipo='recebida'))
+    uow.update_session(session_id, {'estado': 'perguntar_patrimonio'})
+    uow.upsert_qualificacao(lead_id, session_id, {'patrimonio_resposta': '500k'})
+    assert uow.flush()
+
+    assert store.rpc_enabled and snapshot.session_created
+    assert sessions.get_active_session(lead_id)['estado'] == 'perguntar_patrimonio'
+    assert qualificacoes.get_lead_qualificacao(lead_id, columns='patrimonio_resposta') == {'patrimonio_resposta': '500k'}
+    assert [m['conteudo'] for m in messages.get_session_messages(session_id)] == ['oi']
+
+
+def test_inbound_flush_updates_only_the_latest_qualificacao(db):
+    leads, sessions = LeadRepository(db), SessionRepository(db)
+    store = InboundStore(leads, sessions, MessageRepository(db), QualificacaoRepository(db), None, client=db.get_client())
+    lead = leads.create_lead(Lead(nome='Ana', telefone='5511999999999', canal='whatsapp'))
+    session = sessions.create_session(Session(lead_id=lead['id']))
+    client = db.get_client()
+    for stamp, resposta in (('2024-01-01T00:00:00+00:00', 'antiga'), ('2024-02-01T00:00:00+00:00', 'atual')):
+        client.table('qualificacoes').insert({
+            'lead_id': lead['id'], 'session_id': session['id'], 'patrimonio_resposta': resposta, 'created_at': stamp,
+        }).execute()
+
+    uow = store.begin()
+    uow.load_by_phone('5511999999999', 'Ana')
+    uow.upsert_qualificacao(lead['id'], session['id'], {'patrimonio_resposta': '500k'})
+    assert uow.flush()
+
+    rows = (
+        client.table('qualificacoes').select('patrimonio_resposta').eq('lead_id', lead['id'])
+        .order('created_at').execute().data
+    )
+    assert [r['patrimonio_resposta'] for r in rows] == ['antiga', '500k']
+
+
+def test_inbound_flush_applies_explicit_nulls(db):
+    leads, sessions = LeadRepository(db), SessionRepository(db)
+    store = InboundStore(leads, sessions, MessageRepository(db), QualificacaoRepository(db), None, client=db.get_client())
+    lead = leads.create_lead(Lead(nome='Ana', telefone='5511999999999', canal='whatsapp', status='em_qualificacao'))
+    session = sessions.create_session(Session(lead_id=lead['id'], contexto={'responses': {'a': 1}}))
+
+    uow = store.begin()
+    uow.load_by_phone('5511999999999', 'Ana')
+    uow.update_session(session['id'], {'contexto': None})
+    uow.update_lead(lead['id'], {'status': None, 'score': 99})
+    assert uow.flush()
+
+    assert sessions.get_active_session(lead['id'])['contexto'] is None
+    assert leads.get_lead_by_phone('5511999999999', columns='status,score') == {'status': None, 'score': 0}
@@ -0,0 +1,91 @@
+import threading
+
+from backend.models.database_models import LeadRepository
+from backend.models.log_sink import DROPPED_EVENT, SystemLogSink, get_log_sink
+from benchmarks.fake_supabase import FakeDatabaseConnection, FakeSupabase
+
+
+class BlockingInsertClient(FakeSupabase):
+    """Supabase stand-in whose ``system_logs`` inserts hang until released."""
+
+    def __init__(self):
+        super().__init__()
+        self.release = threading.Event()
+
+    def _round_trip(self, *args, **kwargs):
+        self.release.wait(timeout=5)
+        return super()._round_trip(*args, **kwargs)
+
+
+class FailingQuery:
+    def insert(self, rows):
+        return self
+
+    def execute(self):
+        raise RuntimeError('503 Service Unavailable')
+
+
+class FailingClient:
+    def table(self, name):
+        return FailingQuery()
+
+
+def test_records_are_written_in_batches():
+    client = FakeSupabase()
+    sink = SystemLogSink(client, batch_size=10, flush_interval=60)
+
+    for n in range(25):
+        sink.submit({'nivel': 'ERROR', 'evento': f"erro {n}"})
+    sink.flush()
+
+    assert len(client.tables['system_logs']) == 25
+    assert sink.stats()['batches'] == 3
+    assert client.round_trips == 3
+
+
+def test_full_buffer_drops_without_blocking_and_reports_the_count():
+    client = FakeSupabase()
+    sink = SystemLogSink(client, max_buffer=5, batch_size=100, flush_interval=60, sample_every=0)
+
+    accepted = [sink.submit({'nivel': 'ERROR', 'evento': f"erro {n}"}) for n in range(8)]
+    sink.flush()
+
+    assert accepted == [True] * 5 + [False] * 3
+    assert sink.stats()['dropped'] == 3
+    rows = client.tables['system_logs']
+    assert [row['evento'] for row in rows][-1] == DROPPED_EVENT
+    assert rows[-1]['detalhes']['descartados'] == 3
+
+
+def test_sampling_keeps_some_of_the_newest_records():
+    sink = SystemLogSink(FakeSupabase(), max_buffer=3, batch_size=100, flush_interval=60, sample_every=2)
+
+    for n in range(7):
+        sink.submit({'nivel': 'ERROR', 'evento': f"erro {n}"})
+
+    eventos = [record['evento'] for record in sink._buffer]  # pylint: disable=protected-access
+    assert eventos == ['erro 2', 'erro 4', 'erro 6']
+    assert sink.stats()['dropped'] == 4
+
+
+def test_repository_errors_do_not_wait_for_a_slow_database():
+    client = BlockingInsertClient()
+    repo = LeadRepository(FakeDatabaseConnection(client))
+    sink = get_log_sink(client)
+
+    repo.log_error("x" * 150, {'lead_id': 'lead-1'})  # returns while the insert would hang
+    assert sink.pending() == 1
+
+    client.release.set()
+    sink.flush()
+    row = client.tables['system_logs'][0]
+    assert len(row['evento']) == 100
+    assert row['detalhes'] == {'lead_id': 'lead-1', 'mensagem': "x" * 150}
+
+
+def test_failed_batches_are_counted_not_raised():
+    sink = SystemLogSink(FailingClient(), flush_interval=60)
+    sink.submit({'nivel': 'ERROR', 'evento': 'erro'})
+
+    assert sink.flush() == 0
+    assert sink.stats()['failed'] == 1
@@ -0,0 +1,87 @@
+import threading
+
+import structlog
+
+from backend.models.cached_repositories import CachedLeadRepository
+from backend.models.database_models import Lead, LeadRepository
+from backend.services.delivery_scheduler import DeliveryScheduler
+from backend.services.inbound_worker import InboundWorkerPool
+from backend.services.tracing import (
+    LatencyHistogram,
+    Tracer,
+    correlation_scope,
+    current_correlation_id,
+    trace_summary,
+    tracer,
+)
+from benchmarks.fake_supabase import FakeDatabaseConnection, FakeSupabase
+
+
+def test_histogram_buckets_and_percentiles():
+    histogram = LatencyHistogram(bounds_ms=(1, 10, 100))
+    for ms in [0.5] * 90 + [50] * 9 + [400]:
+        histogram.observe(ms)
+
+    summary = histogram.to_dict()
+    assert summary['buckets'] == {'le_1ms': 90, 'le_10ms': 0, 'le_100ms': 9, 'inf': 1}
+    assert (summary['p50_ms'], summary['p95_ms'], summary['p99_ms']) == (1, 100, 100)
+    assert histogram.percentile(100) == 400
+
+
+def test_correlation_id_follows_the_message_across_threads():
+    local = Tracer()
+    seen = {}
+    done = threading.Event()
+    scheduler = DeliveryScheduler(workers=1)
+
+    def deliver():
+        with local.span('deliver'):
+            seen['delivery'] = current_correlation_id()
+        done.set()
+
+    def handle(job):
+        with local.span('handle'):
+            seen['worker'] = current_correlation_id()
+            seen['log_context'] = structlog.contextvars.get_contextvars().get('correlation_id')
+        scheduler.schedule(0, deliver)
+
+    pool = InboundWorkerPool(handler=handle, workers=1)
+    with correlation_scope('abc123'):
+        pool.submit('5511999999999', None)
+        pool.join(timeout=2)
+        assert done.wait(timeout=2)
+        assert set(trace_summary()) == {'handle', 'deliver'}
+    pool.stop()
+    scheduler.shutdown()
+
+    assert seen == {'worker': 'abc123', 'delivery': 'abc123', 'log_context': 'abc123'}
+    assert current_correlation_id() is None
+    assert local.stats()['handle']['count'] == 1
+
+
+def test_repository_calls_are_timed_per_method():
+    tracer.reset()
+    repo = LeadRepository(FakeDatabaseConnection(FakeSupabase()))
+
+    repo.get_lead_by_phone('5511999999999')
+    repo.get_lead_by_phone('5511999999998')
+    list(repo.iter_unprocessed_leads())
+
+    stats = tracer.stats()
+    assert stats['repo.LeadRepository.get_lead_by_phone']['count'] == 2
+    assert 'repo.LeadRepository.iter_unprocessed_leads' not in stats
+    assert LeadRepository.get_lead_by_phone.__name__ == 'get_lead_by_phone'
+
+
+def test_cached_repository_overrides_are_not_timed_twice():
+    tracer.reset()
+    repo = CachedLeadRepository(FakeDatabaseConnection(FakeSupabase()))
+    repo.create_lead(Lead(nome='Ana', telefone='5511999999999', canal='site'))
+
+    repo.get_lead_by_phone('5511999999999')  # cache hit: no database call
+    repo.get_lead_by_phone('5511999999998')  # miss: one span for the lookup
+
+    stats = tracer.stats()
+    assert stats['repo.LeadRepository.get_lead_by_phone']['count'] == 1
+    assert stats['repo.LeadRepository.create_lead']['count'] == 1
+    assert not [stage for stage in stats if stage.startswith('repo.CachedLeadRepository')]
@@ -0,0 +1,133 @@
+import pytest
+
+from backend.models.database_models import Message
+from backend.models.unit_of_work import InboundStore
+
+
+class RecordingRepo:
+    def __init__(self, lead=None, session=None, qualificacao=None):
+        self.calls = []
+        self.lead = lead
+        self.session = session
+        self.qualificacao = qualificacao
+
+    def get_lead_by_phone(self, telefone):
+        self.calls.append(('get_lead_by_phone', telefone))
+        return self.lead
+
+    def get_or_create_with_session(self, lead, session, session_repo):
+        self.calls.append(('get_or_create_with_session', lead.telefone))
+        return {'lead': self.lead, 'session': self.session}
+
+    def get_active_session(self, lead_id):
+        self.calls.append(('get_active_session', lead_id))
+        return self.session
+
+    def create_message(self, message):
+        self.calls.append(('create_message', message.conteudo))
+        return {'id': 'msg-1'}
+
+    def update_session(self, session_id, updates):
+        self.calls.append(('update_session', session_id))
+        return True
+
+    def update_lead(self, lead_id, updates):
+        self.calls.append(('update_lead', updates))
+        return True
+
+    def get_lead_qualificacao(self, lead_id):
+        self.calls.append(('get_lead_qualificacao', lead_id))
+        return self.qualificacao
+
+    def create_qualificacao(self, qualificacao):
+        self.calls.append(('create_qualificacao', qualificacao.patrimonio_resposta))
+        return {'id': 'q-1'}
+
+
+class RpcCall:
+    def __init__(self, client, name, params):
+        self.client, self.name, self.params = client, name, params
+
+    def execute(self):
+        self.client.calls.append((self.name, self.params))
+        if self.client.fail:
+            raise RuntimeError('function does not exist')
+        if self.name in self.client.timeouts:
+            raise TimeoutError('read timed out')
+        data = {'ok': True}
+        if self.name == InboundStore.LOAD_RPC:
+            data = {'lead': {'id': 'lead-1'}, 'session': {'id': 'sess-1'}, 'qualificacao': None}
+        return type('Response', (), {'data': data})()
+
+
+class FakeRpcClient:
+    def __init__(self, fail=False, timeouts=()):
+        self.calls = []
+        self.fail = fail
+        self.timeouts = set(timeouts)
+
+    def rpc(self, name, params):
+        return RpcCall(self, name, params)
+
+
+def _stage(uow):
+    uow.add_message(Message(session_id='sess-1', lead_id='lead-1', conteudo='oi', tipo='recebida'))
+    uow.update_session('sess-1', {'estado': 'perguntar_patrimonio'})
+    uow.update_lead('lead-1', {'status': 'em_qualificacao'})
+    uow.upsert_qualificacao('lead-1', 'sess-1', {'patrimonio_resposta': '500k'})
+
+
+def test_rpc_path_uses_one_load_and_one_flush():
+    repo = RecordingRepo()
+    client = FakeRpcClient()
+    store = InboundStore(repo, repo, repo, repo, repo, client=client)
+
+    uow = store.begin()
+    snapshot = uow.load_by_phone('5511999999999', 'Ana')
+    _stage(uow)
+    assert uow.flush()
+
+    assert snapshot.session == {'id': 'sess-1'}
+    assert [name for name, _ in client.calls] == [InboundStore.LOAD_RPC, InboundStore.FLUSH_RPC]
+    payload = client.calls[1][1]['p_payload']
+    assert payload['messages'][0]['conteudo'] == 'oi'
+    assert payload['qualificacao']['fields'] == {'patrimonio_resposta': '500k'}
+    assert repo.calls == []
+
+
+def test_missing_rpc_falls_back_to_repositories_and_stays_disabled():
+    repo = RecordingRepo(lead={'id': 'lead-1'}, session={'id': 'sess-1'})
+    client = FakeRpcClient(fail=True)
+    store = InboundStore(repo, repo, repo, repo, repo, client=client)
+
+    uow = store.begin()
+    uow.load_by_phone('5511999999999', 'Ana')
+    _stage(uow)
+    assert uow.flush()
+
+    assert len(client.calls) == 1  # disabled after the first failure
+    assert not store.rpc_enabled
+    assert [name for name, _ in repo.calls] == [
+        'get_or_create_with_session',
+        'create_message',
+        'update_session',
+        'update_lead',
+        'get_lead_qualificacao',
+        'create_qualificacao',
+    ]
+    assert repo.calls[-1] == ('create_qualificacao', '500k')
+
+
+def test_transient_flush_error_is_raised_without_sequential_writes():
+    repo = RecordingRepo(lead={'id': 'lead-1'}, session={'id': 'sess-1'})
+    client = FakeRpcClient(timeouts={InboundStore.LOAD_RPC, InboundStore.FLUSH_RPC})
+    store = InboundStore(repo, repo, repo, repo, repo, client=client)
+
+    uow = store.begin()
+    uow.load_by_phone('5511999999999', 'Ana')  # a read: falls back for this call only
+    _stage(uow)
+    with pytest.raises(TimeoutError):
+        uow.flush()  # aplicar_inbound may have committed: never re-applied sequentially
+
+    assert store.rpc_enabled and uow.pending
+    assert [name for name, _ in repo.calls] == ['get_or_create_with_session']